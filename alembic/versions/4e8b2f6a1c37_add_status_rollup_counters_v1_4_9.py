@@ -0,0 +1,68 @@
+"""add_status_rollup_counters_v1_4_9
+
+Revision ID: 4e8b2f6a1c37
+Revises: 7c3e1a9d4b52
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4e8b2f6a1c37'
+down_revision: Union[str, None] = '7c3e1a9d4b52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+COUNTERS = ('cassette_printed_count', 'glass_printed_count', 'glass_scanned_count')
+
+
+def upgrade() -> None:
+    for table in ('samples', 'cases'):
+        for column in COUNTERS:
+            op.add_column(table, sa.Column(column, sa.Integer(), server_default='0', nullable=False))
+
+    # Начальные значения; полный пересчёт с флагами —
+    # python -m cor_pass.repository.laboratory.status_rollup rebuild
+    op.execute(
+        """
+        UPDATE samples s SET
+            cassette_printed_count = (
+                SELECT count(*) FROM cassettes c WHERE c.sample_id = s.id AND c.is_printed
+            ),
+            glass_printed_count = (
+                SELECT count(*) FROM glasses g JOIN cassettes c ON c.id = g.cassette_id
+                WHERE c.sample_id = s.id AND g.is_printed
+            ),
+            glass_scanned_count = (
+                SELECT count(*) FROM glasses g JOIN cassettes c ON c.id = g.cassette_id
+                WHERE c.sample_id = s.id AND g.scan_url IS NOT NULL
+            )
+        """
+    )
+    op.execute(
+        """
+        UPDATE cases k SET
+            cassette_printed_count = agg.cassette_printed_count,
+            glass_printed_count = agg.glass_printed_count,
+            glass_scanned_count = agg.glass_scanned_count
+        FROM (
+            SELECT case_id,
+                   sum(cassette_printed_count) AS cassette_printed_count,
+                   sum(glass_printed_count) AS glass_printed_count,
+                   sum(glass_scanned_count) AS glass_scanned_count
+            FROM samples GROUP BY case_id
+        ) agg
+        WHERE agg.case_id = k.id
+        """
+    )
+
+
+def downgrade() -> None:
+    for table in ('cases', 'samples'):
+        for column in reversed(COUNTERS):
+            op.drop_column(table, column)
@@ -0,0 +1,40 @@
+"""add_case_code_sequences_v1_4_9
+
+Revision ID: 7c3e1a9d4b52
+Revises: f60d5cdd7f7f
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c3e1a9d4b52'
+down_revision: Union[str, None] = 'f60d5cdd7f7f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('case_code_sequences',
+    sa.Column('scope', sa.String(length=16), nullable=False),
+    sa.Column('last_value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('scope')
+    )
+    # Счётчики стартуют с максимального уже выданного номера каждого года
+    op.execute(
+        """
+        INSERT INTO case_code_sequences (scope, last_value)
+        SELECT substr(case_code, 2, 2), max(CAST(substr(case_code, 5) AS INTEGER))
+        FROM cases
+        WHERE length(case_code) = 9 AND substr(case_code, 5) ~ '^[0-9]{5}$'
+        GROUP BY substr(case_code, 2, 2)
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('case_code_sequences')
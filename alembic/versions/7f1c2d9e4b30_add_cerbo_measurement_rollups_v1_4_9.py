@@ -0,0 +1,73 @@
+"""add_cerbo_measurement_rollups_v1_4_9
+
+Revision ID: 7f1c2d9e4b30
+Revises: e5b3f0a9c712
+Create Date: 2026-10-16 18:00:00.000000
+
+Агрегаты заполняются по мере записи новых измерений; для уже сохранённых:
+python -m cor_pass.repository.energy.measurement_rollups rebuild
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f1c2d9e4b30'
+down_revision: Union[str, None] = 'e5b3f0a9c712'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'cerbo_measurement_rollups',
+        sa.Column('energetic_object_id', sa.String(length=36), nullable=False),
+        sa.Column('resolution_seconds', sa.Integer(), nullable=False, comment='Длина интервала: 60, 3600 или 86400'),
+        sa.Column('bucket_start', sa.DateTime(), nullable=False, comment='Начало интервала'),
+        sa.Column('object_name', sa.String(), nullable=True),
+        sa.Column('sample_count', sa.Integer(), nullable=False),
+        sa.Column('soc_count', sa.Integer(), nullable=False),
+        sa.Column('last_measured_at', sa.DateTime(), nullable=False, comment='Время измерения, давшего *_last'),
+        sa.Column('general_battery_power_sum', sa.Float(), nullable=False),
+        sa.Column('general_battery_power_min', sa.Float(), nullable=False),
+        sa.Column('general_battery_power_max', sa.Float(), nullable=False),
+        sa.Column('general_battery_power_last', sa.Float(), nullable=False),
+        sa.Column('inverter_total_ac_output_sum', sa.Float(), nullable=False),
+        sa.Column('inverter_total_ac_output_min', sa.Float(), nullable=False),
+        sa.Column('inverter_total_ac_output_max', sa.Float(), nullable=False),
+        sa.Column('inverter_total_ac_output_last', sa.Float(), nullable=False),
+        sa.Column('ess_total_input_power_sum', sa.Float(), nullable=False),
+        sa.Column('ess_total_input_power_min', sa.Float(), nullable=False),
+        sa.Column('ess_total_input_power_max', sa.Float(), nullable=False),
+        sa.Column('ess_total_input_power_last', sa.Float(), nullable=False),
+        sa.Column('solar_total_pv_power_sum', sa.Float(), nullable=False),
+        sa.Column('solar_total_pv_power_min', sa.Float(), nullable=False),
+        sa.Column('solar_total_pv_power_max', sa.Float(), nullable=False),
+        sa.Column('solar_total_pv_power_last', sa.Float(), nullable=False),
+        sa.Column('soc_sum', sa.Float(), nullable=True),
+        sa.Column('soc_min', sa.Float(), nullable=True),
+        sa.Column('soc_max', sa.Float(), nullable=True),
+        sa.Column('soc_last', sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(['energetic_object_id'], ['energetic_objects.id']),
+        sa.PrimaryKeyConstraint('energetic_object_id', 'resolution_seconds', 'bucket_start'),
+    )
+    op.create_index(
+        'ix_cerbo_measurement_rollups_name_resolution_bucket',
+        'cerbo_measurement_rollups',
+        ['object_name', 'resolution_seconds', 'bucket_start'],
+        unique=False,
+    )
+    op.create_index(
+        'ix_cerbo_measurement_rollups_resolution_bucket',
+        'cerbo_measurement_rollups',
+        ['resolution_seconds', 'bucket_start'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_cerbo_measurement_rollups_resolution_bucket', table_name='cerbo_measurement_rollups')
+    op.drop_index('ix_cerbo_measurement_rollups_name_resolution_bucket', table_name='cerbo_measurement_rollups')
+    op.drop_table('cerbo_measurement_rollups')
@@ -0,0 +1,75 @@
+"""add_case_worklist_v1_4_9
+
+Revision ID: 9d2f5c7e3a18
+Revises: 4e8b2f6a1c37
+Create Date: 2026-10-16 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d2f5c7e3a18'
+down_revision: Union[str, None] = '4e8b2f6a1c37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'case_worklist',
+        sa.Column('case_id', sa.String(length=36), nullable=False),
+        sa.Column('case_type', sa.String(length=1), nullable=True),
+        sa.Column(
+            'grossing_status',
+            postgresql.ENUM(name='grossing_status', create_type=False),
+            nullable=True,
+        ),
+        sa.Column('has_glass', sa.Boolean(), nullable=False),
+        sa.Column('creation_date', sa.DateTime(), nullable=True),
+        sa.Column('sort_priority', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['case_id'], ['cases.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('case_id'),
+    )
+    op.create_index(
+        'ix_case_worklist_priority_date', 'case_worklist', ['sort_priority', 'creation_date'], unique=False
+    )
+    op.create_index(
+        'ix_case_worklist_type_status_date',
+        'case_worklist',
+        ['case_type', 'grossing_status', 'creation_date'],
+        unique=False,
+    )
+
+    # Начальное заполнение; повторная пересборка —
+    # python -m cor_pass.repository.laboratory.status_rollup rebuild
+    op.execute(
+        """
+        INSERT INTO case_worklist
+            (case_id, case_type, grossing_status, has_glass, creation_date, sort_priority)
+        SELECT
+            id,
+            substr(case_code, 1, 1),
+            grossing_status,
+            coalesce(glass_count, 0) > 0,
+            creation_date,
+            CASE
+                WHEN grossing_status <> 'COMPLETED'
+                     AND substr(case_code, 1, 1) IN ('F', 'U') THEN 1
+                WHEN grossing_status <> 'COMPLETED'
+                     AND substr(case_code, 1, 1) = 'S'
+                     AND coalesce(glass_count, 0) > 0 THEN 2
+            END
+        FROM cases
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_case_worklist_type_status_date', table_name='case_worklist')
+    op.drop_index('ix_case_worklist_priority_date', table_name='case_worklist')
+    op.drop_table('case_worklist')
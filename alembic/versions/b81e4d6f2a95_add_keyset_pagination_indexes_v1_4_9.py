@@ -0,0 +1,37 @@
+"""add_keyset_pagination_indexes_v1_4_9
+
+Revision ID: b81e4d6f2a95
+Revises: 9d2f5c7e3a18
+Create Date: 2026-10-16 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b81e4d6f2a95'
+down_revision: Union[str, None] = '9d2f5c7e3a18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_cerbo_measurements_measured_at_id',
+        'cerbo_measurements',
+        ['measured_at', 'id'],
+        unique=False,
+    )
+    op.create_index(
+        'ix_cerbo_measurements_object_measured_at_id',
+        'cerbo_measurements',
+        ['energetic_object_id', 'measured_at', 'id'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_cerbo_measurements_object_measured_at_id', table_name='cerbo_measurements')
+    op.drop_index('ix_cerbo_measurements_measured_at_id', table_name='cerbo_measurements')
@@ -0,0 +1,34 @@
+"""add_register_samples_v1_4_9
+
+Revision ID: c4a7e91d2b58
+Revises: b81e4d6f2a95
+Create Date: 2026-10-16 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4a7e91d2b58'
+down_revision: Union[str, None] = 'b81e4d6f2a95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'register_samples',
+        sa.Column('energetic_object_id', sa.String(length=36), nullable=False),
+        sa.Column('register_key', sa.String(length=64), nullable=False, comment='Имя регистра из modbus_configs'),
+        sa.Column('measured_at', sa.DateTime(), nullable=False, comment='Дата и время опроса'),
+        sa.Column('value', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['energetic_object_id'], ['energetic_objects.id']),
+        sa.PrimaryKeyConstraint('energetic_object_id', 'register_key', 'measured_at'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('register_samples')
@@ -0,0 +1,140 @@
+"""partition_cerbo_measurements_v1_4_9
+
+Revision ID: e5b3f0a9c712
+Revises: c4a7e91d2b58
+Create Date: 2026-10-16 17:00:00.000000
+
+"""
+from datetime import date, datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b3f0a9c712'
+down_revision: Union[str, None] = 'c4a7e91d2b58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Партиции на столько месяцев вперёд от текущего; дальше их создаёт воркер
+# (cor_pass.repository.energy.measurement_partitions)
+AHEAD_MONTHS = 3
+
+OLD_INDEXES = (
+    'cerbo_measurements_pkey',
+    'ix_cerbo_measurements_energetic_object_id',
+    'ix_cerbo_measurements_object_name',
+    'ix_cerbo_measurements_measured_at_id',
+    'ix_cerbo_measurements_object_measured_at_id',
+)
+
+COLUMNS = (
+    'id, energetic_object_id, created_at, measured_at, object_name, general_battery_power, '
+    'inverter_total_ac_output, ess_total_input_power, solar_total_pv_power, soc'
+)
+
+
+def _columns():
+    return [
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column('energetic_object_id', sa.String(length=36), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('measured_at', sa.DateTime(), nullable=False, comment='Дата и время измерения'),
+        sa.Column('object_name', sa.String(), nullable=True),
+        sa.Column('general_battery_power', sa.Float(), nullable=False),
+        sa.Column('inverter_total_ac_output', sa.Float(), nullable=False),
+        sa.Column('ess_total_input_power', sa.Float(), nullable=False),
+        sa.Column('solar_total_pv_power', sa.Float(), nullable=False),
+        sa.Column('soc', sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(['energetic_object_id'], ['energetic_objects.id']),
+    ]
+
+
+def _add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _rename_old_table() -> None:
+    op.rename_table('cerbo_measurements', 'cerbo_measurements_old')
+    for name in OLD_INDEXES:
+        op.execute(f'ALTER INDEX IF EXISTS {name} RENAME TO {name}_old')
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        op.create_index(
+            'ix_cerbo_measurements_object_name_measured_at',
+            'cerbo_measurements',
+            ['object_name', 'measured_at'],
+            unique=False,
+        )
+        return
+
+    _rename_old_table()
+    op.create_table(
+        'cerbo_measurements',
+        *_columns(),
+        sa.PrimaryKeyConstraint('id', 'measured_at'),
+        postgresql_partition_by='RANGE (measured_at)',
+    )
+    op.create_index('ix_cerbo_measurements_measured_at_id', 'cerbo_measurements', ['measured_at', 'id'])
+    op.create_index(
+        'ix_cerbo_measurements_object_measured_at_id',
+        'cerbo_measurements',
+        ['energetic_object_id', 'measured_at', 'id'],
+    )
+    op.create_index(
+        'ix_cerbo_measurements_object_name_measured_at',
+        'cerbo_measurements',
+        ['object_name', 'measured_at'],
+    )
+
+    # Помесячные партиции от первого измерения до AHEAD_MONTHS вперёд
+    first_measured = op.get_bind().execute(sa.text('SELECT min(measured_at) FROM cerbo_measurements_old')).scalar()
+    today = datetime.now()
+    current = date(today.year, today.month, 1)
+    month = date(first_measured.year, first_measured.month, 1) if first_measured else current
+    month = min(month, current)
+    while month <= _add_months(current, AHEAD_MONTHS):
+        upper = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE cerbo_measurements_p{month.year:04d}{month.month:02d} "
+            f"PARTITION OF cerbo_measurements "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+        )
+        month = upper
+    op.execute('CREATE TABLE cerbo_measurements_default PARTITION OF cerbo_measurements DEFAULT')
+
+    op.execute(f'INSERT INTO cerbo_measurements ({COLUMNS}) SELECT {COLUMNS} FROM cerbo_measurements_old')
+    op.drop_table('cerbo_measurements_old')
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        op.drop_index('ix_cerbo_measurements_object_name_measured_at', table_name='cerbo_measurements')
+        return
+
+    op.rename_table('cerbo_measurements', 'cerbo_measurements_old')
+    for name in (
+        'cerbo_measurements_pkey',
+        'ix_cerbo_measurements_measured_at_id',
+        'ix_cerbo_measurements_object_measured_at_id',
+        'ix_cerbo_measurements_object_name_measured_at',
+    ):
+        op.execute(f'ALTER INDEX IF EXISTS {name} RENAME TO {name}_old')
+    op.create_table('cerbo_measurements', *_columns(), sa.PrimaryKeyConstraint('id'))
+    op.create_index('ix_cerbo_measurements_energetic_object_id', 'cerbo_measurements', ['energetic_object_id'])
+    op.create_index('ix_cerbo_measurements_object_name', 'cerbo_measurements', ['object_name'])
+    op.create_index('ix_cerbo_measurements_measured_at_id', 'cerbo_measurements', ['measured_at', 'id'])
+    op.create_index(
+        'ix_cerbo_measurements_object_measured_at_id',
+        'cerbo_measurements',
+        ['energetic_object_id', 'measured_at', 'id'],
+    )
+    op.execute(f'INSERT INTO cerbo_measurements ({COLUMNS}) SELECT {COLUMNS} FROM cerbo_measurements_old')
+    # Партиции удаляются вместе с родительской таблицей
+    op.drop_table('cerbo_measurements_old')
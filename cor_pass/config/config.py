@@ -57,7 +57,73 @@ class Settings(BaseSettings):
     scan_interval_seconds: int = 60
     base_path: str = "BASE_PATH"
     smb_enabled: bool = False
-    
+    smb_pool_max_size: int = 4  # Максимум SMB-подключений в пуле на процесс
+    smb_pool_idle_timeout: int = 300  # Секунды простоя до закрытия подключения
+    scan_state_db_path: str = "scan_worker_state/scan_state.sqlite3"  # Локальное состояние сканер-воркера
+    scan_unmatched_retry_base_seconds: int = 120  # Первая пауза перед повторным сопоставлением файла без стекла
+    scan_unmatched_retry_max_seconds: int = 3600  # Предел растущей паузы для файлов без стекла
+    smb_block_size_kb: int = 1024  # Размер блока при чтении файлов с шары по диапазонам
+    smb_block_cache_dir: str = "smb_cache/blocks"
+    smb_block_cache_max_mb: int = 2048
+
+    # SVS viewer cache
+    svs_slide_cache_size: int = 8  # Количество одновременно открытых слайдов на процесс
+    svs_tile_cache_mb: int = 256  # Бюджет памяти под закодированные тайлы на процесс
+    # Тайлы DeepZoom адресуются версией слайда, поэтому неизменяемы.
+    # "public" имеет смысл только если прокси сам проверяет авторизацию.
+    svs_tile_cache_control: str = "private, max-age=31536000, immutable"
+    svs_tile_store_dir: str = "slide_tile_store"  # Общая папка API и сканер-воркера
+    svs_tile_store_max_mb: int = 4096
+    svs_pretile_enabled: bool = True
+    svs_pretile_max_tiles: int = 512  # Сколько тайлов нижних уровней рендерить заранее
+    svs_local_cache_dir: str = "smb_cache/slides"  # Локальные копии SVS, общие для API и сканер-воркера
+    svs_local_cache_max_mb: int = 51200
+
+    # DICOM viewer cache
+    dicom_volume_cache_dir: str = "dicom_volume_cache"  # Тома в .npy, общие для всех воркеров
+    dicom_volume_cache_max_mb: int = 8192
+    dicom_decode_workers: int = 4  # Потоков на декодирование срезов одной серии
+    dicom_series_key_ttl: float = 5.0  # Секунд до повторного обхода папки серии и stat её файлов
+    dicom_mpr_cache_mb: int = 128  # Бюджет памяти под готовые срезы MPR на процесс
+
+    # Label printers (HTTP, порт 8080)
+    printer_batch_size: int = 20  # Меток в одной задаче /task/new
+    printer_concurrency: int = 2  # Одновременных задач на один принтер
+    printer_max_connections: int = 16  # Размер пула соединений на процесс
+    printer_retries: int = 2
+    printer_retry_delay: float = 0.5  # Пауза перед первым повтором, дальше удваивается
+    printer_timeout: float = 10.0
+
+    # Cerbo collection
+    cerbo_read_concurrency: int = 4  # Одновременных чтений (и подключений Modbus TCP) на один Cerbo
+
+    # История регистров (register_samples)
+    register_samples_flush_size: int = 500  # Строк в одном INSERT-пакете
+    register_samples_flush_interval: float = 5.0  # Секунд между записями неполного буфера
+    register_samples_max_pending: int = 20000  # Предел буфера; дальше — ожидание записи и отброс старых
+
+    # Пакетная запись измерений Cerbo (cerbo_measurements)
+    measurement_flush_size: int = 200  # Измерений в одной транзакции записи
+    measurement_flush_interval: float = 5.0  # Секунд между записями неполного буфера
+    measurement_max_pending: int = 5000  # Предел буфера в памяти; излишек уходит на диск
+    measurement_spool_dir: str = "measurement_spool"  # Файлы измерений, не записанных из-за недоступности БД
+    measurement_spool_max_mb: int = 512  # Предел папки; дальше удаляются самые старые файлы
+
+    # Партиции cerbo_measurements (помесячные, только PostgreSQL)
+    cerbo_partitions_ahead_months: int = 3  # Сколько месяцев вперёд держать готовые партиции
+    cerbo_retention_months: int = 0  # Удалять партиции старше N месяцев; 0 — хранить всё
+    cerbo_partition_check_interval: float = 3600.0  # Секунд между проверками партиций в воркере
+
+    # Расписания энергетических объектов
+    schedule_resync_interval: float = 300.0  # Секунд между перечитываниями расписаний объекта, если не пришло изменений
+
+    # Расчёт энергии по измерениям
+    energy_max_gap_seconds: float = 300.0  # Более длинный промежуток между измерениями — разрыв, не интегрируется
+
+    # Keyset pagination
+    pagination_cursor_key: str = ""  # Ключ подписи курсоров; пусто — используется secret_key
+    pagination_estimate_cap: int = 10000  # Приблизительный total считается не дальше этого числа
+
     # SIBIONICS CGM Integration
     SIBIONICS_API_URL: str = "https://cgm-ce-uat.sisensing.com"
     SIBIONICS_APP_KEY: str = "SIBIONICS_APP_KEY"
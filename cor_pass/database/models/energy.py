@@ -103,16 +103,22 @@ class EnergeticDeviceAccess(Base):
 class CerboMeasurement(Base):
     """
     Измерение Cerbo - данные с устройств мониторинга энергопотребления Cerbo GX
+
+    В PostgreSQL таблица разбита на помесячные партиции по measured_at
+    (см. cor_pass.repository.energy.measurement_partitions), поэтому
+    measured_at входит в первичный ключ.
     """
     __tablename__ = "cerbo_measurements"
 
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    energetic_object_id = Column(String(36), ForeignKey("energetic_objects.id"), nullable=False, index=True)
-    
+    energetic_object_id = Column(String(36), ForeignKey("energetic_objects.id"), nullable=False)
+
     created_at = Column(DateTime, nullable=False, default=func.now())
-    measured_at = Column(DateTime, nullable=False, comment="Дата и время измерения")
+    measured_at = Column(DateTime, primary_key=True, nullable=False, comment="Дата и время измерения")
 
-    object_name: Column[str] = Column(String, nullable=True, index=True)
+    # Отдельные индексы по energetic_object_id и object_name не нужны:
+    # их покрывают составные индексы ниже
+    object_name: Column[str] = Column(String, nullable=True)
 
     # Данные из battery_status
     general_battery_power: Column[float] = Column(Float, nullable=False)
@@ -131,6 +137,17 @@ class CerboMeasurement(Base):
     # Relationships
     energetic_object = relationship("EnergeticObject", back_populates="measurements")
 
+    # Ключи keyset-пагинации списков измерений (measured_at DESC, id DESC)
+    # и выборок истории по имени объекта за период.
+    # В PostgreSQL таблица разбита по RANGE (measured_at): партиции создают
+    # миграция e5b3f0a9c712 и measurement_partitions, а не create_all —
+    # иначе получилась бы партиционированная таблица без единой партиции
+    __table_args__ = (
+        Index("ix_cerbo_measurements_measured_at_id", "measured_at", "id"),
+        Index("ix_cerbo_measurements_object_measured_at_id", "energetic_object_id", "measured_at", "id"),
+        Index("ix_cerbo_measurements_object_name_measured_at", "object_name", "measured_at"),
+    )
+
     def __repr__(self):
         return (
             f"<CerboMeasurement(id={self.id}, measured_at='{self.measured_at}', "
@@ -138,6 +155,88 @@ class CerboMeasurement(Base):
         )
 
 
+class CerboMeasurementRollup(Base):
+    """
+    Агрегаты измерений Cerbo за минуту, час или сутки.
+
+    Одна строка на (объект, разрешение, начало интервала): сумма, минимум,
+    максимум и последнее значение каждого поля; среднее — <поле>_sum /
+    sample_count (для soc — soc_sum / soc_count, он бывает пустым).
+    Обновляется в той же транзакции, что и запись измерений
+    (cor_pass.repository.energy.measurement_rollups).
+    """
+    __tablename__ = "cerbo_measurement_rollups"
+
+    energetic_object_id = Column(String(36), ForeignKey("energetic_objects.id"), primary_key=True)
+    resolution_seconds = Column(Integer, primary_key=True, comment="Длина интервала: 60, 3600 или 86400")
+    bucket_start = Column(DateTime, primary_key=True, comment="Начало интервала")
+
+    object_name = Column(String, nullable=True)
+    sample_count = Column(Integer, nullable=False)
+    soc_count = Column(Integer, nullable=False, default=0)
+    last_measured_at = Column(DateTime, nullable=False, comment="Время измерения, давшего *_last")
+
+    general_battery_power_sum = Column(Float, nullable=False)
+    general_battery_power_min = Column(Float, nullable=False)
+    general_battery_power_max = Column(Float, nullable=False)
+    general_battery_power_last = Column(Float, nullable=False)
+
+    inverter_total_ac_output_sum = Column(Float, nullable=False)
+    inverter_total_ac_output_min = Column(Float, nullable=False)
+    inverter_total_ac_output_max = Column(Float, nullable=False)
+    inverter_total_ac_output_last = Column(Float, nullable=False)
+
+    ess_total_input_power_sum = Column(Float, nullable=False)
+    ess_total_input_power_min = Column(Float, nullable=False)
+    ess_total_input_power_max = Column(Float, nullable=False)
+    ess_total_input_power_last = Column(Float, nullable=False)
+
+    solar_total_pv_power_sum = Column(Float, nullable=False)
+    solar_total_pv_power_min = Column(Float, nullable=False)
+    solar_total_pv_power_max = Column(Float, nullable=False)
+    solar_total_pv_power_last = Column(Float, nullable=False)
+
+    soc_sum = Column(Float, nullable=True)
+    soc_min = Column(Float, nullable=True)
+    soc_max = Column(Float, nullable=True)
+    soc_last = Column(Float, nullable=True)
+
+    __table_args__ = (
+        Index(
+            "ix_cerbo_measurement_rollups_name_resolution_bucket",
+            "object_name", "resolution_seconds", "bucket_start",
+        ),
+        Index("ix_cerbo_measurement_rollups_resolution_bucket", "resolution_seconds", "bucket_start"),
+    )
+
+    def __repr__(self):
+        return (
+            f"<CerboMeasurementRollup(object='{self.energetic_object_id}', resolution={self.resolution_seconds}, "
+            f"bucket_start='{self.bucket_start}', count={self.sample_count})>"
+        )
+
+
+class RegisterSample(Base):
+    """
+    Значение регистра, опрошенного по JSON-конфигу устройства (Deye, Victron).
+
+    Узкая таблица временного ряда: одна строка на (объект, ключ регистра, время).
+    Пишется пачками из worker.register_sample_writer.
+    """
+    __tablename__ = "register_samples"
+
+    energetic_object_id = Column(String(36), ForeignKey("energetic_objects.id"), primary_key=True)
+    register_key = Column(String(64), primary_key=True, comment="Имя регистра из modbus_configs")
+    measured_at = Column(DateTime, primary_key=True, comment="Дата и время опроса")
+    value = Column(Float, nullable=False)
+
+    def __repr__(self):
+        return (
+            f"<RegisterSample(object='{self.energetic_object_id}', key='{self.register_key}', "
+            f"measured_at='{self.measured_at}', value={self.value})>"
+        )
+
+
 class EnergeticSchedule(Base):
     """
     Расписание энергетических задач - управление режимами работы инвертора
@@ -3,6 +3,8 @@ Laboratory Domain Models
 
 This module contains all models related to laboratory operations:
 - Case: Патогистологический случай
+- CaseCodeSequence: Счётчик порядковых номеров кодов кейсов
+- CaseWorklist: Проекция кейсов для списков "Текущие кейсы"
 - Sample: Банка с биоматериалом
 - Cassette: Кассета для образцов
 - Glass: Стекло с препаратом
@@ -21,6 +23,7 @@ from sqlalchemy import (
     Boolean,
     Text,
     Enum,
+    Index,
     LargeBinary,
     func,
     ARRAY,
@@ -60,6 +63,10 @@ class Case(Base):
     is_printed_cassette = Column(Boolean, nullable=True, default=False)
     is_printed_glass = Column(Boolean, nullable=True, default=False)
     is_printed_qr = Column(Boolean, nullable=True, default=False)
+    # Счётчики для статусов (поддерживаются repository/laboratory/status_rollup.py)
+    cassette_printed_count = Column(Integer, nullable=False, default=0, server_default="0")
+    glass_printed_count = Column(Integer, nullable=False, default=0, server_default="0")
+    glass_scanned_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     samples = relationship(
         "Sample", back_populates="case", cascade="all, delete-orphan"
@@ -81,6 +88,34 @@ class Case(Base):
     )
 
 
+class CaseCodeSequence(Base):
+    """Последний выданный порядковый номер кода кейса в пределах года"""
+    __tablename__ = "case_code_sequences"
+
+    scope = Column(String(16), primary_key=True)  # Две последние цифры года, например "25"
+    last_value = Column(Integer, nullable=False, default=0)
+
+
+class CaseWorklist(Base):
+    """
+    Проекция кейса для списков "Текущие кейсы" (repository/laboratory/case_worklist.py).
+    sort_priority: 1 — срочные F/U, 2 — S со стеклами, NULL — кейс не в списке.
+    """
+    __tablename__ = "case_worklist"
+
+    case_id = Column(String(36), ForeignKey("cases.id", ondelete="CASCADE"), primary_key=True)
+    case_type = Column(String(1), nullable=True)  # Первая буква кода кейса
+    grossing_status = Column(Enum(Grossing_status), nullable=True)
+    has_glass = Column(Boolean, nullable=False, default=False)
+    creation_date = Column(DateTime, nullable=True)
+    sort_priority = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        Index("ix_case_worklist_priority_date", "sort_priority", "creation_date"),
+        Index("ix_case_worklist_type_status_date", "case_type", "grossing_status", "creation_date"),
+    )
+
+
 class Sample(Base):
     """Банка с биоматериалом"""
     __tablename__ = "samples"
@@ -94,6 +129,10 @@ class Sample(Base):
     macro_description = Column(Text, nullable=True)
     is_printed_cassette = Column(Boolean, nullable=True, default=False)
     is_printed_glass = Column(Boolean, nullable=True, default=False)
+    # Счётчики для статусов (поддерживаются repository/laboratory/status_rollup.py)
+    cassette_printed_count = Column(Integer, nullable=False, default=0, server_default="0")
+    glass_printed_count = Column(Integer, nullable=False, default=0, server_default="0")
+    glass_scanned_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     case = relationship("Case", back_populates="samples")
     cassette = relationship(
@@ -2,8 +2,8 @@ import base64
 from datetime import date, datetime, timedelta
 import re
 from fastapi import APIRouter, HTTPException, UploadFile, status
-from sqlalchemy import asc, desc, func, select
-from typing import List, Optional, Tuple, List
+from sqlalchemy import func, select
+from typing import List, Optional
 
 import sqlalchemy
 
@@ -27,6 +27,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from cor_pass.repository.laboratory.case import get_patient_list_cases
 from cor_pass.repository.medical.patient import get_patient_by_corid
+from cor_pass.repository.shared.pagination import SortKey, TotalMode, paginate
 from cor_pass.repository.user.person import get_user_by_corid
 from cor_pass.schemas import (
     DoctorCreate,
@@ -172,115 +173,16 @@ async def create_doctor_service(
     return certificates, diploma, clinic_aff
 
 
-async def get_doctor_patients_with_status(
-    db: AsyncSession,
-    doctor: Doctor,
-    status_filters: Optional[List[PatientStatus]] = None,
-    sex_filters: Optional[List[str]] = None,
-    sort_by: Optional[str] = "change_date",
-    sort_order: Optional[str] = "desc",
-    skip: int = 1,
-    limit: int = 10,
-) -> Tuple[List, int]:
-    """
-    Асинхронно получает список пациентов конкретного врача вместе с их статусами с учетом
-    фильтрации, сортировки и пагинации.
-    """
-    query = (
-        select(DoctorPatientStatus, Patient)
-        .join(Patient, DoctorPatientStatus.patient_id == Patient.id)
-        .where(DoctorPatientStatus.doctor_id == doctor.id)
-    )
-
-    # Фильтрация по статусу
-    if status_filters:
-        query = query.where(
-            DoctorPatientStatus.status.in_([s.value for s in status_filters])
-        )
-
-    # Фильтрация по полу пациента
-    if sex_filters:
-        query = query.where(Patient.sex.in_(sex_filters))
-
-    # Сортировка
-    order_by_clause = None
-    if sort_by == "change_date":
-        order_by_clause = (
-            desc(Patient.change_date)
-            if sort_order == "desc"
-            else asc(Patient.change_date)
-        )
-    elif sort_by == "birth_date":
-        order_by_clause = (
-            desc(Patient.birth_date)
-            if sort_order == "desc"
-            else asc(Patient.birth_date)
-        )
-
-    if order_by_clause is not None:
-        query = query.order_by(order_by_clause)
-
-    # Пагинация
-    offset = (skip - 1) * limit
-    patients_with_status_result = await db.execute(query.offset(offset).limit(limit))
-    patients_with_status = patients_with_status_result.all()
-
-    # Получаем общее количество результатов для пагинации
-    count_query = (
-        select(func.count())
-        .select_from(DoctorPatientStatus)
-        .join(Patient, DoctorPatientStatus.patient_id == Patient.id)
-        .where(DoctorPatientStatus.doctor_id == doctor.id)
+def _patients_scope(owner: str, doctor_statuses, clinic_statuses, sexes) -> str:
+    """Scope курсора списка пациентов: чей список и значения фильтров."""
+    values = {
+        "doctor_status": sorted(s.value for s in doctor_statuses or []),
+        "clinic_status": sorted(s.value for s in clinic_statuses or []),
+        "sex": sorted(sexes or []),
+    }
+    return f"doctor_patients:{owner}:" + ",".join(
+        f"{name}={'|'.join(items)}" for name, items in values.items()
     )
-    if status_filters:
-        count_query = count_query.where(
-            DoctorPatientStatus.status.in_([s.value for s in status_filters])
-        )
-    if sex_filters:
-        count_query = count_query.where(Patient.sex.in_(sex_filters))
-
-    total_count_result = await db.execute(count_query)
-    total_count = total_count_result.scalar_one()
-
-    result = []
-    decoded_key = base64.b64decode(settings.aes_key)
-    for dps, patient in patients_with_status:
-        decrypted_surname = (
-            await decrypt_data(patient.encrypted_surname, decoded_key)
-            if patient.encrypted_surname
-            else None
-        )
-        decrypted_first_name = (
-            await decrypt_data(patient.encrypted_first_name, decoded_key)
-            if patient.encrypted_first_name
-            else None
-        )
-        decrypted_middle_name = (
-            await decrypt_data(patient.encrypted_middle_name, decoded_key)
-            if patient.encrypted_middle_name
-            else None
-        )
-
-        result.append(
-            {
-                "patient": {
-                    "id": patient.id,
-                    "patient_cor_id": patient.patient_cor_id,
-                    "surname": decrypted_surname,
-                    "first_name": decrypted_first_name,
-                    "middle_name": decrypted_middle_name,
-                    "birth_date": patient.birth_date,
-                    "sex": patient.sex,
-                    "email": patient.email,
-                    "phone_number": patient.phone_number,
-                    "address": patient.address,
-                    "change_date": patient.change_date,
-                },
-                "status": dps.status.value,
-            }
-        )
-
-    return result, total_count
 
 
 async def get_patients_with_optional_status(
@@ -294,7 +196,16 @@ async def get_patients_with_optional_status(
     skip: int = 1,
     limit: int = 30,
     filter_by_doctor: bool = False,  # Новый параметр - фильтровать ли по конкретному врачу
-) -> Tuple[List, int]:
+    cursor: Optional[str] = None,
+    approximate_total: bool = False,
+) -> GetAllPatientsResponce:
+    """
+    Список пациентов (всех или только текущего врача) со статусами у врача
+    и в клинике, с фильтрацией и сортировкой.
+
+    skip — номер страницы (начиная с 1); если передан cursor из предыдущей
+    страницы, выборка идёт по ключу сортировки без OFFSET.
+    """
     # filter_by_doctor=True означает "показать только пациентов конкретного врача"
     # filter_by_doctor=False означает "показать всех пациентов" (для лаборанта или врача без фильтра)
     
@@ -343,82 +254,38 @@ async def get_patients_with_optional_status(
     if sex_filters:
         query = query.where(Patient.sex.in_(sex_filters))
 
-    order_by_clause = None
+    # Сортировка; id пациента и id статусов (строк одного пациента может быть
+    # несколько — по одной на врача) делают порядок однозначным для курсора
+    descending = sort_order == "desc"
+    sort_keys = [
+        SortKey(Patient.id, descending),
+        SortKey(DoctorPatientStatus.id, descending, nullable=True),
+        SortKey(PatientClinicStatusModel.id, descending, nullable=True),
+    ]
     if sort_by == "change_date":
-        order_by_clause = (
-            desc(Patient.change_date)
-            if sort_order == "desc"
-            else asc(Patient.change_date)
-        )
+        sort_keys.insert(0, SortKey(Patient.change_date, descending, nullable=True))
     elif sort_by == "birth_date":
-        order_by_clause = (
-            desc(Patient.birth_date)
-            if sort_order == "desc"
-            else asc(Patient.birth_date)
-        )
-
-    if order_by_clause is not None:
-        query = query.order_by(order_by_clause)
-
-    offset = (skip - 1) * limit
-    patients_data_result = await db.execute(query.offset(offset).limit(limit))
-
-    patients_data = patients_data_result.all()
-
-    # Count query - аналогично основному запросу
-    if filter_by_doctor and doctor:
-        count_query = (
-            select(func.count(Patient.id.distinct()))
-            .select_from(Patient)
-            .join(
-                DoctorPatientStatus,
-                DoctorPatientStatus.patient_id == Patient.id,
-            )
-            .join(
-                PatientClinicStatusModel,
-                PatientClinicStatusModel.patient_id == Patient.id,
-                isouter=True,
-            )
-            .where(DoctorPatientStatus.doctor_id == doctor.id)
-        )
-    else:
-        count_query = (
-            select(func.count(Patient.id.distinct()))
-            .select_from(Patient)
-            .join(
-                DoctorPatientStatus,
-                DoctorPatientStatus.patient_id == Patient.id,
-                isouter=True,  # LEFT JOIN для всех пациентов
-            )
-            .join(
-                PatientClinicStatusModel,
-                PatientClinicStatusModel.patient_id == Patient.id,
-                isouter=True,
-            )
-        )
-
-    if doctor_status_filters:
-        count_query = count_query.where(
-            DoctorPatientStatus.status.in_([s.value for s in doctor_status_filters])
-        )
-
-    if clinic_status_filters:
-        count_query = count_query.where(
-            PatientClinicStatusModel.patient_status_for_clinic.in_(
-                [s.value for s in clinic_status_filters]
-            )
-        )
-
-    if sex_filters:
-        count_query = count_query.where(Patient.sex.in_(sex_filters))
-
-    total_count_result = await db.execute(count_query)
-    total_count = total_count_result.scalar_one()
+        sort_keys.insert(0, SortKey(Patient.birth_date, descending, nullable=True))
+
+    # Курсор действует только для того же списка и тех же фильтров
+    owner = doctor.id if filter_by_doctor and doctor else "all"
+    scope = _patients_scope(owner, doctor_status_filters, clinic_status_filters, sex_filters)
+
+    page = await paginate(
+        db,
+        query,
+        sort_keys,
+        scope=scope,
+        limit=limit,
+        cursor=cursor,
+        offset=(skip - 1) * limit,
+        total=TotalMode.ESTIMATE if approximate_total else TotalMode.EXACT,
+    )
 
     result = []
     decoded_key = base64.b64decode(settings.aes_key)
 
-    for doctor_patient_status, patient, clinic_patient_status in patients_data:
+    for doctor_patient_status, patient, clinic_patient_status in page.items:
         decrypted_surname = (
             await decrypt_data(patient.encrypted_surname, decoded_key)
             if patient.encrypted_surname
@@ -462,7 +329,12 @@ async def get_patients_with_optional_status(
         )
         result.append(patient_response)
  
-    response = GetAllPatientsResponce(patients=result, total_count=total_count)
+    response = GetAllPatientsResponce(
+        patients=result,
+        total_count=page.total_count,
+        next_cursor=page.next_cursor,
+        total_is_estimate=page.total_is_estimate,
+    )
     return response
 
  
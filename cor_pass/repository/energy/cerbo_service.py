@@ -3,10 +3,16 @@ from datetime import datetime, timedelta
 from uuid import uuid4
 from fastapi import FastAPI, HTTPException
 from sqlalchemy import UUID, delete, func, select, update
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional
 from math import ceil
 
-from cor_pass.database.models import CerboMeasurement, EnergeticObject, EnergeticSchedule
+from cor_pass.database.models import (
+    CerboMeasurement,
+    CerboMeasurementRollup,
+    EnergeticObject,
+    EnergeticSchedule,
+    RegisterSample,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
 from cor_pass.schemas import (
     EnergeticObjectCreate,
@@ -16,11 +22,17 @@ from cor_pass.schemas import (
     EnergeticScheduleCreateForObject,
     FullDeviceMeasurementCreate,
     FullDeviceMeasurementResponse,
-    CerboMeasurementResponse
+    CerboMeasurementResponse,
+    CerboRollupPoint,
 )
 from loguru import logger
 from pymodbus.client import AsyncModbusTcpClient
+from cor_pass.config.config import settings
 from cor_pass.database.db import async_session_maker
+from cor_pass.repository.energy.measurement_rollups import choose_resolution, get_rollup_series, rollups_cover
+from cor_pass.repository.shared.pagination import KeysetPage, SortKey, TotalMode, paginate
+from cor_pass.services.energy.energy_integration import POWER_FIELDS, energy_report
+from cor_pass.services.energy.schedule_timeline import notify_schedules_changed
 
 error_count = 0
 
@@ -188,6 +200,56 @@ def decode_signed_32(high: int, low: int) -> int:
 
 
 
+MEASUREMENT_SORT_KEYS = (
+    SortKey(CerboMeasurement.measured_at, descending=True),
+    SortKey(CerboMeasurement.id, descending=True),
+)
+
+
+def _measurements_in_range(
+    query, start_date: Optional[datetime], end_date: Optional[datetime]
+):
+    if start_date:
+        query = query.where(CerboMeasurement.measured_at >= start_date)
+    if end_date:
+        query = query.where(CerboMeasurement.measured_at <= end_date)
+    return query
+
+
+def _measurements_scope(
+    listing: str, start_date: Optional[datetime], end_date: Optional[datetime], **filters
+) -> str:
+    """Scope курсора: список и значения фильтров, при которых он выдан."""
+    values = [f"{name}={value or ''}" for name, value in sorted(filters.items())]
+    values += [
+        f"start={start_date.isoformat() if start_date else ''}",
+        f"end={end_date.isoformat() if end_date else ''}",
+    ]
+    return f"{listing}:{','.join(values)}"
+
+
+async def _paginate_measurements(
+    db: AsyncSession,
+    query,
+    scope: str,
+    page: int,
+    page_size: int,
+    cursor: Optional[str],
+    approximate_total: bool,
+) -> KeysetPage:
+    return await paginate(
+        db,
+        query,
+        MEASUREMENT_SORT_KEYS,
+        scope=scope,
+        limit=page_size,
+        cursor=cursor,
+        offset=(page - 1) * page_size,
+        total=TotalMode.ESTIMATE if approximate_total else TotalMode.EXACT,
+        scalars=True,
+    )
+
+
 async def get_device_measurements_paginated(
     db: AsyncSession,
     page: int = 1,
@@ -195,51 +257,34 @@ async def get_device_measurements_paginated(
     object_name: Optional[str] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-) -> Tuple[List[CerboMeasurement], int]:
+    cursor: Optional[str] = None,
+    approximate_total: bool = False,
+) -> KeysetPage:
     """
     Получает записи CerboMeasurement с пагинацией и необязательными фильтрами.
 
     Args:
         db: Асинхронная сессия базы данных.
-        page: Номер текущей страницы (начиная с 1).
+        page: Номер текущей страницы (начиная с 1), если не передан cursor.
         page_size: Количество записей на странице.
         object_name: Необязательный фильтр по имени объекта.
         start_date: Необязательный фильтр по начальной дате measured_at.
         end_date: Необязательный фильтр по конечной дате measured_at.
+        cursor: Курсор следующей страницы из предыдущего ответа.
+        approximate_total: Считать общее количество приблизительно.
 
     Returns:
-        Кортеж, содержащий список объектов CerboMeasurement и общее количество записей.
+        KeysetPage с объектами CerboMeasurement, курсором следующей страницы
+        и общим количеством записей.
     """
-
     query = select(CerboMeasurement)
-    count_query = select(func.count()).select_from(CerboMeasurement)
-
     if object_name:
         query = query.where(CerboMeasurement.object_name == object_name)
-        count_query = count_query.where(CerboMeasurement.object_name == object_name)
-
-    if start_date:
-        query = query.where(CerboMeasurement.measured_at >= start_date)
-        count_query = count_query.where(CerboMeasurement.measured_at >= start_date)
-
-    if end_date:
-        query = query.where(CerboMeasurement.measured_at <= end_date)
-        count_query = count_query.where(CerboMeasurement.measured_at <= end_date)
-
-    offset = (page - 1) * page_size
-    query = (
-        query.offset(offset)
-        .limit(page_size)
-        .order_by(CerboMeasurement.measured_at.desc())
+    query = _measurements_in_range(query, start_date, end_date)
+    scope = _measurements_scope(
+        "cerbo_measurements", start_date, end_date, object_name=object_name
     )
-
-    result = await db.execute(query)
-    measurements = result.scalars().all()
-
-    total_count_result = await db.execute(count_query)
-    total_count = total_count_result.scalar_one()
-
-    return measurements, total_count
+    return await _paginate_measurements(db, query, scope, page, page_size, cursor, approximate_total)
 
 
 async def get_device_measurements_by_object_paginated(
@@ -249,51 +294,34 @@ async def get_device_measurements_by_object_paginated(
     energetic_object_id: Optional[str] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-) -> Tuple[List[CerboMeasurement], int]:
+    cursor: Optional[str] = None,
+    approximate_total: bool = False,
+) -> KeysetPage:
     """
     Получает записи измерений инвертора с пагинацией и необязательными фильтрами по ID энергетического обьекта .
 
     Args:
         db: Асинхронная сессия базы данных.
-        page: Номер текущей страницы (начиная с 1).
+        page: Номер текущей страницы (начиная с 1), если не передан cursor.
         page_size: Количество записей на странице.
         energetic_object_id: Фильтр по ID энергетического объекта.
         start_date: Необязательный фильтр по начальной дате measured_at.
         end_date: Необязательный фильтр по конечной дате measured_at.
+        cursor: Курсор следующей страницы из предыдущего ответа.
+        approximate_total: Считать общее количество приблизительно.
 
     Returns:
-        Кортеж, содержащий список объектов CerboMeasurement и общее количество записей.
+        KeysetPage с объектами CerboMeasurement, курсором следующей страницы
+        и общим количеством записей.
     """
-
     query = select(CerboMeasurement)
-    count_query = select(func.count()).select_from(CerboMeasurement)
-
     if energetic_object_id:
         query = query.where(CerboMeasurement.energetic_object_id == energetic_object_id)
-        count_query = count_query.where(CerboMeasurement.energetic_object_id == energetic_object_id)
-
-    if start_date:
-        query = query.where(CerboMeasurement.measured_at >= start_date)
-        count_query = count_query.where(CerboMeasurement.measured_at >= start_date)
-
-    if end_date:
-        query = query.where(CerboMeasurement.measured_at <= end_date)
-        count_query = count_query.where(CerboMeasurement.measured_at <= end_date)
-
-    offset = (page - 1) * page_size
-    query = (
-        query.offset(offset)
-        .limit(page_size)
-        .order_by(CerboMeasurement.measured_at.desc())
+    query = _measurements_in_range(query, start_date, end_date)
+    scope = _measurements_scope(
+        "cerbo_measurements_by_object", start_date, end_date, energetic_object_id=energetic_object_id
     )
-
-    result = await db.execute(query)
-    measurements = result.scalars().all()
-
-    total_count_result = await db.execute(count_query)
-    total_count = total_count_result.scalar_one()
-
-    return measurements, total_count
+    return await _paginate_measurements(db, query, scope, page, page_size, cursor, approximate_total)
 
 async def create_schedule(
     db: AsyncSession, schedule_data: EnergeticScheduleCreate
@@ -322,6 +350,7 @@ async def create_schedule(
     db.add(db_schedule)
     await db.commit()
     await db.refresh(db_schedule)
+    await notify_schedules_changed(db_schedule.energetic_object_id)
     return db_schedule
 
 
@@ -353,6 +382,7 @@ async def create_schedule_with_energetic_object_id(
     db.add(db_schedule)
     await db.commit()
     await db.refresh(db_schedule)
+    await notify_schedules_changed(db_schedule.energetic_object_id)
     return db_schedule
 
 
@@ -417,6 +447,7 @@ async def update_schedule(
 
     await db.commit()
     await db.refresh(db_schedule)
+    await notify_schedules_changed(db_schedule.energetic_object_id)
     return db_schedule
 
 
@@ -425,10 +456,15 @@ async def delete_schedule(db: AsyncSession, schedule_id: str) -> bool:
     Удаляет расписание по ID.
     """
     result = await db.execute(
-        delete(EnergeticSchedule).where(EnergeticSchedule.id == schedule_id)
+        delete(EnergeticSchedule)
+        .where(EnergeticSchedule.id == schedule_id)
+        .returning(EnergeticSchedule.energetic_object_id)
     )
+    object_ids = result.scalars().all()
     await db.commit()
-    return result.rowcount > 0
+    for object_id in object_ids:
+        await notify_schedules_changed(object_id)
+    return bool(object_ids)
 
 
 async def update_schedule_is_active_status(
@@ -621,6 +657,23 @@ async def send_dvcc_max_charge_current_command(app: FastAPI, charge_battery_valu
 
 
 
+async def get_measurement_rollups_service(
+    db: AsyncSession,
+    object_name: Optional[str],
+    start_date: datetime,
+    end_date: datetime,
+    intervals: int = 60
+) -> List[CerboRollupPoint]:
+    """Среднее, минимум, максимум и последнее значение полей по интервалам — из агрегатов."""
+    if end_date <= start_date:
+        raise ValueError("end_date должна быть позже start_date")
+    resolution = choose_resolution(start_date, end_date, intervals)
+    if resolution is None:
+        raise ValueError("Шаг интервала меньше минуты: используйте /measurements/averaged/")
+    points = await get_rollup_series(db, object_name, start_date, end_date, intervals, resolution)
+    return [CerboRollupPoint(resolution_seconds=resolution, **point) for point in points]
+
+
 async def get_averaged_measurements_service(
     db: AsyncSession,
     object_name: Optional[str] = None,
@@ -631,6 +684,26 @@ async def get_averaged_measurements_service(
     if not start_date or not end_date:
         raise ValueError("Необходимо указать start_date и end_date")
 
+    # Шаг от минуты и больше — считаем по агрегатам, если они покрывают весь период
+    resolution = choose_resolution(start_date, end_date, intervals)
+    if resolution is not None and await rollups_cover(db, object_name, start_date, end_date, resolution):
+        points = await get_rollup_series(db, object_name, start_date, end_date, intervals, resolution)
+        if points:
+            return [
+                CerboMeasurementResponse(
+                    id=f"rollup-{resolution}-{point['interval_start']:%Y%m%d%H%M%S}",
+                    created_at=point["interval_start"],
+                    measured_at=point["interval_start"],
+                    object_name=point["object_name"],
+                    general_battery_power=point["general_battery_power"]["avg"],
+                    inverter_total_ac_output=point["inverter_total_ac_output"]["avg"],
+                    ess_total_input_power=point["ess_total_input_power"]["avg"],
+                    solar_total_pv_power=point["solar_total_pv_power"]["avg"],
+                    soc=point["soc"]["avg"],
+                )
+                for point in points
+            ]
+
     # Получаем все данные за период одним запросом
     query = select(CerboMeasurement).where(
         CerboMeasurement.measured_at >= start_date,
@@ -841,23 +914,13 @@ async def get_energy_measurements_service(
                        + timedelta(hours=1))
 
     
-    # Создаем интервалы
-    current_interval_start = rounded_start
-    intervals = []
-    while current_interval_start < rounded_end:
-        current_interval_end = current_interval_start + timedelta(minutes=interval_minutes)
-        intervals.append({
-            "start": current_interval_start,
-            "end": current_interval_end,
-            "measurements": [],
-            "measurement_count": 0,
-            "has_sufficient_data": False
-        })
-        current_interval_start = current_interval_end
-
-    # Загружаем все измерения (отсортированы)
+    # Колонки измерений без ORM-объектов; интегрирование — в numpy, вне event loop
     query = (
-        select(CerboMeasurement)
+        select(
+            CerboMeasurement.energetic_object_id,
+            CerboMeasurement.measured_at,
+            *(getattr(CerboMeasurement, field) for field, _ in POWER_FIELDS),
+        )
         .where(CerboMeasurement.measured_at >= rounded_start,
                CerboMeasurement.measured_at <= rounded_end)
         .order_by(CerboMeasurement.measured_at.asc())
@@ -865,104 +928,15 @@ async def get_energy_measurements_service(
     if object_name:
         query = query.where(CerboMeasurement.object_name == object_name)
 
-    result = await db.execute(query)
-    all_measurements = result.scalars().all()
-
-    # Распределяем измерения по интервалам 
-    for measurement in all_measurements:
-        for interval in intervals:
-            if interval["start"] <= measurement.measured_at < interval["end"]:
-                interval["measurements"].append(measurement)
-                interval["measurement_count"] += 1
-                break
-
-    # Подсчёт энергии внутри интервалов
-    results = []
-    for interval in intervals:
-        measurements = interval["measurements"]
-        interval["has_sufficient_data"] = len(measurements) >= 3
-
-        if len(measurements) < 2:
-            results.append({
-                "interval_start": interval["start"],
-                "interval_end": interval["end"],
-                "solar_energy_kwh": 0.0,
-                "load_energy_kwh": 0.0,
-                "grid_energy_kwh": 0.0,
-                "battery_energy_kwh": 0.0,
-                "measurement_count": interval["measurement_count"],
-                "has_sufficient_data": interval["has_sufficient_data"]
-            })
-            continue
-
-        solar_energy = 0.0
-        load_energy = 0.0
-        grid_energy = 0.0
-        battery_energy = 0.0
-
-        for j in range(1, len(measurements)):
-            prev = measurements[j - 1]
-            curr = measurements[j]
-            delta_h = (curr.measured_at - prev.measured_at).total_seconds() / 3600.0
-
-            if prev.solar_total_pv_power is not None:
-                solar_energy += (prev.solar_total_pv_power / 1000.0) * delta_h
-            if prev.inverter_total_ac_output is not None:
-                load_energy += (prev.inverter_total_ac_output / 1000.0) * delta_h
-            if prev.ess_total_input_power is not None:
-                grid_energy += (prev.ess_total_input_power / 1000.0) * delta_h
-            if prev.general_battery_power is not None:
-                battery_energy += (prev.general_battery_power / 1000.0) * delta_h
-
-        results.append({
-            "interval_start": interval["start"],
-            "interval_end": interval["end"],
-            "solar_energy_kwh": round(solar_energy, 3),
-            "load_energy_kwh": round(load_energy, 3),
-            "grid_energy_kwh": round(grid_energy, 3),
-            "battery_energy_kwh": round(battery_energy, 3),
-            "measurement_count": interval["measurement_count"],
-            "has_sufficient_data": interval["has_sufficient_data"]
-        })
-
-    # точные totals как сумма квантов между всеми подряд идущими измерениями 
-    total_solar = 0.0
-    total_load = 0.0
-    total_grid_import = 0.0
-    total_grid_export = 0.0
-    total_battery = 0.0
-
-    for j in range(1, len(all_measurements)):
-        prev = all_measurements[j - 1]
-        curr = all_measurements[j]
-        delta_h = (curr.measured_at - prev.measured_at).total_seconds() / 3600.0
-        if delta_h <= 0:
-            continue
-
-        if prev.solar_total_pv_power is not None:
-            total_solar += (prev.solar_total_pv_power / 1000.0) * delta_h
-        if prev.inverter_total_ac_output is not None:
-            total_load += (prev.inverter_total_ac_output / 1000.0) * delta_h
-        if prev.ess_total_input_power is not None:
-            grid_q = (prev.ess_total_input_power / 1000.0) * delta_h
-            if grid_q >= 0:
-                total_grid_import += grid_q
-            else:
-                total_grid_export += abs(grid_q)
-        if prev.general_battery_power is not None:
-            total_battery += (prev.general_battery_power / 1000.0) * delta_h
-
-    return {
-        "intervals": results,
-        "totals": {
-            # округляем с точностью до 0 знаков — точные интегральные суммы квантов
-            "solar_energy_total": round(total_solar, 0),
-            "load_energy_total": round(total_load, 0),
-            "grid_import_total": round(total_grid_import, 0),
-            "grid_export_total": round(total_grid_export, 0),
-            "battery_energy_total": round(total_battery, 0),
-        }
-    }
+    rows = (await db.execute(query)).all()
+    return await asyncio.to_thread(
+        energy_report,
+        rows,
+        rounded_start,
+        rounded_end,
+        interval_minutes,
+        settings.energy_max_gap_seconds,
+    )
 
 
 # CRUD по энергетическим обьектам / инверторам
@@ -1020,6 +994,8 @@ async def update_energetic_object(
 
     await db.commit()
     await db.refresh(db_obj)
+    if "timezone" in update_data:
+        await notify_schedules_changed(object_id)
     return db_obj
 
 async def delete_energetic_object(db: AsyncSession, object_id: str, cascade: bool = False) -> bool:
@@ -1038,10 +1014,16 @@ async def delete_energetic_object(db: AsyncSession, object_id: str, cascade: boo
         HTTPException(409): Если есть связанные данные и cascade=False
     """
     if cascade:
-        # Удаляем связанные измерения
+        # Удаляем связанные измерения, их агрегаты и историю регистров
         await db.execute(
             delete(CerboMeasurement).where(CerboMeasurement.energetic_object_id == object_id)
         )
+        await db.execute(
+            delete(CerboMeasurementRollup).where(CerboMeasurementRollup.energetic_object_id == object_id)
+        )
+        await db.execute(
+            delete(RegisterSample).where(RegisterSample.energetic_object_id == object_id)
+        )
         
         # Удаляем связанные расписания
         await db.execute(
@@ -1080,4 +1062,8 @@ async def delete_energetic_object(db: AsyncSession, object_id: str, cascade: boo
     
     result = await db.execute(delete(EnergeticObject).where(EnergeticObject.id == object_id))
     await db.commit()
-    return result.rowcount > 0
\ No newline at end of file
+    deleted = result.rowcount > 0
+    if deleted:
+        # Задача расписаний объекта перечитает таймлайн и завершится
+        await notify_schedules_changed(object_id)
+    return deleted
\ No newline at end of file
@@ -0,0 +1,202 @@
+"""
+Помесячные партиции cerbo_measurements (PostgreSQL).
+
+Таблица разбита по RANGE (measured_at) на партиции cerbo_measurements_pYYYYMM
+плюс cerbo_measurements_default для строк вне созданных диапазонов.
+maintain_measurement_partitions держит готовыми партиции на
+settings.cerbo_partitions_ahead_months вперёд и, если задан
+settings.cerbo_retention_months, удаляет партиции целиком, когда весь их
+месяц старше срока хранения (DROP TABLE вместо DELETE по миллионам строк).
+
+Если строки уже попали в default-партицию (например, воркер долго не
+запускался), ensure_partitions переносит их в новую партицию: таблица
+создаётся отдельно, заполняется из default и только потом подключается.
+
+Воркер вызывает обслуживание периодически; вручную:
+
+    python -m cor_pass.repository.energy.measurement_partitions status|maintain
+"""
+
+import asyncio
+import re
+import sys
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional
+
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cor_pass.config.config import settings
+
+
+TABLE = "cerbo_measurements"
+DEFAULT_PARTITION = f"{TABLE}_default"
+_NAME_RE = re.compile(rf"^{TABLE}_p(\d{{4}})(\d{{2}})$")
+
+
+def month_start(value: datetime) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_p{month.year:04d}{month.month:02d}"
+
+
+def parse_partition_name(name: str) -> Optional[date]:
+    """Месяц партиции по её имени; None для default и чужих таблиц."""
+    match = _NAME_RE.match(name)
+    if not match:
+        return None
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def months_between(first: date, last: date) -> List[date]:
+    """Первые числа месяцев от first до last включительно."""
+    months, month = [], month_start(first)
+    while month <= last:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def expired_partitions(names: Iterable[str], now: datetime, retention_months: int) -> List[str]:
+    """
+    Партиции, весь месяц которых старше retention_months месяцев от now.
+
+    Месяц текущей даты и retention_months предыдущих сохраняются.
+    retention_months <= 0 — хранить всё.
+    """
+    if retention_months <= 0:
+        return []
+    keep_from = add_months(month_start(now), -retention_months)
+    expired = []
+    for name in names:
+        month = parse_partition_name(name)
+        if month is not None and month < keep_from:
+            expired.append(name)
+    return sorted(expired)
+
+
+async def is_partitioned(db: AsyncSession) -> bool:
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    result = await db.execute(
+        text("SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :t"),
+        {"t": TABLE},
+    )
+    return result.scalar() is not None
+
+
+async def list_partitions(db: AsyncSession) -> List[str]:
+    result = await db.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :t ORDER BY c.relname"
+        ),
+        {"t": TABLE},
+    )
+    return list(result.scalars().all())
+
+
+async def _create_partition(db: AsyncSession, month: date) -> None:
+    name, upper = partition_name(month), add_months(month, 1)
+    bounds = {"lo": datetime(month.year, month.month, 1), "hi": datetime(upper.year, upper.month, 1)}
+    await db.execute(text(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = await db.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            f"WHERE measured_at >= :lo AND measured_at < :hi RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ),
+        bounds,
+    )
+    await db.execute(
+        text(
+            f"ALTER TABLE {TABLE} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{bounds['lo'].isoformat()}') TO ('{bounds['hi'].isoformat()}')"
+        )
+    )
+    if moved.rowcount:
+        logger.info(f"Партиция {name}: перенесено {moved.rowcount} строк из {DEFAULT_PARTITION}")
+
+
+async def ensure_partitions(db: AsyncSession, first: date, last: date) -> List[str]:
+    """Создаёт недостающие партиции для месяцев first..last. Коммит — на вызывающем."""
+    existing = set(await list_partitions(db))
+    created = []
+    for month in months_between(first, last):
+        name = partition_name(month)
+        if name not in existing:
+            await _create_partition(db, month)
+            created.append(name)
+    return created
+
+
+async def drop_partitions(db: AsyncSession, names: Iterable[str]) -> List[str]:
+    dropped = []
+    for name in names:
+        if parse_partition_name(name) is None:
+            raise ValueError(f"{name} не является помесячной партицией {TABLE}")
+        await db.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+        await db.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+    return dropped
+
+
+async def maintain_measurement_partitions(
+    db: AsyncSession,
+    now: Optional[datetime] = None,
+    ahead_months: Optional[int] = None,
+    retention_months: Optional[int] = None,
+) -> Dict[str, List[str]]:
+    """
+    Создаёт партиции на ahead_months вперёд и удаляет просроченные.
+
+    На непартиционированной таблице (SQLite, не применённая миграция)
+    ничего не делает.
+    """
+    if not await is_partitioned(db):
+        return {"created": [], "dropped": []}
+    now = now or datetime.now()
+    ahead = settings.cerbo_partitions_ahead_months if ahead_months is None else ahead_months
+    retention = settings.cerbo_retention_months if retention_months is None else retention_months
+
+    current = month_start(now)
+    created = await ensure_partitions(db, current, add_months(current, ahead))
+    dropped = await drop_partitions(db, expired_partitions(await list_partitions(db), now, retention))
+    await db.commit()
+    if created or dropped:
+        logger.info(f"Партиции {TABLE}: создано {created}, удалено {dropped}")
+    return {"created": created, "dropped": dropped}
+
+
+async def _main(command: str) -> int:
+    from cor_pass.database.db import async_session_maker
+
+    async with async_session_maker() as db:
+        if not await is_partitioned(db):
+            logger.warning(f"{TABLE} не партиционирована (нужна миграция e5b3f0a9c712 и PostgreSQL)")
+            return 1
+        if command == "maintain":
+            await maintain_measurement_partitions(db)
+        partitions = await list_partitions(db)
+        default_rows = (await db.execute(text(f"SELECT count(*) FROM {DEFAULT_PARTITION}"))).scalar()
+    logger.info(f"Партиции {TABLE}: {', '.join(partitions)}")
+    if default_rows:
+        logger.warning(f"В {DEFAULT_PARTITION} {default_rows} строк вне помесячных партиций")
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in ("status", "maintain"):
+        print("Использование: python -m cor_pass.repository.energy.measurement_partitions status|maintain")
+        sys.exit(2)
+    sys.exit(asyncio.run(_main(sys.argv[1])))
@@ -0,0 +1,323 @@
+"""
+Минутные, часовые и суточные агрегаты измерений Cerbo.
+
+apply_measurement_rollups вызывается в транзакции записи измерений:
+пачка сначала сворачивается в Python до одной строки на (объект,
+разрешение, интервал), затем строки сливаются с таблицей одним
+INSERT ... ON CONFLICT DO UPDATE (суммы и счётчики складываются, min/max
+сравниваются, *_last берётся у более позднего измерения). Поэтому
+агрегаты не зависят от того, сколькими пачками и в каком порядке пришли
+измерения.
+
+choose_resolution выбирает самое грубое разрешение, которое не крупнее
+запрошенного шага графика; get_rollup_series собирает из агрегатов точки
+графика. Границы периода при этом округляются до выбранного разрешения:
+учитываются интервалы, начинающиеся в [start, end).
+
+Заполнить агрегаты по уже сохранённым измерениям (после миграции) или
+пересчитать их:
+
+    python -m cor_pass.repository.energy.measurement_rollups rebuild
+"""
+
+import asyncio
+import sys
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import case, delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cor_pass.database.models import CerboMeasurement, CerboMeasurementRollup
+
+
+ROLLUP_FIELDS = (
+    "general_battery_power",
+    "inverter_total_ac_output",
+    "ess_total_input_power",
+    "solar_total_pv_power",
+    "soc",
+)
+MINUTE, HOUR, DAY = 60, 3600, 86400
+RESOLUTIONS = (MINUTE, HOUR, DAY)
+
+_EPOCH = datetime(1970, 1, 1)
+_COLUMNS = [column.name for column in CerboMeasurementRollup.__table__.columns]
+# SQLite ограничивает число параметров в запросе (999 в старых сборках)
+INSERT_CHUNK_ROWS = 999 // len(_COLUMNS)
+
+RollupKey = Tuple[str, int, datetime]
+
+
+def bucket_start(ts: datetime, resolution: int) -> datetime:
+    """Начало интервала длиной resolution секунд, содержащего ts (как date_trunc)."""
+    seconds = (ts - _EPOCH) // timedelta(seconds=1)
+    return _EPOCH + timedelta(seconds=seconds - seconds % resolution)
+
+
+def _value(measurement: Any, name: str) -> Any:
+    if isinstance(measurement, Mapping):
+        return measurement.get(name)
+    return getattr(measurement, name)
+
+
+def _min(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    return b if a is None else a if b is None else min(a, b)
+
+
+def _max(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    return b if a is None else a if b is None else max(a, b)
+
+
+def _add(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    return b if a is None else a if b is None else a + b
+
+
+def _merge(row: Dict[str, Any], other: Dict[str, Any]) -> None:
+    """Сливает other в row по тем же правилам, что и upsert в БД."""
+    newer = other["last_measured_at"] >= row["last_measured_at"]
+    row["sample_count"] += other["sample_count"]
+    row["soc_count"] += other["soc_count"]
+    if newer:
+        row["last_measured_at"] = other["last_measured_at"]
+        row["object_name"] = other["object_name"]
+    for field in ROLLUP_FIELDS:
+        row[f"{field}_sum"] = _add(row[f"{field}_sum"], other[f"{field}_sum"])
+        row[f"{field}_min"] = _min(row[f"{field}_min"], other[f"{field}_min"])
+        row[f"{field}_max"] = _max(row[f"{field}_max"], other[f"{field}_max"])
+        if newer:
+            row[f"{field}_last"] = other[f"{field}_last"]
+
+
+def rollup_rows(measurements: Iterable[Any]) -> List[Dict[str, Any]]:
+    """
+    Сворачивает измерения (ORM-объекты или словари полей CerboMeasurement)
+    в строки cerbo_measurement_rollups для всех разрешений.
+    """
+    rows: Dict[RollupKey, Dict[str, Any]] = {}
+    for measurement in measurements:
+        measured_at = _value(measurement, "measured_at")
+        single = {
+            "object_name": _value(measurement, "object_name"),
+            "sample_count": 1,
+            "soc_count": 0 if _value(measurement, "soc") is None else 1,
+            "last_measured_at": measured_at,
+        }
+        for field in ROLLUP_FIELDS:
+            value = _value(measurement, field)
+            for suffix in ("sum", "min", "max", "last"):
+                single[f"{field}_{suffix}"] = value
+        object_id = _value(measurement, "energetic_object_id")
+        for resolution in RESOLUTIONS:
+            key = (object_id, resolution, bucket_start(measured_at, resolution))
+            if key in rows:
+                _merge(rows[key], single)
+            else:
+                rows[key] = {
+                    "energetic_object_id": key[0],
+                    "resolution_seconds": key[1],
+                    "bucket_start": key[2],
+                    **single,
+                }
+    return list(rows.values())
+
+
+def _upsert_statement(db: AsyncSession, rows: List[Dict[str, Any]]):
+    is_postgres = db.get_bind().dialect.name == "postgresql"
+    stmt = (postgresql if is_postgres else sqlite).insert(CerboMeasurementRollup).values(rows)
+    # LEAST/GREATEST в PostgreSQL пропускают NULL, а min/max в SQLite — нет;
+    # coalesce выравнивает поведение для soc
+    least, greatest = (func.least, func.greatest) if is_postgres else (func.min, func.max)
+    current, new = CerboMeasurementRollup.__table__.c, stmt.excluded
+    newer = new.last_measured_at >= current.last_measured_at
+
+    values = {
+        "sample_count": current.sample_count + new.sample_count,
+        "soc_count": current.soc_count + new.soc_count,
+        "last_measured_at": case((newer, new.last_measured_at), else_=current.last_measured_at),
+        "object_name": case((newer, new.object_name), else_=current.object_name),
+    }
+    for field in ROLLUP_FIELDS:
+        old_sum, new_sum = current[f"{field}_sum"], new[f"{field}_sum"]
+        old_min, new_min = current[f"{field}_min"], new[f"{field}_min"]
+        old_max, new_max = current[f"{field}_max"], new[f"{field}_max"]
+        values[f"{field}_sum"] = func.coalesce(old_sum + new_sum, old_sum, new_sum)
+        values[f"{field}_min"] = func.coalesce(least(old_min, new_min), old_min, new_min)
+        values[f"{field}_max"] = func.coalesce(greatest(old_max, new_max), old_max, new_max)
+        values[f"{field}_last"] = case((newer, new[f"{field}_last"]), else_=current[f"{field}_last"])
+    return stmt.on_conflict_do_update(
+        index_elements=["energetic_object_id", "resolution_seconds", "bucket_start"],
+        set_=values,
+    )
+
+
+async def apply_measurement_rollups(db: AsyncSession, measurements: Iterable[Any]) -> int:
+    """
+    Добавляет измерения в агрегаты. Коммит — на вызывающем, в той же
+    транзакции, что и INSERT самих измерений. Возвращает число строк агрегатов.
+    """
+    rows = rollup_rows(measurements)
+    for i in range(0, len(rows), INSERT_CHUNK_ROWS):
+        await db.execute(_upsert_statement(db, rows[i:i + INSERT_CHUNK_ROWS]))
+    return len(rows)
+
+
+def choose_resolution(start: datetime, end: datetime, intervals: int) -> Optional[int]:
+    """
+    Самое грубое разрешение, не превышающее шаг (end - start) / intervals.
+
+    None — шаг меньше минуты, нужны исходные измерения.
+    """
+    step = (end - start).total_seconds() / intervals
+    usable = [resolution for resolution in RESOLUTIONS if resolution <= step]
+    return max(usable) if usable else None
+
+
+async def get_rollup_series(
+    db: AsyncSession,
+    object_name: Optional[str],
+    start: datetime,
+    end: datetime,
+    intervals: int,
+    resolution: int,
+) -> List[Dict[str, Any]]:
+    """
+    Точки графика из агрегатов разрешения resolution.
+
+    Для каждого непустого из intervals интервалов: interval_start,
+    object_name, sample_count и по каждому полю avg/min/max/last.
+    """
+    rollup = CerboMeasurementRollup
+    query = select(rollup).where(
+        rollup.resolution_seconds == resolution,
+        rollup.bucket_start >= start,
+        rollup.bucket_start < end,
+    )
+    if object_name:
+        query = query.where(rollup.object_name == object_name)
+    rows = (await db.execute(query.order_by(rollup.bucket_start))).scalars().all()
+
+    interval_size = (end - start) / intervals
+    grouped: Dict[int, Dict[str, Any]] = {}
+    for row in rows:
+        index = min(int((row.bucket_start - start) / interval_size), intervals - 1)
+        values = {column: getattr(row, column) for column in _COLUMNS}
+        if index in grouped:
+            _merge(grouped[index], values)
+        else:
+            grouped[index] = values
+
+    points = []
+    for index in sorted(grouped):
+        group = grouped[index]
+        point: Dict[str, Any] = {
+            "interval_start": start + index * interval_size,
+            "object_name": group["object_name"],
+            "sample_count": group["sample_count"],
+        }
+        for field in ROLLUP_FIELDS:
+            count = group["soc_count"] if field == "soc" else group["sample_count"]
+            total = group[f"{field}_sum"]
+            point[field] = {
+                "avg": total / count if count and total is not None else None,
+                "min": group[f"{field}_min"],
+                "max": group[f"{field}_max"],
+                "last": group[f"{field}_last"],
+            }
+        points.append(point)
+    return points
+
+
+async def rollups_cover(
+    db: AsyncSession,
+    object_name: Optional[str],
+    start: datetime,
+    end: datetime,
+    resolution: int,
+) -> bool:
+    """
+    Есть ли агрегаты resolution с начала периода.
+
+    Агрегаты ведутся с момента миграции; если до первой корзины периода
+    есть исходные измерения (история без rebuild), ряд из агрегатов был
+    бы неполным — тогда False, и график строится по исходным строкам.
+    """
+    rollup = CerboMeasurementRollup
+    query = select(func.min(rollup.bucket_start)).where(
+        rollup.resolution_seconds == resolution,
+        rollup.bucket_start >= bucket_start(start, resolution),
+        rollup.bucket_start < end,
+    )
+    if object_name:
+        query = query.where(rollup.object_name == object_name)
+    first_bucket = (await db.execute(query)).scalar()
+    if first_bucket is None:
+        return False
+    if first_bucket <= start:
+        return True
+    raw = select(CerboMeasurement.measured_at).where(
+        CerboMeasurement.measured_at >= start,
+        CerboMeasurement.measured_at < first_bucket,
+    )
+    if object_name:
+        raw = raw.where(CerboMeasurement.object_name == object_name)
+    return (await db.execute(raw.limit(1))).first() is None
+
+
+async def rebuild_rollups(
+    db: AsyncSession,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> int:
+    """
+    Пересчитывает агрегаты из cerbo_measurements посуточно, с коммитом
+    после каждых суток. Границы округляются до суток. Возвращает число
+    обработанных измерений.
+    """
+    if start is None or end is None:
+        first, last = (await db.execute(
+            select(func.min(CerboMeasurement.measured_at), func.max(CerboMeasurement.measured_at))
+        )).one()
+        if first is None:
+            return 0
+        start, end = start or first, end or last
+    day = bucket_start(start, DAY)
+    end = bucket_start(end, DAY) + timedelta(days=1)
+
+    processed = 0
+    while day < end:
+        next_day = day + timedelta(days=1)
+        await db.execute(delete(CerboMeasurementRollup).where(
+            CerboMeasurementRollup.bucket_start >= day,
+            CerboMeasurementRollup.bucket_start < next_day,
+        ))
+        measurements = (await db.execute(
+            select(CerboMeasurement).where(
+                CerboMeasurement.measured_at >= day,
+                CerboMeasurement.measured_at < next_day,
+            )
+        )).scalars().all()
+        await apply_measurement_rollups(db, measurements)
+        await db.commit()
+        db.expunge_all()
+        processed += len(measurements)
+        day = next_day
+    return processed
+
+
+async def _main(since: Optional[datetime]) -> int:
+    from cor_pass.database.db import async_session_maker
+
+    async with async_session_maker() as db:
+        processed = await rebuild_rollups(db, start=since, end=datetime.now() if since else None)
+    logger.info(f"Агрегаты пересчитаны по {processed} измерениям")
+    return 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3) or sys.argv[1] != "rebuild":
+        print("Использование: python -m cor_pass.repository.energy.measurement_rollups rebuild [YYYY-MM-DD]")
+        sys.exit(2)
+    sys.exit(asyncio.run(_main(datetime.fromisoformat(sys.argv[2]) if len(sys.argv) == 3 else None)))
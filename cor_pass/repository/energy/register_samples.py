@@ -0,0 +1,60 @@
+"""
+Временной ряд опрошенных регистров (register_samples).
+
+Значения пишутся пачками multi-row INSERT; повтор того же
+(объект, регистр, время) игнорируется, поэтому повторная запись пачки
+после сбоя не создаёт дублей.
+"""
+
+from datetime import datetime
+from typing import List, Optional, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cor_pass.database.models import RegisterSample
+
+
+# SQLite ограничивает число параметров в запросе (999 в старых сборках),
+# в строке 4 колонки
+INSERT_CHUNK_ROWS = 240
+
+
+def _insert(db: AsyncSession):
+    dialect = db.get_bind().dialect.name
+    return (postgresql if dialect == "postgresql" else sqlite).insert(RegisterSample)
+
+
+async def insert_register_samples(db: AsyncSession, rows: Sequence[dict]) -> int:
+    """
+    Записывает строки {energetic_object_id, register_key, measured_at, value}.
+
+    Коммит — на вызывающем. Возвращает число переданных строк.
+    """
+    for i in range(0, len(rows), INSERT_CHUNK_ROWS):
+        stmt = _insert(db).values(list(rows[i:i + INSERT_CHUNK_ROWS]))
+        await db.execute(stmt.on_conflict_do_nothing(
+            index_elements=["energetic_object_id", "register_key", "measured_at"]
+        ))
+    return len(rows)
+
+
+async def get_register_samples(
+    db: AsyncSession,
+    object_id: str,
+    register_key: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+) -> List[RegisterSample]:
+    """История одного регистра объекта по возрастанию времени."""
+    query = select(RegisterSample).where(
+        RegisterSample.energetic_object_id == object_id,
+        RegisterSample.register_key == register_key,
+    )
+    if start_date:
+        query = query.where(RegisterSample.measured_at >= start_date)
+    if end_date:
+        query = query.where(RegisterSample.measured_at <= end_date)
+    result = await db.execute(query.order_by(RegisterSample.measured_at))
+    return list(result.scalars().all())
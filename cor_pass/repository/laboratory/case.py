@@ -3,12 +3,13 @@ from enum import Enum
 import re
 from typing import Any, Dict, List, Optional
 from fastapi import APIRouter, HTTPException, Request, UploadFile, status
-from sqlalchemy import and_, func, literal_column, select
+from sqlalchemy import func, select
 import sqlalchemy
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
-from cor_pass.repository.laboratory.cassette import print_cassette_data
-from cor_pass.repository.laboratory.glass import print_glass_data
+from cor_pass.repository.laboratory.case_code import ensure_case_number_reserved, reserve_case_numbers
+from cor_pass.repository.laboratory.case_worklist import current_cases_query, sync_case_worklist
+from cor_pass.repository.laboratory.status_rollup import refresh_rollups
 from cor_pass.repository.doctor.lawyer import get_doctor
 from cor_pass.repository.medical.patient import get_patient_by_corid
 from cor_pass.repository.devices.printing_device import get_printing_device_by_device_class
@@ -24,7 +25,6 @@ from cor_pass.schemas import (
     CaseParametersScheema,
     CaseWithOwner,
     CassetteForGlassPage,
-    CassettePrinting,
     CassetteTestForGlassPage,
     DoctorDiagnosisSchema,
     DoctorResponseForSignature,
@@ -33,7 +33,7 @@ from cor_pass.schemas import (
     FirstCaseReferralDetailsWithOwner,
     FirstCaseTestGlassDetailsSchema,
     GeneralPrinting,
-    GlassPrinting,
+    PrintLabel,
     GlassTestModelScheema,
     LastCaseExcisionDetailsSchemaWithOwner,
     PatientFinalReportPageResponse,
@@ -74,6 +74,11 @@ from loguru import logger
 from cor_pass.config.config import settings
 from string import ascii_uppercase
 
+from cor_pass.services.laboratory.glass_and_cassette_printing import (
+    cassette_label_content,
+    glass_label_content,
+    print_label_groups,
+)
 from cor_pass.services.shared.websocket import DEEP_LINK_SCHEME, _is_expired
 
 
@@ -89,53 +94,6 @@ class ErrorCode(str, Enum):
     SIGNATURE_MISMATCH = "SIGNATURE_MISMATCH: Diagnosis by {diagnosis_doctor}, signed by {signature_doctor}"
 
 
-async def _create_single_sample_with_dependencies(
-    db: AsyncSession, case_id: str, sample_char: str
-):
-    """
-    Создает один семпл, одну кассету и одно стекло.
-    Возвращает созданный семпл.
-    """
-    db_case = await db.get(db_models.Case, case_id)
-
-    db_sample = db_models.Sample(case_id=db_case.id, sample_number=sample_char)
-    db.add(db_sample)
-    db_case.bank_count += 1
-    await db.flush()
-    await db.refresh(db_sample)
-    await db.refresh(db_case)
-
-    db_cassette = db_models.Cassette(
-        sample_id=db_sample.id, cassette_number=f"{sample_char}1"
-    )
-    db.add(db_cassette)
-    db_case.cassette_count += 1
-    db_sample.cassette_count += 1
-    await db.flush()
-    await db.refresh(db_cassette)
-    await db.refresh(db_case)
-    await db.refresh(db_sample)
-
-    db_glass = db_models.Glass(
-        cassette_id=db_cassette.id,
-        glass_number=0,
-        staining=db_models.StainingType.HE,
-    )
-    db.add(db_glass)
-    db_case.glass_count += 1
-    db_sample.glass_count += 1
-    db_cassette.glass_count += 1
-    await db.flush()
-    await db.refresh(db_glass)
-    await db.refresh(db_case)
-    await db.refresh(db_sample)
-    await db.refresh(db_cassette)
-    await _update_ancestor_statuses_from_cassette(db=db, cassette=db_cassette)
-    await _update_ancestor_statuses_from_glass(db=db, glass=db_glass)
-
-    return db_sample
-
-
 async def _get_next_sample_char(db: AsyncSession, case_id: str):
     """Определяет следующий доступный буквенный номер семпла."""
     samples_result = await db.execute(
@@ -167,130 +125,164 @@ async def generate_case_code(
     return f"{urgency_char}{year_short}{sample_type_char}{formatted_number}"
 
 
+def _sample_char(index: int) -> str:
+    return (
+        ascii_uppercase[index]
+        if index < len(ascii_uppercase)
+        else f"Z{index - len(ascii_uppercase) + 1}"
+    )
+
+
+def _build_case_tree(
+    body: CaseCreate, case_codes: List[str]
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Собирает в памяти строки кейсов и их начальных семплов, кассет и стекол.
+
+    Идентификаторы генерируются здесь же, поэтому связи известны до вставки,
+    а счётчики и статусы печати сразу имеют итоговые значения: у нового
+    дерева все кассеты и стекла не напечатаны.
+    """
+    now = datetime.now()
+    rows: Dict[str, List[Dict[str, Any]]] = {
+        "cases": [], "parameters": [], "samples": [], "cassettes": [], "glasses": []
+    }
+    for case_code in case_codes:
+        case_id = str(uuid.uuid4())
+        rows["cases"].append({
+            "id": case_id,
+            "patient_id": body.patient_cor_id,
+            "creation_date": now,
+            "case_code": case_code,
+            "bank_count": body.num_samples,
+            "cassette_count": body.num_samples,
+            "glass_count": body.num_samples,
+            "is_printed_cassette": False,
+            "is_printed_glass": False,
+        })
+        rows["parameters"].append({
+            "id": str(uuid.uuid4()),
+            "case_id": case_id,
+            "urgency": body.urgency,
+            "material_type": body.material_type,
+        })
+        for j in range(body.num_samples):
+            sample_char = _sample_char(j)
+            sample_id, cassette_id = str(uuid.uuid4()), str(uuid.uuid4())
+            rows["samples"].append({
+                "id": sample_id,
+                "case_id": case_id,
+                "sample_number": sample_char,
+                "cassette_count": 1,
+                "glass_count": 1,
+                "is_printed_cassette": False,
+                "is_printed_glass": False,
+            })
+            rows["cassettes"].append({
+                "id": cassette_id,
+                "sample_id": sample_id,
+                "cassette_number": f"{sample_char}1",
+                "glass_count": 1,
+                "is_printed": False,
+            })
+            rows["glasses"].append({
+                "id": str(uuid.uuid4()),
+                "cassette_id": cassette_id,
+                "glass_number": 0,
+                "staining": db_models.StainingType.HE,
+                "is_printed": False,
+            })
+    return rows
+
+
+async def _insert_returning(
+    db: AsyncSession, model, rows: List[Dict[str, Any]]
+) -> List[Any]:
+    """Многострочный INSERT ... RETURNING; объекты возвращаются в порядке rows."""
+    if not rows:
+        return []
+    result = await db.scalars(
+        sqlalchemy.insert(model).returning(model, sort_by_parameter_order=True), rows
+    )
+    return list(result.all())
+
+
 async def create_cases_with_initial_data(
     db: AsyncSession, body: CaseCreate
 ) -> Dict[str, Any]:
     """
     Асинхронно создает указанное количество кейсов, семплов и связанные с ними данные.
+
+    Всё дерево вставляется в одной транзакции многострочными INSERT ... RETURNING
+    (по одному на таблицу), так что число запросов не зависит от количества кейсов.
     """
-    created_cases_db: List[db_models.Case] = []
+    if body.num_cases < 1:
+        return {"all_cases": [], "first_case_details": None}
 
-    now = datetime.now()
-    year_short = now.strftime("%y")
+    year_short = datetime.now().strftime("%y")
     urgency_char = body.urgency.value[0].upper()
     material_type_char = body.material_type.value[0].upper()
 
-    result = await db.execute(select(db_models.Case.case_code))
-    all_existing_case_codes = result.scalars().all()
-    max_sequential_number = 0
-    for code in all_existing_case_codes:
-        if len(code) == 9 and code[1:3] == year_short:
-            try:
-                sequential_number = int(code[4:])
-                if sequential_number > max_sequential_number:
-                    max_sequential_number = sequential_number
-            except ValueError:
-                continue
-    next_number = max_sequential_number + 1
-    for i in range(body.num_cases):
-        db_case = db_models.Case(
-            id=str(uuid.uuid4()),
-            patient_id=body.patient_cor_id,
-            creation_date=datetime.now(),
-            bank_count=0,
-            cassette_count=0,
-            glass_count=0,
-        )
-        db_case.case_code = await generate_case_code(
-            urgency_char, year_short, material_type_char, next_number
-        )
-        db.add(db_case)
-
-        await db.flush()
-        await db.refresh(db_case)
-        next_number += 1
-
-        for j in range(body.num_samples):
-            sample_char = (
-                ascii_uppercase[j]
-                if j < len(ascii_uppercase)
-                else f"Z{j - len(ascii_uppercase) + 1}"
-            )
-
-            await _create_single_sample_with_dependencies(db, db_case.id, sample_char)
-
-        db_case_parameters = db_models.CaseParameters(
-            case_id=db_case.id,
-            urgency=body.urgency,
-            material_type=body.material_type,
-        )
-        db.add(db_case_parameters)
-
-        await db.commit()
-        await db.refresh(db_case_parameters)
-        await db.refresh(db_case)
-
-        created_cases_db.append(db_case)
-
-    if created_cases_db:
-        first_case_with_relations = await db.execute(
-            select(db_models.Case)
-            .options(
-                selectinload(db_models.Case.samples)
-                .selectinload(db_models.Sample.cassette)
-                .selectinload(db_models.Cassette.glass)
-            )
-            .where(db_models.Case.id == created_cases_db[0].id)
-        )
-        first_case_db_full = first_case_with_relations.scalar_one_or_none()
+    first_number = await reserve_case_numbers(db, year_short, body.num_cases)
+    case_codes = [
+        await generate_case_code(urgency_char, year_short, material_type_char, first_number + i)
+        for i in range(body.num_cases)
+    ]
+    rows = _build_case_tree(body, case_codes)
+
+    # Порядок вставки соблюдает внешние ключи; RETURNING отдаёт готовые объекты
+    created_cases_db = await _insert_returning(db, db_models.Case, rows["cases"])
+    await _insert_returning(db, db_models.CaseParameters, rows["parameters"])
+    samples_db = await _insert_returning(db, db_models.Sample, rows["samples"])
+    cassettes_db = await _insert_returning(db, db_models.Cassette, rows["cassettes"])
+    glasses_db = await _insert_returning(db, db_models.Glass, rows["glasses"])
+    await sync_case_worklist(db, [row["id"] for row in rows["cases"]])
+    await db.commit()
 
     all_cases = [
         CaseModelScheema.model_validate(case).model_dump() for case in created_cases_db
     ]
-    first_case_details = None
 
-    if created_cases_db:
-        first_case_db = created_cases_db[0]
-
-        samples_result = await db.execute(
-            select(db_models.Sample)
-            .where(db_models.Sample.case_id == first_case_db.id)
-            .order_by(db_models.Sample.sample_number)
-        )
-        first_case_samples_db = samples_result.scalars().all()
-        first_case_samples = []
-
-        for i, sample_db in enumerate(first_case_samples_db):
-            sample = SampleModelScheema.model_validate(sample_db).model_dump()
-            sample["cassettes"] = []
+    first_case_db = created_cases_db[0]
+    glasses_by_cassette: Dict[str, List[db_models.Glass]] = {}
+    for glass in glasses_db:
+        glasses_by_cassette.setdefault(glass.cassette_id, []).append(glass)
+    cassettes_by_sample: Dict[str, List[db_models.Cassette]] = {}
+    for cassette in cassettes_db:
+        cassettes_by_sample.setdefault(cassette.sample_id, []).append(cassette)
+
+    first_case_samples_db = sorted(
+        (sample for sample in samples_db if sample.case_id == first_case_db.id),
+        key=lambda sample: sample.sample_number,
+    )
+    first_case_samples = []
+    for i, sample_db in enumerate(first_case_samples_db):
+        sample = SampleModelScheema.model_validate(sample_db).model_dump()
+        sample["cassettes"] = []
 
-            if i == 0 and sample_db:
-                await db.refresh(sample_db, attribute_names=["cassette"])
-                for cassette_db in sample_db.cassette:
-                    await db.refresh(cassette_db, attribute_names=["glass"])
-                    cassette = CassetteModelScheema.model_validate(
-                        cassette_db
-                    ).model_dump()
-                    cassette["glasses"] = [
-                        GlassModelScheema.model_validate(glass).model_dump()
-                        for glass in cassette_db.glass
-                    ]
-                    sample["cassettes"].append(cassette)
-            first_case_samples.append(sample)
+        if i == 0:
+            for cassette_db in cassettes_by_sample.get(sample_db.id, []):
+                cassette = CassetteModelScheema.model_validate(cassette_db).model_dump()
+                cassette["glasses"] = [
+                    GlassModelScheema.model_validate(glass).model_dump()
+                    for glass in glasses_by_cassette.get(cassette_db.id, [])
+                ]
+                sample["cassettes"].append(cassette)
+        first_case_samples.append(sample)
 
-        first_case_details = {
-            "id": first_case_db.id,
-            "case_code": first_case_db.case_code,
-            "creation_date": first_case_db.creation_date,
-            "samples": first_case_samples,
-            "bank_count": first_case_db.bank_count,
-            "cassette_count": first_case_db.cassette_count,
-            "glass_count": first_case_db.glass_count,
-            "grossing_status": first_case_db.grossing_status,
-            "is_printed_cassette": first_case_db.is_printed_cassette,
-            "is_printed_glass": first_case_db.is_printed_glass,
-            "is_printed_qr": first_case_db.is_printed_qr,
-        }
+    first_case_details = {
+        "id": first_case_db.id,
+        "case_code": first_case_db.case_code,
+        "creation_date": first_case_db.creation_date,
+        "samples": first_case_samples,
+        "bank_count": first_case_db.bank_count,
+        "cassette_count": first_case_db.cassette_count,
+        "glass_count": first_case_db.glass_count,
+        "grossing_status": first_case_db.grossing_status,
+        "is_printed_cassette": first_case_db.is_printed_cassette,
+        "is_printed_glass": first_case_db.is_printed_glass,
+        "is_printed_qr": first_case_db.is_printed_qr,
+    }
 
     return {"all_cases": all_cases, "first_case_details": first_case_details}
 
@@ -482,6 +474,7 @@ async def update_case_parameters(
 
         db_case.case_code = new_case_code
         db.add(db_case)
+        await sync_case_worklist(db, [db_case.id])
 
     db.add(case_parameters_db)
     await db.commit()
@@ -718,6 +711,8 @@ async def update_case_code_suffix(db: AsyncSession, case_id: str, new_suffix: st
         )
 
     db_case.case_code = new_full_case_code
+    await ensure_case_number_reserved(db, current_year_short, int(new_suffix))
+    await sync_case_worklist(db, [db_case.id])
     await db.commit()
     await db.refresh(db_case)
 
@@ -1216,110 +1211,7 @@ async def get_current_cases_glass_details(
     """
     
     case_id_query = case_id
-    cases_fu_subquery = (
-        select(
-            db_models.Case.id,
-            db_models.Case.case_code,
-            db_models.Case.creation_date,
-            db_models.Case.patient_id,
-            db_models.Case.grossing_status,
-            db_models.Case.bank_count,
-            db_models.Case.cassette_count,
-            db_models.Case.glass_count,
-            db_models.Case.pathohistological_conclusion,
-            db_models.Case.microdescription,
-            db_models.Case.is_printed_cassette,
-            db_models.Case.is_printed_glass,
-            db_models.Case.is_printed_qr,
-            db_models.Case.case_owner,
-            literal_column("1").label("sort_priority"),
-        ).where(
-            and_(
-                func.substr(db_models.Case.case_code, 1, 1).in_(["F", "U"]),
-                db_models.Case.grossing_status
-                != db_models.Grossing_status.COMPLETED.value,
-            )
-        )
-    ).subquery("cases_fu")
-
-    scanned_glass_exists_clause = (
-        select(1)
-        .select_from(db_models.Sample)
-        .join(db_models.Cassette, db_models.Sample.id == db_models.Cassette.sample_id)
-        .join(db_models.Glass, db_models.Cassette.id == db_models.Glass.cassette_id)
-        .where(db_models.Sample.case_id == db_models.Case.id)
-        .exists()
-    )
-
-    cases_s_subquery = (
-        select(
-            db_models.Case.id,
-            db_models.Case.case_code,
-            db_models.Case.creation_date,
-            db_models.Case.patient_id,
-            db_models.Case.grossing_status,
-            db_models.Case.bank_count,
-            db_models.Case.cassette_count,
-            db_models.Case.glass_count,
-            db_models.Case.pathohistological_conclusion,
-            db_models.Case.microdescription,
-            db_models.Case.is_printed_cassette,
-            db_models.Case.is_printed_glass,
-            db_models.Case.is_printed_qr,
-            db_models.Case.case_owner,
-            literal_column("2").label("sort_priority"),
-        ).where(
-            and_(
-                func.substr(db_models.Case.case_code, 1, 1) == "S",
-                db_models.Case.grossing_status
-                != db_models.Grossing_status.COMPLETED.value,
-                scanned_glass_exists_clause,
-            )
-        )
-    ).subquery("cases_s")
-
-    combined_query_for_data = select(
-        cases_fu_subquery.c.id,
-        cases_fu_subquery.c.case_code,
-        cases_fu_subquery.c.creation_date,
-        cases_fu_subquery.c.patient_id,
-        cases_fu_subquery.c.grossing_status,
-        cases_fu_subquery.c.bank_count,
-        cases_fu_subquery.c.cassette_count,
-        cases_fu_subquery.c.glass_count,
-        cases_fu_subquery.c.pathohistological_conclusion,
-        cases_fu_subquery.c.microdescription,
-        cases_fu_subquery.c.sort_priority,
-        cases_fu_subquery.c.is_printed_cassette,
-        cases_fu_subquery.c.is_printed_glass,
-        cases_fu_subquery.c.is_printed_qr,
-        cases_fu_subquery.c.case_owner,
-    ).union_all(
-        select(
-            cases_s_subquery.c.id,
-            cases_s_subquery.c.case_code,
-            cases_s_subquery.c.creation_date,
-            cases_s_subquery.c.patient_id,
-            cases_s_subquery.c.grossing_status,
-            cases_s_subquery.c.bank_count,
-            cases_s_subquery.c.cassette_count,
-            cases_s_subquery.c.glass_count,
-            cases_s_subquery.c.pathohistological_conclusion,
-            cases_s_subquery.c.microdescription,
-            cases_s_subquery.c.sort_priority,
-            cases_s_subquery.c.is_printed_cassette,
-            cases_s_subquery.c.is_printed_glass,
-            cases_s_subquery.c.is_printed_qr,
-            cases_s_subquery.c.case_owner,
-        )
-    )
-
-    final_ordered_query = combined_query_for_data.order_by(
-        combined_query_for_data.c.sort_priority.asc(),
-        combined_query_for_data.c.creation_date.desc(),
-    )
-
-    paginated_results = await db.execute(final_ordered_query.offset(skip).limit(limit))
+    paginated_results = await db.execute(current_cases_query().offset(skip).limit(limit))
     all_current_cases_raw = paginated_results.all()
 
     current_cases_list: List[CaseModelScheema] = []
@@ -2527,6 +2419,7 @@ async def change_case_status_after_signing(
         )
 
     case_db.grossing_status = db_models.Grossing_status.IN_SIGNING_STATUS
+    await sync_case_worklist(db, [case_db.id])
 
     await db.commit()
     await db.refresh(case_db)
@@ -2974,110 +2867,7 @@ async def get_current_case_details_for_excision_page(
     Используется для вкладки "Excision" (удаление/макроописание) на странице врача.
     """
     case_id_query = case_id
-    cases_fu_subquery = (
-        select(
-            db_models.Case.id,
-            db_models.Case.case_code,
-            db_models.Case.creation_date,
-            db_models.Case.patient_id,
-            db_models.Case.grossing_status,
-            db_models.Case.bank_count,
-            db_models.Case.cassette_count,
-            db_models.Case.glass_count,
-            db_models.Case.pathohistological_conclusion,
-            db_models.Case.microdescription,
-            db_models.Case.is_printed_cassette,
-            db_models.Case.is_printed_glass,
-            db_models.Case.is_printed_qr,
-            db_models.Case.case_owner,
-            literal_column("1").label("sort_priority"),
-        ).where(
-            and_(
-                func.substr(db_models.Case.case_code, 1, 1).in_(["F", "U"]),
-                db_models.Case.grossing_status
-                != db_models.Grossing_status.COMPLETED.value,
-            )
-        )
-    ).subquery("cases_fu")
-
-    scanned_glass_exists_clause = (
-        select(1)
-        .select_from(db_models.Sample)
-        .join(db_models.Cassette, db_models.Sample.id == db_models.Cassette.sample_id)
-        .join(db_models.Glass, db_models.Cassette.id == db_models.Glass.cassette_id)
-        .where(db_models.Sample.case_id == db_models.Case.id)
-        .exists()
-    )
-
-    cases_s_subquery = (
-        select(
-            db_models.Case.id,
-            db_models.Case.case_code,
-            db_models.Case.creation_date,
-            db_models.Case.patient_id,
-            db_models.Case.grossing_status,
-            db_models.Case.bank_count,
-            db_models.Case.cassette_count,
-            db_models.Case.glass_count,
-            db_models.Case.pathohistological_conclusion,
-            db_models.Case.microdescription,
-            db_models.Case.is_printed_cassette,
-            db_models.Case.is_printed_glass,
-            db_models.Case.is_printed_qr,
-            db_models.Case.case_owner,
-            literal_column("2").label("sort_priority"),
-        ).where(
-            and_(
-                func.substr(db_models.Case.case_code, 1, 1) == "S",
-                db_models.Case.grossing_status
-                != db_models.Grossing_status.COMPLETED.value,
-                scanned_glass_exists_clause,
-            )
-        )
-    ).subquery("cases_s")
-
-    combined_query_for_data = select(
-        cases_fu_subquery.c.id,
-        cases_fu_subquery.c.case_code,
-        cases_fu_subquery.c.creation_date,
-        cases_fu_subquery.c.patient_id,
-        cases_fu_subquery.c.grossing_status,
-        cases_fu_subquery.c.bank_count,
-        cases_fu_subquery.c.cassette_count,
-        cases_fu_subquery.c.glass_count,
-        cases_fu_subquery.c.pathohistological_conclusion,
-        cases_fu_subquery.c.microdescription,
-        cases_fu_subquery.c.is_printed_cassette,
-        cases_fu_subquery.c.is_printed_glass,
-        cases_fu_subquery.c.is_printed_qr,
-        cases_fu_subquery.c.sort_priority,
-        cases_fu_subquery.c.case_owner,
-    ).union_all(
-        select(
-            cases_s_subquery.c.id,
-            cases_s_subquery.c.case_code,
-            cases_s_subquery.c.creation_date,
-            cases_s_subquery.c.patient_id,
-            cases_s_subquery.c.grossing_status,
-            cases_s_subquery.c.bank_count,
-            cases_s_subquery.c.cassette_count,
-            cases_s_subquery.c.glass_count,
-            cases_s_subquery.c.pathohistological_conclusion,
-            cases_s_subquery.c.microdescription,
-            cases_s_subquery.c.is_printed_cassette,
-            cases_s_subquery.c.is_printed_glass,
-            cases_s_subquery.c.is_printed_qr,
-            cases_s_subquery.c.sort_priority,
-            cases_s_subquery.c.case_owner,
-        )
-    )
-
-    final_ordered_query = combined_query_for_data.order_by(
-        combined_query_for_data.c.sort_priority.asc(),
-        combined_query_for_data.c.creation_date.desc(),
-    )
-
-    paginated_results = await db.execute(final_ordered_query.offset(skip).limit(limit))
+    paginated_results = await db.execute(current_cases_query().offset(skip).limit(limit))
     all_current_cases_raw = paginated_results.all()
 
     current_cases_list: List[CaseModelScheema] = []
@@ -3208,114 +2998,7 @@ async def get_current_cases_report_page_data(
     - Все стёкла последнего кейса (для выбора, какие прикрепить).
     """
     case_id_query = case_id
-    cases_fu_subquery = (
-        select(
-            db_models.Case.id,
-            db_models.Case.case_code,
-            db_models.Case.creation_date,
-            db_models.Case.patient_id,
-            db_models.Case.grossing_status,
-            db_models.Case.bank_count,
-            db_models.Case.cassette_count,
-            db_models.Case.glass_count,
-            db_models.Case.pathohistological_conclusion,
-            db_models.Case.microdescription,
-            db_models.Case.case_owner,
-            db_models.Case.is_printed_cassette,
-            db_models.Case.is_printed_glass,
-            db_models.Case.is_printed_qr,
-            db_models.Case.case_owner,
-            literal_column("1").label("sort_priority"),
-        ).where(
-            and_(
-                func.substr(db_models.Case.case_code, 1, 1).in_(["F", "U"]),
-                db_models.Case.grossing_status
-                != db_models.Grossing_status.COMPLETED.value,
-            )
-        )
-    ).subquery("cases_fu")
-
-    scanned_glass_exists_clause = (
-        select(1)
-        .select_from(db_models.Sample)
-        .join(db_models.Cassette, db_models.Sample.id == db_models.Cassette.sample_id)
-        .join(db_models.Glass, db_models.Cassette.id == db_models.Glass.cassette_id)
-        .where(db_models.Sample.case_id == db_models.Case.id)
-        .exists()
-    )
-
-    cases_s_subquery = (
-        select(
-            db_models.Case.id,
-            db_models.Case.case_code,
-            db_models.Case.creation_date,
-            db_models.Case.patient_id,
-            db_models.Case.grossing_status,
-            db_models.Case.bank_count,
-            db_models.Case.cassette_count,
-            db_models.Case.glass_count,
-            db_models.Case.pathohistological_conclusion,
-            db_models.Case.microdescription,
-            db_models.Case.case_owner,
-            db_models.Case.is_printed_cassette,
-            db_models.Case.is_printed_glass,
-            db_models.Case.is_printed_qr,
-            db_models.Case.case_owner,
-            literal_column("2").label("sort_priority"),
-        ).where(
-            and_(
-                func.substr(db_models.Case.case_code, 1, 1) == "S",
-                db_models.Case.grossing_status
-                != db_models.Grossing_status.COMPLETED.value,
-                scanned_glass_exists_clause,
-            )
-        )
-    ).subquery("cases_s")
-
-    combined_query_for_data = select(
-        cases_fu_subquery.c.id,
-        cases_fu_subquery.c.case_code,
-        cases_fu_subquery.c.creation_date,
-        cases_fu_subquery.c.patient_id,
-        cases_fu_subquery.c.grossing_status,
-        cases_fu_subquery.c.bank_count,
-        cases_fu_subquery.c.cassette_count,
-        cases_fu_subquery.c.glass_count,
-        cases_fu_subquery.c.pathohistological_conclusion,
-        cases_fu_subquery.c.microdescription,
-        cases_fu_subquery.c.sort_priority,
-        cases_fu_subquery.c.case_owner,
-        cases_fu_subquery.c.is_printed_cassette,
-        cases_fu_subquery.c.is_printed_glass,
-        cases_fu_subquery.c.is_printed_qr,
-        cases_fu_subquery.c.case_owner,
-    ).union_all(
-        select(
-            cases_s_subquery.c.id,
-            cases_s_subquery.c.case_code,
-            cases_s_subquery.c.creation_date,
-            cases_s_subquery.c.patient_id,
-            cases_s_subquery.c.grossing_status,
-            cases_s_subquery.c.bank_count,
-            cases_s_subquery.c.cassette_count,
-            cases_s_subquery.c.glass_count,
-            cases_s_subquery.c.pathohistological_conclusion,
-            cases_s_subquery.c.microdescription,
-            cases_s_subquery.c.sort_priority,
-            cases_s_subquery.c.case_owner,
-            cases_s_subquery.c.is_printed_cassette,
-            cases_s_subquery.c.is_printed_glass,
-            cases_s_subquery.c.is_printed_qr,
-            cases_s_subquery.c.case_owner,
-        )
-    )
-
-    final_ordered_query = combined_query_for_data.order_by(
-        combined_query_for_data.c.sort_priority.asc(),
-        combined_query_for_data.c.creation_date.desc(),
-    )
-
-    paginated_results = await db.execute(final_ordered_query.offset(skip).limit(limit))
+    paginated_results = await db.execute(current_cases_query().offset(skip).limit(limit))
     all_current_cases_raw = paginated_results.all()
 
     current_cases_list: List[CaseWithOwner] = []
@@ -3502,110 +3185,7 @@ async def get_current_cases_with_directions(
     Включает ссылки на файлы направлений для первого кейса.
     """
     case_id_query = case_id
-    cases_fu_subquery = (
-        select(
-            db_models.Case.id,
-            db_models.Case.case_code,
-            db_models.Case.creation_date,
-            db_models.Case.patient_id,
-            db_models.Case.grossing_status,
-            db_models.Case.bank_count,
-            db_models.Case.cassette_count,
-            db_models.Case.glass_count,
-            db_models.Case.pathohistological_conclusion,
-            db_models.Case.microdescription,
-            db_models.Case.is_printed_cassette,
-            db_models.Case.is_printed_glass,
-            db_models.Case.is_printed_qr,
-            db_models.Case.case_owner,
-            literal_column("1").label("sort_priority"),
-        ).where(
-            and_(
-                func.substr(db_models.Case.case_code, 1, 1).in_(["F", "U"]),
-                db_models.Case.grossing_status
-                != db_models.Grossing_status.COMPLETED.value,
-            )
-        )
-    ).subquery("cases_fu")
-
-    scanned_glass_exists_clause = (
-        select(1)
-        .select_from(db_models.Sample)
-        .join(db_models.Cassette, db_models.Sample.id == db_models.Cassette.sample_id)
-        .join(db_models.Glass, db_models.Cassette.id == db_models.Glass.cassette_id)
-        .where(db_models.Sample.case_id == db_models.Case.id)
-        .exists()
-    )
-
-    cases_s_subquery = (
-        select(
-            db_models.Case.id,
-            db_models.Case.case_code,
-            db_models.Case.creation_date,
-            db_models.Case.patient_id,
-            db_models.Case.grossing_status,
-            db_models.Case.bank_count,
-            db_models.Case.cassette_count,
-            db_models.Case.glass_count,
-            db_models.Case.pathohistological_conclusion,
-            db_models.Case.microdescription,
-            db_models.Case.is_printed_cassette,
-            db_models.Case.is_printed_glass,
-            db_models.Case.is_printed_qr,
-            db_models.Case.case_owner,
-            literal_column("2").label("sort_priority"),
-        ).where(
-            and_(
-                func.substr(db_models.Case.case_code, 1, 1) == "S",
-                db_models.Case.grossing_status
-                != db_models.Grossing_status.COMPLETED.value,
-                scanned_glass_exists_clause,
-            )
-        )
-    ).subquery("cases_s")
-
-    combined_query_for_data = select(
-        cases_fu_subquery.c.id,
-        cases_fu_subquery.c.case_code,
-        cases_fu_subquery.c.creation_date,
-        cases_fu_subquery.c.patient_id,
-        cases_fu_subquery.c.grossing_status,
-        cases_fu_subquery.c.bank_count,
-        cases_fu_subquery.c.cassette_count,
-        cases_fu_subquery.c.glass_count,
-        cases_fu_subquery.c.pathohistological_conclusion,
-        cases_fu_subquery.c.microdescription,
-        cases_fu_subquery.c.sort_priority,
-        cases_fu_subquery.c.is_printed_cassette,
-        cases_fu_subquery.c.is_printed_glass,
-        cases_fu_subquery.c.is_printed_qr,
-        cases_fu_subquery.c.case_owner,
-    ).union_all(
-        select(
-            cases_s_subquery.c.id,
-            cases_s_subquery.c.case_code,
-            cases_s_subquery.c.creation_date,
-            cases_s_subquery.c.patient_id,
-            cases_s_subquery.c.grossing_status,
-            cases_s_subquery.c.bank_count,
-            cases_s_subquery.c.cassette_count,
-            cases_s_subquery.c.glass_count,
-            cases_s_subquery.c.pathohistological_conclusion,
-            cases_s_subquery.c.microdescription,
-            cases_s_subquery.c.sort_priority,
-            cases_s_subquery.c.is_printed_cassette,
-            cases_s_subquery.c.is_printed_glass,
-            cases_s_subquery.c.is_printed_qr,
-            cases_s_subquery.c.case_owner,
-        )
-    )
-
-    final_ordered_query = combined_query_for_data.order_by(
-        combined_query_for_data.c.sort_priority.asc(),
-        combined_query_for_data.c.creation_date.desc(),
-    )
-
-    paginated_results = await db.execute(final_ordered_query.offset(skip).limit(limit))
+    paginated_results = await db.execute(current_cases_query().offset(skip).limit(limit))
     all_current_cases_raw = paginated_results.all()
 
     current_cases_list: List[CaseWithOwner] = []
@@ -3764,110 +3344,7 @@ async def get_current_cases_final_report_page_data(
       и его заключение (если есть). Если заключения нет, оно будет создано.
     - Все стёкла последнего кейса (для выбора, какие прикрепить).
     """
-    cases_fu_subquery = (
-        select(
-            db_models.Case.id,
-            db_models.Case.case_code,
-            db_models.Case.creation_date,
-            db_models.Case.patient_id,
-            db_models.Case.grossing_status,
-            db_models.Case.bank_count,
-            db_models.Case.cassette_count,
-            db_models.Case.glass_count,
-            db_models.Case.pathohistological_conclusion,
-            db_models.Case.microdescription,
-            db_models.Case.is_printed_cassette,
-            db_models.Case.is_printed_glass,
-            db_models.Case.is_printed_qr,
-            db_models.Case.case_owner,
-            literal_column("1").label("sort_priority"),
-        ).where(
-            and_(
-                func.substr(db_models.Case.case_code, 1, 1).in_(["F", "U"]),
-                db_models.Case.grossing_status
-                != db_models.Grossing_status.COMPLETED.value,
-            )
-        )
-    ).subquery("cases_fu")
-
-    scanned_glass_exists_clause = (
-        select(1)
-        .select_from(db_models.Sample)
-        .join(db_models.Cassette, db_models.Sample.id == db_models.Cassette.sample_id)
-        .join(db_models.Glass, db_models.Cassette.id == db_models.Glass.cassette_id)
-        .where(db_models.Sample.case_id == db_models.Case.id)
-        .exists()
-    )
-
-    cases_s_subquery = (
-        select(
-            db_models.Case.id,
-            db_models.Case.case_code,
-            db_models.Case.creation_date,
-            db_models.Case.patient_id,
-            db_models.Case.grossing_status,
-            db_models.Case.bank_count,
-            db_models.Case.cassette_count,
-            db_models.Case.glass_count,
-            db_models.Case.pathohistological_conclusion,
-            db_models.Case.microdescription,
-            db_models.Case.is_printed_cassette,
-            db_models.Case.is_printed_glass,
-            db_models.Case.is_printed_qr,
-            db_models.Case.case_owner,
-            literal_column("2").label("sort_priority"),
-        ).where(
-            and_(
-                func.substr(db_models.Case.case_code, 1, 1) == "S",
-                db_models.Case.grossing_status
-                != db_models.Grossing_status.COMPLETED.value,
-                scanned_glass_exists_clause,
-            )
-        )
-    ).subquery("cases_s")
-
-    combined_query_for_data = select(
-        cases_fu_subquery.c.id,
-        cases_fu_subquery.c.case_code,
-        cases_fu_subquery.c.creation_date,
-        cases_fu_subquery.c.patient_id,
-        cases_fu_subquery.c.grossing_status,
-        cases_fu_subquery.c.bank_count,
-        cases_fu_subquery.c.cassette_count,
-        cases_fu_subquery.c.glass_count,
-        cases_fu_subquery.c.pathohistological_conclusion,
-        cases_fu_subquery.c.microdescription,
-        cases_fu_subquery.c.is_printed_cassette,
-        cases_fu_subquery.c.is_printed_glass,
-        cases_fu_subquery.c.is_printed_qr,
-        cases_fu_subquery.c.sort_priority,
-        cases_fu_subquery.c.case_owner,
-    ).union_all(
-        select(
-            cases_s_subquery.c.id,
-            cases_s_subquery.c.case_code,
-            cases_s_subquery.c.creation_date,
-            cases_s_subquery.c.patient_id,
-            cases_s_subquery.c.grossing_status,
-            cases_s_subquery.c.bank_count,
-            cases_s_subquery.c.cassette_count,
-            cases_s_subquery.c.glass_count,
-            cases_s_subquery.c.pathohistological_conclusion,
-            cases_s_subquery.c.microdescription,
-            cases_s_subquery.c.is_printed_cassette,
-            cases_s_subquery.c.is_printed_glass,
-            cases_s_subquery.c.is_printed_qr,
-            cases_s_subquery.c.sort_priority,
-            cases_s_subquery.c.case_owner,
-        )
-    )
-
-    final_ordered_query = combined_query_for_data.order_by(
-        combined_query_for_data.c.sort_priority.asc(),
-        combined_query_for_data.c.creation_date.desc(),
-    )
-
-    paginated_results = await db.execute(final_ordered_query.offset(skip).limit(limit))
+    paginated_results = await db.execute(current_cases_query().offset(skip).limit(limit))
     all_current_cases_raw = paginated_results.all()
 
     current_cases_list: List[CaseModelScheema] = []
@@ -4036,6 +3513,7 @@ async def take_case_ownership(
 
     case_db.case_owner = doctor_id
     case_db.grossing_status = db_models.Grossing_status.PROCESSING
+    await sync_case_worklist(db, [case_db.id])
     await db.commit()
     await db.refresh(case_db)
 
@@ -4138,6 +3616,7 @@ async def release_case_ownership(
 
     case_db.case_owner = None
     case_db.grossing_status = db_models.Grossing_status.CREATED
+    await sync_case_worklist(db, [case_db.id])
     await db.commit()
     await db.refresh(case_db)
 
@@ -4283,6 +3762,7 @@ async def close_case_service(
     case_to_close.closing_date = datetime.now()
 
     db.add(case_to_close)
+    await sync_case_worklist(db, [case_to_close.id])
     await db.commit()
     await db.refresh(case_to_close)
 
@@ -4325,6 +3805,7 @@ async def auto_close_case_service(
     case_db.closing_date = datetime.now()
 
     db.add(case_db)
+    await sync_case_worklist(db, [case_db.id])
     await db.commit()
     await db.refresh(case_db)
     logger.debug("Case closed")
@@ -4379,11 +3860,38 @@ async def get_case_owner(
 
 
 
+async def _print_case_labels(
+    printer_ip: str, labels: List[PrintLabel], request: Request
+) -> set:
+    """
+    Печатает метки кейса одним заданием и возвращает uuid напечатанных.
+
+    Если не напечаталась ни одна метка — ошибка, как при печати одной метки.
+    """
+    if not labels:
+        return set()
+    jobs = await print_label_groups({printer_ip: labels}, request)
+    job = jobs[printer_ip]
+    if job.failed:
+        logger.warning(
+            f"Не напечатано {len(job.failed)} из {len(labels)} меток на {printer_ip}: "
+            f"{[r.uuid for r in job.failed]}"
+        )
+    if not job.printed:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=job.failed[0].error,
+        )
+    return set(job.printed)
+
+
 async def print_all_case_glasses(
     db: AsyncSession, case_id: str, printing: bool, data: GeneralPrinting, request: Request
 ) -> Optional[Dict[str, Any]]:
     """
-    Печатает все стёкла кейса, используя жадную загрузку для всех уровней.
+    Печатает все стёкла кейса одним пакетным заданием на принтер.
+    Статус печати ставится только напечатанным стёклам, статусы семплов
+    и кейса пересчитываются по счётчикам.
     Возвращает полную информацию о кейсе в виде Pydantic-схемы.
     """
     case_result = await db.execute(
@@ -4398,46 +3906,39 @@ async def print_all_case_glasses(
     case_db = case_result.scalar_one_or_none()
     if not case_db:
         return None
-    case_db.is_printed_glass = printing
 
-    glasses_to_update: List[db_models.Glass] = []
+    device = await get_printing_device_by_device_class(db=db, device_class="GlassPrinter")
+    printer_ip = data.printer_ip or (device.ip_address if device else None)
+    if not printer_ip:
+        raise HTTPException(status_code=404, detail="Принтер для стекол не найден")
+    model_id = data.number_models_id if data.number_models_id else "8"
+    clinic_name = data.clinic_name if data.clinic_name else "FF"
 
+    labels: List[PrintLabel] = []
     for sample_db in case_db.samples:
-
-        sample_db.is_printed_glass = printing
-
         for cassette_db in sample_db.cassette:
             for glass_db in cassette_db.glass:
-                glasses_to_update.append(glass_db)
-
-    for glass_db in glasses_to_update:
-        glass_data = GlassPrinting(
-            printer_ip=data.printer_ip,
-            model_id=data.number_models_id,
-            clinic_name=data.clinic_name,
-            hooper=data.hooper,
-            glass_id=glass_db.id,
-            printing=printing
-        )
-        await print_glass_data(db=db, data=glass_data, request=request)
-        glass_db.is_printed = printing
-
-    # def sort_cassettes(cassette: db_models.Cassette):
-    #     match = re.match(r"([A-Z]+)(\d+)", cassette.cassette_number)
-    #     if match:
-    #         letter_part = match.group(1)
-    #         number_part = int(match.group(2))
-    #         return (letter_part, number_part)
-    #     return (cassette.cassette_number, 0)
-
-    # case_schema = CaseDetailsResponse.model_validate(case_db)
+                content = glass_label_content(
+                    clinic_name,
+                    case_db.case_code,
+                    sample_db.sample_number,
+                    cassette_db.cassette_number,
+                    glass_db.glass_number,
+                    db_models.StainingType(glass_db.staining).abbr(),
+                    case_db.patient_id,
+                )
+                labels.append(PrintLabel(model_id=model_id, content=content, uuid=glass_db.id))
 
-    # for sample_schema in case_schema.samples:
-    #     sorted_cassettes_schemas = sorted(sample_schema.cassettes, key=sort_cassettes)
-    #     sample_schema.cassettes = sorted_cassettes_schemas
+    printed = await _print_case_labels(printer_ip, labels, request)
 
-    #     for cassette_schema in sample_schema.cassettes:
-    #         cassette_schema.glasses.sort(key=lambda glass_s: glass_s.glass_number)
+    for sample_db in case_db.samples:
+        for cassette_db in sample_db.cassette:
+            for glass_db in cassette_db.glass:
+                if glass_db.id in printed:
+                    glass_db.is_printed = printing
+    await refresh_rollups(
+        db, sample_ids=[sample_db.id for sample_db in case_db.samples], case_ids=[case_db.id]
+    )
 
     await db.commit()
     await db.refresh(case_db)
@@ -4451,7 +3952,9 @@ async def print_all_case_cassette(
     db: AsyncSession, case_id: str, printing: bool, data: GeneralPrinting, request: Request
 ) -> Optional[Dict[str, Any]]:
     """
-    Печатает все кассеты кейса, используя жадную загрузку для всех уровней.
+    Печатает все кассеты кейса одним пакетным заданием на принтер.
+    Статус печати ставится только напечатанным кассетам, статусы семплов
+    и кейса пересчитываются по счётчикам.
     Возвращает полную информацию о кейсе в виде Pydantic-схемы.
     """
     case_result = await db.execute(
@@ -4466,23 +3969,44 @@ async def print_all_case_cassette(
     case_db = case_result.scalar_one_or_none()
     if not case_db:
         return None
-    case_db.is_printed_cassette = printing
-    cassettes_to_update = []
-    for sample_db in case_db.samples:
-        sample_db.is_printed_cassette = printing
-        cassettes_to_update = list(sample_db.cassette) if sample_db.cassette else []
-
-        for cassette_db in cassettes_to_update:
-            cassette_data = CassettePrinting(
-            printer_ip=data.printer_ip,
-            number_models_id=data.number_models_id,
-            clinic_name=data.clinic_name,
-            hooper=data.hooper,
-            cassete_id=cassette_db.id,
-            printing=printing
-        )
-            await print_cassette_data(db=db, data=cassette_data, request=request)
+
+    cassettes = [
+        (sample_db, cassette_db)
+        for sample_db in case_db.samples
+        for cassette_db in sample_db.cassette
+    ]
+    device = await get_printing_device_by_device_class(db=db, device_class="CassetPrinter")
+    if device:
+        printer_ip = data.printer_ip if data.printer_ip else device.ip_address
+        model_id = data.number_models_id if data.number_models_id else "8"
+        clinic_name = data.clinic_name if data.clinic_name else "FF"
+        hooper = data.hooper if data.hooper else "?"
+        labels = [
+            PrintLabel(
+                model_id=model_id,
+                content=cassette_label_content(
+                    clinic_name,
+                    case_db.case_code,
+                    sample_db.sample_number,
+                    cassette_db.cassette_number,
+                    hooper,
+                    case_db.patient_id,
+                ),
+                uuid=cassette_db.id,
+            )
+            for sample_db, cassette_db in cassettes
+        ]
+        printed = await _print_case_labels(printer_ip, labels, request)
+    else:
+        # Без зарегистрированного принтера кассеты только отмечаются
+        printed = {cassette_db.id for _, cassette_db in cassettes}
+
+    for _, cassette_db in cassettes:
+        if cassette_db.id in printed:
             cassette_db.is_printed = printing
+    await refresh_rollups(
+        db, sample_ids=[sample_db.id for sample_db in case_db.samples], case_ids=[case_db.id]
+    )
 
     await db.commit()
     await db.refresh(case_db)
@@ -4521,163 +4045,26 @@ async def print_case_qr(
 # --- Вспомогательные функции для обновления статусов ---
 
 
-async def _update_sample_glass_status(db: AsyncSession, sample: db_models.Sample):
-    """
-    Обновляет is_printed_glass для Sample на основе статусов всех его Glass.
-    Статус True, если ВСЕ стекла напечатаны. False, если хотя бы одно не напечатано.
-    """
-    all_glasses_in_sample_result = await db.execute(
-        select(db_models.Glass).where(
-            db_models.Glass.cassette.has(db_models.Cassette.sample_id == sample.id)
-        )
-    )
-    all_glasses_in_sample = all_glasses_in_sample_result.scalars().all()
-
-    new_sample_glass_status = (
-        all(g.is_printed for g in all_glasses_in_sample)
-        if all_glasses_in_sample
-        else True
-    )
-
-    if sample.is_printed_glass != new_sample_glass_status:
-        sample.is_printed_glass = new_sample_glass_status
-        db.add(sample)
-
-
-async def _update_sample_cassette_status(db: AsyncSession, sample: db_models.Sample):
-    """
-    Обновляет is_printed_cassette для Sample на основе статусов всех его Cassette.
-    Статус True, если ВСЕ кассеты напечатаны. False, если хотя бы одна не напечатана.
-    """
-    all_cassettes_in_sample_result = await db.execute(
-        select(db_models.Cassette).where(db_models.Cassette.sample_id == sample.id)
-    )
-    all_cassettes_in_sample = all_cassettes_in_sample_result.scalars().all()
-
-    new_sample_cassette_status = (
-        all(c.is_printed for c in all_cassettes_in_sample)
-        if all_cassettes_in_sample
-        else True
-    )
-
-    if sample.is_printed_cassette != new_sample_cassette_status:
-        sample.is_printed_cassette = new_sample_cassette_status
-        db.add(sample)
-
-
-async def _update_case_glass_status(db: AsyncSession, case: db_models.Case):
-    """
-    Обновляет is_printed_glass для Case на основе is_printed_glass статусов всех его Sample.
-    Статус True, если is_printed_glass всех семплов True. False, если хотя бы у одного False.
-    """
-    all_samples_in_case_result = await db.execute(
-        select(db_models.Sample).where(db_models.Sample.case_id == case.id)
-    )
-    all_samples_in_case = all_samples_in_case_result.scalars().all()
-
-    new_case_glass_status = (
-        all(s.is_printed_glass for s in all_samples_in_case)
-        if all_samples_in_case
-        else True
-    )
-
-    if case.is_printed_glass != new_case_glass_status:
-        case.is_printed_glass = new_case_glass_status
-        db.add(case)
-
-
-async def _update_case_cassette_status(db: AsyncSession, case: db_models.Case):
-    """
-    Обновляет is_printed_cassette для Case на основе is_printed_cassette статусов всех его Sample.
-    Статус True, если is_printed_cassette всех семплов True. False, если хотя бы у одного False.
-    """
-    all_samples_in_case_result = await db.execute(
-        select(db_models.Sample).where(db_models.Sample.case_id == case.id)
-    )
-    all_samples_in_case = all_samples_in_case_result.scalars().all()
-
-    new_case_cassette_status = (
-        all(s.is_printed_cassette for s in all_samples_in_case)
-        if all_samples_in_case
-        else True
-    )
-
-    if case.is_printed_cassette != new_case_cassette_status:
-        case.is_printed_cassette = new_case_cassette_status
-        db.add(case)
-
-
 async def _update_ancestor_statuses_from_glass(
     db: AsyncSession, glass: db_models.Glass
 ):
     """
-    Основная функция, вызываемая при изменении статуса `is_printed` у Glass.
-    Запускает цепочку обновлений вверх по иерархии: Glass -> Cassette -> Sample -> Case.
+    Вызывается при изменении стекла (печать, скан, создание).
+    Пересчитывает счётчики и статусы семпла и кейса стекла и коммитит.
     """
-
-    cassette = await db.get(db_models.Cassette, glass.cassette_id)
-    if not cassette:
-        return
-
-    # all_glasses_in_cassette_result = await db.execute(
-    #     select(db_models.Glass).where(db_models.Glass.cassette_id == cassette.id)
-    # )
-    # all_glasses_in_cassette = all_glasses_in_cassette_result.scalars().all()
-
-    # new_cassette_is_printed_status = all(g.is_printed for g in all_glasses_in_cassette) if all_glasses_in_cassette else True
-
-    # if cassette.is_printed != new_cassette_is_printed_status:
-    #     cassette.is_printed = new_cassette_is_printed_status
-    #     db.add(cassette)
-
-    sample = await db.get(db_models.Sample, cassette.sample_id)
-    if not sample:
-        return
-
-    await _update_sample_glass_status(db, sample)
-
-    # await _update_sample_cassette_status(db, sample)
-
-    case = await db.get(db_models.Case, sample.case_id)
-    if not case:
-        return
-
-    await _update_case_glass_status(db, case)
-
-    # await _update_case_cassette_status(db, case)
-
+    await refresh_rollups(db, cassette_ids=[glass.cassette_id])
     await db.commit()
-    await db.refresh(glass)
-    await db.refresh(cassette)
-    await db.refresh(sample)
-    await db.refresh(case)
 
 
 async def _update_ancestor_statuses_from_cassette(
     db: AsyncSession, cassette: db_models.Cassette
 ):
     """
-    Основная функция, вызываемая при изменении статуса `is_printed` у Cassette.
-    Запускает цепочку обновлений вверх по иерархии: Cassette -> Sample -> Case.
+    Вызывается при изменении кассеты (печать, создание).
+    Пересчитывает счётчики и статусы семпла и кейса кассеты и коммитит.
     """
-
-    sample = await db.get(db_models.Sample, cassette.sample_id)
-    if not sample:
-        return
-
-    await _update_sample_cassette_status(db, sample)
-
-    case = await db.get(db_models.Case, sample.case_id)
-    if not case:
-
-        return
-
-    await _update_case_cassette_status(db, case)
-
+    await refresh_rollups(db, sample_ids=[cassette.sample_id])
     await db.commit()
-    await db.refresh(cassette)
-    await db.refresh(sample)
-    await db.refresh(case)
 
 
 async def print_case_QR_data(
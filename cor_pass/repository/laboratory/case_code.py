@@ -0,0 +1,78 @@
+"""
+Выдача порядковых номеров для кодов кейсов.
+
+Номер уникален в пределах года (код: срочность, год, тип материала,
+5 цифр). Счётчик хранится в case_code_sequences и сдвигается одним
+UPDATE ... RETURNING: строка года блокируется до конца транзакции, поэтому
+параллельные регистрации получают непересекающиеся номера, а выдача не
+зависит от количества уже созданных кейсов.
+"""
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cor_pass.database import models as db_models
+
+
+async def _max_existing_number(db: AsyncSession, year_short: str) -> int:
+    """Максимальный номер среди существующих кодов года — начальное значение нового счётчика."""
+    result = await db.execute(
+        select(db_models.Case.case_code).where(
+            func.length(db_models.Case.case_code) == 9,
+            func.substr(db_models.Case.case_code, 2, 2) == year_short,
+        )
+    )
+    numbers = [int(code[4:]) for code in result.scalars().all() if code[4:].isdigit()]
+    return max(numbers, default=0)
+
+
+def _insert(db: AsyncSession):
+    dialect = db.get_bind().dialect.name
+    return (postgresql if dialect == "postgresql" else sqlite).insert(db_models.CaseCodeSequence)
+
+
+async def reserve_case_numbers(db: AsyncSession, year_short: str, count: int = 1) -> int:
+    """
+    Резервирует count подряд идущих номеров года и возвращает первый из них.
+
+    Номера принадлежат вызывающей транзакции: при откате счётчик тоже откатывается.
+    """
+    sequence = db_models.CaseCodeSequence
+    last_value = (
+        await db.execute(
+            update(sequence)
+            .where(sequence.scope == year_short)
+            .values(last_value=sequence.last_value + count)
+            .returning(sequence.last_value)
+        )
+    ).scalar_one_or_none()
+
+    if last_value is None:
+        # Первый кейс года (или счётчик ещё не заведён) — стартуем с уже выданных номеров
+        seed = await _max_existing_number(db, year_short)
+        stmt = _insert(db).values(scope=year_short, last_value=seed + count)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[sequence.scope],
+            set_={"last_value": sequence.last_value + count},
+        ).returning(sequence.last_value)
+        last_value = (await db.execute(stmt)).scalar_one()
+
+    return last_value - count + 1
+
+
+async def ensure_case_number_reserved(db: AsyncSession, year_short: str, number: int) -> None:
+    """Сдвигает счётчик года так, чтобы вручную заданный номер больше не выдавался."""
+    sequence = db_models.CaseCodeSequence
+    await reserve_case_numbers(db, year_short, 0)
+    await db.execute(
+        update(sequence)
+        .where(sequence.scope == year_short)
+        .values(
+            last_value=case(
+                (sequence.last_value < number, number),
+                else_=sequence.last_value,
+            )
+        )
+    )
+
@@ -0,0 +1,130 @@
+"""
+Проекция кейсов для списков "Текущие кейсы".
+
+Для каждого кейса в case_worklist хранится тип (первая буква кода),
+статус, наличие стекол, дата создания и приоритет в списке: 1 — срочные
+F/U, 2 — S, у которых уже есть стекла; NULL — кейс в список не попадает.
+Строка пересчитывается из cases функцией sync_case_worklist там же, где
+меняются код, статус или счётчики кейса, в той же транзакции. Списки
+читаются одним запросом по индексу (sort_priority, creation_date) вместо
+UNION ALL с фильтрами по substr(case_code).
+"""
+
+from typing import Iterable
+
+from sqlalchemy import and_, case, delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+from cor_pass.database import models as db_models
+
+
+REBUILD_BATCH_SIZE = 1000
+
+PRIORITY_URGENT = 1
+PRIORITY_STANDARD = 2
+
+
+def _worklist_columns():
+    """Колонки проекции, вычисленные по строке cases."""
+    db_case = db_models.Case
+    case_type = func.substr(db_case.case_code, 1, 1)
+    is_open = db_case.grossing_status != db_models.Grossing_status.COMPLETED
+    has_glass = func.coalesce(db_case.glass_count, 0) > 0
+    sort_priority = case(
+        (and_(is_open, case_type.in_(["F", "U"])), PRIORITY_URGENT),
+        (and_(is_open, case_type == "S", has_glass), PRIORITY_STANDARD),
+        else_=None,
+    )
+    return {
+        "case_id": db_case.id,
+        "case_type": case_type,
+        "grossing_status": db_case.grossing_status,
+        "has_glass": has_glass,
+        "creation_date": db_case.creation_date,
+        "sort_priority": sort_priority,
+    }
+
+
+def _insert(db: AsyncSession):
+    dialect = db.get_bind().dialect.name
+    return (postgresql if dialect == "postgresql" else sqlite).insert(db_models.CaseWorklist)
+
+
+async def _upsert(db: AsyncSession, condition) -> None:
+    columns = _worklist_columns()
+    stmt = _insert(db).from_select(
+        list(columns), select(*columns.values()).where(condition)
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[db_models.CaseWorklist.case_id],
+        set_={name: stmt.excluded[name] for name in columns if name != "case_id"},
+    )
+    await db.execute(stmt)
+
+
+async def sync_case_worklist(db: AsyncSession, case_ids: Iterable[str]) -> None:
+    """Пересчитывает строки проекции для указанных кейсов. Не коммитит."""
+    case_ids = list(case_ids)
+    if case_ids:
+        await _upsert(db, db_models.Case.id.in_(case_ids))
+
+
+async def rebuild_case_worklist(db: AsyncSession, batch_size: int = REBUILD_BATCH_SIZE) -> int:
+    """Пересобирает проекцию для всех кейсов пачками; возвращает число кейсов."""
+    worklist = db_models.CaseWorklist
+    await db.execute(
+        delete(worklist).where(worklist.case_id.not_in(select(db_models.Case.id)))
+    )
+    total = 0
+    last_id = ""
+    while True:
+        ids = list(
+            (
+                await db.scalars(
+                    select(db_models.Case.id)
+                    .where(db_models.Case.id > last_id)
+                    .order_by(db_models.Case.id)
+                    .limit(batch_size)
+                )
+            ).all()
+        )
+        if not ids:
+            break
+        await _upsert(db, db_models.Case.id.in_(ids))
+        await db.commit()
+        total += len(ids)
+        last_id = ids[-1]
+    await db.commit()
+    return total
+
+
+def current_cases_query() -> Select:
+    """
+    Текущие кейсы: сначала F/U, затем S со стеклами, внутри — новые первыми.
+    Колонки совпадают с прежним UNION ALL (включая sort_priority).
+    """
+    db_case, worklist = db_models.Case, db_models.CaseWorklist
+    return (
+        select(
+            db_case.id,
+            db_case.case_code,
+            db_case.creation_date,
+            db_case.patient_id,
+            db_case.grossing_status,
+            db_case.bank_count,
+            db_case.cassette_count,
+            db_case.glass_count,
+            db_case.pathohistological_conclusion,
+            db_case.microdescription,
+            db_case.is_printed_cassette,
+            db_case.is_printed_glass,
+            db_case.is_printed_qr,
+            db_case.case_owner,
+            worklist.sort_priority,
+        )
+        .join(worklist, worklist.case_id == db_case.id)
+        .where(worklist.sort_priority.is_not(None))
+        .order_by(worklist.sort_priority.asc(), worklist.creation_date.desc())
+    )
@@ -14,7 +14,8 @@ from typing import Any, Dict, List, Optional
 from sqlalchemy.orm import selectinload
 from cor_pass.database import models as db_models
 from cor_pass.repository.laboratory import case as repository_cases
-from cor_pass.services.laboratory.glass_and_cassette_printing import print_labels
+from cor_pass.repository.laboratory.status_rollup import refresh_rollups
+from cor_pass.services.laboratory.glass_and_cassette_printing import cassette_label_content, print_labels
 
 
 async def get_cassette(
@@ -85,10 +86,9 @@ async def create_cassette(
         db_cassette.glass_count += 1
         await db.commit()
         await db.refresh(db_glass)
-        await repository_cases._update_ancestor_statuses_from_glass(
-            db=db, glass=db_glass
-        )
 
+    await refresh_rollups(db, sample_ids=[db_sample.id])
+    await db.commit()
     await db.refresh(db_sample)
     await db.refresh(db_case)
 
@@ -101,10 +101,6 @@ async def create_cassette(
             key=lambda glass_schema: glass_schema.glass_number,
         )
         created_cassettes_with_glasses.append(cassette_schema.model_dump())
-
-        await repository_cases._update_ancestor_statuses_from_cassette(
-            db=db, cassette=cassette_db
-        )
     return created_cassettes_with_glasses
 
 
@@ -153,9 +149,6 @@ async def delete_cassettes(
             db_case = await db.get(db_models.Case, db_sample.case_id)
 
             num_glasses_to_decrement = len(db_cassette.glass)
-            await repository_cases._update_ancestor_statuses_from_cassette(
-                db=db, cassette=db_cassette
-            )
 
             await db.delete(db_cassette)
             deleted_count += 1
@@ -166,6 +159,7 @@ async def delete_cassettes(
             db_case.glass_count -= num_glasses_to_decrement
             db_case.cassette_count -= 1
 
+            await refresh_rollups(db, sample_ids=[db_sample.id])
             await db.commit()
 
             await db.refresh(db_sample)
@@ -262,12 +256,12 @@ async def print_cassette_data(
         case_code = db_cassette.case_code
         sample_number=db_cassette.sample_number
         cassette_number=db_cassette.cassette_number
-        glass_number="-"
-        staining="-"
         hooper=data.hooper if data.hooper else "?"
         patient_cor_id=db_cassette.patient_cor_id
             
-        content = f"{clinic_name}|{case_code}|{sample_number}|{cassette_number}|L{glass_number}|{staining}|{hooper}|{patient_cor_id}"
+        content = cassette_label_content(
+            clinic_name, case_code, sample_number, cassette_number, hooper, patient_cor_id
+        )
 
         label_to_print = PrintLabel(
             model_id=models_id, 
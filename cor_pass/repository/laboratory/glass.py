@@ -1,10 +1,5 @@
 import asyncio
-from datetime import datetime, time
 import time as t
-from io import BytesIO
-import os
-import socket
-import tempfile
 from threading import Timer
 from fastapi import HTTPException, Request
 from sqlalchemy import select
@@ -15,10 +10,10 @@ from typing import Any, Dict, List
 from sqlalchemy.orm import selectinload, joinedload
 from cor_pass.database import models as db_models
 from cor_pass.repository.laboratory import case as repository_cases
-from cor_pass.services.laboratory.glass_and_cassette_printing import print_labels
+from cor_pass.repository.laboratory.status_rollup import refresh_rollups
+from cor_pass.services.laboratory.glass_and_cassette_printing import glass_label_content, print_labels
 from loguru import logger
-from cor_pass.config.config import settings
-from smb.SMBConnection import SMBConnection
+from cor_pass.services.shared.smb_pool import download_to_temp, smb_pool, smb_relative_path
 
 async def get_glass(db: AsyncSession, glass_id: int) -> GlassModelScheema | None:
     """Асинхронно получает конкретное стекло, связанное с кассетой по её ID и номеру."""
@@ -58,127 +53,20 @@ async def fetch_file_from_smb(path: str) -> str:
     Загружает файл с SMB-сервера во временный файл и возвращает путь к нему.
     """
     loop = asyncio.get_running_loop()
+    relative_path = smb_relative_path(path)
+    logger.debug(f"Загрузка файла с SMB: {relative_path}")
 
-    def _read_file():
-        conn = SMBConnection(
-            settings.smb_user,
-            settings.smb_pass,
-            my_name=socket.gethostname(),
-            remote_name=settings.remote_name,
-            use_ntlm_v2=True,
-            is_direct_tcp=True,
-        )
-        if not conn.connect(settings.smb_server_ip, 445):
-            logger.error(f"Не удалось подключиться к SMB-серверу {settings.smb_server_ip}")
-            raise RuntimeError("Failed to connect to SMB server")
-
-        prefix = f"\\\\{settings.smb_server_ip}\\{settings.smb_share}\\"
-        if path.startswith(prefix):
-            relative_path = path[len(prefix):].strip("/\\")
-        else:
-            relative_path = path.strip("/\\")
-
-        logger.debug(f"Загрузка файла с SMB: {relative_path}")
-
-        try:
-            file_info = conn.getAttributes(settings.smb_share, relative_path)
-            filesize = getattr(file_info, "file_size", None)
-            if filesize is None:
-                logger.error(f"Не удалось получить размер файла для {relative_path}")
-                raise ValueError("Cannot get filesize from SMB file_info")
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as temp_file:
-                start_time = datetime.now()
-                conn.retrieveFile(settings.smb_share, relative_path, temp_file)
-                temp_file.flush()
-                logger.debug(f"Время загрузки файла: {datetime.now() - start_time} секунд")
-
-                temp_file.seek(0, os.SEEK_END)
-                file_size = temp_file.tell()
-                if file_size != filesize:
-                    logger.error(f"Ожидалось {filesize} байт, но записано {file_size} байт")
-                    raise RuntimeError(f"Expected {filesize} bytes, but wrote {file_size} bytes")
-                
-                return temp_file.name
-        finally:
-            conn.close()
-
-    return await loop.run_in_executor(None, _read_file)
+    return await loop.run_in_executor(
+        None, smb_pool.run, lambda conn: download_to_temp(conn, relative_path, ".png")
+    )
 
 
 async def fetch_file_from_smb_with_timeout(path: str) -> str:
     """
     Загружает файл с SMB-сервера во временный файл и возвращает путь к нему.
     """
-    loop = asyncio.get_running_loop()
+    return await fetch_file_from_smb(path)
 
-    def _read_file():
-        conn = SMBConnection(
-            settings.smb_user,
-            settings.smb_pass,
-            my_name=socket.gethostname(),
-            remote_name=settings.remote_name,
-            use_ntlm_v2=True,
-            is_direct_tcp=True,
-        )
-        if not conn.connect(settings.smb_server_ip, 445):
-            logger.error(f"Не удалось подключиться к SMB-серверу {settings.smb_server_ip}")
-            raise RuntimeError("Failed to connect to SMB server")
-
-
-        prefix = f"\\\\{settings.smb_server_ip}\\{settings.smb_share}\\"
-        if path.startswith(prefix):
-            relative_path = path[len(prefix):].strip("/\\")
-        else:
-            relative_path = path.strip("/\\")
-
-        logger.debug(f"Загрузка файла с SMB: {relative_path}")
-
-        try:
-            file_info = conn.getAttributes(settings.smb_share, relative_path)
-            filesize = getattr(file_info, "file_size", None)
-            if filesize is None:
-                logger.error(f"Не удалось получить размер файла для {relative_path}")
-                raise ValueError("Cannot get filesize from SMB file_info")
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as temp_file:
-                start_time = datetime.now()
-                conn.retrieveFile(settings.smb_share, relative_path, temp_file)
-                temp_file.flush()
-                logger.debug(f"Время загрузки файла: {datetime.now() - start_time} секунд")
-
-                temp_file.seek(0, os.SEEK_END)
-                file_size = temp_file.tell()
-                if file_size != filesize:
-                    logger.error(f"Ожидалось {filesize} байт, но записано {file_size} байт")
-                    raise RuntimeError(f"Expected {filesize} bytes, but wrote {file_size} bytes")
-                
-                return temp_file.name
-        finally:
-            conn.close()
-
-
-    return await loop.run_in_executor(None, _read_file)
-
-
-async def fetch_png_from_smb(path: str) -> BytesIO:
-    """
-    Загружает PNG-файл с SMB-сервера и возвращает его содержимое в BytesIO.
-    """
-    try:
-        temp_file_path = await fetch_file_from_smb_with_timeout(path)
-        try:
-            with open(temp_file_path, "rb") as f:
-                buf = BytesIO(f.read())
-                logger.debug(f"PNG-файл успешно загружен в память: {path}")
-                return buf
-        finally:
-            if os.path.exists(temp_file_path):
-                os.unlink(temp_file_path)
-                logger.debug(f"Временный файл {temp_file_path} удалён")
-    except Exception as e:
-        logger.error(f"Ошибка при загрузке PNG-файла {path}: {str(e)}")
-        raise
 
 async def get_glass_svs(db: AsyncSession, glass_id: str):
     """
@@ -271,7 +159,8 @@ async def create_glass(
     await db.refresh(db_case)
     for glass in created_glasses:
         await db.refresh(glass)
-        await repository_cases._update_ancestor_statuses_from_glass(db=db, glass=glass)
+    await refresh_rollups(db, sample_ids=[db_sample.id])
+    await db.commit()
 
     return [
         GlassModelScheema.model_validate(glass).model_dump()
@@ -318,15 +207,13 @@ async def delete_glasses(db: AsyncSession, glass_ids: List[str]) -> Dict[str, An
 
             db_sample = db_sample
             db_case = db_case
-            await repository_cases._update_ancestor_statuses_from_glass(
-                db=db, glass=db_glass
-            )
             await db.delete(db_glass)
             deleted_count += 1
 
             db_cassette.glass_count -= 1
             db_sample.glass_count -= 1
             db_case.glass_count -= 1
+            await refresh_rollups(db, sample_ids=[db_sample.id])
             await db.commit()
             await db.refresh(db_cassette)
             await db.refresh(db_sample)
@@ -446,9 +333,9 @@ async def print_glass_data(
     hooper=data.hooper if data.hooper else "?"
     patient_cor_id=db_glass.patient_cor_id
         
-    # Старый формат с добавлением разделителей _ для парсинга
-    # Сканер игнорирует |, поэтому остаются только _
-    content = f"{case_code}|_{cassette_number}|_{clinic_name}|_{sample_number}|_L{glass_number}|_{staining}|_{patient_cor_id}"
+    content = glass_label_content(
+        clinic_name, case_code, sample_number, cassette_number, glass_number, staining, patient_cor_id
+    )
 
     label_to_print = PrintLabel(
         model_id=model_id, 
@@ -3,10 +3,8 @@ from string import ascii_uppercase
 from fastapi import Request
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from cor_pass.repository.laboratory.case import (
-    _update_ancestor_statuses_from_cassette,
-    _update_ancestor_statuses_from_glass,
-)
+from cor_pass.repository.laboratory.case import _update_ancestor_statuses_from_cassette
+from cor_pass.repository.laboratory.status_rollup import refresh_rollups
 from cor_pass.repository.laboratory.cassette import print_cassette_data
 from cor_pass.repository.laboratory.glass import print_glass_data
 from cor_pass.schemas import (
@@ -250,8 +248,8 @@ async def create_sample(
         await db.refresh(db_glass)
         await db.refresh(db_case)
 
+        # Пересчёт семпла покрывает и его кассету, и стекло
         await _update_ancestor_statuses_from_cassette(db=db, cassette=db_cassette)
-        await _update_ancestor_statuses_from_glass(db=db, glass=db_glass)
 
         try:
             last_index = ascii_uppercase.index(next_sample_char)
@@ -348,6 +346,7 @@ async def delete_samples(db: AsyncSession, samples_ids: List[str]) -> Dict[str,
             db_case.cassette_count -= num_cassettes_to_decrement
             db_case.glass_count -= num_glasses_to_decrement
 
+            await refresh_rollups(db, case_ids=[db_case.id])
             await db.commit()
             await db.refresh(db_case)
 
@@ -431,6 +430,7 @@ async def print_all_sample_cassettes(
         #     await _update_ancestor_statuses_from_glass(db=db, glass=glass_db)
         sample_schema.cassettes.append(cassette_schema)
 
+    await refresh_rollups(db, sample_ids=[sample_db.id])
     await db.commit()
     await db.refresh(sample_db)
     return sample_schema
@@ -497,6 +497,7 @@ async def print_all_sample_glasses(
         )
         sample_schema.cassettes.append(cassette_schema)
 
+    await refresh_rollups(db, sample_ids=[sample_db.id])
     await db.commit()
     await db.refresh(sample_db)
 
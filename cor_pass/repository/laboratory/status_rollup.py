@@ -0,0 +1,211 @@
+"""
+Счётчики и статусы печати/сканирования семплов и кейсов.
+
+У семпла и кейса хранятся количества кассет и стекол, сколько из них
+напечатано и сколько стекол отсканировано; флаги is_printed_cassette и
+is_printed_glass выводятся из этих счётчиков. После изменения кассет или
+стекол вызывается refresh_rollups для затронутых семплов: один UPDATE
+пересчитывает счётчики семплов по их детям, второй — счётчики кейсов по
+их семплам. Оба выполняются в транзакции вызывающего кода, поэтому чтение
+статусов — это одна строка кейса или семпла без обхода иерархии.
+
+find_rollup_mismatches сравнивает сохранённые значения с пересчитанными,
+rebuild_rollups пересчитывает всё (rebuild из командной строки заодно
+пересобирает проекцию case_worklist):
+
+    python -m cor_pass.repository.laboratory.status_rollup check|rebuild
+"""
+
+import asyncio
+import sys
+from typing import Any, Dict, Iterable, List, Optional
+
+from loguru import logger
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+
+from cor_pass.database import models as db_models
+from cor_pass.repository.laboratory.case_worklist import rebuild_case_worklist, sync_case_worklist
+
+
+REBUILD_BATCH_SIZE = 500
+
+
+def _sample_values() -> Dict[str, Any]:
+    """Значения колонок семпла, посчитанные по его кассетам и стеклам."""
+    sample, cassette, glass = db_models.Sample, db_models.Cassette, db_models.Glass
+    cassettes = select(func.count(cassette.id)).where(cassette.sample_id == sample.id)
+    glasses = (
+        select(func.count(glass.id))
+        .join(cassette, glass.cassette_id == cassette.id)
+        .where(cassette.sample_id == sample.id)
+    )
+    cassette_count = cassettes.scalar_subquery()
+    cassette_printed_count = cassettes.where(cassette.is_printed.is_(True)).scalar_subquery()
+    glass_count = glasses.scalar_subquery()
+    glass_printed_count = glasses.where(glass.is_printed.is_(True)).scalar_subquery()
+    return {
+        "cassette_count": cassette_count,
+        "cassette_printed_count": cassette_printed_count,
+        "glass_count": glass_count,
+        "glass_printed_count": glass_printed_count,
+        "glass_scanned_count": glasses.where(glass.scan_url.is_not(None)).scalar_subquery(),
+        # Пустой семпл считается напечатанным, как и раньше
+        "is_printed_cassette": cassette_printed_count >= cassette_count,
+        "is_printed_glass": glass_printed_count >= glass_count,
+    }
+
+
+def _case_values() -> Dict[str, Any]:
+    """Значения колонок кейса, посчитанные по счётчикам его семплов."""
+    case, sample = db_models.Case, db_models.Sample
+
+    def total(column):
+        return (
+            select(func.coalesce(func.sum(column), 0))
+            .where(sample.case_id == case.id)
+            .scalar_subquery()
+        )
+
+    cassette_count = total(sample.cassette_count)
+    cassette_printed_count = total(sample.cassette_printed_count)
+    glass_count = total(sample.glass_count)
+    glass_printed_count = total(sample.glass_printed_count)
+    return {
+        "bank_count": select(func.count(sample.id)).where(sample.case_id == case.id).scalar_subquery(),
+        "cassette_count": cassette_count,
+        "cassette_printed_count": cassette_printed_count,
+        "glass_count": glass_count,
+        "glass_printed_count": glass_printed_count,
+        "glass_scanned_count": total(sample.glass_scanned_count),
+        "is_printed_cassette": cassette_printed_count >= cassette_count,
+        "is_printed_glass": glass_printed_count >= glass_count,
+    }
+
+
+async def _refresh(db: AsyncSession, model, values: Dict[str, Any], condition) -> list:
+    """
+    Пересчитывает строки model по condition и возвращает (id, case_id) обновлённых.
+
+    Загруженные в сессию объекты получают новые значения без лишних запросов.
+    """
+    extra = [model.case_id] if model is db_models.Sample else []
+    result = await db.execute(
+        update(model)
+        .where(condition)
+        .values(values)
+        .returning(model.id, *extra, *(getattr(model, name) for name in values))
+        .execution_options(synchronize_session=False)
+    )
+    rows = result.all()
+    for row in rows:
+        obj = db.identity_map.get(identity_key(model, row.id))
+        if obj is not None:
+            for name in values:
+                set_committed_value(obj, name, getattr(row, name))
+    return rows
+
+
+async def refresh_rollups(
+    db: AsyncSession,
+    sample_ids: Iterable[str] = (),
+    case_ids: Iterable[str] = (),
+    cassette_ids: Iterable[str] = (),
+) -> None:
+    """
+    Пересчитывает счётчики затронутых семплов и их кейсов. Не коммитит.
+
+    sample_ids/cassette_ids — семплы, у которых менялись кассеты или стекла
+    (для кассет семпл определяется в том же запросе); case_ids — кейсы, у
+    которых удалялись семплы.
+    """
+    sample, cassette = db_models.Sample, db_models.Cassette
+    conditions = []
+    if sample_ids := list(sample_ids):
+        conditions.append(sample.id.in_(sample_ids))
+    if cassette_ids := list(cassette_ids):
+        conditions.append(
+            sample.id.in_(select(cassette.sample_id).where(cassette.id.in_(cassette_ids)))
+        )
+
+    touched_cases = set(case_ids)
+    if conditions:
+        rows = await _refresh(db, sample, _sample_values(), or_(*conditions))
+        touched_cases.update(row.case_id for row in rows)
+    if touched_cases:
+        await _refresh(db, db_models.Case, _case_values(), db_models.Case.id.in_(touched_cases))
+        # Появление первого стекла переводит S-кейс в список текущих
+        await sync_case_worklist(db, touched_cases)
+
+
+def _mismatch_condition(model, values: Dict[str, Any]):
+    return or_(*(getattr(model, name).is_distinct_from(value) for name, value in values.items()))
+
+
+async def find_rollup_mismatches(
+    db: AsyncSession, limit: Optional[int] = None
+) -> Dict[str, List[str]]:
+    """ID семплов и кейсов, у которых сохранённые счётчики расходятся с фактическими."""
+    mismatches = {}
+    for key, model, values in (
+        ("samples", db_models.Sample, _sample_values()),
+        ("cases", db_models.Case, _case_values()),
+    ):
+        query = select(model.id).where(_mismatch_condition(model, values)).order_by(model.id)
+        if limit is not None:
+            query = query.limit(limit)
+        mismatches[key] = list((await db.scalars(query)).all())
+    return mismatches
+
+
+async def rebuild_rollups(db: AsyncSession, batch_size: int = REBUILD_BATCH_SIZE) -> Dict[str, int]:
+    """Пересчитывает все семплы, затем все кейсы, коммитя каждую пачку."""
+    updated = {}
+    for key, model, values in (
+        ("samples", db_models.Sample, _sample_values),
+        ("cases", db_models.Case, _case_values),
+    ):
+        updated[key] = 0
+        last_id = ""
+        while True:
+            ids = list(
+                (
+                    await db.scalars(
+                        select(model.id).where(model.id > last_id).order_by(model.id).limit(batch_size)
+                    )
+                ).all()
+            )
+            if not ids:
+                break
+            await _refresh(db, model, values(), model.id.in_(ids))
+            await db.commit()
+            updated[key] += len(ids)
+            last_id = ids[-1]
+    return updated
+
+
+async def _main(command: str) -> int:
+    from cor_pass.database.db import async_session_maker
+
+    async with async_session_maker() as db:
+        if command == "rebuild":
+            updated = await rebuild_rollups(db)
+            logger.info(f"Пересчитано семплов: {updated['samples']}, кейсов: {updated['cases']}")
+            logger.info(f"Проекция case_worklist: {await rebuild_case_worklist(db)} кейсов")
+        mismatches = await find_rollup_mismatches(db)
+    for key, ids in mismatches.items():
+        if ids:
+            logger.warning(f"Расхождения в {key}: {len(ids)} (например {ids[:10]})")
+    if not any(mismatches.values()):
+        logger.info("Счётчики семплов и кейсов согласованы")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in ("check", "rebuild"):
+        print("Использование: python -m cor_pass.repository.laboratory.status_rollup check|rebuild")
+        sys.exit(2)
+    sys.exit(asyncio.run(_main(sys.argv[1])))
@@ -0,0 +1,230 @@
+"""
+Keyset-пагинация списков с непрозрачными подписанными курсорами.
+
+Вместо OFFSET следующая страница выбирается условием "строго после
+последней строки" по ключам сортировки, поэтому глубокие страницы стоят
+столько же, сколько первая, если под ключи есть индекс. Последним ключом
+должна идти уникальная колонка (обычно id), иначе строки с одинаковыми
+значениями сортировки могут потеряться между страницами.
+
+Курсор — base64url от JSON со значениями ключей последней строки и HMAC,
+привязанный к списку и порядку сортировки: подделанный курсор или курсор
+от другого списка отклоняется с 400.
+
+Общее количество можно не считать, считать точно или приблизительно —
+count по выборке, ограниченной settings.pagination_estimate_cap.
+"""
+
+import base64
+import binascii
+import enum
+import hashlib
+import hmac
+import json
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, List, NamedTuple, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, false, func, or_, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+from cor_pass.config.config import settings
+
+
+SIGNATURE_BYTES = 16
+
+
+class SortKey(NamedTuple):
+    """Ключ сортировки: колонка, направление и может ли она содержать NULL."""
+
+    column: Any
+    descending: bool = False
+    nullable: bool = False
+
+
+class TotalMode(str, enum.Enum):
+    NONE = "none"
+    EXACT = "exact"
+    ESTIMATE = "estimate"
+
+
+@dataclass
+class KeysetPage:
+    items: list
+    next_cursor: Optional[str]
+    total_count: Optional[int] = None
+    total_is_estimate: bool = False
+
+
+def _dump_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, enum.Enum):
+        return value.name
+    return value
+
+
+def _load_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        raise ValueError("unknown cursor value")
+    return value
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _signature(payload: bytes) -> bytes:
+    key = (settings.pagination_cursor_key or settings.secret_key).encode()
+    return hmac.new(key, payload, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+
+
+def encode_cursor(scope: str, values: Sequence[Any]) -> str:
+    """Упаковывает значения ключей последней строки в подписанный курсор."""
+    payload = json.dumps(
+        [scope, [_dump_value(v) for v in values]], separators=(",", ":")
+    ).encode()
+    return f"{_b64encode(payload)}.{_b64encode(_signature(payload))}"
+
+
+def decode_cursor(cursor: str, scope: str) -> List[Any]:
+    """Проверяет подпись и scope курсора и возвращает значения ключей."""
+    try:
+        encoded_payload, encoded_signature = cursor.split(".")
+        payload = _b64decode(encoded_payload)
+        if not hmac.compare_digest(_b64decode(encoded_signature), _signature(payload)):
+            raise ValueError("bad signature")
+        cursor_scope, values = json.loads(payload)
+        if cursor_scope != scope or not isinstance(values, list):
+            raise ValueError("cursor from another listing")
+        return [_load_value(v) for v in values]
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный курсор пагинации",
+        )
+
+
+def _key_scope(scope: str, keys: Sequence[SortKey]) -> str:
+    spec = ",".join(
+        f"{getattr(k.column, 'key', k.column)}:{'d' if k.descending else 'a'}" for k in keys
+    )
+    return f"{scope}|{spec}"
+
+
+def _order_by(keys: Sequence[SortKey]) -> list:
+    clauses = []
+    for key in keys:
+        clause = key.column.desc() if key.descending else key.column.asc()
+        clauses.append(clause.nulls_last() if key.nullable else clause)
+    return clauses
+
+
+def _after(key: SortKey, value: Any):
+    """Строки строго после value по одному ключу (NULL идут последними)."""
+    if value is None:
+        return false()
+    condition = key.column < value if key.descending else key.column > value
+    return or_(condition, key.column.is_(None)) if key.nullable else condition
+
+
+def _equal(key: SortKey, value: Any):
+    return key.column.is_(None) if value is None else key.column == value
+
+
+def keyset_condition(keys: Sequence[SortKey], values: Sequence[Any]):
+    """Условие "строго после строки с values" для набора ключей."""
+    if len(values) != len(keys):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный курсор пагинации",
+        )
+    same_direction = len({k.descending for k in keys}) == 1
+    if same_direction and not any(k.nullable for k in keys):
+        # Сравнение кортежей Postgres отдаёт индексу целиком
+        left, right = tuple_(*(k.column for k in keys)), tuple_(*values)
+        return left < right if keys[0].descending else left > right
+    return or_(
+        *(
+            and_(*(_equal(k, v) for k, v in zip(keys[:i], values[:i])), _after(keys[i], values[i]))
+            for i in range(len(keys))
+        )
+    )
+
+
+async def count_total(
+    db: AsyncSession, query: Select, mode: TotalMode = TotalMode.EXACT
+) -> Tuple[Optional[int], bool]:
+    """
+    Количество строк query: (total, is_estimate). В режиме ESTIMATE count
+    останавливается на pagination_estimate_cap и возвращает его как оценку.
+    """
+    if mode == TotalMode.NONE:
+        return None, False
+    query = query.order_by(None)
+    if mode == TotalMode.EXACT:
+        return await db.scalar(select(func.count()).select_from(query.subquery())), False
+    cap = settings.pagination_estimate_cap
+    total = await db.scalar(select(func.count()).select_from(query.limit(cap + 1).subquery()))
+    return (cap, True) if total > cap else (total, False)
+
+
+async def paginate(
+    db: AsyncSession,
+    query: Select,
+    keys: Sequence[SortKey],
+    scope: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    offset: int = 0,
+    total: TotalMode = TotalMode.EXACT,
+    scalars: bool = False,
+) -> KeysetPage:
+    """
+    Страница query, упорядоченная по keys.
+
+    С cursor строки выбираются после позиции курсора; без него — с offset
+    (для старых клиентов, которые передают номер страницы). В обоих случаях
+    возвращается next_cursor для перехода на следующую страницу, либо None,
+    если она пустая. scalars=True возвращает первые колонки строк.
+    """
+    scope = _key_scope(scope, keys)
+    page_query = query.add_columns(
+        *(k.column.label(f"_keyset_{i}") for i, k in enumerate(keys))
+    ).order_by(*_order_by(keys))
+    if cursor:
+        page_query = page_query.where(keyset_condition(keys, decode_cursor(cursor, scope)))
+    elif offset:
+        page_query = page_query.offset(offset)
+
+    rows = (await db.execute(page_query.limit(limit + 1))).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = (
+        encode_cursor(scope, list(rows[-1][-len(keys):])) if has_more and rows else None
+    )
+    width = len(rows[0]) - len(keys) if rows else 0
+    items = [row[0] if scalars else tuple(row[:width]) for row in rows]
+
+    total_count, is_estimate = await count_total(db, query, total)
+    return KeysetPage(
+        items=items,
+        next_cursor=next_cursor,
+        total_count=total_count,
+        total_is_estimate=is_estimate,
+    )
@@ -598,6 +598,8 @@ async def get_doctor_patients(
     sort_order: Optional[str] = Query("desc", description="Сортировка (asc или desc)"),
     skip: int = Query(1, ge=1, description="Страницы (1-based index)"),
     limit: int = Query(50, ge=1, le=100, description="К-ство на страницу"),
+    cursor: Optional[str] = Query(None, description="Курсор next_cursor из предыдущего ответа; при нём skip не используется для выборки"),
+    approximate_total: bool = Query(False, description="Считать total_count приблизительно (быстрее на больших объёмах)"),
 ):
     # Получаем объект медперсонала (врач или лаборант)
     staff_object = None
@@ -639,12 +641,14 @@ async def get_doctor_patients(
         doctor=staff_object,
         doctor_status_filters=doctor_status_filters,
         clinic_status_filters=clinic_status_filters,
-        sex_filters=sex,
+        sex_filters=[sex] if sex else None,
         sort_by=sort_by,
         sort_order=sort_order,
         skip=skip,
         limit=limit,
         filter_by_doctor=filter_by_current_doctor,  # Передаём флаг фильтрации
+        cursor=cursor,
+        approximate_total=approximate_total,
     )
     return response
  
@@ -2,8 +2,8 @@ from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, status
 from typing import List, Optional
 from cor_pass.database.models import User
-from cor_pass.repository.energy.cerbo_service import BATTERY_ID, ESS_UNIT_ID, INVERTER_ID, REGISTERS, create_energetic_object, create_schedule, create_schedule_with_energetic_object_id, decode_signed_16, decode_signed_32, delete_energetic_object, delete_schedule, get_all_energetic_objects, get_all_schedules, get_all_schedules_by_object_id, get_device_measurements_by_object_paginated, get_device_measurements_paginated,get_averaged_measurements_service, get_energetic_object,get_energy_measurements_service, get_modbus_client, get_schedule_by_id, register_modbus_error, update_energetic_object, update_schedule
-from cor_pass.schemas import CerboMeasurementResponse, DVCCMaxChargeCurrentRequest, EnergeticObjectCreate, EnergeticObjectResponse, EnergeticObjectUpdate, EnergeticScheduleBase, EnergeticScheduleCreate, EnergeticScheduleCreateForObject, EnergeticScheduleResponse, EssAdvancedControl, GridLimitUpdate, InverterPowerPayload, PaginatedResponse, RegisterWriteRequest, VebusSOCControl, WSMessageBase
+from cor_pass.repository.energy.cerbo_service import BATTERY_ID, ESS_UNIT_ID, INVERTER_ID, REGISTERS, create_energetic_object, create_schedule, create_schedule_with_energetic_object_id, decode_signed_16, decode_signed_32, delete_energetic_object, delete_schedule, get_all_energetic_objects, get_all_schedules, get_all_schedules_by_object_id, get_device_measurements_by_object_paginated, get_device_measurements_paginated,get_averaged_measurements_service, get_energetic_object,get_energy_measurements_service, get_measurement_rollups_service, get_modbus_client, get_schedule_by_id, register_modbus_error, update_energetic_object, update_schedule
+from cor_pass.schemas import CerboMeasurementResponse, CerboRollupPoint, DVCCMaxChargeCurrentRequest, EnergeticObjectCreate, EnergeticObjectResponse, EnergeticObjectUpdate, EnergeticScheduleBase, EnergeticScheduleCreate, EnergeticScheduleCreateForObject, EnergeticScheduleResponse, EssAdvancedControl, GridLimitUpdate, InverterPowerPayload, PaginatedResponse, RegisterWriteRequest, VebusSOCControl, WSMessageBase
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from cor_pass.database.db import get_db
@@ -751,25 +751,32 @@ async def read_measurements(
     object_name: Optional[str] = Query(None, description="Фильтр по имени объекта"),
     start_date: Optional[datetime] = Query(None, description="Начальная дата измерения (ISO 8601, например '2023-01-01T00:00:00')"),
     end_date: Optional[datetime] = Query(None, description="Конечная дата измерения (ISO 8601, например '2023-12-31T23:59:59')"),
+    cursor: Optional[str] = Query(None, description="Курсор next_cursor из предыдущего ответа; при нём page не используется для выборки"),
+    approximate_total: bool = Query(False, description="Считать total_count приблизительно (быстрее на больших объёмах)"),
     db: AsyncSession = Depends(get_db)
 ):
-    measurements, total_count = await get_device_measurements_paginated(
+    measurements_page = await get_device_measurements_paginated(
         db=db,
         page=page,
         page_size=page_size,
         object_name=object_name,
         start_date=start_date,
-        end_date=end_date
+        end_date=end_date,
+        cursor=cursor,
+        approximate_total=approximate_total,
     )
+    total_count = measurements_page.total_count
 
     total_pages = ceil(total_count / page_size) if total_count > 0 else 0
 
     return PaginatedResponse(
-        items=[CerboMeasurementResponse.model_validate(m) for m in measurements],
+        items=[CerboMeasurementResponse.model_validate(m) for m in measurements_page.items],
         total_count=total_count,
         page=page,
         page_size=page_size,
-        total_pages=total_pages
+        total_pages=total_pages,
+        next_cursor=measurements_page.next_cursor,
+        total_is_estimate=measurements_page.total_is_estimate,
     )
 
 @router.get(
@@ -785,25 +792,32 @@ async def read_measurements(
     energetic_object_id: str = Query(..., description="Фильтр по ID объекта"),
     start_date: Optional[datetime] = Query(None, description="Начальная дата измерения (ISO 8601, например '2023-01-01T00:00:00')"),
     end_date: Optional[datetime] = Query(None, description="Конечная дата измерения (ISO 8601, например '2023-12-31T23:59:59')"),
+    cursor: Optional[str] = Query(None, description="Курсор next_cursor из предыдущего ответа; при нём page не используется для выборки"),
+    approximate_total: bool = Query(False, description="Считать total_count приблизительно (быстрее на больших объёмах)"),
     db: AsyncSession = Depends(get_db)
 ):
-    measurements, total_count = await get_device_measurements_by_object_paginated(
+    measurements_page = await get_device_measurements_by_object_paginated(
         db=db,
         page=page,
         page_size=page_size,
         energetic_object_id=energetic_object_id,
         start_date=start_date,
-        end_date=end_date
+        end_date=end_date,
+        cursor=cursor,
+        approximate_total=approximate_total,
     )
+    total_count = measurements_page.total_count
 
     total_pages = ceil(total_count / page_size) if total_count > 0 else 0
 
     return PaginatedResponse(
-        items=[CerboMeasurementResponse.model_validate(m) for m in measurements],
+        items=[CerboMeasurementResponse.model_validate(m) for m in measurements_page.items],
         total_count=total_count,
         page=page,
         page_size=page_size,
-        total_pages=total_pages
+        total_pages=total_pages,
+        next_cursor=measurements_page.next_cursor,
+        total_is_estimate=measurements_page.total_is_estimate,
     )
 
 
@@ -844,13 +858,39 @@ async def get_averaged_measurements(
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@router.get(
+    "/measurements/rollups/",
+    response_model=List[CerboRollupPoint],
+    summary="Агрегаты измерений по интервалам",
+    description="Среднее, минимум, максимум и последнее значение по интервалам из минутных, часовых "
+                "или суточных агрегатов (выбирается самое грубое разрешение, не крупнее шага)",
+    tags=["Measurements"]
+)
+async def get_measurement_rollups(
+    object_name: Optional[str] = Query(None, description="Фильтр по имени объекта"),
+    start_date: datetime = Query(..., description="Начальная дата периода (ISO 8601)"),
+    end_date: datetime = Query(..., description="Конечная дата периода (ISO 8601)"),
+    intervals: int = Query(60, gt=0, description="Количество интервалов"),
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        return await get_measurement_rollups_service(db, object_name, start_date, end_date, intervals)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Ошибка при получении агрегатов измерений: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
 
 # Добавить energetic object id
 
 @router.get( "/measurements/energy/",
     summary="Энергетический баланс по интервалам",
     description="Считает энергию (кВт·ч) по каждому интервалу времени: солнце, нагрузка, сеть, батарея. "
-                "Возвращает интервалы и итоговые значения за период.",
+                "Возвращает интервалы и итоговые значения за период. "
+                "Итоги (totals) — сумма по всем интервалам, включая интервалы с has_sufficient_data=false; "
+                "разрывы связи длиннее energy_max_gap_seconds в энергию не входят и отражаются в quality.",
     tags=["Measurements"]
 )
 async def get_energy_measurements(
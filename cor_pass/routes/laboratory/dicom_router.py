@@ -1,24 +1,24 @@
-from fastapi import APIRouter, Depends, Query, HTTPException, UploadFile, File, status
-from fastapi.responses import StreamingResponse, HTMLResponse
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, UploadFile, File, status
+from fastapi.responses import HTMLResponse, Response
 import os
-import numpy as np
 import pydicom
 import pydicom.config
 from openslide import OpenSlide, OpenSlideUnsupportedFormatError
-from skimage.transform import resize
-from PIL import Image
-from PIL import ImageOps
-from io import BytesIO
-from functools import lru_cache
 from pathlib import Path
-import zipfile
-import shutil
 from typing import List
-from collections import Counter
-from skimage.transform import resize
-from collections import Counter
 from cor_pass.services.user.auth import auth_service
 from cor_pass.database.models import User
+from cor_pass.services.laboratory.dicom_ingest import IngestError, dicom_ingestor, get_progress
+from cor_pass.services.laboratory.dicom_volume_cache import dicom_volume_cache
+from cor_pass.services.laboratory.mpr_render import (
+    MPR_FORMATS,
+    PLANES,
+    clamp_index,
+    get_slice,
+    mpr_cache,
+    mpr_etag,
+    mpr_key,
+)
 from pydicom import config
 from loguru import logger
 
@@ -103,121 +103,20 @@ def load_all_series(user_cor_id: str):
 
 
 
-@lru_cache(maxsize=16)
-def load_volume(user_cor_id: str):
-    logger.debug("[INFO] Загружаем том из DICOM-файлов...")
-
+def load_volume_with_key(user_cor_id: str):
+    """Том пользователя из общего кэша: (ключ серии, float32-том только для чтения, dataset-образец)."""
     user_dicom_dir = os.path.join(DICOM_ROOT_DIR, user_cor_id)
     if not os.path.exists(user_dicom_dir):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="DICOM данные для этого пользователя не найдены.",
         )
+    return dicom_volume_cache.load_with_key(user_dicom_dir)
 
-    dicom_paths = [
-        os.path.join(root, f)
-        for root, dirs, files in os.walk(user_dicom_dir)
-        for f in files
-        if not f.startswith(".")
-    ]
-
-    datasets = []
-    skipped_files = 0
-
-    for path in dicom_paths:
-        try:
-            ds = None
-            for attempt in [
-                lambda: pydicom.dcmread(path),
-                lambda: pydicom.dcmread(path, force=True),
-                lambda: pydicom.dcmread(path, force=True, defer_size=1024),
-            ]:
-                try:
-                    ds = attempt()
-                    break
-                except:
-                    continue
-
-            if ds is None:
-                logger.debug(f"[WARN] Не удалось прочитать файл {path}")
-                skipped_files += 1
-                continue
-
-            # Декомпрессия при необходимости
-            if hasattr(ds, "file_meta") and hasattr(ds.file_meta, "TransferSyntaxUID"):
-                if ds.file_meta.TransferSyntaxUID.is_compressed:
-                    try:
-                        ds.decompress()
-                    except Exception as e:
-                        logger.debug(f"[WARN] Не удалось декомпрессировать {path}: {e}")
-                        skipped_files += 1
-                        continue
-
-            # Проверка тегов
-            required_attrs = ["ImagePositionPatient", "ImageOrientationPatient", "pixel_array"]
-            if not all(hasattr(ds, attr) for attr in required_attrs):
-                logger.debug(
-                    f"[WARN] Файл {path} не содержит необходимых тегов: {[attr for attr in required_attrs if hasattr(ds, attr)]}"
-                )
-                skipped_files += 1
-                continue
-
-            datasets.append((ds, path))
-
-        except Exception as e:
-            logger.debug(f"[WARN] Ошибка чтения файла {path}: {e}")
-            skipped_files += 1
-            continue
-
-    if not datasets:
-        raise RuntimeError("Нет подходящих DICOM-файлов с ImagePositionPatient.")
-
-    # Определяем нормаль к срезу и сортируем
-    orientation = datasets[0][0].ImageOrientationPatient
-    normal = np.cross(orientation[:3], orientation[3:])
-    datasets.sort(key=lambda item: np.dot(item[0].ImagePositionPatient, normal))
-
-    slices = []
-    shapes = []
-
-    for ds, path in datasets:
-        try:
-            arr = ds.pixel_array.astype(np.float32)
-            # Rescale
-            slope = float(getattr(ds, "RescaleSlope", 1.0))
-            intercept = float(getattr(ds, "RescaleIntercept", 0.0))
-            arr = arr * slope + intercept
-            slices.append(arr)
-            shapes.append(arr.shape)
-        except Exception as e:
-            logger.debug(f"[WARN] Ошибка обработки {path}: {e}")
-            continue
 
-    if not slices:
-        raise RuntimeError("Не удалось загрузить ни одного среза.")
-
-    # Приведение всех к одной форме
-    target_shape = Counter(shapes).most_common(1)[0][0]
-    logger.debug(f"[INFO] Приведение всех срезов к форме {target_shape}")
-
-    resized_slices = [
-        resize(slice_, target_shape, preserve_range=True).astype(np.float32)
-        if slice_.shape != target_shape else slice_
-        for slice_ in slices
-    ]
-
-    volume = np.stack(resized_slices)
-    example_ds = datasets[0][0]  # Берем первый dataset для метаданных
-
-    logger.debug(f"[INFO] Загружено срезов: {len(volume)}")
-    logger.debug(f"DICOM dataset keys: {list(example_ds.dir())}")
-    logger.debug(f"PixelSpacing: {getattr(example_ds, 'PixelSpacing', None)}")
-    logger.debug(f"SliceThickness: {getattr(example_ds, 'SliceThickness', None)}")
-    logger.debug(f"[INFO] Пропущено файлов: {skipped_files}")
-
-    return volume, example_ds
-
-    
+def load_volume(user_cor_id: str):
+    _, volume, ds = load_volume_with_key(user_cor_id)
+    return volume, ds
 
 
 @router.get("/viewer", response_class=HTMLResponse)
@@ -225,118 +124,37 @@ def get_viewer(current_user: User = Depends(auth_service.get_current_user)):
     return HTMLResponse(HTML_FILE.read_text(encoding="utf-8"))
 
 
-def apply_window(img, ds):
-    try:
-        wc = (
-            float(ds.WindowCenter[0])
-            if isinstance(ds.WindowCenter, pydicom.multival.MultiValue)
-            else float(ds.WindowCenter)
-        )
-        ww = (
-            float(ds.WindowWidth[0])
-            if isinstance(ds.WindowWidth, pydicom.multival.MultiValue)
-            else float(ds.WindowWidth)
-        )
-        img_min = wc - ww / 2
-        img_max = wc + ww / 2
-        img = np.clip(img, img_min, img_max)
-        img = ((img - img_min) / (img_max - img_min + 1e-5)) * 255
-        return img.astype(np.uint8)
-    except Exception as e:
-        logger.debug(f"[WARN] Ошибка применения Window Center/Width: {e}")
-        return img.astype(np.uint8)
-
-
 @router.get("/reconstruct/{plane}")
 def reconstruct(
     plane: str,
+    request: Request,
     index: int = Query(...),
     size: int = 512,
     mode: str = Query("auto", enum=["auto", "window", "raw"]),
     window_center: float = Query(None),
     window_width: float = Query(None),
+    format: str = Query("png", enum=list(MPR_FORMATS)),
+    quality: int = Query(85, ge=1, le=100),
     current_user: User = Depends(auth_service.get_current_user),
 ):
+    if plane not in PLANES:
+        raise HTTPException(status_code=400, detail="Invalid plane")
     try:
-        volume, ds = load_volume(str(current_user.cor_id))
-
-        # Безопасное извлечение PixelSpacing и SliceThickness
-        try:
-            ps = ds.PixelSpacing if hasattr(ds, "PixelSpacing") else [1.0, 1.0]
-            ps = [float(ps[0]), float(ps[1])]
-        except Exception:
-            ps = [1.0, 1.0]
+        series, volume, ds = load_volume_with_key(str(current_user.cor_id))
+        index = clamp_index(volume, plane, index)
+        key = mpr_key(series, plane, index, mode, window_center, window_width, size, format, quality)
 
-        try:
-            st = float(ds.SliceThickness) if hasattr(ds, "SliceThickness") else 1.0
-        except Exception:
-            st = 1.0
-
-        # Выбор плоскости
-        if plane == "axial":
-            img = volume[np.clip(index, 0, volume.shape[0] - 1), :, :]
-            spacing_x, spacing_y = ps
-        elif plane == "sagittal":
-            img = np.flip(
-                volume[:, :, np.clip(index, 0, volume.shape[2] - 1)], axis=(0, 1)
-            )
-            spacing_x, spacing_y = st, ps[0]
-        elif plane == "coronal":
-            img = np.flip(volume[:, np.clip(index, 0, volume.shape[1] - 1), :], axis=0)
-            spacing_x, spacing_y = st, ps[1]
-        else:
-            raise HTTPException(status_code=400, detail="Invalid plane")
-
-        # Windowing
-        if mode == "auto":
-            img = apply_window(img, ds)
-        elif mode == "window":
-            try:
-                wc = (
-                    window_center
-                    if window_center is not None
-                    else (
-                        float(ds.WindowCenter[0])
-                        if isinstance(ds.WindowCenter, pydicom.multival.MultiValue)
-                        else float(ds.WindowCenter)
-                    )
-                )
-                ww = (
-                    window_width
-                    if window_width is not None
-                    else (
-                        float(ds.WindowWidth[0])
-                        if isinstance(ds.WindowWidth, pydicom.multival.MultiValue)
-                        else float(ds.WindowWidth)
-                    )
-                )
-                img_min = wc - ww / 2
-                img_max = wc + ww / 2
-                img = np.clip(img, img_min, img_max)
-                img = ((img - img_min) / (img_max - img_min + 1e-5)) * 255
-                img = img.astype(np.uint8)
-            except Exception:
-                img = ((img - img.min()) / (img.max() - img.min() + 1e-5)) * 255
-                img = img.astype(np.uint8)
-        elif mode == "raw":
-            img = ((img - img.min()) / (img.max() - img.min() + 1e-5)) * 255
-            img = img.astype(np.uint8)
-
-        # Преобразуем в изображение и добавляем паддинг (size x size)
-        img_pil = Image.fromarray(img).convert("L")
-        img_pil = ImageOps.pad(
-            img_pil,
-            (size, size),
-            method=Image.Resampling.BICUBIC,
-            color=0,
-            centering=(0.5, 0.5),
-        )
+        # Ключ серии в ETag: после загрузки новых файлов кэш браузера не сработает
+        etag = mpr_etag(key)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
 
-        buf = BytesIO()
-        img_pil.save(buf, format="PNG")
-        buf.seek(0)
-        return StreamingResponse(buf, media_type="image/png")
+        data = get_slice(key, volume, ds)
+        return Response(content=data, media_type=MPR_FORMATS[format], headers=headers)
 
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -348,95 +166,33 @@ async def upload_dicom_files(
     files: List[UploadFile] = File(...),
     current_user: User = Depends(auth_service.get_current_user),
 ):
-    try:
-        user_dir = os.path.join(DICOM_ROOT_DIR, str(current_user.cor_id))
-        user_dicom_dir = user_dir
-        user_slide_dir = os.path.join(user_dir, "slides")
-
-        # --- безопасное удаление старых данных ---
-        shutil.rmtree(user_dicom_dir, ignore_errors=True)  # не падает, если нет папки
-
-        # --- создание директорий ---
-        os.makedirs(user_dicom_dir, exist_ok=True)
-        os.makedirs(user_slide_dir, exist_ok=True)
-
-        processed_files = 0
-        valid_dicom = 0
-        valid_svs = 0
-
-        for file in files:
-            file_ext = os.path.splitext(file.filename)[1].lower()
-
-            temp_path = os.path.join(user_dicom_dir, file.filename)
-            os.makedirs(os.path.dirname(temp_path), exist_ok=True)
-            with open(temp_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-
-            processed_files += 1
-
-            if file_ext == ".svs":
-                continue
-
-            if file_ext == ".zip":
-                try:
-                    with zipfile.ZipFile(temp_path, "r") as zip_ref:
-                        for member in zip_ref.namelist():
-                            member_path = os.path.join(user_dicom_dir, member)
-                            if not member_path.startswith(user_dicom_dir):
-                                raise ValueError("Zip Slip атака предотвращена!")
-                            zip_ref.extract(member, user_dicom_dir)
-                    os.remove(temp_path)
-                except Exception as e:
-                    print(f"[ERROR] Ошибка распаковки {file.filename}: {e}")
-                    os.remove(temp_path)
-                    continue
-
-        if not os.path.exists(user_dicom_dir):
-            raise HTTPException(status_code=404, detail="User DICOM directory not found")
-
-        dicom_paths = []
-
-        for root, dirs, files in os.walk(user_dicom_dir):
-            for f in files:
-                if f.startswith("."):
-                    continue
-                if f.lower().endswith(".svs"):
-                    continue
-                # поддерживаем файлы без расширений и DICOM-файлы
-                if f.lower().endswith(".dcm") or "." not in f:
-                    dicom_paths.append(os.path.join(root, f))
-
-        for file_path in dicom_paths:
-            try:
-                pydicom.dcmread(file_path, stop_before_pixels=True)
-                valid_dicom += 1
-            except:
-                os.remove(file_path)
-
-        if valid_dicom == 0 and valid_svs == 0:
-            shutil.rmtree(user_dicom_dir, ignore_errors=True)
-            raise HTTPException(
-                status_code=400, detail="No valid DICOM or SVS files found."
-            )
-
-        load_volume.cache_clear()
-
-        if valid_svs > 0 and valid_dicom == 0:
-            message = f"Загружен файл SVS ({valid_svs} шт.)"
-        elif valid_dicom > 0 and valid_svs == 0:
-            message = f"Загружено {valid_dicom} срезов DICOM"
-        elif valid_dicom > 0 and valid_svs > 0:
-            message = f"Загружено {valid_dicom} срезов DICOM и {valid_svs} файл(ов) SVS"
-        else:
-            message = "Файлы загружены, но не удалось распознать ни одного DICOM или SVS."
-
-        return {"message": message}
+    """
+    Загружает DICOM-файлы и zip-архивы вместо текущих данных пользователя.
 
+    Запись, распаковка и проверка идут в пуле потоков, ход — в /upload/progress.
+    """
+    user_dir = os.path.join(DICOM_ROOT_DIR, str(current_user.cor_id))
+    try:
+        valid_dicom = await dicom_ingestor.ingest(user_dir, files)
+    except IngestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+    dicom_volume_cache.clear()
+    mpr_cache.clear()
+    return {"message": f"Загружено {valid_dicom} срезов DICOM"}
+
+
+@router.get("/upload/progress")
+def get_upload_progress(current_user: User = Depends(auth_service.get_current_user)):
+    progress = get_progress(str(current_user.cor_id))
+    if progress is None:
+        raise HTTPException(status_code=404, detail="No upload in progress")
+    return progress
+
 
 @router.get("/volume_info")
 def get_volume_info(current_user: User = Depends(auth_service.get_current_user)):
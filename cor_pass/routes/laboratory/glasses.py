@@ -1,4 +1,3 @@
-import asyncio
 from datetime import datetime
 from io import BytesIO
 import os
@@ -19,9 +18,11 @@ from cor_pass.schemas import (
     UploadGlassSVSResponse
 )
 from cor_pass.repository.laboratory import glass as glass_service
+from cor_pass.repository.laboratory.status_rollup import refresh_rollups
 from typing import List, Optional
 
 from cor_pass.services.shared.access import doctor_access, lab_assistant_or_doctor_access
+from cor_pass.services.shared.smb_stream import ranged_smb_response
 from loguru import logger
 from cor_pass.config.config import settings
 from scan_worker.smbprotocol_worker import save_file_to_smb, save_file_to_smb_manual
@@ -154,9 +155,10 @@ PLACEHOLDER_PATH = "cor_pass/static/assets/dummy_glass.png"
     "/{glass_id}/preview",
     dependencies=[Depends(lab_assistant_or_doctor_access)],
 )
-async def get_glass_preview(glass_id: str, db: AsyncSession = Depends(get_db)):
+async def get_glass_preview(glass_id: str, request: Request, db: AsyncSession = Depends(get_db)):
     """
     Получает PNG-превью для стекла по его ID. Возвращает заглушный PNG при ошибке.
+    Поддерживает Range-запросы, с шары читаются только нужные блоки.
     """
     db_glass = await glass_service.get_glass_preview_png(db=db, glass_id=glass_id)
     if db_glass is None:
@@ -175,23 +177,40 @@ async def get_glass_preview(glass_id: str, db: AsyncSession = Depends(get_db)):
             raise HTTPException(status_code=500, detail="Placeholder PNG not found")
 
     try:
-        buf = await glass_service.fetch_png_from_smb(db_glass.preview_url)
-        buf.seek(0)
+        response = await ranged_smb_response(db_glass.preview_url, request, media_type="image/png")
         logger.debug(f"Успешно возвращено превью для стекла {glass_id}")
-        return StreamingResponse(buf, media_type="image/png")
-    except asyncio.TimeoutError as e:
-        logger.error(f"Таймаут при получении превью для стекла {glass_id}: {str(e)}")
-        with open(PLACEHOLDER_PATH, "rb") as f:
-            placeholder_buf = BytesIO(f.read())
-            placeholder_buf.seek(0)
-            return StreamingResponse(placeholder_buf, media_type="image/png")
+        return response
     except Exception as e:
         logger.error(f"Ошибка при получении превью для стекла {glass_id}: {str(e)}")
         with open(PLACEHOLDER_PATH, "rb") as f:
             placeholder_buf = BytesIO(f.read())
             placeholder_buf.seek(0)
             return StreamingResponse(placeholder_buf, media_type="image/png")
-        
+
+
+@router.get(
+    "/{glass_id}/scan",
+    dependencies=[Depends(lab_assistant_or_doctor_access)],
+)
+async def get_glass_scan(glass_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Отдаёт SVS-скан стекла с шары с поддержкой Range, не скачивая файл целиком.
+    """
+    if not settings.smb_enabled:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="You are not connected to NAS",
+        )
+    db_glass = await glass_service.get_glass_svs(db=db, glass_id=glass_id)
+    if db_glass is None:
+        raise HTTPException(status_code=404, detail="Glass or scan URL not found")
+    try:
+        return await ranged_smb_response(
+            db_glass.scan_url, request, media_type="application/octet-stream"
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при получении скана для стекла {glass_id}: {str(e)}")
+        raise HTTPException(status_code=502, detail="Failed to read scan from NAS")
 
 
 @router.post("/upload-glass/{glass_id}",
@@ -278,6 +297,7 @@ async def upload_glass_file(
 
         glass.scan_url = smb_full_path
         glass.preview_url = preview_path
+        await refresh_rollups(db, cassette_ids=[glass.cassette_id])
         await db.commit()
         response = UploadGlassSVSResponse(
             preview_url=preview_path,
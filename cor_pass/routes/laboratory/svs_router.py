@@ -1,23 +1,46 @@
+import asyncio
 import errno
 import re
-from fastapi import APIRouter, Depends, Query, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, Query, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 import os
 import logging
 from openslide import OpenSlide
 from io import BytesIO
-from cor_pass.repository.laboratory.glass import fetch_file_from_smb, get_glass_svs
-from cor_pass.routes.laboratory.dicom_router import load_volume
+from cor_pass.repository.laboratory.glass import get_glass_svs
 from cor_pass.services.user.auth import auth_service
 from cor_pass.database.models import User
 from PIL import Image
 from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
 from cor_pass.database.db import get_db
-import shutil
+from cor_pass.config.config import settings
 from openslide import OpenSlide, OpenSlideUnsupportedFormatError
 
+from cor_pass.services.laboratory.dicom_volume_cache import dicom_volume_cache
+from cor_pass.services.laboratory.deepzoom import (
+    DZ_FORMATS,
+    DZ_OVERLAP,
+    DZFormat,
+    DZ_TILE_SIZE,
+    get_dzi,
+    get_generator,
+    local_store_key,
+    render_tile,
+    slide_content_id,
+    tile_etag,
+)
+from cor_pass.services.laboratory.slide_cache import (
+    cache_stats,
+    find_user_slide,
+    invalidate_slide,
+    slide_handles,
+    tile_cache,
+    tile_key,
+)
+from cor_pass.services.laboratory.slide_tile_store import slide_tile_store
 from cor_pass.services.shared.safe_delete_smb import DICOM_DIR, safe_delete_dir
+from cor_pass.services.shared.smb_stream import fetch_cached_slide, link_or_copy
 
 router = APIRouter(prefix="/svs", tags=["SVS"])
 
@@ -29,21 +52,19 @@ DICOM_ROOT_DIR = "dicom_users_data"
 @router.get("/svs_metadata")
 def get_svs_metadata(current_user: User = Depends(auth_service.get_current_user)):
     user_slide_dir = os.path.join(DICOM_ROOT_DIR, str(current_user.cor_id), "slides")
-    svs_files = [f for f in os.listdir(user_slide_dir) if f.lower().endswith(".svs")]
+    svs_path = find_user_slide(user_slide_dir)
 
-    if not svs_files:
+    if svs_path is None:
         raise HTTPException(status_code=404, detail="No SVS files found.")
 
-    svs_path = os.path.join(user_slide_dir, svs_files[0])
-
     try:
-        slide = OpenSlide(svs_path)
+        slide = slide_handles.get(svs_path)
 
         tile_size = 256  # размер тайла, подставь свой, если другой
 
         # Основные метаданные
         metadata = {
-            "filename": svs_files[0],
+            "filename": os.path.basename(svs_path),
             "dimensions": {
                 "width": slide.dimensions[0],
                 "height": slide.dimensions[1],
@@ -96,15 +117,13 @@ def preview_svs(
     current_user: User = Depends(auth_service.get_current_user),
 ):
     user_slide_dir = os.path.join(DICOM_ROOT_DIR, str(current_user.cor_id), "slides")
-    svs_files = [f for f in os.listdir(user_slide_dir) if f.lower().endswith(".svs")]
+    svs_path = find_user_slide(user_slide_dir)
 
-    if not svs_files:
+    if svs_path is None:
         raise HTTPException(status_code=404, detail="No SVS found.")
 
-    svs_path = os.path.join(user_slide_dir, svs_files[0])
-
     try:
-        slide = OpenSlide(svs_path)
+        slide = slide_handles.get(svs_path)
 
         if full:
             # Полное изображение в выбранном разрешении
@@ -120,9 +139,14 @@ def preview_svs(
             if img.mode == "RGBA":
                 img = img.convert("RGB")
         else:
-            # Миниатюра
+            # Миниатюра: сначала из хранилища заранее отрендеренных тайлов
             size = (300, 300)
-            img = slide.get_thumbnail(size)
+            stored = slide_tile_store.read_thumbnail(local_store_key(svs_path))
+            if stored is not None:
+                img = Image.open(BytesIO(stored))
+                img.thumbnail(size)
+            else:
+                img = slide.get_thumbnail(size)
 
         buf = BytesIO()
         img.save(buf, format="PNG")
@@ -138,22 +162,25 @@ def get_tile(
     x: int = Query(..., description="Tile X index"),
     y: int = Query(..., description="Tile Y index"),
     tile_size: int = Query(256, description="Tile size in pixels"),
+    quality: int = Query(75, ge=1, le=95, description="JPEG quality"),
     current_user: User = Depends(auth_service.get_current_user),
 ):
     try:
         user_slide_dir = os.path.join(
             DICOM_ROOT_DIR, str(current_user.cor_id), "slides"
         )
-        svs_files = [
-            f for f in os.listdir(user_slide_dir) if f.lower().endswith(".svs")
-        ]
+        svs_path = find_user_slide(user_slide_dir)
 
-        if not svs_files:
+        if svs_path is None:
             logger.warning(f"[NO SVS] User {current_user.cor_id} has no SVS files")
             raise HTTPException(status_code=404, detail="No SVS files found.")
 
-        svs_path = os.path.join(user_slide_dir, svs_files[0])
-        slide = OpenSlide(svs_path)
+        key = tile_key(svs_path, level, x, y, tile_size, quality)
+        cached_tile = tile_cache.get(key)
+        if cached_tile is not None:
+            return Response(content=cached_tile, media_type="image/jpeg")
+
+        slide = slide_handles.get(svs_path)
 
         if level < 0 or level >= slide.level_count:
             logger.warning(
@@ -182,12 +209,15 @@ def get_tile(
         region = slide.read_region(
             location, level, (region_width, region_height)
         ).convert("RGB")
-        region = region.resize((tile_size, tile_size), Image.LANCZOS)
+        if region.size != (tile_size, tile_size):
+            # Ресемплинг нужен только для краевых тайлов
+            region = region.resize((tile_size, tile_size), Image.LANCZOS)
 
         buf = BytesIO()
-        region.save(buf, format="JPEG")
-        buf.seek(0)
-        return StreamingResponse(buf, media_type="image/jpeg")
+        region.save(buf, format="JPEG", quality=quality)
+        data = buf.getvalue()
+        tile_cache.put(key, data)
+        return Response(content=data, media_type="image/jpeg")
 
     except Exception as e:
         import traceback
@@ -196,6 +226,102 @@ def get_tile(
         return empty_tile()
 
 
+def _current_user_slide(current_user: User, slide_id: str | None = None) -> str:
+    """Путь к текущему SVS пользователя; при slide_id проверяет, что это та же версия."""
+    user_slide_dir = os.path.join(DICOM_ROOT_DIR, str(current_user.cor_id), "slides")
+    svs_path = find_user_slide(user_slide_dir)
+    if svs_path is None:
+        raise HTTPException(status_code=404, detail="No SVS files found.")
+    if slide_id is not None and slide_content_id(svs_path) != slide_id:
+        raise HTTPException(status_code=404, detail="Slide version not found.")
+    return svs_path
+
+
+@router.get("/deepzoom")
+def get_deepzoom_info(current_user: User = Depends(auth_service.get_current_user)):
+    """
+    Описание DeepZoom-пирамиды текущего слайда пользователя.
+
+    Возвращает идентификатор версии слайда и URL DZI-дескриптора, который
+    можно отдавать в OpenSeadragon как tileSource.
+    """
+    svs_path = _current_user_slide(current_user)
+    try:
+        generator = get_generator(svs_path)
+    except Exception as e:
+        logger.error(f"[ERROR DEEPZOOM] {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    slide_id = slide_content_id(svs_path)
+    width, height = generator.level_dimensions[-1]
+    return {
+        "slide_id": slide_id,
+        "filename": os.path.basename(svs_path),
+        "dzi_url": f"{router.prefix}/deepzoom/{slide_id}.dzi",
+        "tile_size": DZ_TILE_SIZE,
+        "overlap": DZ_OVERLAP,
+        "levels": generator.level_count,
+        "width": width,
+        "height": height,
+    }
+
+
+@router.get("/deepzoom/{slide_id}.dzi")
+def get_deepzoom_dzi(
+    slide_id: str,
+    request: Request,
+    format: DZFormat = Query("jpeg"),
+    current_user: User = Depends(auth_service.get_current_user),
+):
+    svs_path = _current_user_slide(current_user, slide_id)
+    etag = f'"{slide_id}-{format}"'
+    headers = {"ETag": etag, "Cache-Control": settings.svs_tile_cache_control}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(
+        content=get_dzi(svs_path, format), media_type="application/xml", headers=headers
+    )
+
+
+@router.get("/deepzoom/{slide_id}_files/{level:int}/{col:int}_{row:int}.{fmt}")
+def get_deepzoom_tile(
+    slide_id: str,
+    level: int,
+    col: int,
+    row: int,
+    fmt: str,
+    request: Request,
+    quality: int = Query(75, ge=1, le=95, description="JPEG quality"),
+    current_user: User = Depends(auth_service.get_current_user),
+):
+    if fmt not in DZ_FORMATS:
+        raise HTTPException(status_code=400, detail="Unsupported tile format")
+    svs_path = _current_user_slide(current_user, slide_id)
+
+    etag = tile_etag(slide_id, level, col, row, fmt, quality)
+    headers = {"ETag": etag, "Cache-Control": settings.svs_tile_cache_control}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    try:
+        data = render_tile(svs_path, level, col, row, fmt, quality)
+    except Exception:
+        import traceback
+
+        logger.error(f"[ERROR DEEPZOOM TILE] {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail="Failed to render tile")
+
+    if data is None:
+        raise HTTPException(status_code=404, detail="Tile out of bounds")
+    return Response(content=data, media_type=DZ_FORMATS[fmt], headers=headers)
+
+
+@router.get("/cache_stats")
+def get_svs_cache_stats(current_user: User = Depends(auth_service.get_current_user)):
+    """Статистика кэшей слайдов и тайлов текущего процесса."""
+    return cache_stats()
+
+
 def empty_tile(color=(255, 255, 255)) -> StreamingResponse:
     """Возвращает 1x1 JPEG-заглушку."""
     img = Image.new("RGB", (1, 1), color)
@@ -247,6 +373,7 @@ async def upload_svs_from_storage(
             f_path = os.path.join(user_slide_dir, f)
             if os.path.isfile(f_path) and f.lower().endswith(".svs"):
                 try:
+                    invalidate_slide(f_path)
                     os.remove(f_path)
                     logger.debug(f"Удалён старый SVS-файл: {f_path}")
                 except Exception as e:
@@ -259,30 +386,23 @@ async def upload_svs_from_storage(
             raise HTTPException(status_code=400, detail="File is not an SVS file")
 
 
-        temp_path = await fetch_file_from_smb(db_glass.scan_url)
-        logger.debug(f"SVS-файл загружен во временный файл: {temp_path}")
+        # Слайд берётся из общего локального кэша и качается с шары только один раз
+        cached_path = await fetch_cached_slide(db_glass.scan_url)
 
         try:
-            OpenSlide(temp_path)
+            OpenSlide(cached_path)
             target_path = os.path.join(user_slide_dir, filename)
-            shutil.move(temp_path, target_path)
-            logger.info(f"SVS-файл перемещён в: {target_path}")
+            await asyncio.to_thread(link_or_copy, cached_path, target_path)
+            logger.info(f"SVS-файл из кэша размещён в: {target_path}")
         except OpenSlideUnsupportedFormatError:
             logger.error(f"Файл {filename} не является допустимым SVS-форматом")
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
             raise HTTPException(status_code=400, detail=f"File {filename} is not a valid SVS format")
         except Exception as e:
             logger.error(f"Ошибка при обработке файла {filename}: {str(e)}")
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
             raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
 
 
-        try:
-            load_volume.cache_clear()
-        except NameError:
-            logger.debug("load_volume не определён, кэш не очищается")
+        dicom_volume_cache.clear()
 
         return {"message": f"Загружен файл SVS (1 шт.)"}
 
@@ -2119,6 +2119,12 @@ class PatientResponseForGetPatients(BaseModel):
 class GetAllPatientsResponce(BaseModel):
     patients: List[PatientResponseForGetPatients]
     total_count: int
+    next_cursor: Optional[str] = Field(
+        None, description="Курсор следующей страницы (передать в cursor); None — страниц больше нет"
+    )
+    total_is_estimate: bool = Field(
+        False, description="total_count — оценка снизу, а не точное количество"
+    )
 
 
 class LawyerCreate(BaseModel):
@@ -2442,6 +2448,25 @@ class CerboMeasurementResponse(BaseModel):
         from_attributes = True
 
 
+class CerboRollupFieldStats(BaseModel):
+    avg: Optional[float] = Field(None, description="Среднее за интервал")
+    min: Optional[float] = Field(None, description="Минимум за интервал")
+    max: Optional[float] = Field(None, description="Максимум за интервал")
+    last: Optional[float] = Field(None, description="Последнее значение в интервале")
+
+
+class CerboRollupPoint(BaseModel):
+    interval_start: datetime = Field(..., description="Начало интервала графика")
+    object_name: Optional[str] = Field(None, description="Имя объекта")
+    sample_count: int = Field(..., description="Количество измерений в интервале")
+    resolution_seconds: int = Field(..., description="Разрешение агрегатов, из которых собрана точка")
+    general_battery_power: CerboRollupFieldStats
+    inverter_total_ac_output: CerboRollupFieldStats
+    ess_total_input_power: CerboRollupFieldStats
+    solar_total_pv_power: CerboRollupFieldStats
+    soc: CerboRollupFieldStats
+
+
 T = TypeVar("T")
 
 
@@ -2451,6 +2476,12 @@ class PaginatedResponse(BaseModel, Generic[T]):
     page: int = Field(..., description="Текущий номер страницы (начиная с 1)")
     page_size: int = Field(..., description="Количество элементов на странице")
     total_pages: int = Field(..., description="Общее количество страниц")
+    next_cursor: Optional[str] = Field(
+        None, description="Курсор следующей страницы (передать в cursor); None — страниц больше нет"
+    )
+    total_is_estimate: bool = Field(
+        False, description="total_count — оценка снизу, а не точное количество"
+    )
 
 
 # Модель данных для управления ESS
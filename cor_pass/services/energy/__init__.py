@@ -0,0 +1 @@
+"""Energy domain services - energy integration over Cerbo measurements"""
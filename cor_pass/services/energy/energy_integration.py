@@ -0,0 +1,201 @@
+"""
+Интегрирование мощности Cerbo в энергию (кВт·ч) по интервалам.
+
+Колонки измерений переводятся в массивы numpy (секунды от начала периода
+и мощности в Вт), ряд каждого объекта интегрируется отдельно:
+
+- интеграл по каждому отрезку между соседними измерениями считается по
+  формуле трапеций;
+- отрезок, пересекающий границу интервала, делится на ней линейной
+  интерполяцией, поэтому сумма интервалов равна итогу за период;
+- отрезок длиннее max_gap_seconds — разрыв связи: через него ничего не
+  экстраполируется, интегрирование начинается заново со следующего
+  измерения; отрезки нулевой длины (повторы времени) пропускаются;
+  и те и другие возвращаются в quality;
+- для сети импорт и экспорт считаются отдельно: отрезок, где мощность
+  меняет знак, делится в точке пересечения нуля;
+- итоги за период — сумма всех интервалов, в том числе с
+  has_sufficient_data=False (флаг только помечает интервал).
+
+Интервал измерения находится через np.searchsorted по границам
+интервалов, суммы по интервалам — через np.bincount.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+
+# Поле CerboMeasurement -> ключ результата
+POWER_FIELDS = (
+    ("solar_total_pv_power", "solar"),
+    ("inverter_total_ac_output", "load"),
+    ("ess_total_input_power", "grid"),
+    ("general_battery_power", "battery"),
+)
+GRID_COLUMN = 2
+# Вт·с -> кВт·ч
+_WS_PER_KWH = 3.6e6
+# Сколько измерений в интервале считается достаточным
+SUFFICIENT_MEASUREMENTS = 3
+
+
+def interval_edges(start: datetime, end: datetime, interval_minutes: int) -> List[datetime]:
+    """Границы интервалов длиной interval_minutes от start, покрывающих [start, end)."""
+    step = timedelta(minutes=interval_minutes)
+    edges = [start]
+    while edges[-1] < end:
+        edges.append(edges[-1] + step)
+    return edges
+
+
+def integrate_power(
+    seconds: np.ndarray,
+    watts: np.ndarray,
+    edges: np.ndarray,
+    max_gap_seconds: float,
+) -> Dict[str, Any]:
+    """
+    Энергия по интервалам для одного непрерывного ряда.
+
+    seconds — время измерений по возрастанию (n,), watts — мощности (n, k),
+    edges — границы интервалов (m + 1,) в тех же секундах.
+    Возвращает energy/positive/negative (m, k) в кВт·ч, counts (m,) и
+    статистику разрывов.
+    """
+    m, k = len(edges) - 1, watts.shape[1]
+    result = {
+        "energy": np.zeros((m, k)),
+        "positive": np.zeros((m, k)),
+        "negative": np.zeros((m, k)),
+        "counts": np.zeros(m, dtype=np.int64),
+        "gap_count": 0,
+        "gap_seconds": 0.0,
+        "duplicate_count": 0,
+    }
+    n = len(seconds)
+    if n == 0 or m == 0:
+        return result
+    sample_bins = np.searchsorted(edges, seconds, side="right") - 1
+    in_range = (sample_bins >= 0) & (sample_bins < m)
+    result["counts"] = np.bincount(sample_bins[in_range], minlength=m)
+    if n < 2:
+        return result
+
+    dt = np.diff(seconds)
+    gaps = dt > max_gap_seconds
+    duplicates = dt <= 0
+    valid = ~gaps & ~duplicates
+    result["gap_count"] = int(gaps.sum())
+    result["gap_seconds"] = float(dt[gaps].sum())
+    result["duplicate_count"] = int(duplicates.sum())
+
+    # Точки на внутренних границах интервалов внутри действительных отрезков
+    segment = np.searchsorted(seconds, edges, side="right") - 1
+    split = (segment >= 0) & (segment < n - 1)
+    split[split] &= valid[segment[split]]
+    split[split] &= seconds[segment[split]] < edges[split]
+    split_segment, split_time = segment[split], edges[split]
+    fraction = (split_time - seconds[split_segment]) / dt[split_segment]
+    split_watts = watts[split_segment] + (watts[split_segment + 1] - watts[split_segment]) * fraction[:, None]
+
+    origin = np.concatenate([np.arange(n), split_segment])
+    times = np.concatenate([seconds, split_time])
+    order = np.lexsort((times, origin))
+    times, origin = times[order], origin[order]
+    values = np.concatenate([watts, split_watts])[order]
+
+    step = np.diff(times)
+    start_values, end_values = values[:-1], values[1:]
+    segment_bins = np.searchsorted(edges, times[:-1], side="right") - 1
+    use = np.append(valid, False)[origin[:-1]] & (segment_bins >= 0) & (segment_bins < m)
+
+    area = (start_values + end_values) * 0.5 * step[:, None]
+    # Положительная часть трапеции; при смене знака — до точки пересечения нуля
+    up, down = np.maximum(start_values, 0.0), np.maximum(end_values, 0.0)
+    crosses = start_values * end_values < 0
+    span = np.where(crosses, np.abs(start_values) + np.abs(end_values), 1.0)
+    positive = np.where(
+        crosses,
+        (up * up + down * down) / span * 0.5 * step[:, None],
+        (up + down) * 0.5 * step[:, None],
+    )
+    finite = np.isfinite(area)
+    area = np.where(finite, area, 0.0) / _WS_PER_KWH
+    positive = np.where(finite, positive, 0.0) / _WS_PER_KWH
+
+    bins = segment_bins[use]
+    for column in range(k):
+        result["energy"][:, column] = np.bincount(bins, weights=area[use, column], minlength=m)
+        result["positive"][:, column] = np.bincount(bins, weights=positive[use, column], minlength=m)
+    result["negative"] = result["energy"] - result["positive"]
+    return result
+
+
+def energy_report(
+    rows: Sequence[Sequence[Any]],
+    start: datetime,
+    end: datetime,
+    interval_minutes: int,
+    max_gap_seconds: float,
+) -> Dict[str, Any]:
+    """
+    Отчёт get_energy_measurements_service из строк
+    (energetic_object_id, measured_at, solar, load, grid, battery),
+    отсортированных по measured_at.
+    """
+    edges = interval_edges(start, end, interval_minutes)
+    m, k = len(edges) - 1, len(POWER_FIELDS)
+    edge_seconds = np.array([(edge - start).total_seconds() for edge in edges])
+
+    energy, positive = np.zeros((m, k)), np.zeros((m, k))
+    counts = np.zeros(m, dtype=np.int64)
+    quality = {"gap_count": 0, "gap_hours": 0.0, "duplicate_count": 0, "max_gap_seconds": max_gap_seconds}
+
+    if rows:
+        objects, measured_at, *columns = zip(*rows)
+        seconds = (
+            np.array(measured_at, dtype="datetime64[us]") - np.datetime64(start, "us")
+        ) / np.timedelta64(1, "s")
+        watts = np.array(columns, dtype=np.float64).T
+        object_codes = np.unique(np.array(objects, dtype=object), return_inverse=True)[1]
+        # Ряд каждого объекта интегрируется отдельно; stable сохраняет порядок по времени
+        order = np.argsort(object_codes, kind="stable")
+        boundaries = np.flatnonzero(np.diff(object_codes[order])) + 1
+        for part in np.split(order, boundaries):
+            series = integrate_power(seconds[part], watts[part], edge_seconds, max_gap_seconds)
+            energy += series["energy"]
+            positive += series["positive"]
+            counts += series["counts"]
+            quality["gap_count"] += series["gap_count"]
+            quality["gap_hours"] += series["gap_seconds"] / 3600.0
+            quality["duplicate_count"] += series["duplicate_count"]
+    quality["gap_hours"] = round(quality["gap_hours"], 3)
+
+    intervals = []
+    for index in range(m):
+        solar, load, grid, battery = energy[index]
+        intervals.append({
+            "interval_start": edges[index],
+            "interval_end": edges[index + 1],
+            "solar_energy_kwh": round(float(solar), 3),
+            "load_energy_kwh": round(float(load), 3),
+            "grid_energy_kwh": round(float(grid), 3),
+            "battery_energy_kwh": round(float(battery), 3),
+            "measurement_count": int(counts[index]),
+            "has_sufficient_data": bool(counts[index] >= SUFFICIENT_MEASUREMENTS),
+        })
+
+    totals = energy.sum(axis=0)
+    return {
+        "intervals": intervals,
+        "totals": {
+            "solar_energy_total": round(float(totals[0]), 0),
+            "load_energy_total": round(float(totals[1]), 0),
+            "grid_import_total": round(float(positive[:, GRID_COLUMN].sum()), 0),
+            "grid_export_total": round(float(-(energy - positive)[:, GRID_COLUMN].sum()), 0),
+            "battery_energy_total": round(float(totals[3]), 0),
+        },
+        "quality": quality,
+    }
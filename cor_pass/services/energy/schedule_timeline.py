@@ -0,0 +1,133 @@
+"""
+Таймлайн расписаний энергетического объекта.
+
+Расписания повторяются каждые сутки по местному времени объекта, поэтому
+активное расписание меняется только в моменты start_time/end_time одного из
+них (и при переводе часов). ScheduleTimeline хранит снимок операционных
+расписаний объекта и по текущему моменту отдаёт активное расписание и
+ближайший момент, когда оно может смениться: воркеру достаточно проснуться
+в этот момент, а не опрашивать БД по кругу.
+
+При изменении расписаний API публикует id объекта в Redis-канал
+SCHEDULE_CHANGES_CHANNEL (notify_schedules_changed), воркер по нему
+перестраивает таймлайн объекта.
+"""
+
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Iterable, List, Optional
+from zoneinfo import ZoneInfo
+
+from loguru import logger
+
+
+SCHEDULE_CHANGES_CHANNEL = "energy:schedules"
+# Сколько суток вперёд искать следующий переход
+_LOOKAHEAD_DAYS = 3
+
+
+@dataclass(frozen=True)
+class ScheduleWindow:
+    """Снимок операционного расписания, не привязанный к сессии БД."""
+
+    id: str
+    start_time: time
+    end_time: time
+    grid_feed_w: int
+    battery_level_percent: int
+    charge_battery_value: int
+
+    @classmethod
+    def from_schedule(cls, schedule) -> "ScheduleWindow":
+        return cls(
+            id=schedule.id,
+            start_time=schedule.start_time,
+            end_time=schedule.end_time,
+            grid_feed_w=schedule.grid_feed_w,
+            battery_level_percent=schedule.battery_level_percent,
+            charge_battery_value=schedule.charge_battery_value,
+        )
+
+    def contains(self, local_time: time) -> bool:
+        if self.start_time <= self.end_time:
+            return self.start_time <= local_time < self.end_time
+        # Окно через полночь
+        return local_time >= self.start_time or local_time < self.end_time
+
+
+class ScheduleTimeline:
+    """Операционные расписания одного объекта и моменты их переключения."""
+
+    def __init__(self, schedules: Iterable, timezone_name: str):
+        # Порядок как в get_all_schedules (по start_time): при пересечении окон побеждает первое
+        self.windows: List[ScheduleWindow] = [
+            ScheduleWindow.from_schedule(s)
+            for s in sorted(schedules, key=lambda s: s.start_time)
+            if not s.is_manual_mode
+        ]
+        self.timezone_name = timezone_name
+        self.tz = ZoneInfo(timezone_name)
+        self._boundaries = sorted({w.start_time for w in self.windows} | {w.end_time for w in self.windows})
+
+    def active_at(self, now: datetime) -> Optional[ScheduleWindow]:
+        """Активное в момент now (aware datetime) расписание или None."""
+        local_time = now.astimezone(self.tz).time()
+        return next((w for w in self.windows if w.contains(local_time)), None)
+
+    def get_window(self, schedule_id: Optional[str]) -> Optional[ScheduleWindow]:
+        return next((w for w in self.windows if w.id == schedule_id), None)
+
+    def _local_instants(self, day: date, boundary: time) -> List[datetime]:
+        # Обе трактовки времени, попадающего на перевод часов назад
+        return [
+            datetime.combine(day, boundary, tzinfo=self.tz).replace(fold=fold).astimezone(timezone.utc)
+            for fold in (0, 1)
+        ]
+
+    def _offset_change(self, start: datetime, end: datetime) -> Optional[datetime]:
+        """Момент перевода часов в (start, end] с точностью до секунды или None."""
+        offset = start.astimezone(self.tz).utcoffset()
+        if end.astimezone(self.tz).utcoffset() == offset:
+            return None
+        low, high = start, end
+        while high - low > timedelta(seconds=1):
+            middle = low + (high - low) / 2
+            if middle.astimezone(self.tz).utcoffset() == offset:
+                low = middle
+            else:
+                high = middle
+        return high
+
+    def next_transition(self, now: datetime) -> Optional[datetime]:
+        """
+        Ближайший момент после now (UTC), когда активное расписание может
+        смениться; None, если операционных расписаний нет.
+        """
+        if not self._boundaries:
+            return None
+        now = now.astimezone(timezone.utc)
+        today = now.astimezone(self.tz).date()
+        candidates = [
+            instant
+            for offset in range(-1, _LOOKAHEAD_DAYS)
+            for boundary in self._boundaries
+            for instant in self._local_instants(today + timedelta(days=offset), boundary)
+            if instant > now
+        ]
+        transition = min(candidates)
+        # Перевод часов сдвигает местное время скачком — тоже возможная смена окна
+        return self._offset_change(now, transition) or transition
+
+
+async def notify_schedules_changed(energetic_object_id: str) -> None:
+    """
+    Сообщает воркеру, что расписания (или часовой пояс) объекта изменились.
+    Ошибка Redis не прерывает запрос: воркер всё равно перечитает
+    расписания через schedule_resync_interval.
+    """
+    from cor_pass.database.redis_db import redis_client
+
+    try:
+        await redis_client.publish(SCHEDULE_CHANGES_CHANNEL, energetic_object_id)
+    except Exception as e:
+        logger.warning(f"⚠️ Не удалось опубликовать изменение расписаний объекта {energetic_object_id}: {e}")
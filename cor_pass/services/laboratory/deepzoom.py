@@ -0,0 +1,164 @@
+"""
+DeepZoom-пирамида для SVS-слайдов поверх кэша дескрипторов OpenSlide.
+
+Адресация тайлов стандартная (DZI-дескриптор + level/col_row), а в URL
+входит идентификатор содержимого слайда, поэтому ответы можно кэшировать
+как неизменяемые.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import Literal, Optional, Tuple, get_args
+
+from openslide import OpenSlide
+from openslide.deepzoom import DeepZoomGenerator
+
+from cor_pass.services.laboratory.slide_cache import slide_handles, tile_cache
+from cor_pass.services.laboratory.slide_tile_store import slide_store_key, slide_tile_store
+
+
+DZ_TILE_SIZE = 254
+DZ_OVERLAP = 1
+DZ_LIMIT_BOUNDS = False
+# Форматы тайлов; Literal проверяет query-параметр на уровне FastAPI
+DZFormat = Literal["jpeg", "png"]
+DZ_FORMATS = {fmt: f"image/{fmt}" for fmt in get_args(DZFormat)}
+DZ_STORE_QUALITY = 75
+THUMBNAIL_SIZE = (512, 512)
+
+_MAX_GENERATORS = 16
+
+
+def slide_content_id(svs_path: str) -> str:
+    """Идентификатор версии слайда: меняется при замене файла."""
+    st = os.stat(svs_path)
+    raw = f"{os.path.abspath(svs_path)}:{st.st_mtime_ns}:{st.st_size}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+_generators: "OrderedDict[Tuple[str, str], DeepZoomGenerator]" = OrderedDict()
+_generators_lock = threading.Lock()
+
+
+def get_generator(svs_path: str) -> DeepZoomGenerator:
+    """Возвращает DeepZoomGenerator для слайда, переиспользуя уже созданные."""
+    key = (os.path.abspath(svs_path), slide_content_id(svs_path))
+    with _generators_lock:
+        generator = _generators.get(key)
+        if generator is not None:
+            _generators.move_to_end(key)
+            return generator
+
+    generator = DeepZoomGenerator(
+        slide_handles.get(svs_path),
+        tile_size=DZ_TILE_SIZE,
+        overlap=DZ_OVERLAP,
+        limit_bounds=DZ_LIMIT_BOUNDS,
+    )
+    with _generators_lock:
+        _generators[key] = generator
+        while len(_generators) > _MAX_GENERATORS:
+            _generators.popitem(last=False)
+    return generator
+
+
+def get_dzi(svs_path: str, fmt: str = "jpeg") -> str:
+    return get_generator(svs_path).get_dzi(fmt)
+
+
+def local_store_key(svs_path: str) -> str:
+    """Ключ локальной копии слайда в хранилище заранее отрендеренных тайлов."""
+    return slide_store_key(svs_path, os.path.getsize(svs_path))
+
+
+def tile_etag(content_id: str, level: int, col: int, row: int, fmt: str, quality: int) -> str:
+    """Сильный ETag тайла: определяется версией слайда и адресом тайла."""
+    raw = f"{content_id}:{DZ_TILE_SIZE}:{DZ_OVERLAP}:{level}:{col}:{row}:{fmt}:{quality}"
+    return '"' + hashlib.sha1(raw.encode()).hexdigest() + '"'
+
+
+def render_tile(
+    svs_path: str, level: int, col: int, row: int, fmt: str, quality: int
+) -> Optional[bytes]:
+    """
+    Возвращает закодированный тайл пирамиды или None, если адрес вне пирамиды.
+
+    Каждый тайл рендерится один раз и дальше отдаётся из кэша тайлов.
+    """
+    abs_path = os.path.abspath(svs_path)
+    key = (abs_path, slide_content_id(svs_path), "dz", level, col, row, fmt, quality)
+    data = tile_cache.get(key)
+    if data is not None:
+        return data
+
+    if fmt == "jpeg" and quality == DZ_STORE_QUALITY:
+        data = slide_tile_store.read_tile(local_store_key(svs_path), level, col, row)
+        if data is not None:
+            tile_cache.put(key, data)
+            return data
+
+    generator = get_generator(svs_path)
+    if level < 0 or level >= generator.level_count:
+        return None
+    cols, rows = generator.level_tiles[level]
+    if col < 0 or col >= cols or row < 0 or row >= rows:
+        return None
+
+    tile = generator.get_tile(level, (col, row))
+    buf = BytesIO()
+    if fmt == "jpeg":
+        tile.convert("RGB").save(buf, format="JPEG", quality=quality)
+    else:
+        tile.save(buf, format="PNG")
+    data = buf.getvalue()
+    tile_cache.put(key, data)
+    return data
+
+
+def pretile_slide(svs_path: str, store_key: str, max_tiles: int) -> int:
+    """
+    Рендерит нижние уровни пирамиды и миниатюру слайда в хранилище тайлов.
+
+    Уровни идут от самого мелкого, пока суммарное число тайлов не превысит
+    max_tiles. Возвращает количество записанных тайлов.
+    """
+    slide = OpenSlide(svs_path)
+    try:
+        generator = DeepZoomGenerator(
+            slide,
+            tile_size=DZ_TILE_SIZE,
+            overlap=DZ_OVERLAP,
+            limit_bounds=DZ_LIMIT_BOUNDS,
+        )
+        written = 0
+
+        def build(target_dir: str) -> None:
+            nonlocal written
+            with open(os.path.join(target_dir, "slide.dzi"), "w", encoding="utf-8") as f:
+                f.write(generator.get_dzi("jpeg"))
+            slide.get_thumbnail(THUMBNAIL_SIZE).save(
+                os.path.join(target_dir, "thumbnail.png"), format="PNG"
+            )
+            for level in range(generator.level_count):
+                cols, rows = generator.level_tiles[level]
+                if written + cols * rows > max_tiles:
+                    break
+                level_dir = os.path.join(target_dir, str(level))
+                os.makedirs(level_dir, exist_ok=True)
+                for row in range(rows):
+                    for col in range(cols):
+                        tile = generator.get_tile(level, (col, row)).convert("RGB")
+                        tile.save(
+                            os.path.join(level_dir, f"{col}_{row}.jpeg"),
+                            format="JPEG",
+                            quality=DZ_STORE_QUALITY,
+                        )
+                        written += 1
+
+        slide_tile_store.write_slide(store_key, build)
+        return written
+    finally:
+        slide.close()
@@ -0,0 +1,222 @@
+"""
+Приём DICOM-исследований без блокировки event loop.
+
+Загрузка собирается во временной папке рядом с папкой пользователя:
+файлы пишутся на диск кусками, zip-архивы распаковываются, заголовки
+проверяются (stop_before_pixels) в пуле потоков. Готовая папка
+подменяет старую переименованием, поэтому просмотрщик до последнего
+момента видит прежнюю серию, а неудачная загрузка её не затирает.
+Ход загрузки доступен через get_progress.
+"""
+
+import asyncio
+import os
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, List, Optional
+
+import pydicom
+from loguru import logger
+
+from cor_pass.config.config import settings
+from cor_pass.services.laboratory.slide_cache import invalidate_slide
+
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class IngestError(Exception):
+    """Загрузка не содержит ни одного пригодного файла."""
+
+
+class IngestProgress:
+    """Ход одной загрузки; обновляется из потоков пула, читается из роутов."""
+
+    def __init__(self, files_total: int):
+        self._lock = threading.Lock()
+        self.stage = "receiving"
+        self.files_total = files_total
+        self.files_received = 0
+        self.bytes_received = 0
+        self.archives_extracted = 0
+        self.files_to_validate = 0
+        self.files_validated = 0
+        self.valid_dicom = 0
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def update(self, **fields) -> None:
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    def add(self, **increments) -> None:
+        with self._lock:
+            for name, value in increments.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "stage": self.stage,
+                "files_total": self.files_total,
+                "files_received": self.files_received,
+                "bytes_received": self.bytes_received,
+                "archives_extracted": self.archives_extracted,
+                "files_to_validate": self.files_to_validate,
+                "files_validated": self.files_validated,
+                "valid_dicom": self.valid_dicom,
+                "error": self.error,
+                "elapsed_seconds": round((self.finished_at or time.time()) - self.started_at, 1),
+            }
+
+
+_progress: Dict[str, IngestProgress] = {}
+
+
+def get_progress(user_key: str) -> Optional[dict]:
+    progress = _progress.get(user_key)
+    return progress.snapshot() if progress else None
+
+
+def _inside(root: str, path: str) -> bool:
+    root = os.path.realpath(root)
+    return os.path.commonpath([root, os.path.realpath(path)]) == root
+
+
+def save_upload(source: BinaryIO, target_path: str, progress: IngestProgress) -> None:
+    """Копирует загруженный файл на диск кусками, обновляя счётчик байт."""
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    with open(target_path, "wb") as out:
+        while True:
+            chunk = source.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            out.write(chunk)
+            progress.add(bytes_received=len(chunk))
+
+
+def extract_archive(archive_path: str, target_dir: str) -> None:
+    with zipfile.ZipFile(archive_path, "r") as zip_ref:
+        for member in zip_ref.namelist():
+            if not _inside(target_dir, os.path.join(target_dir, member)):
+                raise ValueError("Zip Slip атака предотвращена!")
+        zip_ref.extractall(target_dir)
+
+
+def dicom_candidates(root_dir: str) -> List[str]:
+    """Файлы, похожие на срезы: с расширением .dcm или без расширения."""
+    paths = []
+    for root, dirs, files in os.walk(root_dir):
+        for f in files:
+            if f.startswith(".") or f.lower().endswith(".svs"):
+                continue
+            if f.lower().endswith(".dcm") or "." not in f:
+                paths.append(os.path.join(root, f))
+    return paths
+
+
+def validate_dicom(path: str) -> bool:
+    """Проверяет заголовок; непрочитанный файл удаляется."""
+    try:
+        pydicom.dcmread(path, stop_before_pixels=True)
+        return True
+    except Exception:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return False
+
+
+def swap_directory(staging_dir: str, user_dir: str) -> None:
+    """Подменяет папку пользователя собранной; старая удаляется после подмены."""
+    trash_dir = None
+    if os.path.exists(user_dir):
+        old_slides = os.path.join(user_dir, "slides")
+        if os.path.isdir(old_slides):
+            for f in os.listdir(old_slides):
+                invalidate_slide(os.path.join(old_slides, f))
+        trash_dir = f"{user_dir}.old-{uuid.uuid4().hex}"
+        os.rename(user_dir, trash_dir)
+    os.rename(staging_dir, user_dir)
+    if trash_dir:
+        shutil.rmtree(trash_dir, ignore_errors=True)
+
+
+class DicomIngestor:
+    def __init__(self, workers: int):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="dicom-ingest")
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+
+    async def ingest(self, user_dir: str, uploads: list) -> int:
+        """
+        Принимает список UploadFile и подменяет ими содержимое user_dir.
+
+        Возвращает число валидных DICOM-файлов; IngestError, если их нет.
+        """
+        user_key = os.path.basename(os.path.normpath(user_dir))
+        progress = IngestProgress(files_total=len(uploads))
+        _progress[user_key] = progress
+        staging_dir = os.path.join(
+            os.path.dirname(os.path.normpath(user_dir)), f".staging-{user_key}-{uuid.uuid4().hex}"
+        )
+        try:
+            os.makedirs(os.path.join(staging_dir, "slides"))
+            archives = []
+            for upload in uploads:
+                target_path = os.path.join(staging_dir, upload.filename)
+                if not _inside(staging_dir, target_path):
+                    logger.warning(f"Пропущен файл с недопустимым именем: {upload.filename}")
+                    continue
+                await self._run(save_upload, upload.file, target_path, progress)
+                progress.add(files_received=1)
+                if upload.filename.lower().endswith(".zip"):
+                    archives.append(target_path)
+
+            progress.update(stage="extracting")
+            for archive_path in archives:
+                try:
+                    await self._run(extract_archive, archive_path, staging_dir)
+                    progress.add(archives_extracted=1)
+                except Exception as e:
+                    logger.error(f"Ошибка распаковки {os.path.basename(archive_path)}: {e}")
+                finally:
+                    os.remove(archive_path)
+
+            progress.update(stage="validating")
+            candidates = await self._run(dicom_candidates, staging_dir)
+            progress.update(files_to_validate=len(candidates))
+            loop = asyncio.get_running_loop()
+            valid_dicom = 0
+            for future in asyncio.as_completed(
+                [loop.run_in_executor(self._pool, validate_dicom, path) for path in candidates]
+            ):
+                is_valid = await future
+                valid_dicom += int(is_valid)
+                progress.add(files_validated=1, valid_dicom=int(is_valid))
+
+            if valid_dicom == 0:
+                raise IngestError("No valid DICOM or SVS files found.")
+
+            progress.update(stage="publishing")
+            await self._run(swap_directory, staging_dir, user_dir)
+            progress.update(stage="done", finished_at=time.time())
+            logger.info(f"Загружено {valid_dicom} срезов DICOM для {user_key}")
+            return valid_dicom
+        except Exception as e:
+            progress.update(stage="failed", error=str(e), finished_at=time.time())
+            raise
+        finally:
+            if os.path.exists(staging_dir):
+                await self._run(shutil.rmtree, staging_dir, True)
+
+
+dicom_ingestor = DicomIngestor(workers=settings.dicom_decode_workers)
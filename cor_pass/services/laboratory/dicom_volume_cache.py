@@ -0,0 +1,316 @@
+"""
+Общий кэш DICOM-томов для просмотрщика.
+
+Срезы серии декодируются параллельно, собранный float32-том сохраняется на
+диск в .npy и открывается через memmap. Файл адресуется отпечатком серии
+(пути, размеры и mtime файлов), поэтому все воркеры gunicorn читают одну и
+ту же копию через page cache, а не держат каждый свою. Объём папки кэша
+ограничен, при превышении удаляются давно не открывавшиеся тома.
+
+Чтобы горячие запросы срезов не обходили папку и не делали stat каждого
+файла, отпечаток серии запоминается на series_ttl секунд и сбрасывается
+раньше при изменении mtime папки пользователя или вызове clear().
+
+Структура:
+    {root}/{key}.npy   — том (срезы, строки, столбцы)
+    {root}/{key}.json  — путь к файлу-образцу для метаданных и число срезов
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter as ShapeCounter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pydicom
+from loguru import logger
+from prometheus_client import Counter
+from skimage.transform import resize
+
+from cor_pass.config.config import settings
+
+
+# Счетчик обращений к кэшу DICOM-томов
+dicom_volume_cache_requests_total = Counter(
+    "dicom_volume_cache_requests_total",
+    "Total number of DICOM volume cache lookups",
+    ["result"],
+)
+
+# Файлы, которые точно не являются срезами серии
+SKIPPED_EXTENSIONS = (".svs", ".zip", ".png", ".jpg", ".jpeg")
+
+Slice = Tuple[float, np.ndarray, str]
+
+
+def list_dicom_files(user_dicom_dir: str) -> List[str]:
+    return sorted(
+        os.path.join(root, f)
+        for root, dirs, files in os.walk(user_dicom_dir)
+        for f in files
+        if not f.startswith(".") and not f.lower().endswith(SKIPPED_EXTENSIONS)
+    )
+
+
+def series_key(paths: List[str]) -> str:
+    """Отпечаток набора файлов: меняется при добавлении, удалении или замене любого из них."""
+    digest = hashlib.sha1()
+    for path in paths:
+        st = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def read_dataset(path: str, **kwargs) -> Optional[pydicom.Dataset]:
+    for attempt in (
+        lambda: pydicom.dcmread(path, **kwargs),
+        lambda: pydicom.dcmread(path, force=True, **kwargs),
+        lambda: pydicom.dcmread(path, force=True, defer_size=1024, **kwargs),
+    ):
+        try:
+            return attempt()
+        except Exception:
+            continue
+    return None
+
+
+def decode_slice(path: str) -> Optional[Tuple[pydicom.Dataset, np.ndarray]]:
+    """Читает один срез и возвращает (dataset, float32-пиксели с rescale) или None."""
+    ds = read_dataset(path)
+    if ds is None:
+        logger.debug(f"[WARN] Не удалось прочитать файл {path}")
+        return None
+
+    # Декомпрессия при необходимости
+    if hasattr(ds, "file_meta") and hasattr(ds.file_meta, "TransferSyntaxUID"):
+        if ds.file_meta.TransferSyntaxUID.is_compressed:
+            try:
+                ds.decompress()
+            except Exception as e:
+                logger.debug(f"[WARN] Не удалось декомпрессировать {path}: {e}")
+                return None
+
+    if not hasattr(ds, "ImagePositionPatient") or not hasattr(ds, "ImageOrientationPatient"):
+        logger.debug(f"[WARN] Файл {path} не содержит ImagePositionPatient/ImageOrientationPatient")
+        return None
+
+    try:
+        arr = ds.pixel_array.astype(np.float32)
+        slope = float(getattr(ds, "RescaleSlope", 1.0))
+        intercept = float(getattr(ds, "RescaleIntercept", 0.0))
+        if slope != 1.0:
+            arr *= slope
+        if intercept != 0.0:
+            arr += intercept
+    except Exception as e:
+        logger.debug(f"[WARN] Ошибка обработки {path}: {e}")
+        return None
+    return ds, arr
+
+
+def decode_series(paths: List[str], workers: int) -> Tuple[List[Slice], int]:
+    """
+    Параллельно декодирует срезы и сортирует их вдоль нормали к срезу.
+
+    Возвращает список (позиция, пиксели, путь) и число пропущенных файлов.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        decoded = list(pool.map(decode_slice, paths))
+
+    items = [(result[0], result[1], path) for result, path in zip(decoded, paths) if result is not None]
+    skipped = len(paths) - len(items)
+    if not items:
+        raise RuntimeError("Нет подходящих DICOM-файлов с ImagePositionPatient.")
+
+    orientation = items[0][0].ImageOrientationPatient
+    normal = np.cross(orientation[:3], orientation[3:])
+    slices = [
+        (float(np.dot(ds.ImagePositionPatient, normal)), arr, path)
+        for ds, arr, path in items
+    ]
+    slices.sort(key=lambda item: item[0])
+    return slices, skipped
+
+
+class DicomVolumeCache:
+    def __init__(
+        self, root: str, max_bytes: int, workers: int, max_opened: int = 16, series_ttl: float = 5.0
+    ):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.max_opened = max_opened
+        self.series_ttl = series_ttl
+        # Открытые memmap'ы процесса: сами данные лежат в page cache, а не в куче
+        self._opened: "OrderedDict[str, Tuple[np.ndarray, pydicom.Dataset]]" = OrderedDict()
+        # Папка пользователя -> (mtime папки, момент проверки, ключ серии, файлы)
+        self._series: Dict[str, Tuple[int, float, str, List[str]]] = {}
+        self._lock = threading.Lock()
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        base = os.path.join(self.root, key)
+        return f"{base}.npy", f"{base}.json"
+
+    def load(self, user_dicom_dir: str) -> Tuple[np.ndarray, pydicom.Dataset]:
+        """Возвращает (том только для чтения, dataset-образец без пикселей)."""
+        _, volume, example_ds = self.load_with_key(user_dicom_dir)
+        return volume, example_ds
+
+    def load_with_key(self, user_dicom_dir: str) -> Tuple[str, np.ndarray, pydicom.Dataset]:
+        """То же, что load, плюс ключ серии — для кэшей, производных от тома."""
+        key, paths = self._series_key(user_dicom_dir)
+
+        with self._lock:
+            cached = self._opened.get(key)
+            if cached is not None:
+                self._opened.move_to_end(key)
+        if cached is not None:
+            dicom_volume_cache_requests_total.labels(result="hit").inc()
+            return (key,) + cached
+
+        opened = self._open(key)
+        if opened is not None:
+            dicom_volume_cache_requests_total.labels(result="hit").inc()
+        else:
+            opened = self._build(key, paths)
+        volume, example_path = opened
+        cached = volume, read_dataset(example_path, stop_before_pixels=True)
+        with self._lock:
+            self._opened[key] = cached
+            while len(self._opened) > self.max_opened:
+                self._opened.popitem(last=False)
+        return (key,) + cached
+
+    def _series_key(self, user_dicom_dir: str) -> Tuple[str, List[str]]:
+        """Ключ серии и её файлы; полный обход папки не чаще раза в series_ttl."""
+        dir_mtime = os.stat(user_dicom_dir).st_mtime_ns
+        now = time.monotonic()
+        with self._lock:
+            cached = self._series.get(user_dicom_dir)
+        if cached is not None and cached[0] == dir_mtime and now - cached[1] < self.series_ttl:
+            return cached[2], cached[3]
+
+        paths = list_dicom_files(user_dicom_dir)
+        if not paths:
+            raise RuntimeError("Нет подходящих DICOM-файлов с ImagePositionPatient.")
+        key = series_key(paths)
+        with self._lock:
+            self._series[user_dicom_dir] = (dir_mtime, now, key, paths)
+        return key, paths
+
+    def _open(self, key: str) -> Optional[Tuple[np.ndarray, str]]:
+        volume_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            volume = np.load(volume_path, mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            return None
+        try:
+            os.utime(volume_path)
+        except OSError:
+            pass
+        return volume, meta["example_path"]
+
+    def _build(self, key: str, paths: List[str]) -> Tuple[np.ndarray, str]:
+        os.makedirs(self.root, exist_ok=True)
+        # Один и тот же том собирает только один процесс, остальные ждут и открывают готовый
+        with open(os.path.join(self.root, f".{key}.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                opened = self._open(key)
+                if opened is not None:
+                    dicom_volume_cache_requests_total.labels(result="hit").inc()
+                    return opened
+                dicom_volume_cache_requests_total.labels(result="miss").inc()
+                logger.debug("[INFO] Загружаем том из DICOM-файлов...")
+                slices, skipped = decode_series(paths, self.workers)
+                volume_path, meta_path = self._paths(key)
+                write_volume(volume_path, [arr for _, arr, _ in slices])
+                example_path = slices[0][2]
+                tmp_meta = f"{meta_path}.tmp"
+                with open(tmp_meta, "w", encoding="utf-8") as f:
+                    json.dump({"example_path": example_path, "slices": len(slices)}, f)
+                os.replace(tmp_meta, meta_path)
+                logger.debug(f"[INFO] Загружено срезов: {len(slices)}, пропущено файлов: {skipped}")
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        self.enforce_limit(keep=key)
+        return np.load(volume_path, mmap_mode="r"), example_path
+
+    def clear(self) -> None:
+        """
+        Забывает открытые в процессе тома и отпечатки серий; файлы на диске
+        остаются и вытесняются по лимиту.
+        """
+        with self._lock:
+            self._opened.clear()
+            self._series.clear()
+
+    def enforce_limit(self, keep: str = "") -> int:
+        volumes = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".npy"):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            volumes.append((st.st_mtime, st.st_size, name[:-len(".npy")]))
+
+        total = sum(size for _, size, _ in volumes)
+        removed = 0
+        for _, size, key in sorted(volumes):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for path in self._paths(key):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            with self._lock:
+                self._opened.pop(key, None)
+            total -= size
+            removed += 1
+            logger.debug(f"DICOM-том {key} удалён из кэша")
+        return removed
+
+
+def write_volume(volume_path: str, slices: List[np.ndarray]) -> None:
+    """
+    Пишет срезы сразу в .npy через memmap, приводя к самой частой форме.
+
+    Так в памяти не держится вторая копия тома, как при np.stack.
+    """
+    target_shape = ShapeCounter(arr.shape for arr in slices).most_common(1)[0][0]
+    tmp_path = f"{volume_path}.tmp"
+    try:
+        out = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=np.float32, shape=(len(slices),) + tuple(target_shape)
+        )
+        for i, arr in enumerate(slices):
+            if arr.shape != target_shape:
+                arr = resize(arr, target_shape, preserve_range=True)
+            out[i] = arr
+        out.flush()
+        del out
+        os.replace(tmp_path, volume_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+dicom_volume_cache = DicomVolumeCache(
+    root=settings.dicom_volume_cache_dir,
+    max_bytes=settings.dicom_volume_cache_max_mb * 1024 * 1024,
+    workers=settings.dicom_decode_workers,
+    series_ttl=settings.dicom_series_key_ttl,
+)
@@ -1,54 +1,83 @@
-from typing import List
+from typing import Dict, List
 
 from fastapi import HTTPException, Request, status
-import httpx
 from loguru import logger
 
 from cor_pass.schemas import PrintLabel
+from cor_pass.services.laboratory.print_jobs import PrintJobResult, print_dispatcher
 
 
-PRINTER_BASE_URL = "http://{printer_ip}:8080/task/new"
+TEST_PRINT_BASE_URL = "http://dev-corid.cor-medical.ua/"
+
+
+def is_test_printing(request: Request) -> bool:
+    """На тестовом стенде принтеров нет — печать только имитируется."""
+    logger.debug(request.base_url)
+    return request.base_url == TEST_PRINT_BASE_URL
+
+
+def glass_label_content(
+    clinic_name: str,
+    case_code: str,
+    sample_number: str,
+    cassette_number: str,
+    glass_number: int,
+    staining_abbr: str,
+    patient_cor_id: str,
+) -> str:
+    # Старый формат с добавлением разделителей _ для парсинга
+    # Сканер игнорирует |, поэтому остаются только _
+    return f"{case_code}|_{cassette_number}|_{clinic_name}|_{sample_number}|_L{glass_number}|_{staining_abbr}|_{patient_cor_id}"
+
+
+def cassette_label_content(
+    clinic_name: str,
+    case_code: str,
+    sample_number: str,
+    cassette_number: str,
+    hooper: str,
+    patient_cor_id: str,
+) -> str:
+    glass_number = "-"
+    staining = "-"
+    return f"{clinic_name}|{case_code}|{sample_number}|{cassette_number}|L{glass_number}|{staining}|{hooper}|{patient_cor_id}"
+
+
+def _raise_for_job(job: PrintJobResult) -> None:
+    if job.success:
+        return
+    failed = job.failed[0]
+    if failed.status_code is not None:
+        raise HTTPException(status_code=failed.status_code, detail=failed.error)
+    raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=failed.error)
+
 
 async def print_labels(printer_ip: str, labels_to_print: List[PrintLabel], request: Request):
     """
     Отправляет запрос на печать меток на принтер.
 
     """
-    logger.debug(request.base_url)
-    if request.base_url == "http://dev-corid.cor-medical.ua/":
+    if is_test_printing(request):
         logger.debug("Тестовая печать успешна")
         return {"success": True, "printer_response": "Делаем вид что принтер напечатал"}
-    printer_url = PRINTER_BASE_URL.format(printer_ip=printer_ip)
-    try:
-        async with httpx.AsyncClient() as client:
-            labels_data = [label.dict() for label in labels_to_print]
-            
-            logger.debug(f"Отправка на принтер {printer_url}: {labels_data}") 
-
-            response = await client.post(
-                printer_url,
-                json={"labels": labels_data},
-                timeout=10
-            )
-            response.raise_for_status()
-
-            logger.debug(f"Статус ответа принтера: {response.status_code}, тело: {response.text}")
-            return {"success": True, "printer_response": response.text}
-
-    except httpx.HTTPStatusError as e:
-        logger.error(f"Произошла HTTP ошибка: {e.response.text}")
-        raise HTTPException(
-            status_code=e.response.status_code,
-            detail=f"Принтер ответил ошибкой: {e.response.text}"
-        )
-    except httpx.RequestError as e:
-        logger.error(f"Произошла ошибка запроса: {e}")
-        raise HTTPException(
-            status_code=503,
-            detail=f"Не удалось подключиться к принтеру по адресу {printer_ip}: {str(e)}"
-        )
-    except Exception as e:
-        logger.error(f"Произошла непредвиденная ошибка: {e}")
-        raise HTTPException(
-            status_code=503, detail=f"Не удалось отправить на принтер: {str(e)}"
-        )
\ No newline at end of file
+    job = await print_dispatcher.submit(printer_ip, labels_to_print)
+    _raise_for_job(job)
+    return job.to_dict()
+
+
+async def print_label_groups(
+    jobs: Dict[str, List[PrintLabel]], request: Request
+) -> Dict[str, PrintJobResult]:
+    """
+    Печатает метки, сгруппированные по IP принтера.
+
+    В отличие от print_labels не бросает исключение: частичный успех
+    возвращается как статусы отдельных меток.
+    """
+    if is_test_printing(request):
+        logger.debug("Тестовая печать успешна")
+        return {
+            printer_ip: PrintJobResult.simulated(printer_ip, labels)
+            for printer_ip, labels in jobs.items()
+        }
+    return await print_dispatcher.submit_many(jobs)
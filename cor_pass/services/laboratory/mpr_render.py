@@ -0,0 +1,181 @@
+"""
+Рендер срезов MPR (аксиальный, сагиттальный, корональный) для DICOM-просмотрщика.
+
+Окно/уровень применяется через таблицу преобразования (LUT) по целым
+значениям среза, готовые закодированные изображения кэшируются по
+(серия, плоскость, индекс, окно, размер, формат), а ETag строится из того
+же ключа — повторный запрос отдаётся без рендера или вовсе отвечает 304.
+"""
+
+import hashlib
+import math
+from functools import lru_cache
+from io import BytesIO
+from typing import Optional, Tuple
+
+import numpy as np
+import pydicom
+from PIL import Image, ImageOps
+
+from cor_pass.config.config import settings
+from cor_pass.services.laboratory.slide_cache import TileCache
+
+
+MPR_FORMATS = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+PLANES = ("axial", "sagittal", "coronal")
+
+# Больший диапазон значений считаем напрямую, без таблицы
+MAX_LUT_SIZE = 1 << 17
+
+MprKey = Tuple[str, str, int, str, Optional[float], Optional[float], int, str, int]
+
+
+def clamp_index(volume: np.ndarray, plane: str, index: int) -> int:
+    axis = {"axial": 0, "coronal": 1, "sagittal": 2}[plane]
+    return int(np.clip(index, 0, volume.shape[axis] - 1))
+
+
+def extract_plane(volume: np.ndarray, plane: str, index: int) -> np.ndarray:
+    """Срез тома в заданной плоскости (index уже приведён clamp_index)."""
+    if plane == "axial":
+        return volume[index, :, :]
+    if plane == "sagittal":
+        return np.flip(volume[:, :, index], axis=(0, 1))
+    if plane == "coronal":
+        return np.flip(volume[:, index, :], axis=0)
+    raise ValueError(f"Invalid plane: {plane}")
+
+
+def _first_value(value) -> float:
+    if isinstance(value, pydicom.multival.MultiValue):
+        return float(value[0])
+    return float(value)
+
+
+def resolve_window(
+    img: np.ndarray,
+    ds: pydicom.Dataset,
+    mode: str,
+    window_center: Optional[float] = None,
+    window_width: Optional[float] = None,
+) -> Tuple[float, float]:
+    """
+    Возвращает (нижняя граница окна, ширина окна).
+
+    auto — окно из тегов DICOM; window — переданные значения, недостающие
+    берутся из тегов; raw и отсутствие тегов — растяжение по min/max среза.
+    """
+    if mode in ("auto", "window"):
+        try:
+            wc = window_center if mode == "window" and window_center is not None else _first_value(ds.WindowCenter)
+            ww = window_width if mode == "window" and window_width is not None else _first_value(ds.WindowWidth)
+            return wc - ww / 2, ww
+        except Exception:
+            pass
+    img_min, img_max = float(img.min()), float(img.max())
+    return img_min, img_max - img_min
+
+
+@lru_cache(maxsize=64)
+def _window_lut(value_min: int, value_max: int, low: float, width: float) -> np.ndarray:
+    values = np.arange(value_min, value_max + 1, dtype=np.float32)
+    return _scale_window(values, low, width)
+
+
+def _scale_window(values: np.ndarray, low: float, width: float) -> np.ndarray:
+    clipped = np.clip(values, np.float32(low), np.float32(low + width))
+    return ((clipped - np.float32(low)) * np.float32(255.0 / (width + 1e-5))).astype(np.uint8)
+
+
+def window_to_uint8(img: np.ndarray, low: float, width: float) -> np.ndarray:
+    """
+    Окно/уровень в uint8: clip(img, low, low + width) растягивается на 0..255.
+
+    Таблица (LUT) применяется только к целочисленным значениям; дробные
+    (RescaleSlope, интерполяция при ресайзе) считаются по формуле напрямую.
+    """
+    value_min, value_max = math.floor(float(img.min())), math.ceil(float(img.max()))
+    if value_max - value_min >= MAX_LUT_SIZE:
+        return _scale_window(img, low, width)
+    offsets = np.subtract(img, value_min, dtype=np.float32)
+    index = offsets.astype(np.intp)
+    if not np.issubdtype(img.dtype, np.integer) and not np.array_equal(index, offsets):
+        return _scale_window(img, low, width)
+    lut = _window_lut(value_min, value_max, float(low), float(width))
+    return lut.take(index)
+
+
+def encode_image(img: Image.Image, fmt: str, quality: int) -> bytes:
+    buf = BytesIO()
+    if fmt == "png":
+        img.save(buf, format="PNG")
+    elif fmt == "jpeg":
+        img.save(buf, format="JPEG", quality=quality)
+    elif fmt == "webp":
+        # method=0 — самое быстрое сжатие
+        img.save(buf, format="WEBP", quality=quality, method=0)
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+    return buf.getvalue()
+
+
+def mpr_key(
+    series: str,
+    plane: str,
+    index: int,
+    mode: str,
+    window_center: Optional[float],
+    window_width: Optional[float],
+    size: int,
+    fmt: str,
+    quality: int,
+) -> MprKey:
+    if fmt == "png":
+        quality = 0
+    if mode != "window":
+        window_center = window_width = None
+    return series, plane, index, mode, window_center, window_width, size, fmt, quality
+
+
+def mpr_etag(key: MprKey) -> str:
+    return '"' + hashlib.sha1(repr(key).encode()).hexdigest() + '"'
+
+
+def render_slice(
+    volume: np.ndarray,
+    ds: pydicom.Dataset,
+    plane: str,
+    index: int,
+    size: int,
+    mode: str,
+    window_center: Optional[float],
+    window_width: Optional[float],
+    fmt: str,
+    quality: int,
+) -> bytes:
+    img = extract_plane(volume, plane, index)
+    low, width = resolve_window(img, ds, mode, window_center, window_width)
+    pixels = window_to_uint8(img, low, width)
+
+    # Паддинг до квадрата size x size
+    img_pil = ImageOps.pad(
+        Image.fromarray(pixels),
+        (size, size),
+        method=Image.Resampling.BICUBIC,
+        color=0,
+        centering=(0.5, 0.5),
+    )
+    return encode_image(img_pil, fmt, quality)
+
+
+def get_slice(key: MprKey, volume: np.ndarray, ds: pydicom.Dataset) -> bytes:
+    """Отдаёт срез из кэша или рендерит и кладёт его туда."""
+    data = mpr_cache.get(key)
+    if data is None:
+        _, plane, index, mode, window_center, window_width, size, fmt, quality = key
+        data = render_slice(volume, ds, plane, index, size, mode, window_center, window_width, fmt, quality)
+        mpr_cache.put(key, data)
+    return data
+
+
+mpr_cache = TileCache(max_bytes=settings.dicom_mpr_cache_mb * 1024 * 1024, name="mpr")
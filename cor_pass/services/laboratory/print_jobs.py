@@ -0,0 +1,262 @@
+"""
+Пакетная печать меток стекол и кассет.
+
+Метки группируются по принтерам и уходят пачками в одну задачу
+(`/task/new` принимает список меток) через общий httpx-клиент с пулом
+соединений. Число одновременных задач ограничено на каждый принтер и
+в целом. Неудачная пачка повторяется с экспоненциальной паузой; если
+принтер отверг пачку (ответ 4xx), метки отправляются по одной, чтобы
+отделить плохую метку от остальных. После исчерпанных повторов 5xx
+пачка считается ненапечатанной целиком. Повторяется только пачка, которая
+точно не дошла до принтера (не удалось подключиться); если связь оборвалась
+после отправки тела, принтер мог уже напечатать метки, поэтому они
+помечаются «результат неизвестен» и не отправляются повторно.
+Результат — статус каждой метки.
+"""
+
+import asyncio
+from typing import Dict, List, Optional
+
+import httpx
+from loguru import logger
+from prometheus_client import Counter
+
+from cor_pass.config.config import settings
+from cor_pass.schemas import PrintLabel
+
+
+PRINTER_TASK_URL = "http://{printer_ip}:8080/task/new"
+
+# Ответы, после которых повтор той же пачки не поможет
+NON_RETRYABLE_STATUSES = frozenset({400, 404, 413, 415, 422})
+
+# Ошибки до отправки запроса: принтер пачку не получал, повтор безопасен
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# Счетчик отправленных меток по результату
+print_labels_total = Counter(
+    "print_labels_total",
+    "Total number of labels sent to printers",
+    ["result"],
+)
+
+
+class LabelResult:
+    """Итог печати одной метки."""
+
+    def __init__(
+        self,
+        uuid: str,
+        success: bool,
+        attempts: int,
+        error: Optional[str] = None,
+        status_code: Optional[int] = None,
+        outcome_unknown: bool = False,
+    ):
+        self.uuid = uuid
+        self.success = success
+        self.attempts = attempts
+        self.error = error
+        self.status_code = status_code
+        # Пачка ушла на принтер, но ответа нет: метка могла быть напечатана
+        self.outcome_unknown = outcome_unknown
+
+    def to_dict(self) -> dict:
+        return {
+            "uuid": self.uuid,
+            "success": self.success,
+            "attempts": self.attempts,
+            "error": self.error,
+            "outcome_unknown": self.outcome_unknown,
+        }
+
+
+class PrintJobResult:
+    """Итог задания на один принтер."""
+
+    def __init__(self, printer_ip: str, results: List[LabelResult], responses: List[str]):
+        self.printer_ip = printer_ip
+        self.results = results
+        self.responses = responses
+
+    @classmethod
+    def simulated(cls, printer_ip: str, labels: List[PrintLabel]) -> "PrintJobResult":
+        """Результат без обращения к принтеру (тестовый стенд)."""
+        return cls(
+            printer_ip,
+            [LabelResult(label.uuid, True, 0) for label in labels],
+            ["Делаем вид что принтер напечатал"],
+        )
+
+    @property
+    def printed(self) -> List[str]:
+        return [r.uuid for r in self.results if r.success]
+
+    @property
+    def failed(self) -> List[LabelResult]:
+        return [r for r in self.results if not r.success]
+
+    @property
+    def success(self) -> bool:
+        return not self.failed
+
+    def to_dict(self) -> dict:
+        return {
+            "success": self.success,
+            "printer_ip": self.printer_ip,
+            "printer_response": "\n".join(self.responses),
+            "labels": [r.to_dict() for r in self.results],
+        }
+
+
+class _BatchError(Exception):
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        retryable: bool = True,
+        outcome_unknown: bool = False,
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.outcome_unknown = outcome_unknown
+
+
+class PrintJobDispatcher:
+    def __init__(
+        self,
+        batch_size: int,
+        per_printer_concurrency: int,
+        max_connections: int,
+        retries: int,
+        retry_delay: float,
+        timeout: float,
+        task_url: str = PRINTER_TASK_URL,
+    ):
+        self.task_url = task_url
+        self.batch_size = max(1, batch_size)
+        self.per_printer_concurrency = max(1, per_printer_concurrency)
+        self.max_connections = max(1, max_connections)
+        self.retries = max(0, retries)
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+        self._printer_slots: Dict[str, asyncio.Semaphore] = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    def _slots(self, printer_ip: str) -> asyncio.Semaphore:
+        slots = self._printer_slots.get(printer_ip)
+        if slots is None:
+            slots = asyncio.Semaphore(self.per_printer_concurrency)
+            self._printer_slots[printer_ip] = slots
+        return slots
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._printer_slots.clear()
+
+    async def _post(self, printer_ip: str, labels: List[PrintLabel]) -> str:
+        printer_url = self.task_url.format(printer_ip=printer_ip)
+        labels_data = [label.model_dump() for label in labels]
+        logger.debug(f"Отправка на принтер {printer_url}: {labels_data}")
+        try:
+            async with self._slots(printer_ip):
+                response = await self._get_client().post(printer_url, json={"labels": labels_data})
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            code = e.response.status_code
+            raise _BatchError(
+                f"Принтер ответил ошибкой: {e.response.text}",
+                status_code=code,
+                retryable=code not in NON_RETRYABLE_STATUSES,
+            )
+        except NOT_SENT_ERRORS as e:
+            raise _BatchError(f"Не удалось подключиться к принтеру по адресу {printer_ip}: {e}")
+        except httpx.RequestError as e:
+            raise _BatchError(
+                f"Связь с принтером {printer_ip} прервана после отправки, результат неизвестен: {e!r}",
+                retryable=False,
+                outcome_unknown=True,
+            )
+        logger.debug(f"Статус ответа принтера: {response.status_code}, тело: {response.text}")
+        return response.text
+
+    async def _send_batch(
+        self, printer_ip: str, labels: List[PrintLabel], responses: List[str]
+    ) -> List[LabelResult]:
+        attempts = 0
+        error: Optional[_BatchError] = None
+        while attempts <= self.retries:
+            attempts += 1
+            try:
+                responses.append(await self._post(printer_ip, labels))
+                return [LabelResult(label.uuid, True, attempts) for label in labels]
+            except _BatchError as e:
+                error = e
+                logger.warning(
+                    f"Пачка из {len(labels)} меток на {printer_ip} не напечатана "
+                    f"(попытка {attempts}): {e}"
+                )
+                if not e.retryable:
+                    break
+                if attempts <= self.retries:
+                    await asyncio.sleep(self.retry_delay * 2 ** (attempts - 1))
+
+        if error.status_code is not None and 400 <= error.status_code < 500 and len(labels) > 1:
+            # Принтер доступен, но отверг пачку — ищем конкретные метки.
+            # При 5xx принтер неисправен: поштучная отправка только умножит запросы
+            singles = await asyncio.gather(
+                *(self._send_batch(printer_ip, [label], responses) for label in labels)
+            )
+            return [result for batch in singles for result in batch]
+
+        return [
+            LabelResult(
+                label.uuid, False, attempts, str(error), error.status_code, error.outcome_unknown
+            )
+            for label in labels
+        ]
+
+    async def submit(self, printer_ip: str, labels: List[PrintLabel]) -> PrintJobResult:
+        """Печатает метки на одном принтере; порядок результатов совпадает с labels."""
+        responses: List[str] = []
+        batches = [
+            labels[i : i + self.batch_size] for i in range(0, len(labels), self.batch_size)
+        ]
+        batch_results = await asyncio.gather(
+            *(self._send_batch(printer_ip, batch, responses) for batch in batches)
+        )
+        results = [result for batch in batch_results for result in batch]
+        for result in results:
+            outcome = "printed" if result.success else "unknown" if result.outcome_unknown else "failed"
+            print_labels_total.labels(result=outcome).inc()
+        return PrintJobResult(printer_ip, results, responses)
+
+    async def submit_many(self, jobs: Dict[str, List[PrintLabel]]) -> Dict[str, PrintJobResult]:
+        """Печатает группы меток на нескольких принтерах параллельно."""
+        printer_ips = list(jobs)
+        results = await asyncio.gather(*(self.submit(ip, jobs[ip]) for ip in printer_ips))
+        return dict(zip(printer_ips, results))
+
+
+print_dispatcher = PrintJobDispatcher(
+    batch_size=settings.printer_batch_size,
+    per_printer_concurrency=settings.printer_concurrency,
+    max_connections=settings.printer_max_connections,
+    retries=settings.printer_retries,
+    retry_delay=settings.printer_retry_delay,
+    timeout=settings.printer_timeout,
+)
@@ -0,0 +1,233 @@
+"""
+Кэш открытых SVS-слайдов и готовых тайлов для просмотрщика.
+
+Держит на процесс ограниченный LRU открытых дескрипторов OpenSlide
+(ключ — путь и mtime файла) и ограниченный по байтам LRU уже закодированных
+тайлов (ключ — слайд, уровень, x, y, размер, качество).
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+from openslide import OpenSlide
+from prometheus_client import Counter
+
+from cor_pass.config.config import settings
+
+
+# Счетчик обращений к кэшам слайдов/тайлов
+svs_cache_requests_total = Counter(
+    "svs_cache_requests_total",
+    "Total number of SVS cache lookups",
+    ["cache", "result"],
+)
+
+# Счетчик вытеснений из кэшей слайдов/тайлов
+svs_cache_evictions_total = Counter(
+    "svs_cache_evictions_total",
+    "Total number of SVS cache evictions",
+    ["cache"],
+)
+
+
+SlideKey = Tuple[str, int]
+TileKey = Tuple[str, int, int, int, int, int, int]
+
+
+def _slide_key(path: str) -> SlideKey:
+    """Ключ слайда: абсолютный путь + mtime, чтобы замена файла давала новый ключ."""
+    abs_path = os.path.abspath(path)
+    return abs_path, os.stat(abs_path).st_mtime_ns
+
+
+class SlideHandleCache:
+    """
+    LRU открытых дескрипторов OpenSlide.
+
+    Вытесненные дескрипторы явно не закрываются: их ещё может читать другой
+    поток, поэтому OpenSlide закроется сам, когда пропадёт последняя ссылка.
+    """
+
+    def __init__(self, max_handles: int):
+        self.max_handles = max(1, max_handles)
+        self._handles: "OrderedDict[SlideKey, OpenSlide]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path: str) -> OpenSlide:
+        """Возвращает открытый слайд, открывая его при промахе."""
+        key = _slide_key(path)
+        with self._lock:
+            slide = self._handles.get(key)
+            if slide is not None:
+                self._handles.move_to_end(key)
+                self.hits += 1
+                svs_cache_requests_total.labels(cache="slide", result="hit").inc()
+                return slide
+
+        # Открываем вне блокировки — это самая дорогая часть
+        slide = OpenSlide(key[0])
+
+        with self._lock:
+            existing = self._handles.get(key)
+            if existing is not None:
+                # Другой поток успел открыть этот же файл
+                self._handles.move_to_end(key)
+                slide = existing
+                self.hits += 1
+                svs_cache_requests_total.labels(cache="slide", result="hit").inc()
+            else:
+                self.misses += 1
+                svs_cache_requests_total.labels(cache="slide", result="miss").inc()
+                # Старые версии того же файла больше не нужны
+                for old_key in [k for k in self._handles if k[0] == key[0]]:
+                    del self._handles[old_key]
+                self._handles[key] = slide
+                while len(self._handles) > self.max_handles:
+                    self._handles.popitem(last=False)
+                    self.evictions += 1
+                    svs_cache_evictions_total.labels(cache="slide").inc()
+        return slide
+
+    def invalidate(self, path: str) -> None:
+        """Убирает из кэша все дескрипторы, открытые для указанного пути."""
+        abs_path = os.path.abspath(path)
+        with self._lock:
+            for key in [k for k in self._handles if k[0] == abs_path]:
+                del self._handles[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._handles.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._handles),
+                "max_size": self.max_handles,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class TileCache:
+    """
+    LRU закодированных тайлов, ограниченный суммарным размером в байтах.
+
+    name — метка кэша в метриках (тот же класс используется и для срезов MPR).
+    """
+
+    def __init__(self, max_bytes: int, name: str = "tile"):
+        self.max_bytes = max(0, max_bytes)
+        self.name = name
+        self._tiles: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            data = self._tiles.get(key)
+            if data is None:
+                self.misses += 1
+                svs_cache_requests_total.labels(cache=self.name, result="miss").inc()
+                return None
+            self._tiles.move_to_end(key)
+            self.hits += 1
+            svs_cache_requests_total.labels(cache=self.name, result="hit").inc()
+            return data
+
+    def put(self, key: Hashable, data: bytes) -> None:
+        size = len(data)
+        if size > self.max_bytes:
+            # Тайл больше всего бюджета — не кэшируем
+            return
+        with self._lock:
+            old = self._tiles.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old)
+            self._tiles[key] = data
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._tiles:
+                _, evicted = self._tiles.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                self.evictions += 1
+                svs_cache_evictions_total.labels(cache=self.name).inc()
+
+    def invalidate_slide(self, slide_path: str) -> None:
+        """Удаляет все тайлы указанного слайда (первый элемент ключа — путь)."""
+        abs_path = os.path.abspath(slide_path)
+        with self._lock:
+            for key in [k for k in self._tiles if isinstance(k, tuple) and k and k[0] == abs_path]:
+                self.current_bytes -= len(self._tiles.pop(key))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tiles.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._tiles),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+_slide_dir_listing: Dict[str, Tuple[int, Optional[str]]] = {}
+_slide_dir_lock = threading.Lock()
+
+
+def find_user_slide(user_slide_dir: str) -> Optional[str]:
+    """
+    Возвращает путь к первому SVS-файлу в папке пользователя.
+
+    Листинг перечитывается только при изменении mtime папки.
+    """
+    try:
+        dir_mtime = os.stat(user_slide_dir).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    with _slide_dir_lock:
+        cached = _slide_dir_listing.get(user_slide_dir)
+        if cached is not None and cached[0] == dir_mtime:
+            return cached[1]
+
+    svs_files = sorted(f for f in os.listdir(user_slide_dir) if f.lower().endswith(".svs"))
+    svs_path = os.path.join(user_slide_dir, svs_files[0]) if svs_files else None
+
+    with _slide_dir_lock:
+        _slide_dir_listing[user_slide_dir] = (dir_mtime, svs_path)
+    return svs_path
+
+
+def tile_key(svs_path: str, level: int, x: int, y: int, tile_size: int, quality: int) -> TileKey:
+    """Ключ тайла; mtime слайда в ключе отсекает тайлы заменённого файла."""
+    abs_path, mtime = _slide_key(svs_path)
+    return abs_path, mtime, level, x, y, tile_size, quality
+
+
+def invalidate_slide(svs_path: str) -> None:
+    """Сбрасывает дескриптор и тайлы слайда (например, перед удалением файла)."""
+    slide_handles.invalidate(svs_path)
+    tile_cache.invalidate_slide(svs_path)
+
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    return {"slides": slide_handles.stats(), "tiles": tile_cache.stats()}
+
+
+slide_handles = SlideHandleCache(max_handles=settings.svs_slide_cache_size)
+tile_cache = TileCache(max_bytes=settings.svs_tile_cache_mb * 1024 * 1024)
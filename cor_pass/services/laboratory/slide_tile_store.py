@@ -0,0 +1,157 @@
+"""
+Локальное дисковое хранилище заранее отрендеренных тайлов SVS-слайдов.
+
+Сканер-воркер кладёт сюда нижние уровни DeepZoom-пирамиды и миниатюру
+нового скана, API читает их при первом открытии слайда. Общий объём
+ограничен, при превышении удаляются давно не использованные слайды.
+
+Структура:
+    {root}/{key}/slide.dzi
+    {root}/{key}/thumbnail.png
+    {root}/{key}/{level}/{col}_{row}.jpeg
+    {root}/{key}/.last_used
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from cor_pass.config.config import settings
+
+
+LAST_USED_MARKER = ".last_used"
+TOUCH_INTERVAL_SECONDS = 60
+
+
+def slide_store_key(filename: str, file_size: int) -> str:
+    """
+    Ключ слайда в хранилище.
+
+    Строится по имени файла и размеру, чтобы воркер (знает файл на SMB) и API
+    (знает локальную копию того же файла) получали одинаковый ключ.
+    """
+    # scan_url хранится в виде UNC-пути с обратными слэшами
+    name = os.path.basename(filename.replace("\\", "/")).lower()
+    raw = f"{name}:{file_size}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class SlideTileStore:
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def slide_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def has_slide(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.slide_dir(key), LAST_USED_MARKER))
+
+    def tile_path(self, key: str, level: int, col: int, row: int) -> str:
+        return os.path.join(self.slide_dir(key), str(level), f"{col}_{row}.jpeg")
+
+    def read_tile(self, key: str, level: int, col: int, row: int) -> Optional[bytes]:
+        return self._read(key, self.tile_path(key, level, col, row))
+
+    def read_thumbnail(self, key: str) -> Optional[bytes]:
+        return self._read(key, os.path.join(self.slide_dir(key), "thumbnail.png"))
+
+    def read_dzi(self, key: str) -> Optional[str]:
+        data = self._read(key, os.path.join(self.slide_dir(key), "slide.dzi"))
+        return data.decode("utf-8") if data is not None else None
+
+    def _read(self, key: str, path: str) -> Optional[bytes]:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        self._touch(key)
+        return data
+
+    def _touch(self, key: str) -> None:
+        """Обновляет время использования слайда, не чаще раза в минуту."""
+        now = time.time()
+        with self._lock:
+            if now - self._touched.get(key, 0) < TOUCH_INTERVAL_SECONDS:
+                return
+            self._touched[key] = now
+        try:
+            os.utime(os.path.join(self.slide_dir(key), LAST_USED_MARKER))
+        except OSError:
+            pass
+
+    def write_slide(self, key: str, build: Callable[[str], None]) -> None:
+        """
+        Собирает содержимое слайда во временной папке и атомарно публикует его.
+
+        build(path) должен записать файлы слайда в переданную папку.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        tmp_dir = os.path.join(self.root, f".tmp-{key}-{os.getpid()}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        try:
+            build(tmp_dir)
+            # Маркер пишется последним — по нему читатели понимают, что слайд готов
+            open(os.path.join(tmp_dir, LAST_USED_MARKER), "w").close()
+            target = self.slide_dir(key)
+            if os.path.exists(target):
+                shutil.rmtree(target, ignore_errors=True)
+            os.replace(tmp_dir, target)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.enforce_limit()
+
+    def _slides_usage(self) -> List[Tuple[float, int, str]]:
+        usage = []
+        if not os.path.isdir(self.root):
+            return usage
+        for name in os.listdir(self.root):
+            if name.startswith("."):
+                continue
+            slide_path = os.path.join(self.root, name)
+            marker = os.path.join(slide_path, LAST_USED_MARKER)
+            try:
+                last_used = os.stat(marker).st_mtime
+            except OSError:
+                last_used = 0.0
+            size = 0
+            for dirpath, _, files in os.walk(slide_path):
+                for f in files:
+                    try:
+                        size += os.path.getsize(os.path.join(dirpath, f))
+                    except OSError:
+                        pass
+            usage.append((last_used, size, name))
+        return usage
+
+    def total_bytes(self) -> int:
+        return sum(size for _, size, _ in self._slides_usage())
+
+    def enforce_limit(self) -> int:
+        """Удаляет давно не использованные слайды, пока объём не влезет в лимит."""
+        usage = sorted(self._slides_usage())
+        total = sum(size for _, size, _ in usage)
+        removed = 0
+        for _, size, name in usage:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+            total -= size
+            removed += 1
+            logger.debug(f"Слайд {name} удалён из хранилища тайлов")
+        return removed
+
+
+slide_tile_store = SlideTileStore(
+    root=settings.svs_tile_store_dir,
+    max_bytes=settings.svs_tile_store_max_mb * 1024 * 1024,
+)
@@ -0,0 +1,245 @@
+"""
+Пул переиспользуемых SMB-подключений (pysmb).
+
+Одно подключение стоит TCP + NTLM-согласования, поэтому и API, и сканер-воркер
+берут подключения из общего пула, а не открывают новое на каждую операцию.
+Пул потокобезопасный: pysmb синхронный и вызывается из run_in_executor/to_thread.
+"""
+
+import os
+import socket
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Deque, Iterator, Tuple
+
+from loguru import logger
+from smb.SMBConnection import SMBConnection
+from smb.base import NotConnectedError, SMBTimeout
+
+from cor_pass.config.config import settings
+
+
+# Ошибки, после которых подключение считается сломанным и пересоздаётся
+CONNECTION_ERRORS = (NotConnectedError, SMBTimeout, ConnectionError, socket.error, EOFError)
+
+
+def create_smb_connection() -> SMBConnection:
+    """Открывает новое подключение к SMB-серверу из настроек."""
+    conn = SMBConnection(
+        settings.smb_user,
+        settings.smb_pass,
+        my_name=socket.gethostname(),
+        remote_name=settings.remote_name,
+        use_ntlm_v2=True,
+        is_direct_tcp=True,
+    )
+    if not conn.connect(settings.smb_server_ip, 445):
+        logger.error(f"Не удалось подключиться к SMB-серверу {settings.smb_server_ip}")
+        raise RuntimeError("Failed to connect to SMB server")
+    return conn
+
+
+def smb_relative_path(path: str) -> str:
+    """Превращает UNC-путь \\\\server\\share\\... в путь внутри шары."""
+    prefix = f"\\\\{settings.smb_server_ip}\\{settings.smb_share}\\"
+    if path.startswith(prefix):
+        return path[len(prefix):].strip("/\\")
+    return path.strip("/\\")
+
+
+def download_to_temp(conn, relative_path: str, suffix: str) -> str:
+    """Скачивает файл из шары во временный файл через уже открытое подключение."""
+    file_info = conn.getAttributes(settings.smb_share, relative_path)
+    filesize = getattr(file_info, "file_size", None)
+    if filesize is None:
+        logger.error(f"Не удалось получить размер файла для {relative_path}")
+        raise ValueError("Cannot get filesize from SMB file_info")
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+        try:
+            start_time = datetime.now()
+            conn.retrieveFile(settings.smb_share, relative_path, temp_file)
+            temp_file.flush()
+            logger.debug(f"Время загрузки файла: {datetime.now() - start_time} секунд")
+
+            temp_file.seek(0, os.SEEK_END)
+            file_size = temp_file.tell()
+            if file_size != filesize:
+                logger.error(f"Ожидалось {filesize} байт, но записано {file_size} байт")
+                raise RuntimeError(f"Expected {filesize} bytes, but wrote {file_size} bytes")
+        except BaseException:
+            temp_file.close()
+            os.unlink(temp_file.name)
+            raise
+        return temp_file.name
+
+
+class SMBPoolTimeout(RuntimeError):
+    pass
+
+
+class SMBConnectionPool:
+    """
+    Ограниченный пул SMB-подключений.
+
+    - max_size: максимум одновременно открытых подключений;
+    - idle_timeout: простаивающие дольше подключения закрываются;
+    - health_check_interval: подключение, простоявшее дольше, перед выдачей
+      проверяется echo-запросом;
+    - при ошибке соединения подключение выбрасывается, а run() повторяет
+      операцию на новом подключении.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any] = create_smb_connection,
+        max_size: int = 4,
+        idle_timeout: float = 300,
+        health_check_interval: float = 30,
+        acquire_timeout: float = 60,
+    ):
+        self._factory = factory
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self._idle: Deque[Tuple[Any, float]] = deque()
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self.created = 0
+        self.discarded = 0
+
+    def _close(self, conn: Any) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn: Any) -> bool:
+        try:
+            conn.echo(b"ping", timeout=5)
+            return True
+        except Exception as e:
+            logger.debug(f"SMB-подключение не прошло проверку: {e}")
+            return False
+
+    def _drop_expired(self, now: float) -> list:
+        expired = []
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            expired.append(self._idle.popleft()[0])
+        return expired
+
+    def acquire(self) -> Any:
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                expired = self._drop_expired(now)
+                candidate = None
+                create = False
+                while candidate is None and not create:
+                    if self._idle:
+                        # Берём самое свежее подключение
+                        candidate, last_used = self._idle.pop()
+                        self._in_use += 1
+                    elif self._in_use + len(self._idle) < self.max_size:
+                        self._in_use += 1
+                        create = True
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            for conn in expired:
+                                self._close(conn)
+                            raise SMBPoolTimeout("Timed out waiting for a free SMB connection")
+                        self._cond.wait(remaining)
+                        expired.extend(self._drop_expired(time.monotonic()))
+
+            for conn in expired:
+                self._close(conn)
+
+            if create:
+                try:
+                    conn = self._factory()
+                except Exception:
+                    self._release_slot()
+                    raise
+                with self._cond:
+                    self.created += 1
+                return conn
+
+            idle_for = time.monotonic() - last_used
+            if idle_for <= self.health_check_interval or self._is_healthy(candidate):
+                return candidate
+
+            # Подключение умерло, пока лежало в пуле — пробуем следующее
+            self._close(candidate)
+            self._release_slot(discarded=True)
+
+    def _release_slot(self, discarded: bool = False) -> None:
+        with self._cond:
+            self._in_use -= 1
+            if discarded:
+                self.discarded += 1
+            self._cond.notify()
+
+    def release(self, conn: Any, broken: bool = False) -> None:
+        if broken:
+            self._close(conn)
+            self._release_slot(discarded=True)
+            return
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except CONNECTION_ERRORS:
+            broken = True
+            raise
+        finally:
+            self.release(conn, broken=broken)
+
+    def run(self, operation: Callable[[Any], Any], retries: int = 1) -> Any:
+        """Выполняет operation(conn), при обрыве соединения повторяет на новом подключении."""
+        attempt = 0
+        while True:
+            try:
+                with self.connection() as conn:
+                    return operation(conn)
+            except CONNECTION_ERRORS as e:
+                if attempt >= retries:
+                    raise
+                attempt += 1
+                logger.warning(f"SMB-подключение оборвалось ({e}), повторяем операцию")
+
+    def close_all(self) -> None:
+        with self._cond:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "max_size": self.max_size,
+                "created": self.created,
+                "discarded": self.discarded,
+            }
+
+
+smb_pool = SMBConnectionPool(
+    max_size=settings.smb_pool_max_size,
+    idle_timeout=settings.smb_pool_idle_timeout,
+)
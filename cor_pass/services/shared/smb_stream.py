@@ -0,0 +1,435 @@
+"""
+Потоковый доступ к файлам на SMB-шаре.
+
+- SMBRangeReader читает только нужные диапазоны байт (retrieveFileFromOffset)
+  и складывает их блоками фиксированного размера в локальный BlockCache,
+  поэтому повторные Range-запросы к тому же месту файла не ходят на NAS;
+- LocalSlideCache — локальная копия целых файлов, адресуемая содержимым
+  (путь + размер + mtime на шаре). OpenSlide нужен настоящий файл, поэтому
+  SVS скачивается один раз и переиспользуется всеми запросами, воркерами API
+  и сканер-воркером, если папка кэша общая;
+- ranged_smb_response отдаёт файл с шары с поддержкой HTTP Range.
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from io import BytesIO
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from loguru import logger
+
+from cor_pass.config.config import settings
+from cor_pass.services.laboratory.slide_cache import (
+    svs_cache_evictions_total,
+    svs_cache_requests_total,
+)
+from cor_pass.services.shared.smb_pool import SMBConnectionPool, smb_pool, smb_relative_path
+
+
+# Сколько блоков подряд забирать с шары одним запросом
+MAX_BLOCKS_PER_READ = 8
+STAT_TTL_SECONDS = 30
+
+
+class SMBFileInfo(NamedTuple):
+    relative_path: str
+    size: int
+    mtime: float
+
+    @property
+    def content_id(self) -> str:
+        """Версия файла на шаре: меняется при любой перезаписи."""
+        name = self.relative_path.replace("\\", "/").lower()
+        return hashlib.sha1(f"{name}:{self.size}:{self.mtime}".encode()).hexdigest()
+
+
+def stat_smb_file(conn, relative_path: str) -> SMBFileInfo:
+    attrs = conn.getAttributes(settings.smb_share, relative_path)
+    return SMBFileInfo(relative_path, int(attrs.file_size), float(attrs.last_write_time))
+
+
+def read_smb_range(conn, relative_path: str, offset: int, length: int) -> bytes:
+    """Читает length байт файла начиная с offset."""
+    buf = BytesIO()
+    conn.retrieveFileFromOffset(settings.smb_share, relative_path, buf, offset, length)
+    return buf.getvalue()
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _evict_lru(files: List[Tuple[float, int, str]], max_bytes: int, keep: str = "") -> int:
+    """Удаляет самые старые по mtime файлы, пока их суммарный объём больше max_bytes."""
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+class BlockCache:
+    """
+    Дисковый кэш блоков файлов с шары: {root}/{content_id}/{index}.
+
+    Блок неизменяем, так как content_id меняется при перезаписи файла.
+    Объём ограничен max_bytes, вытесняются давно прочитанные блоки.
+    """
+
+    def __init__(self, root: str, block_size: int, max_bytes: int):
+        self.root = root
+        self.block_size = block_size
+        self.max_bytes = max_bytes
+        self._written_since_check = 0
+        self._lock = threading.Lock()
+
+    def block_path(self, content_id: str, index: int) -> str:
+        return os.path.join(self.root, content_id, str(index))
+
+    def get(self, content_id: str, index: int) -> Optional[bytes]:
+        path = self.block_path(content_id, index)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except (FileNotFoundError, NotADirectoryError):
+            svs_cache_requests_total.labels(cache="smb_block", result="miss").inc()
+            return None
+        svs_cache_requests_total.labels(cache="smb_block", result="hit").inc()
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, content_id: str, index: int, data: bytes) -> None:
+        _atomic_write(self.block_path(content_id, index), data)
+        with self._lock:
+            self._written_since_check += len(data)
+            # Обход папки дорогой, поэтому проверяем лимит порциями
+            check = self._written_since_check >= max(self.block_size, self.max_bytes // 10)
+            if check:
+                self._written_since_check = 0
+        if check:
+            self.enforce_limit()
+
+    def enforce_limit(self) -> int:
+        files = []
+        if not os.path.isdir(self.root):
+            return 0
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        removed = _evict_lru(files, self.max_bytes)
+        if removed:
+            svs_cache_evictions_total.labels(cache="smb_block").inc(removed)
+        return removed
+
+
+class SMBRangeReader:
+    """Чтение диапазонов байт файлов с шары через пул подключений и кэш блоков."""
+
+    def __init__(self, pool: SMBConnectionPool, block_cache: BlockCache):
+        self.pool = pool
+        self.block_cache = block_cache
+        self._stats: Dict[str, Tuple[float, SMBFileInfo]] = {}
+        self._lock = threading.Lock()
+
+    def stat(self, path: str) -> SMBFileInfo:
+        relative_path = smb_relative_path(path)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._stats.get(relative_path)
+            if cached and now - cached[0] < STAT_TTL_SECONDS:
+                return cached[1]
+        info = self.pool.run(lambda conn: stat_smb_file(conn, relative_path))
+        with self._lock:
+            self._stats[relative_path] = (now, info)
+        return info
+
+    def _fetch_blocks(self, info: SMBFileInfo, first: int, last: int) -> List[bytes]:
+        """Одним запросом читает блоки first..last и кладёт их в кэш."""
+        block_size = self.block_cache.block_size
+        offset = first * block_size
+        length = min((last + 1) * block_size, info.size) - offset
+        data = self.pool.run(lambda conn: read_smb_range(conn, info.relative_path, offset, length))
+        if len(data) != length:
+            raise RuntimeError(f"Expected {length} bytes from SMB, got {len(data)}")
+        blocks = []
+        for i, index in enumerate(range(first, last + 1)):
+            block = data[i * block_size:(i + 1) * block_size]
+            self.block_cache.put(info.content_id, index, block)
+            blocks.append(block)
+        return blocks
+
+    def iter_blocks(self, info: SMBFileInfo, start: int, end: int) -> Iterator[bytes]:
+        """Отдаёт байты start..end (включительно) кусками по блокам."""
+        block_size = self.block_cache.block_size
+        first, last = start // block_size, end // block_size
+        index = first
+        while index <= last:
+            block = self.block_cache.get(info.content_id, index)
+            if block is not None:
+                blocks = [block]
+            else:
+                # Подряд идущие отсутствующие блоки забираем одним чтением
+                run_end = index
+                while (
+                    run_end < last
+                    and run_end - index + 1 < MAX_BLOCKS_PER_READ
+                    and not os.path.exists(self.block_cache.block_path(info.content_id, run_end + 1))
+                ):
+                    run_end += 1
+                blocks = self._fetch_blocks(info, index, run_end)
+            for block in blocks:
+                block_start = index * block_size
+                lo = max(start - block_start, 0)
+                hi = min(end - block_start + 1, len(block))
+                yield block[lo:hi]
+                index += 1
+
+    def read(self, info: SMBFileInfo, start: int, end: int) -> bytes:
+        return b"".join(self.iter_blocks(info, start, end))
+
+
+class LocalSlideCache:
+    """
+    Локальные копии целых файлов с шары, адресуемые content_id.
+
+    Файл скачивается один раз; одновременные запросы (в том числе из других
+    процессов) ждут на файловой блокировке, а не качают его повторно.
+    Копия может быть жёсткой ссылкой на слайд пользователя (link_or_copy),
+    поэтому время последнего использования хранится в отдельном файле
+    .{имя}.used, а mtime самой копии не трогается.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def path_for(self, info: SMBFileInfo) -> str:
+        ext = os.path.splitext(info.relative_path.replace("\\", "/"))[1].lower()
+        return os.path.join(self.root, f"{info.content_id}{ext}")
+
+    def ensure(self, info: SMBFileInfo, download: Callable[[str], None]) -> str:
+        """
+        Возвращает путь к локальной копии, при необходимости скачивая её.
+
+        download(path) должен записать файл целиком по переданному пути.
+        """
+        target = self.path_for(info)
+        if self._use(target):
+            svs_cache_requests_total.labels(cache="slide_file", result="hit").inc()
+            return target
+
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, f".{info.content_id}.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if self._use(target):
+                    svs_cache_requests_total.labels(cache="slide_file", result="hit").inc()
+                    return target
+                svs_cache_requests_total.labels(cache="slide_file", result="miss").inc()
+                tmp_path = f"{target}.part"
+                try:
+                    download(tmp_path)
+                    if os.path.getsize(tmp_path) != info.size:
+                        raise RuntimeError(
+                            f"Expected {info.size} bytes, but wrote {os.path.getsize(tmp_path)} bytes"
+                        )
+                    os.replace(tmp_path, target)
+                    self._use(target)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.unlink(tmp_path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        self.enforce_limit(keep=target)
+        return target
+
+    def usage_path(self, path: str) -> str:
+        return os.path.join(self.root, f".{os.path.basename(path)}.used")
+
+    def _use(self, path: str) -> bool:
+        if not os.path.exists(path):
+            return False
+        usage_path = self.usage_path(path)
+        try:
+            os.utime(usage_path)
+        except FileNotFoundError:
+            open(usage_path, "a").close()
+        return True
+
+    def enforce_limit(self, keep: str = "") -> int:
+        files = []
+        if not os.path.isdir(self.root):
+            return 0
+        for name in os.listdir(self.root):
+            if name.startswith(".") or name.endswith(".part"):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            try:
+                used_at = os.stat(self.usage_path(path)).st_mtime
+            except OSError:
+                used_at = st.st_mtime
+            files.append((used_at, st.st_size, path))
+        removed = _evict_lru(files, self.max_bytes, keep=keep)
+        for _, _, path in files:
+            if not os.path.exists(path):
+                try:
+                    os.unlink(self.usage_path(path))
+                except OSError:
+                    pass
+        if removed:
+            svs_cache_evictions_total.labels(cache="slide_file").inc(removed)
+            logger.debug(f"Из локального кэша слайдов удалено файлов: {removed}")
+        return removed
+
+
+def parse_range_header(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Разбирает заголовок Range вида bytes=a-b, bytes=a- или bytes=-n.
+
+    Возвращает (start, end) включительно или None, если заголовка нет или он
+    не поддерживается (несколько диапазонов) — тогда отдаётся весь файл.
+    ValueError — диапазон не пересекается с файлом (ответ 416).
+    """
+    if not header:
+        return None
+    m = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", header)
+    if not m or (not m.group(1) and not m.group(2)):
+        return None
+    if not m.group(1):
+        suffix = int(m.group(2))
+        if suffix == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(size - suffix, 0), size - 1
+    start = int(m.group(1))
+    end = int(m.group(2)) if m.group(2) else size - 1
+    if start >= size or end < start:
+        raise ValueError("Unsatisfiable range")
+    return start, min(end, size - 1)
+
+
+async def ranged_smb_response(
+    path: str,
+    request: Request,
+    media_type: str,
+    reader: Optional[SMBRangeReader] = None,
+) -> Response:
+    """Отдаёт файл с шары целиком или по Range, читая только нужные блоки."""
+    reader = reader or smb_reader
+    info = await asyncio.to_thread(reader.stat, path)
+    etag = f'"{info.content_id}"'
+    headers = {"Accept-Ranges": "bytes", "ETag": etag}
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range != etag:
+        range_header = None
+    try:
+        byte_range = parse_range_header(range_header, info.size)
+    except ValueError:
+        headers["Content-Range"] = f"bytes */{info.size}"
+        return Response(status_code=416, headers=headers)
+
+    if info.size == 0:
+        return Response(content=b"", media_type=media_type, headers=headers)
+
+    status_code = 200
+    start, end = 0, info.size - 1
+    if byte_range is not None:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{info.size}"
+    headers["Content-Length"] = str(end - start + 1)
+    # Синхронный генератор Starlette выполняет в пуле потоков
+    return StreamingResponse(
+        reader.iter_blocks(info, start, end),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers,
+    )
+
+
+def download_smb_file(conn, relative_path: str, target_path: str) -> None:
+    with open(target_path, "wb") as f:
+        conn.retrieveFile(settings.smb_share, relative_path, f)
+
+
+def cache_smb_file(path: str) -> str:
+    """Возвращает локальную копию файла с шары из общего кэша слайдов."""
+    info = smb_reader.stat(path)
+    return local_slide_cache.ensure(
+        info,
+        lambda target: smb_pool.run(
+            lambda conn: download_smb_file(conn, info.relative_path, target)
+        ),
+    )
+
+
+async def fetch_cached_slide(path: str) -> str:
+    start_time = time.time()
+    local_path = await asyncio.to_thread(cache_smb_file, path)
+    logger.debug(f"Слайд {path} доступен локально за {time.time() - start_time:.2f} с: {local_path}")
+    return local_path
+
+
+def link_or_copy(source: str, target: str) -> None:
+    """Жёсткая ссылка на файл из кэша; если папки на разных ФС — копия."""
+    if os.path.exists(target):
+        os.unlink(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+smb_block_cache = BlockCache(
+    root=settings.smb_block_cache_dir,
+    block_size=settings.smb_block_size_kb * 1024,
+    max_bytes=settings.smb_block_cache_max_mb * 1024 * 1024,
+)
+smb_reader = SMBRangeReader(smb_pool, smb_block_cache)
+local_slide_cache = LocalSlideCache(
+    root=settings.svs_local_cache_dir,
+    max_bytes=settings.svs_local_cache_max_mb * 1024 * 1024,
+)
@@ -43,6 +43,7 @@ from cor_pass.routes import (
 
 from cor_pass.config.config import settings
 from cor_pass.services.shared.ip2_location import initialize_ip2location
+from cor_pass.services.laboratory.print_jobs import print_dispatcher
 from loguru import logger
 from cor_pass.services.user.auth import auth_service
 from fastapi.responses import JSONResponse
@@ -329,6 +330,7 @@ async def startup():
 async def shutdown_event():
     logger.info("------------- SHUTDOWN --------------")
     await close_modbus_client(app)
+    await print_dispatcher.aclose()
 
 
 auth_attempts = defaultdict(list)
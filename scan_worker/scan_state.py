@@ -0,0 +1,208 @@
+"""
+Локальное состояние сканер-воркера.
+
+Хранит в SQLite, какие файлы на SMB уже видели (путь, размер, mtime), их
+разобранный ключ и к какому стеклу они привязаны, а также mtime папок с
+датами. Благодаря этому каждый цикл перечитывает только изменившиеся
+папки, разбирает имя файла один раз и сопоставляет со стеклами только
+ещё не привязанные файлы. Файл, для которого стекло не нашлось, получает
+время следующей попытки с растущей паузой и до него не попадает в pending;
+изменение файла (размер/mtime) сбрасывает паузу.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+
+class ScanFile(NamedTuple):
+    path: str
+    size: int
+    mtime: float
+
+
+class ScanKey(NamedTuple):
+    case_code: str
+    sample: str
+    cassette: str
+    glass_number: int
+    staining: str
+
+
+class PendingScan(NamedTuple):
+    path: str
+    mtime: float
+    key: ScanKey
+    cor_id: str
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    case_code TEXT,
+    sample TEXT,
+    cassette TEXT,
+    glass_number INTEGER,
+    staining TEXT,
+    cor_id TEXT,
+    glass_id TEXT,
+    seen_at REAL NOT NULL,
+    unmatched_attempts INTEGER NOT NULL DEFAULT 0,
+    retry_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_scan_files_pending
+    ON scan_files (case_code) WHERE glass_id IS NULL AND case_code IS NOT NULL;
+CREATE TABLE IF NOT EXISTS scan_folders (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL
+);
+"""
+
+# Колонки, добавленные после первой версии схемы: (имя, DDL)
+_ADDED_COLUMNS = (
+    ("unmatched_attempts", "unmatched_attempts INTEGER NOT NULL DEFAULT 0"),
+    ("retry_at", "retry_at REAL"),
+)
+
+_SQLITE_MAX_PARAMS = 500
+# Ограничение показателя степени, чтобы пауза не переполняла целое
+_MAX_BACKOFF_SHIFT = 30
+
+
+class ScanStateStore:
+    def __init__(self, db_path: str):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        # Доступ идёт и из asyncio.to_thread, и из основного потока
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(scan_files)")}
+            for name, ddl in _ADDED_COLUMNS:
+                if name not in columns:
+                    self._conn.execute(f"ALTER TABLE scan_files ADD COLUMN {ddl}")
+
+    def folder_changed(self, path: str, mtime: float) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT mtime FROM scan_folders WHERE path = ?", (path,)
+            ).fetchone()
+        return row is None or row[0] != mtime
+
+    def remember_folder(self, path: str, mtime: float) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO scan_folders (path, mtime) VALUES (?, ?)",
+                (path, mtime),
+            )
+
+    def changed_files(self, files: Iterable[ScanFile]) -> List[ScanFile]:
+        """Возвращает файлы, которых ещё нет в состоянии или у которых изменились размер/mtime."""
+        files = list(files)
+        known: Dict[str, tuple] = {}
+        with self._lock:
+            for i in range(0, len(files), _SQLITE_MAX_PARAMS):
+                chunk = [f.path for f in files[i:i + _SQLITE_MAX_PARAMS]]
+                placeholders = ",".join("?" * len(chunk))
+                for path, size, mtime in self._conn.execute(
+                    f"SELECT path, size, mtime FROM scan_files WHERE path IN ({placeholders})",
+                    chunk,
+                ):
+                    known[path] = (size, mtime)
+        return [f for f in files if known.get(f.path) != (f.size, f.mtime)]
+
+    def record_files(
+        self,
+        files: Iterable[ScanFile],
+        parse: Callable[[str], Optional[dict]],
+    ) -> int:
+        """
+        Разбирает имена новых/изменённых файлов и сохраняет результат.
+
+        Файлы, которые не удалось разобрать, тоже запоминаются, чтобы не
+        разбирать их повторно. Возвращает число распознанных файлов.
+        """
+        now = time.time()
+        rows = []
+        parsed_count = 0
+        for f in files:
+            info = parse(f.path)
+            if info:
+                parsed_count += 1
+                rows.append((
+                    f.path, f.size, f.mtime,
+                    info["case_code"], info["sample"], info["cassette"],
+                    info["glass_number"], info["staining"], info["cor_id"], now,
+                ))
+            else:
+                rows.append((f.path, f.size, f.mtime, None, None, None, None, None, None, now))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO scan_files "
+                "(path, size, mtime, case_code, sample, cassette, glass_number, staining, cor_id, glass_id, seen_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, NULL, ?)",
+                rows,
+            )
+        return parsed_count
+
+    def pending(self, now: Optional[float] = None) -> List[PendingScan]:
+        """Распознанные файлы без стекла, у которых подошло время очередной попытки."""
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, mtime, case_code, sample, cassette, glass_number, staining, cor_id "
+                "FROM scan_files WHERE glass_id IS NULL AND case_code IS NOT NULL "
+                "AND (retry_at IS NULL OR retry_at <= ?)",
+                (now,),
+            ).fetchall()
+        return [
+            PendingScan(path, mtime, ScanKey(case_code, sample, cassette, glass_number, staining), cor_id)
+            for path, mtime, case_code, sample, cassette, glass_number, staining, cor_id in rows
+        ]
+
+    def mark_matched(self, paths: Iterable[str], glass_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE scan_files SET glass_id = ? WHERE path = ?",
+                [(glass_id, path) for path in paths],
+            )
+
+    def mark_unmatched(
+        self,
+        paths: Iterable[str],
+        base_delay: float,
+        max_delay: float,
+        now: Optional[float] = None,
+    ) -> None:
+        """
+        Откладывает файлы, для которых стекло не нашлось: пауза удваивается
+        с каждой неудачной попыткой, от base_delay до max_delay секунд.
+        """
+        now = time.time() if now is None else now
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE scan_files SET "
+                "retry_at = ? + MIN(?, ? * (1 << MIN(unmatched_attempts, ?))), "
+                "unmatched_attempts = unmatched_attempts + 1 "
+                "WHERE path = ? AND glass_id IS NULL",
+                [(now, max_delay, base_delay, _MAX_BACKOFF_SHIFT, path) for path in paths],
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def index_pending(pending: Iterable[PendingScan]) -> Dict[ScanKey, List[PendingScan]]:
+    """Группирует ожидающие файлы по ключу; внутри ключа самые свежие — первыми."""
+    index: Dict[ScanKey, List[PendingScan]] = {}
+    for scan in pending:
+        index.setdefault(scan.key, []).append(scan)
+    for scans in index.values():
+        scans.sort(key=lambda s: s.mtime, reverse=True)
+    return index
@@ -5,22 +5,25 @@ SMB Worker для автоматического сканирования и с
 
 import asyncio
 import enum
-import socket
 import os
 import re
 import sys
 from datetime import datetime, timedelta
-from smb.SMBConnection import SMBConnection
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker, joinedload
+from sqlalchemy.orm import sessionmaker, contains_eager
 from sqlalchemy.future import select
 from loguru import logger
 from openslide import OpenSlide
 from io import BytesIO
-import tempfile
 import time
-from cor_pass.database.models import Cassette, Glass, Sample 
+from cor_pass.database.models import Case, Cassette, Glass, Sample 
 from cor_pass.config.config import settings
+from cor_pass.repository.laboratory.status_rollup import refresh_rollups
+from cor_pass.services.laboratory.deepzoom import pretile_slide
+from cor_pass.services.laboratory.slide_tile_store import slide_store_key, slide_tile_store
+from cor_pass.services.shared.smb_pool import download_to_temp, smb_pool, smb_relative_path
+from cor_pass.services.shared.smb_stream import fetch_cached_slide
+from scan_worker.scan_state import ScanFile, ScanKey, ScanStateStore, index_pending
 import enum
 
 SMB_USER = settings.smb_user
@@ -30,7 +33,11 @@ SMB_SHARE = settings.smb_share
 REMOTE_NAME = settings.remote_name
 DATABASE_URL = settings.sqlalchemy_database_url
 SCAN_INTERVAL_SECONDS = settings.scan_interval_seconds
+UNMATCHED_RETRY_BASE_SECONDS = settings.scan_unmatched_retry_base_seconds
+UNMATCHED_RETRY_MAX_SECONDS = settings.scan_unmatched_retry_max_seconds
 BASE_PATH = settings.base_path
+SVS_PRETILE_ENABLED = settings.svs_pretile_enabled
+CASE_CODES_PER_QUERY = 500
 
 
 engine = create_async_engine(DATABASE_URL, echo=False)
@@ -144,105 +151,30 @@ def parse_filename(filename):
 
 async def fetch_file_from_smb(path: str) -> str:
     loop = asyncio.get_running_loop()
+    relative_path = smb_relative_path(path)
+    logger.debug(f"relative_path: {relative_path}")
 
-    def _read_file():
-        conn = SMBConnection(
-            SMB_USER,
-            SMB_PASS,
-            my_name=socket.gethostname(),
-            remote_name=REMOTE_NAME,
-            use_ntlm_v2=True,
-            is_direct_tcp=True,
-        )
-        if not conn.connect(SMB_SERVER_IP, 445):
-            raise RuntimeError("Failed to connect to SMB server")
-
-        prefix = f"\\\\{SMB_SERVER_IP}\\{SMB_SHARE}\\"
-        if path.startswith(prefix):
-            relative_path = path[len(prefix):].strip("/\\")
-        else:
-            relative_path = path.strip("/\\")
-
-        logger.debug(f"relative_path: {relative_path}")
-
-        try:
-            file_info = conn.getAttributes(SMB_SHARE, relative_path)
-            logger.debug(f"file_info: {file_info}, type: {type(file_info)}")
-            filesize = getattr(file_info, "file_size", None)
-            if filesize is None:
-                raise ValueError("Cannot get filesize from SMB file_info")
-            logger.debug(f"filesize: {filesize}, type: {type(filesize)}")
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".svs") as temp_file:
-                start_time = time.time()
-                conn.retrieveFile(SMB_SHARE, relative_path, temp_file)
-                temp_file.flush()
-                logger.debug(f"Time to retrieve file to disk: {time.time() - start_time} seconds")
-
-                temp_file.seek(0, os.SEEK_END)
-                file_size = temp_file.tell()
-                logger.debug(f"Total bytes written to temp file: {file_size}")
-                if file_size != filesize:
-                    raise RuntimeError(f"Expected {filesize} bytes, but wrote {file_size} bytes")
-                
-                return temp_file.name
-        finally:
-            conn.close()
-
-    return await loop.run_in_executor(None, _read_file)
+    return await loop.run_in_executor(
+        None, smb_pool.run, lambda conn: download_to_temp(conn, relative_path, ".svs")
+    )
 
 async def save_file_to_smb(data: BytesIO, path: str) -> None:
     loop = asyncio.get_running_loop()
+    relative_path = smb_relative_path(path)
 
-    def _write_file():
-        conn = SMBConnection(
-            SMB_USER,
-            SMB_PASS,
-            my_name=socket.gethostname(),
-            remote_name=REMOTE_NAME,
-            use_ntlm_v2=True,
-            is_direct_tcp=True,
-        )
-        if not conn.connect(SMB_SERVER_IP, 445):
-            raise RuntimeError("Failed to connect to SMB server")
-
-        prefix = f"\\\\{SMB_SERVER_IP}\\{SMB_SHARE}\\"
-        if path.startswith(prefix):
-            relative_path = path[len(prefix):].strip("/\\")
-        else:
-            relative_path = path.strip("/\\")
-
+    def _write_file(conn):
         logger.debug(f"Saving file to SMB: {relative_path}")
-        try:
-            data.seek(0)
-            conn.storeFile(SMB_SHARE, relative_path, data)
-            logger.debug(f"Successfully saved file to {relative_path}")
-        finally:
-            conn.close()
+        data.seek(0)
+        conn.storeFile(SMB_SHARE, relative_path, data)
+        logger.debug(f"Successfully saved file to {relative_path}")
 
-    await loop.run_in_executor(None, _write_file)
+    await loop.run_in_executor(None, smb_pool.run, _write_file)
 
 async def save_file_to_smb_manual(data: BytesIO, path: str) -> None:
     loop = asyncio.get_running_loop()
+    relative_path = smb_relative_path(path)
 
-    def _write_file():
-        conn = SMBConnection(
-            SMB_USER,
-            SMB_PASS,
-            my_name=socket.gethostname(),
-            remote_name=REMOTE_NAME,
-            use_ntlm_v2=True,
-            is_direct_tcp=True,
-        )
-        if not conn.connect(SMB_SERVER_IP, 445):
-            raise RuntimeError("Failed to connect to SMB server")
-
-        prefix = f"\\\\{SMB_SERVER_IP}\\{SMB_SHARE}\\"
-        if path.startswith(prefix):
-            relative_path = path[len(prefix):].strip("/\\")
-        else:
-            relative_path = path.strip("/\\")
-
+    def _write_file(conn):
         dir_path, filename = os.path.split(relative_path)
 
         # создаём директории если их нет
@@ -257,199 +189,247 @@ async def save_file_to_smb_manual(data: BytesIO, path: str) -> None:
                     # игнорируем, если уже есть
                     pass
 
-        try:
-            data.seek(0)
-            conn.storeFile(SMB_SHARE, relative_path, data)
-        finally:
-            conn.close()
+        data.seek(0)
+        conn.storeFile(SMB_SHARE, relative_path, data)
+
+    await loop.run_in_executor(None, smb_pool.run, _write_file)
 
-    await loop.run_in_executor(None, _write_file)
 
+# Папки внутри BASE_PATH, которые не являются папками сканов
+EXCLUDED_FOLDERS = ["LenaThyroidChile", "test"]
 
-def list_files_in_folder(conn, share, folder_path):
+
+def list_files_in_folder(conn, share, folder_path) -> list[ScanFile] | None:
+    """Список файлов папки с размером и mtime; None, если папку прочитать не удалось."""
     files = []
-    # logger.debug(f"Сканируем папку: {share}/{folder_path}")
     try:
         entries = conn.listPath(share, folder_path)
-        folder_contents = [entry.filename for entry in entries if entry.filename not in ['.', '..']]
-        # logger.info(f"Содержимое папки {share}/{folder_path}: {folder_contents}")
         for entry in entries:
             if entry.filename in [".", ".."]:
                 continue
             if not entry.isDirectory:
-                files.append(f"{folder_path}/{entry.filename}")
+                files.append(
+                    ScanFile(
+                        path=f"{folder_path}/{entry.filename}",
+                        size=entry.file_size,
+                        mtime=entry.last_write_time,
+                    )
+                )
     except Exception as e:
         logger.error(f"Ошибка при сканировании папки {share}/{folder_path}: {str(e)}")
+        return None
     return files
 
-def list_files_for_current_date(conn, share, base_path, include_yesterday=True):
-    files = []
+
+def collect_new_files(conn, share, base_path, state: ScanStateStore) -> int:
+    """
+    Перечитывает только изменившиеся папки с датами и сохраняет в состоянии
+    новые/изменённые файлы. Папки за сегодня и вчера читаются всегда.
+    Возвращает число новых распознанных файлов.
+    """
+    base_path_clean = base_path.lstrip("/")
     try:
-        base_path_clean = base_path.lstrip("/")
         entries = conn.listPath(share, base_path_clean)
-        date_folders = [entry.filename for entry in entries if entry.isDirectory and entry.filename not in ['.', '..']]
-        # logger.info(f"Доступные папки с датами в {share}/{base_path_clean}: {date_folders}")
     except Exception as e:
         logger.error(f"Ошибка при получении списка папок в {share}/{base_path_clean}: {str(e)}")
-        return files
+        return 0
 
     current_date = datetime.now().strftime("%Y-%m-%d")
-    if current_date in date_folders:
-        files.extend(list_files_in_folder(conn, share, f"{base_path}/{current_date}".lstrip("/")))
-
-    if include_yesterday:
-        yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-        if yesterday in date_folders:
-            files.extend(list_files_in_folder(conn, share, f"{base_path}/{yesterday}".lstrip("/")))
-
-    for folder in date_folders:
-        if folder not in [current_date, yesterday, 'LenaThyroidChile', 'test']:
-            files.extend(list_files_in_folder(conn, share, f"{base_path}/{folder}".lstrip("/")))
-
-    return files
-
-async def update_scan_urls():
-    def sync_scan():
-        conn = SMBConnection(
-            SMB_USER,
-            SMB_PASS,
-            my_name=socket.gethostname(),
-            remote_name=REMOTE_NAME,
-            use_ntlm_v2=True,
-            is_direct_tcp=True
-        )
-        logger.debug(f"Попытка подключения к SMB-серверу: {SMB_SERVER_IP}, share: {SMB_SHARE}, remote_name: {REMOTE_NAME}")
-        connected = conn.connect(SMB_SERVER_IP, 445)
-        if not connected:
-            raise RuntimeError("Не удалось подключиться к SMB-серверу")
-        logger.info("Успешно подключились к SMB-серверу")
-
-        try:
-            shares = conn.listShares()
-        except Exception as e:
-            logger.error(f"Ошибка при получении списка шар: {str(e)}")
-
-        try:
-            root_entries = conn.listPath(SMB_SHARE, "")
-        except Exception as e:
-            logger.error(f"Ошибка при сканировании корня шары {SMB_SHARE}: {str(e)}")
-
-        path_parts = BASE_PATH.lstrip("/").split("/")
-        current_path = ""
-        for part in path_parts:
-            current_path = f"{current_path}/{part}".lstrip("/")
-            # logger.debug(f"Проверка папки: {SMB_SHARE}/{current_path}")
-            try:
-                entries = conn.listPath(SMB_SHARE, current_path)
-                # logger.info(f"Содержимое папки {SMB_SHARE}/{current_path}: {[entry.filename for entry in entries if entry.filename not in ['.', '..']]}")
-                for entry in entries:
-                    if entry.filename in [".", ".."]:
-                        continue
-                    # logger.debug(f"Права для {entry.filename}: isDirectory={entry.isDirectory}, read={entry.isReadOnly is False}")
-            except Exception as e:
-                logger.error(f"Ошибка при сканировании папки {SMB_SHARE}/{current_path}: {str(e)}")
-                if "Unable to open directory" in str(e):
-                    logger.warning(f"Папка {SMB_SHARE}/{current_path} не существует или недоступна")
-
+    yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+
+    new_parsed = 0
+    for entry in entries:
+        if not entry.isDirectory or entry.filename in [".", ".."] + EXCLUDED_FOLDERS:
+            continue
+        folder_path = f"{base_path}/{entry.filename}".lstrip("/")
+        always_rescan = entry.filename in (current_date, yesterday)
+        if not always_rescan and not state.folder_changed(folder_path, entry.last_write_time):
+            continue
+
+        files = list_files_in_folder(conn, share, folder_path)
+        if files is None:
+            continue
+        changed = state.changed_files(files)
+        if changed:
+            new_parsed += state.record_files(changed, parse_filename)
+        # Папку запоминаем только после того, как её файлы сохранены
+        state.remember_folder(folder_path, entry.last_write_time)
+    return new_parsed
+
+# Очередь предварительного тайлинга: scan_url новых сканов
+pretile_queue: "asyncio.Queue[str]" = asyncio.Queue()
+
+
+def enqueue_pretile(scan_url: str) -> bool:
+    """Ставит новый скан в очередь на предварительный тайлинг. False, если тайлинг выключен."""
+    if not SVS_PRETILE_ENABLED:
+        return False
+    pretile_queue.put_nowait(scan_url)
+    return True
+
+
+async def pretile_scan(scan_url: str) -> None:
+    # Копия уже лежит в общем кэше слайдов после generate_preview
+    local_path = await fetch_cached_slide(scan_url)
+    store_key = slide_store_key(scan_url, os.path.getsize(local_path))
+    if slide_tile_store.has_slide(store_key):
+        logger.debug(f"[PRETILE] {scan_url} уже есть в хранилище тайлов")
+        return
+    start_time = time.time()
+    written = await asyncio.to_thread(
+        pretile_slide, local_path, store_key, settings.svs_pretile_max_tiles
+    )
+    logger.info(f"[PRETILE] {scan_url}: {written} тайлов за {time.time() - start_time:.1f} с")
+
+
+async def pretile_worker():
+    """Фоновая задача: по одному рендерит нижние уровни пирамиды новых сканов."""
+    while True:
+        scan_url = await pretile_queue.get()
         try:
-            scanner_entries = conn.listPath("scanner", "")
+            await pretile_scan(scan_url)
         except Exception as e:
-            logger.error(f"Ошибка при сканировании корня шары scanner: {str(e)}")
-
-        files = list_files_for_current_date(conn, SMB_SHARE, BASE_PATH, include_yesterday=True)
-        conn.close()
-        return files
-
-    smb_files = await asyncio.to_thread(sync_scan)
-    for file in smb_files:
-        pass
-        # logger.debug(f"Обнаружен файл: {file}")
+            logger.error(f"[PRETILE] Ошибка предварительного тайлинга {scan_url}: {str(e)}")
+        finally:
+            pretile_queue.task_done()
+
+
+async def generate_preview(glass: Glass, scan_url: str) -> None:
+    """Строит превью скана, сохраняет его рядом на SMB и отдаёт скан в тайлинг."""
+    # Скан попадает в общий кэш слайдов: API и тайлинг не будут качать его повторно
+    local_path = await fetch_cached_slide(scan_url)
+    start_time = time.time()
+    slide = OpenSlide(local_path)
+    logger.debug(f"Time to open slide: {time.time() - start_time} seconds")
+    preview = slide.get_thumbnail((512, 512))
+    buf = BytesIO()
+    preview.save(buf, format="PNG")
+    buf.seek(0)
+    preview_path = scan_url.replace('.svs', '.png').replace('.SVS', '.png')
+    await save_file_to_smb(buf, preview_path)
+    glass.preview_url = preview_path
+    logger.debug(f"[OK] Стекло {glass.id} → preview_url: {preview_path}")
+    enqueue_pretile(scan_url)
+
+
+def glass_scan_key(glass: Glass) -> ScanKey:
+    return ScanKey(
+        case_code=glass.cassette.sample.case.case_code,
+        sample=glass.cassette.sample.sample_number,
+        cassette=glass.cassette.cassette_number,
+        glass_number=glass.glass_number,
+        staining=glass.staining.abbr() if glass.staining else None,
+    )
+
+
+async def update_scan_urls(scan_state: ScanStateStore):
+    def sync_scan(conn):
+        return collect_new_files(conn, SMB_SHARE, BASE_PATH, scan_state)
+
+    new_files = await asyncio.to_thread(smb_pool.run, sync_scan)
+    if new_files:
+        logger.info(f"Новых файлов сканов: {new_files}")
+
+    pending_index = index_pending(scan_state.pending())
+    if not pending_index:
+        return
+    case_codes = sorted({key.case_code for key in pending_index})
 
     async with AsyncSessionLocal() as session:
+        glasses = []
         try:
-            result = await session.execute(
-                select(Glass)
-                .options(
-                    joinedload(Glass.cassette)
-                    .joinedload(Cassette.sample)
-                    .joinedload(Sample.case)
+            # Только стекла тех кейсов, для которых есть непривязанные файлы
+            for i in range(0, len(case_codes), CASE_CODES_PER_QUERY):
+                result = await session.execute(
+                    select(Glass)
+                    .join(Glass.cassette)
+                    .join(Cassette.sample)
+                    .join(Sample.case)
+                    .options(
+                        contains_eager(Glass.cassette)
+                        .contains_eager(Cassette.sample)
+                        .contains_eager(Sample.case)
+                    )
+                    .where(Case.case_code.in_(case_codes[i:i + CASE_CODES_PER_QUERY]))
                 )
-            )
-            glasses = result.scalars().all()
+                glasses.extend(result.scalars().unique().all())
         except Exception as e:
             logger.error(f"Ошибка при выполнении SQL-запроса: {str(e)}")
             raise
 
+        matched: list[tuple[list[str], str]] = []
+        retry_next_cycle: set[str] = set()
         updated = 0
-        skipped = 0
+        touched_samples: set[str] = set()
         for glass in glasses:
-            if glass.scan_url and glass.preview_url:
-                skipped += 1
-                # logger.debug(f"[SKIP] Стекло {glass.id} уже имеет scan_url: {glass.scan_url} и preview_url: {glass.preview_url}")
+            candidates = pending_index.get(glass_scan_key(glass))
+            if not candidates:
                 continue
-
-            case_code = glass.cassette.sample.case.case_code
-            sample_number = glass.cassette.sample.sample_number
-            cassette_number = glass.cassette.cassette_number
-            glass_number = glass.glass_number
-            staining = glass.staining.abbr() if glass.staining else None
             cor_id = glass.cassette.sample.case.patient_id
+            scans = [scan for scan in candidates if scan.cor_id == cor_id]
+            if not scans:
+                continue
+            paths = [scan.path for scan in scans]
+
+            if glass.scan_url and glass.preview_url:
+                # Стекло уже привязано — файл больше не нужно проверять
+                matched.append((paths, glass.id))
+                continue
 
-            # logger.debug(f"Проверяем стекло {glass.id}: case_code={case_code}, sample={sample_number}, cassette={cassette_number}, glass_number={glass_number}, staining={staining}, cor_id={cor_id}")
+            # Если есть пересканы, берём самый свежий файл
+            scan_url = f"\\\\{SMB_SERVER_IP}\\{SMB_SHARE}\\{scans[0].path}"
+            is_new_scan = glass.scan_url != scan_url
+            if glass.scan_url is None:
+                touched_samples.add(glass.cassette.sample_id)
+            glass.scan_url = scan_url
+            logger.debug(f"[OK] Стекло {glass.id} → scan_url: {scan_url}")
 
-            for file in smb_files:
-                info = parse_filename(file)
-                if not info:
+            if not glass.preview_url:
+                try:
+                    await generate_preview(glass, scan_url)
+                except Exception as e:
+                    logger.error(f"Ошибка при генерации или сохранении превью для {scans[0].path}: {str(e)}")
+                    # Файл остаётся в ожидании и будет обработан в следующем цикле
+                    retry_next_cycle.update(paths)
                     continue
+                # Скачанная для превью копия уже ушла в тайлинг
+                is_new_scan = False
 
-                # logger.debug(f"Сравниваем с файлом {file}: {info}")
-
-                if (
-                    info["case_code"] == case_code and
-                    info["sample"] == sample_number and
-                    info["cassette"] == cassette_number and
-                    info["glass_number"] == glass_number and
-                    info["staining"] == staining and
-                    info["cor_id"] == cor_id
-                ):
-                    if file.lower().endswith('.svs'):
-                        scan_url = f"\\\\{SMB_SERVER_IP}\\{SMB_SHARE}\\{file}"
-                        glass.scan_url = scan_url
-                        logger.debug(f"[OK] Стекло {glass.id} → scan_url: {scan_url}")
-
-                        if not glass.preview_url:
-                            try:
-                                temp_file_path = await fetch_file_from_smb(scan_url)
-                                try:
-                                    start_time = time.time()
-                                    slide = OpenSlide(temp_file_path)
-                                    logger.debug(f"Time to open slide: {time.time() - start_time} seconds")
-                                    preview = slide.get_thumbnail((512, 512))
-                                    buf = BytesIO()
-                                    preview.save(buf, format="PNG")
-                                    buf.seek(0)
-                                    preview_path = scan_url.replace('.svs', '.png').replace('.SVS', '.png')
-                                    await save_file_to_smb(buf, preview_path)
-                                    glass.preview_url = preview_path
-                                    logger.debug(f"[OK] Стекло {glass.id} → preview_url: {preview_path}")
-                                finally:
-                                    if os.path.exists(temp_file_path):
-                                        os.unlink(temp_file_path)
-                                        logger.debug(f"Temporary file {temp_file_path} deleted")
-                            except Exception as e:
-                                logger.error(f"Ошибка при генерации или сохранении превью для {file}: {str(e)}")
-                                continue
-
-                        updated += 1
-                        break
+            if is_new_scan:
+                enqueue_pretile(scan_url)
 
+            matched.append((paths, glass.id))
+            updated += 1
+
+        # Счётчики отсканированных стекол у семплов и кейсов
+        await refresh_rollups(session, sample_ids=touched_samples)
         await session.commit()
-        # logger.info(f"Обновлено {updated} записей, пропущено {skipped} записей")
+
+    matched_paths: set[str] = set()
+    for paths, glass_id in matched:
+        scan_state.mark_matched(paths, glass_id)
+        matched_paths.update(paths)
+    # Файлы без стекла откладываются, чтобы не запрашивать их кейсы каждый цикл
+    unmatched = [
+        scan.path
+        for scans in pending_index.values()
+        for scan in scans
+        if scan.path not in matched_paths and scan.path not in retry_next_cycle
+    ]
+    if unmatched:
+        scan_state.mark_unmatched(unmatched, UNMATCHED_RETRY_BASE_SECONDS, UNMATCHED_RETRY_MAX_SECONDS)
+        logger.debug(f"Файлов без стекла отложено: {len(unmatched)}")
+    if updated:
+        logger.info(f"Обновлено стекол: {updated}")
 
 async def main():
+    # Открывается только в самом воркере: API импортирует этот модуль ради save_file_to_smb
+    scan_state = ScanStateStore(settings.scan_state_db_path)
+    if SVS_PRETILE_ENABLED:
+        asyncio.create_task(pretile_worker())
     while True:
         try:
-            await update_scan_urls()
+            await update_scan_urls(scan_state)
         except Exception as e:
             logger.exception(f"Ошибка в update_scan_urls: {e}")
         await asyncio.sleep(SCAN_INTERVAL_SECONDS)
@@ -6,8 +6,8 @@ from uuid import uuid4
 
 import pytest
 from httpx import AsyncClient, ASGITransport
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
-from sqlalchemy import LargeBinary, Date
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy import LargeBinary, Date, Table
 
 from cor_pass.config.config import settings
 from cor_pass.database.models.base import Base
@@ -205,6 +205,60 @@ async def test_engine():
         await conn.run_sync(metadata.drop_all)
     
     await engine.dispose()
+
+
+@pytest.fixture
+async def sqlite_engine(tmp_path):
+    """Factory for file-backed SQLite engines with only the given tables created.
+
+    ``engine = await sqlite_engine(Model.__table__, ..., **engine_kwargs)``.
+    Tables may belong to different MetaData. Engines are disposed after the test.
+    """
+    engines = []
+
+    async def create(*tables: Table, **engine_kwargs) -> AsyncEngine:
+        engine = create_async_engine(
+            f"sqlite+aiosqlite:///{tmp_path / f'test_{len(engines)}.db'}", **engine_kwargs
+        )
+        engines.append(engine)
+        by_metadata = {}
+        for table in tables:
+            by_metadata.setdefault(table.metadata, []).append(table)
+        async with engine.begin() as conn:
+            for metadata, group in by_metadata.items():
+                await conn.run_sync(metadata.create_all, tables=group)
+        return engine
+
+    yield create
+    for engine in engines:
+        await engine.dispose()
+
+
+@pytest.fixture
+def sqlite_sessionmaker(sqlite_engine):
+    """Factory: ``maker = await sqlite_sessionmaker(*tables)`` over a fresh SQLite file."""
+    async def create(*tables: Table, **engine_kwargs) -> async_sessionmaker:
+        engine = await sqlite_engine(*tables, **engine_kwargs)
+        return async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    return create
+
+
+@pytest.fixture
+async def sqlite_session(sqlite_sessionmaker):
+    """Factory: ``db = await sqlite_session(*tables)``; sessions are closed after the test."""
+    sessions = []
+
+    async def create(*tables: Table, **engine_kwargs) -> AsyncSession:
+        session = (await sqlite_sessionmaker(*tables, **engine_kwargs))()
+        sessions.append(session)
+        return session
+
+    yield create
+    for session in sessions:
+        await session.close()
+
+
 @pytest.fixture(scope="function")
 async def db_session(test_engine) -> AsyncGenerator[AsyncSession, None]:
     """Create test database session."""
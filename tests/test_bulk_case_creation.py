@@ -0,0 +1,84 @@
+"""Tests for bulk case creation with batched multi-row inserts."""
+import pytest
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from cor_pass.database import models as db_models
+from cor_pass.repository.laboratory.case import create_cases_with_initial_data
+from cor_pass.schemas import CaseCreate
+
+
+TABLES = [
+    db_models.CaseCodeSequence.__table__,
+    db_models.Case.__table__,
+    db_models.CaseParameters.__table__,
+    db_models.Sample.__table__,
+    db_models.Cassette.__table__,
+    db_models.Glass.__table__,
+    db_models.CaseWorklist.__table__,
+]
+
+
+@pytest.fixture
+async def engine(sqlite_engine):
+    return await sqlite_engine(*TABLES)
+
+
+def _body(num_cases: int, num_samples: int) -> CaseCreate:
+    return CaseCreate(
+        patient_cor_id="PATIENT1",
+        num_cases=num_cases,
+        num_samples=num_samples,
+        urgency=db_models.UrgencyType.S,
+        material_type=db_models.MaterialType.B,
+    )
+
+
+async def _create_counting_statements(engine, body: CaseCreate):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+    try:
+        session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        async with session_factory() as db:
+            result = await create_cases_with_initial_data(db, body)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", count)
+    return result, statements
+
+
+async def test_tree_is_persisted(engine):
+    result, _ = await _create_counting_statements(engine, _body(num_cases=3, num_samples=2))
+
+    codes = [case["case_code"] for case in result["all_cases"]]
+    assert len(codes) == 3 and len(set(codes)) == 3
+    first = result["first_case_details"]
+    assert [s["sample_number"] for s in first["samples"]] == ["A", "B"]
+    assert first["bank_count"] == first["cassette_count"] == first["glass_count"] == 2
+    cassettes = first["samples"][0]["cassettes"]
+    assert [c["cassette_number"] for c in cassettes] == ["A1"]
+    assert [g["glass_number"] for g in cassettes[0]["glasses"]] == [0]
+    assert first["samples"][1]["cassettes"] == []
+
+    async with engine.connect() as conn:
+        for table, expected in (
+            (db_models.Case, 3),
+            (db_models.CaseParameters, 3),
+            (db_models.Sample, 6),
+            (db_models.Cassette, 6),
+            (db_models.Glass, 6),
+        ):
+            assert await conn.scalar(select(func.count()).select_from(table)) == expected
+
+
+async def test_round_trips_do_not_grow_with_case_count(engine):
+    # Первый вызов заводит счётчик года — дальше он сдвигается одним UPDATE
+    await _create_counting_statements(engine, _body(num_cases=1, num_samples=1))
+    _, small = await _create_counting_statements(engine, _body(num_cases=1, num_samples=1))
+    _, large = await _create_counting_statements(engine, _body(num_cases=20, num_samples=5))
+
+    # Счётчик номеров + по одному INSERT на таблицу, независимо от размера дерева
+    assert len(small) == len(large) == 7
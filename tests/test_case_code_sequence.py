@@ -0,0 +1,74 @@
+"""Tests for the database-backed case-code number allocator."""
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from cor_pass.database import models as db_models
+from cor_pass.repository.laboratory.case_code import (
+    ensure_case_number_reserved,
+    reserve_case_numbers,
+)
+
+
+@pytest.fixture
+async def session_factory(sqlite_sessionmaker):
+    # Файловая БД, чтобы несколько сессий работали с одной базой параллельно
+    return await sqlite_sessionmaker(
+        db_models.CaseCodeSequence.__table__,
+        db_models.Case.__table__,
+        connect_args={"timeout": 30},
+    )
+
+
+async def test_new_year_starts_after_existing_codes(session_factory):
+    async with session_factory() as db:
+        db.add_all([
+            db_models.Case(case_code="S25B00041"),
+            db_models.Case(case_code="U25M00007"),
+            db_models.Case(case_code="S24B00999"),
+        ])
+        await db.commit()
+
+        assert await reserve_case_numbers(db, "25") == 42
+        assert await reserve_case_numbers(db, "25", 3) == 43
+        assert await reserve_case_numbers(db, "25") == 46
+        assert await reserve_case_numbers(db, "26") == 1
+        await db.commit()
+
+
+async def test_rollback_returns_numbers(session_factory):
+    async with session_factory() as db:
+        assert await reserve_case_numbers(db, "25", 5) == 1
+        await db.rollback()
+        assert await reserve_case_numbers(db, "25") == 1
+        await db.commit()
+
+
+async def test_manual_number_is_skipped(session_factory):
+    async with session_factory() as db:
+        await reserve_case_numbers(db, "25")
+        await ensure_case_number_reserved(db, "25", 100)
+        await ensure_case_number_reserved(db, "25", 50)
+        assert await reserve_case_numbers(db, "25") == 101
+        await db.commit()
+
+
+async def test_concurrent_reservations_do_not_overlap(session_factory):
+    async def reserve(count: int):
+        async with session_factory() as db:
+            first = await reserve_case_numbers(db, "25", count)
+            await asyncio.sleep(0)
+            await db.commit()
+            return list(range(first, first + count))
+
+    blocks = await asyncio.gather(*(reserve(1 + i % 3) for i in range(30)))
+    numbers = [n for block in blocks for n in block]
+
+    assert len(numbers) == len(set(numbers))
+    assert sorted(numbers) == list(range(1, len(numbers) + 1))
+    async with session_factory() as db:
+        stored = await db.scalar(
+            select(db_models.CaseCodeSequence.last_value).where(db_models.CaseCodeSequence.scope == "25")
+        )
+    assert stored == len(numbers)
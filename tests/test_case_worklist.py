@@ -0,0 +1,105 @@
+"""Tests for the current-cases worklist projection."""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import delete, select, update
+
+from cor_pass.database import models as db_models
+from cor_pass.repository.laboratory.case_worklist import (
+    current_cases_query,
+    rebuild_case_worklist,
+    sync_case_worklist,
+)
+
+
+TABLES = [db_models.Case.__table__, db_models.CaseWorklist.__table__]
+
+
+@pytest.fixture
+async def db(sqlite_session):
+    return await sqlite_session(*TABLES)
+
+
+async def _cases(db, specs):
+    """specs: (case_code, glass_count, grossing_status); даты по убыванию возраста."""
+    start = datetime(2026, 1, 1)
+    cases = []
+    for i, (code, glass_count, status) in enumerate(specs):
+        case = db_models.Case(
+            case_code=code,
+            glass_count=glass_count,
+            grossing_status=status,
+            creation_date=start + timedelta(hours=i),
+        )
+        db.add(case)
+        cases.append(case)
+    await db.flush()
+    return cases
+
+
+async def _current_codes(db):
+    return [row.case_code for row in (await db.execute(current_cases_query())).all()]
+
+
+async def test_priority_and_ordering(db):
+    processing = db_models.Grossing_status.PROCESSING
+    cases = await _cases(
+        db,
+        [
+            ("S26B00001", 1, processing),
+            ("F26B00002", 0, processing),
+            ("S26B00003", 0, processing),
+            ("U26B00004", 0, db_models.Grossing_status.CREATED),
+            ("S26B00005", 2, processing),
+            ("F26B00006", 0, db_models.Grossing_status.COMPLETED),
+        ],
+    )
+    await sync_case_worklist(db, [case.id for case in cases])
+    await db.commit()
+
+    # F/U первыми, затем S со стеклами; внутри — новые первыми
+    assert await _current_codes(db) == ["U26B00004", "F26B00002", "S26B00005", "S26B00001"]
+
+    await db.execute(
+        update(db_models.Case)
+        .where(db_models.Case.id.in_([cases[1].id, cases[2].id]))
+        .values(grossing_status=db_models.Grossing_status.COMPLETED)
+    )
+    await db.execute(update(db_models.Case).where(db_models.Case.id == cases[2].id).values(glass_count=3))
+    await sync_case_worklist(db, [cases[1].id, cases[2].id])
+    await db.commit()
+    assert await _current_codes(db) == ["U26B00004", "S26B00005", "S26B00001"]
+
+    await db.execute(
+        update(db_models.Case)
+        .where(db_models.Case.id == cases[2].id)
+        .values(grossing_status=db_models.Grossing_status.PROCESSING)
+    )
+    await sync_case_worklist(db, [cases[2].id])
+    await db.commit()
+    assert await _current_codes(db) == ["U26B00004", "S26B00005", "S26B00003", "S26B00001"]
+
+
+async def test_rebuild_restores_projection(db):
+    processing = db_models.Grossing_status.PROCESSING
+    cases = await _cases(
+        db, [("F26B00001", 0, processing), ("S26B00002", 1, processing), ("S26B00003", 0, processing)]
+    )
+    await db.commit()
+    assert await _current_codes(db) == []
+
+    assert await rebuild_case_worklist(db, batch_size=2) == 3
+    assert await _current_codes(db) == ["F26B00001", "S26B00002"]
+    rows = (await db.scalars(select(db_models.CaseWorklist).order_by(db_models.CaseWorklist.case_id))).all()
+    assert {row.case_id: (row.case_type, row.has_glass) for row in rows} == {
+        cases[0].id: ("F", False),
+        cases[1].id: ("S", True),
+        cases[2].id: ("S", False),
+    }
+
+    # Строки удалённых кейсов убираются при пересборке
+    await db.execute(delete(db_models.Case).where(db_models.Case.id == cases[0].id))
+    await db.commit()
+    assert await rebuild_case_worklist(db) == 2
+    assert await _current_codes(db) == ["S26B00002"]
+    assert len((await db.scalars(select(db_models.CaseWorklist))).all()) == 2
@@ -0,0 +1,121 @@
+"""Tests for concurrent unit collection with missing-value markers and latency stats."""
+import asyncio
+from uuid import uuid4
+
+import pytest
+
+from worker.collection_planner import MISSING, CollectionPlanner
+from worker.data_collector import get_solarchargers_current_sum, solarcharger_reads, summarize_solarchargers
+from worker.modbus_client import SOLAR_CHARGER_SLAVE_IDS
+
+
+class _Response:
+    def __init__(self, registers=None):
+        self.registers = registers
+
+    def isError(self):
+        return self.registers is None
+
+
+class FakeCerboConnection:
+    """Одно подключение: как и pymodbus, выполняет запросы строго по одному."""
+
+    def __init__(self, shared: dict, delay: float = 0.02):
+        self.shared = shared
+        self.delay = delay
+        self._lock = asyncio.Lock()
+
+    async def read_input_registers(self, address, count=1, slave=1):
+        async with self._lock:
+            self.shared["active"] += 1
+            self.shared["peak"] = max(self.shared["peak"], self.shared["active"])
+            try:
+                await asyncio.sleep(self.delay)
+                if slave in self.shared["broken"]:
+                    return _Response()
+                if slave in self.shared["raising"]:
+                    raise ConnectionError("socket closed")
+                return _Response([slave * 10])
+            finally:
+                self.shared["active"] -= 1
+
+
+@pytest.fixture
+def connections():
+    shared = {"active": 0, "peak": 0, "broken": set(), "raising": set()}
+    return shared, [FakeCerboConnection(shared) for _ in range(6)]
+
+
+async def test_units_are_read_concurrently_under_cap(connections):
+    shared, clients = connections
+    planner = CollectionPlanner("cerbo-1", max_concurrency=4)
+
+    report = await planner.gather(solarcharger_reads(), clients)
+
+    assert shared["peak"] == 4
+    assert not report.missing
+    # 14 чтений по 20 мс в 4 потока — около 80 мс вместо 280
+    assert report.elapsed_s < len(SOLAR_CHARGER_SLAVE_IDS) * 0.02 / 2
+    assert summarize_solarchargers(report, uuid4()) == {
+        "solar_total_pv_power": sum(slave * 10 for slave in SOLAR_CHARGER_SLAVE_IDS)
+    }
+
+
+async def test_connection_count_bounds_concurrency(connections):
+    shared, clients = connections
+    planner = CollectionPlanner("cerbo-1", max_concurrency=8)
+
+    await planner.gather(solarcharger_reads(), clients[:2])
+
+    assert shared["peak"] == 2
+
+
+async def test_partial_failures_are_marked_missing(connections):
+    shared, clients = connections
+    shared["broken"] = {3}
+    shared["raising"] = {100}
+    planner = CollectionPlanner("cerbo-1", max_concurrency=4)
+
+    report = await planner.gather(solarcharger_reads(), clients)
+
+    assert report.get("charger_3") is MISSING
+    assert report.get("charger_100") is MISSING
+    assert report.results["charger_100"].error == "socket closed"
+    assert sorted(report.missing) == ["charger_100", "charger_3"]
+    expected = sum(slave * 10 for slave in SOLAR_CHARGER_SLAVE_IDS if slave not in (3, 100))
+    assert summarize_solarchargers(report, uuid4()) == {"solar_total_pv_power": expected}
+
+
+async def test_all_units_failing_gives_none_not_zero(connections):
+    shared, clients = connections
+    shared["broken"] = set(SOLAR_CHARGER_SLAVE_IDS)
+
+    result = await get_solarchargers_current_sum(clients[0], uuid4())
+
+    assert result == {"solar_total_pv_power": None}
+
+
+async def test_timeout_and_per_unit_latency():
+    planner = CollectionPlanner("cerbo-1", max_concurrency=2, timeout=0.05)
+
+    async def fast(client):
+        await asyncio.sleep(0.01)
+        return {"soc": 50}
+
+    async def hung(client):
+        await asyncio.sleep(1)
+
+    report = await planner.gather({"battery": fast, "inverter": hung}, [object(), object()])
+    await planner.gather({"battery": fast}, [object()])
+
+    assert report.get("battery") == {"soc": 50}
+    assert report.results["inverter"].error == "timeout"
+    assert report.latencies["inverter"] >= 0.05
+    assert report.elapsed_s < 0.5
+    assert "missing ['inverter']" in report.summary()
+
+    units = planner.get_stats()["units"]
+    assert units["battery"]["reads"] == 2 and units["battery"]["failures"] == 0
+    assert units["inverter"]["failures"] == 1
+    assert units["battery"]["latency_max_s"] >= 0.01
+    assert planner.get_stats()["in_flight"] == 0
@@ -0,0 +1,72 @@
+"""Tests for slide version and format handling in the DeepZoom routes."""
+import importlib
+import os
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from cor_pass.services.laboratory.deepzoom import slide_content_id
+from cor_pass.services.user.auth import auth_service
+
+# Пакет routes.laboratory переэкспортирует router под именем svs_router
+svs_router = importlib.import_module("cor_pass.routes.laboratory.svs_router")
+
+
+@pytest.fixture
+def slide(tmp_path, monkeypatch):
+    slides = tmp_path / "user-1" / "slides"
+    slides.mkdir(parents=True)
+    path = slides / "case.svs"
+    path.write_bytes(b"v1")
+    monkeypatch.setattr(svs_router, "DICOM_ROOT_DIR", str(tmp_path))
+    monkeypatch.setattr(svs_router, "get_dzi", lambda svs_path, fmt: f'<Image Format="{fmt}"/>')
+    return path
+
+
+@pytest.fixture
+async def client(slide):
+    app = FastAPI()
+    app.include_router(svs_router.router)
+    app.dependency_overrides[auth_service.get_current_user] = lambda: SimpleNamespace(cor_id="user-1")
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as instance:
+        yield instance
+
+
+async def test_dzi_format_is_validated(client, slide):
+    slide_id = slide_content_id(str(slide))
+
+    default = await client.get(f"/svs/deepzoom/{slide_id}.dzi")
+    assert default.status_code == 200
+    assert default.text == '<Image Format="jpeg"/>'
+
+    png = await client.get(f"/svs/deepzoom/{slide_id}.dzi", params={"format": "png"})
+    assert png.text == '<Image Format="png"/>'
+    assert png.headers["etag"] != default.headers["etag"]
+
+    unknown = await client.get(f"/svs/deepzoom/{slide_id}.dzi", params={"format": "gif"})
+    assert unknown.status_code == 422
+
+
+async def test_dzi_is_bound_to_slide_version(client, slide):
+    slide_id = slide_content_id(str(slide))
+
+    first = await client.get(f"/svs/deepzoom/{slide_id}.dzi")
+    cached = await client.get(
+        f"/svs/deepzoom/{slide_id}.dzi", headers={"If-None-Match": first.headers["etag"]}
+    )
+    assert cached.status_code == 304
+
+    # Заменённый файл получает новую версию, старая ссылка больше не действует
+    slide.write_bytes(b"version 2")
+    stat = os.stat(slide)
+    os.utime(slide, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert (await client.get(f"/svs/deepzoom/{slide_id}.dzi")).status_code == 404
+    assert (await client.get(f"/svs/deepzoom/{slide_content_id(str(slide))}.dzi")).status_code == 200
+
+
+async def test_tile_format_must_be_supported(client, slide):
+    slide_id = slide_content_id(str(slide))
+    response = await client.get(f"/svs/deepzoom/{slide_id}_files/0/0_0.gif")
+    assert response.status_code == 400
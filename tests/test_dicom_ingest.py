@@ -0,0 +1,87 @@
+"""Tests for the staged, non-blocking DICOM upload pipeline."""
+import asyncio
+import io
+import os
+import zipfile
+from types import SimpleNamespace
+
+import pytest
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+from cor_pass.services.laboratory.dicom_ingest import (
+    DicomIngestor,
+    IngestError,
+    get_progress,
+)
+
+
+def _dicom_bytes() -> bytes:
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds.file_meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.2"
+    ds.file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    ds.SOPClassUID = ds.file_meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = ds.file_meta.MediaStorageSOPInstanceUID
+    buf = io.BytesIO()
+    ds.save_as(buf, enforce_file_format=True)
+    return buf.getvalue()
+
+
+def _upload(name: str, data: bytes):
+    return SimpleNamespace(filename=name, file=io.BytesIO(data))
+
+
+def _zip(members: dict) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+
+def test_ingest_replaces_user_directory(tmp_path):
+    user_dir = tmp_path / "USER1"
+    (user_dir / "slides").mkdir(parents=True)
+    (user_dir / "old.dcm").write_bytes(b"old")
+
+    uploads = [
+        _upload("a.dcm", _dicom_bytes()),
+        _upload("study.zip", _zip({"series/IM0001": _dicom_bytes(), "series/broken": b"junk"})),
+    ]
+    valid = asyncio.run(DicomIngestor(workers=2).ingest(str(user_dir), uploads))
+
+    assert valid == 2
+    assert sorted(os.listdir(user_dir)) == ["a.dcm", "series", "slides"]
+    assert os.listdir(user_dir / "series") == ["IM0001"]
+    assert sorted(os.listdir(tmp_path)) == ["USER1"]
+    progress = get_progress("USER1")
+    assert progress["stage"] == "done"
+    assert progress["valid_dicom"] == 2
+    assert progress["files_received"] == 2
+
+
+def test_failed_ingest_keeps_previous_data(tmp_path):
+    user_dir = tmp_path / "USER2"
+    user_dir.mkdir()
+    (user_dir / "old.dcm").write_bytes(b"old")
+
+    with pytest.raises(IngestError):
+        asyncio.run(DicomIngestor(workers=1).ingest(str(user_dir), [_upload("x.dcm", b"junk")]))
+
+    assert os.listdir(user_dir) == ["old.dcm"]
+    assert sorted(os.listdir(tmp_path)) == ["USER2"]
+    assert get_progress("USER2")["stage"] == "failed"
+
+
+def test_zip_slip_is_rejected(tmp_path):
+    user_dir = tmp_path / "USER3"
+    uploads = [
+        _upload("a.dcm", _dicom_bytes()),
+        _upload("evil.zip", _zip({"../../escape.dcm": _dicom_bytes()})),
+    ]
+    asyncio.run(DicomIngestor(workers=1).ingest(str(user_dir), uploads))
+
+    assert not (tmp_path / "escape.dcm").exists()
+    assert os.listdir(user_dir / "slides") == []
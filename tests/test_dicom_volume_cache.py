@@ -0,0 +1,127 @@
+"""Tests for the shared memory-mapped DICOM volume cache."""
+import json
+import os
+
+import numpy as np
+
+from cor_pass.services.laboratory import dicom_volume_cache as cache_module
+from cor_pass.services.laboratory.dicom_volume_cache import (
+    DicomVolumeCache,
+    list_dicom_files,
+    series_key,
+    write_volume,
+)
+
+
+def _touch(path, payload=b"x"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(payload)
+
+
+def test_list_skips_slides_and_hidden_files(tmp_path):
+    _touch(str(tmp_path / "a.dcm"))
+    _touch(str(tmp_path / "series" / "IM0001"))
+    _touch(str(tmp_path / "slides" / "scan.svs"))
+    _touch(str(tmp_path / ".hidden"))
+
+    files = list_dicom_files(str(tmp_path))
+
+    assert [os.path.relpath(f, tmp_path) for f in files] == ["a.dcm", os.path.join("series", "IM0001")]
+
+
+def test_series_key_changes_when_file_changes(tmp_path):
+    path = str(tmp_path / "a.dcm")
+    _touch(path, b"one")
+    key = series_key([path])
+    _touch(path, b"three")
+    assert series_key([path]) != key
+
+
+def test_write_volume_resizes_to_most_common_shape(tmp_path):
+    path = str(tmp_path / "v.npy")
+    slices = [np.ones((4, 4), np.float32), np.ones((4, 4), np.float32), np.ones((2, 2), np.float32)]
+
+    write_volume(path, slices)
+
+    volume = np.load(path, mmap_mode="r")
+    assert volume.shape == (3, 4, 4)
+    assert volume.dtype == np.float32
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_load_builds_once_and_reuses_file(tmp_path, monkeypatch):
+    data_dir = tmp_path / "user"
+    _touch(str(data_dir / "a.dcm"))
+    _touch(str(data_dir / "b.dcm"))
+    builds = []
+
+    def fake_decode(paths, workers):
+        builds.append(paths)
+        return [(float(i), np.full((2, 2), i, np.float32), p) for i, p in enumerate(paths)], 0
+
+    monkeypatch.setattr(cache_module, "decode_series", fake_decode)
+    monkeypatch.setattr(cache_module, "read_dataset", lambda path, **kwargs: path)
+
+    cache = DicomVolumeCache(root=str(tmp_path / "cache"), max_bytes=1024 * 1024, workers=2)
+    volume, example = cache.load(str(data_dir))
+    assert volume.shape == (2, 2, 2)
+    assert example.endswith("a.dcm")
+
+    # Другой процесс: пустой кэш процесса, но готовый файл на диске
+    other = DicomVolumeCache(root=str(tmp_path / "cache"), max_bytes=1024 * 1024, workers=2)
+    volume2, _ = other.load(str(data_dir))
+    assert np.array_equal(volume, volume2)
+    assert len(builds) == 1
+
+
+def test_hot_load_does_not_rescan_series(tmp_path, monkeypatch):
+    data_dir = tmp_path / "user"
+    _touch(str(data_dir / "series" / "a.dcm"))
+    monkeypatch.setattr(
+        cache_module,
+        "decode_series",
+        lambda paths, workers: ([(float(i), np.zeros((2, 2), np.float32), p) for i, p in enumerate(paths)], 0),
+    )
+    monkeypatch.setattr(cache_module, "read_dataset", lambda path, **kwargs: path)
+    scans = []
+    list_files = cache_module.list_dicom_files
+    monkeypatch.setattr(cache_module, "list_dicom_files", lambda path: scans.append(path) or list_files(path))
+
+    cache = DicomVolumeCache(root=str(tmp_path / "cache"), max_bytes=1024 * 1024, workers=1, series_ttl=60)
+    key, _, _ = cache.load_with_key(str(data_dir))
+    for _ in range(3):
+        assert cache.load_with_key(str(data_dir))[0] == key
+    assert len(scans) == 1
+
+    # Новый срез во вложенной папке не меняет mtime папки пользователя: его подхватывает clear()
+    _touch(str(data_dir / "series" / "b.dcm"))
+    assert cache.load_with_key(str(data_dir))[0] == key
+    cache.clear()
+    assert cache.load_with_key(str(data_dir))[0] != key
+
+    # Изменение самой папки пользователя сбрасывает отпечаток сразу
+    _touch(str(data_dir / "c.dcm"))
+    stat = os.stat(data_dir)
+    os.utime(data_dir, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    cache.load_with_key(str(data_dir))
+    assert len(scans) == 3
+
+    # После series_ttl папка перечитывается и без изменений
+    cache.series_ttl = 0
+    cache.load_with_key(str(data_dir))
+    assert len(scans) == 4
+
+
+def test_enforce_limit_evicts_oldest_volume(tmp_path):
+    cache = DicomVolumeCache(root=str(tmp_path), max_bytes=200, workers=1)
+    for key, mtime in (("old", 1), ("new", 2)):
+        volume_path, meta_path = cache._paths(key)
+        write_volume(volume_path, [np.zeros((4, 4), np.float32)])
+        with open(meta_path, "w") as f:
+            json.dump({"example_path": "x", "slices": 1}, f)
+        os.utime(volume_path, (mtime, mtime))
+
+    assert cache.enforce_limit() == 1
+    assert not os.path.exists(cache._paths("old")[0])
+    assert os.path.exists(cache._paths("new")[0])
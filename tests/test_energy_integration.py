@@ -0,0 +1,188 @@
+"""Tests for vectorized energy integration against the previous per-point loop."""
+import random
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from cor_pass.services.energy.energy_integration import energy_report, integrate_power
+
+
+T0 = datetime(2026, 10, 16, 0, 0, 0)
+NO_GAPS = 1e9
+
+
+def legacy_totals(measurements):
+    """Итоги прежней get_energy_measurements_service: прямоугольники по левой точке."""
+    totals = dict(solar=0.0, load=0.0, grid_import=0.0, grid_export=0.0, battery=0.0)
+    for prev, curr in zip(measurements, measurements[1:]):
+        delta_h = (curr.measured_at - prev.measured_at).total_seconds() / 3600.0
+        if delta_h <= 0:
+            continue
+        totals["solar"] += prev.solar_total_pv_power / 1000.0 * delta_h
+        totals["load"] += prev.inverter_total_ac_output / 1000.0 * delta_h
+        grid = prev.ess_total_input_power / 1000.0 * delta_h
+        totals["grid_import" if grid >= 0 else "grid_export"] += abs(grid)
+        totals["battery"] += prev.general_battery_power / 1000.0 * delta_h
+    return totals
+
+
+def random_series(seed, count=400, constant=False, object_id="obj-1"):
+    rng = random.Random(seed)
+    ts, result = T0, []
+    values = [rng.uniform(0, 8000), rng.uniform(0, 5000), rng.uniform(-3000, 3000), rng.uniform(-3000, 3000)]
+    for _ in range(count):
+        if not constant:
+            values = [v + rng.uniform(-300, 300) for v in values]
+        result.append(SimpleNamespace(
+            energetic_object_id=object_id,
+            measured_at=ts,
+            solar_total_pv_power=values[0],
+            inverter_total_ac_output=values[1],
+            ess_total_input_power=values[2],
+            general_battery_power=values[3],
+        ))
+        ts += timedelta(seconds=rng.choice([1, 2, 2, 2, 3, 5]))
+    return result
+
+
+def as_rows(measurements):
+    return [
+        (m.energetic_object_id, m.measured_at, m.solar_total_pv_power, m.inverter_total_ac_output,
+         m.ess_total_input_power, m.general_battery_power)
+        for m in measurements
+    ]
+
+
+def integrate(measurements, edges_minutes, max_gap=NO_GAPS):
+    seconds = np.array([(m.measured_at - T0).total_seconds() for m in measurements])
+    watts = np.array([row[2:] for row in as_rows(measurements)], dtype=float)
+    edges = np.array(edges_minutes, dtype=float) * 60
+    return integrate_power(seconds, watts, edges, max_gap)
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_constant_power_matches_legacy_exactly(seed):
+    measurements = random_series(seed, constant=True)
+    span = (measurements[-1].measured_at - T0).total_seconds() / 60
+    result = integrate(measurements, np.arange(0, span + 5, 5))
+    legacy = legacy_totals(measurements)
+
+    totals = result["energy"].sum(axis=0)
+    assert totals[0] == pytest.approx(legacy["solar"])
+    assert totals[1] == pytest.approx(legacy["load"])
+    assert totals[3] == pytest.approx(legacy["battery"])
+    assert result["positive"][:, 2].sum() == pytest.approx(legacy["grid_import"])
+    assert -result["negative"][:, 2].sum() == pytest.approx(legacy["grid_export"])
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_trapezoid_stays_within_rectangle_error_bound(seed):
+    measurements = random_series(seed)
+    span = (measurements[-1].measured_at - T0).total_seconds() / 60
+    result = integrate(measurements, np.arange(0, span + 7, 7))
+    legacy = legacy_totals(measurements)
+
+    rows = np.array([row[2:] for row in as_rows(measurements)], dtype=float)
+    dt_h = np.diff([(m.measured_at - T0).total_seconds() / 3600 for m in measurements])
+    # Трапеция и левый прямоугольник на отрезке отличаются на |Δv|·dt/2
+    bound = (np.abs(np.diff(rows, axis=0)) * dt_h[:, None]).sum(axis=0) / 2 / 1000
+    totals = result["energy"].sum(axis=0)
+    for column, key in ((0, "solar"), (1, "load"), (3, "battery")):
+        assert abs(totals[column] - legacy[key]) <= bound[column] + 1e-9
+    legacy_grid = legacy["grid_import"] - legacy["grid_export"]
+    assert abs(totals[2] - legacy_grid) <= bound[2] + 1e-9
+    # Интервалы покрывают весь ряд: в сумме дают итог без потерь на границах
+    assert result["counts"].sum() == len(measurements)
+    assert np.allclose(result["positive"] + result["negative"], result["energy"])
+
+
+def test_ramp_is_exact_and_split_at_interval_edges():
+    # 0 → 3600 Вт за час, линейно, раз в 10 секунд
+    measurements = [
+        SimpleNamespace(energetic_object_id="obj-1", measured_at=T0 + timedelta(seconds=s),
+                        solar_total_pv_power=float(s), inverter_total_ac_output=1000.0,
+                        ess_total_input_power=0.0, general_battery_power=0.0)
+        for s in range(0, 3601, 10)
+    ]
+    result = integrate(measurements, [0, 15, 30, 45, 60])
+    # ∫ t dt по четвертям часа, Вт·с -> кВт·ч
+    quarters = [((b * 900) ** 2 - (a * 900) ** 2) / 2 / 3.6e6 for a, b in zip(range(4), range(1, 5))]
+    assert result["energy"][:, 0] == pytest.approx(quarters)
+    assert result["energy"][:, 1] == pytest.approx([0.25] * 4)
+
+    # Граница посреди отрезка: 5-секундные интервалы при шаге 10 секунд
+    result = integrate(measurements[:2], [0, 5 / 60, 10 / 60])
+    assert result["energy"][:, 1] == pytest.approx([1000 * 5 / 3.6e6] * 2)
+
+
+def test_grid_sign_change_splits_import_and_export():
+    measurements = [
+        SimpleNamespace(energetic_object_id="obj-1", measured_at=T0 + timedelta(seconds=s),
+                        solar_total_pv_power=0.0, inverter_total_ac_output=0.0,
+                        ess_total_input_power=w, general_battery_power=0.0)
+        for s, w in ((0, 1000.0), (2, -1000.0))
+    ]
+    result = integrate(measurements, [0, 1])
+    assert result["positive"][0, 2] == pytest.approx(500 / 3.6e6)
+    assert result["negative"][0, 2] == pytest.approx(-500 / 3.6e6)
+    assert result["energy"][0, 2] == pytest.approx(0.0)
+
+
+def test_gaps_and_duplicates_are_not_integrated():
+    times = [0, 2, 4, 4, 6, 1000, 1002, 1004]
+    measurements = [
+        SimpleNamespace(energetic_object_id="obj-1", measured_at=T0 + timedelta(seconds=s),
+                        solar_total_pv_power=3600.0, inverter_total_ac_output=0.0,
+                        ess_total_input_power=0.0, general_battery_power=0.0)
+        for s in times
+    ]
+    result = integrate(measurements, [0, 30], max_gap=300)
+    # 6 секунд до разрыва и 4 после; 994 секунды связи не было
+    assert result["energy"][0, 0] == pytest.approx(3600 * 10 / 3.6e6)
+    assert result["gap_count"] == 1 and result["gap_seconds"] == 994
+    assert result["duplicate_count"] == 1
+    assert result["counts"][0] == len(times)
+
+
+def test_report_integrates_objects_separately():
+    first = random_series(1, count=200, object_id="obj-1")
+    second = random_series(2, count=200, object_id="obj-2")
+    merged = sorted(first + second, key=lambda m: m.measured_at)
+    end = T0 + timedelta(hours=1)
+
+    report = energy_report(as_rows(merged), T0, end, 30, NO_GAPS)
+    separate = [energy_report(as_rows(part), T0, end, 30, NO_GAPS) for part in (first, second)]
+
+    assert len(report["intervals"]) == 2
+    for key in ("solar_energy_kwh", "load_energy_kwh", "battery_energy_kwh"):
+        combined = sum(interval[key] for interval in report["intervals"])
+        assert combined == pytest.approx(
+            sum(interval[key] for part in separate for interval in part["intervals"]), abs=0.01
+        )
+    assert sum(i["measurement_count"] for i in report["intervals"]) == 400
+    assert report["quality"]["gap_count"] == 0
+
+    empty = energy_report([], T0, end, 30, NO_GAPS)
+    assert [i["solar_energy_kwh"] for i in empty["intervals"]] == [0.0, 0.0]
+    assert empty["totals"]["grid_export_total"] == 0
+
+
+def test_totals_include_intervals_without_sufficient_data():
+    # Два измерения — интервал помечен как недостаточный, но его энергия входит в итоги
+    measurements = [
+        SimpleNamespace(energetic_object_id="obj-1", measured_at=T0 + timedelta(seconds=s),
+                        solar_total_pv_power=3.6e6, inverter_total_ac_output=1.8e6,
+                        ess_total_input_power=-3.6e6, general_battery_power=3.6e6)
+        for s in (0, 60)
+    ]
+    report = energy_report(as_rows(measurements), T0, T0 + timedelta(hours=1), 30, NO_GAPS)
+
+    sparse = report["intervals"][0]
+    assert sparse["has_sufficient_data"] is False
+    assert sparse["solar_energy_kwh"] == pytest.approx(60)
+    assert report["totals"]["solar_energy_total"] == 60
+    assert report["totals"]["load_energy_total"] == 30
+    assert report["totals"]["grid_export_total"] == 60
+    assert report["totals"]["battery_energy_total"] == 60
@@ -0,0 +1,226 @@
+"""Tests for the cerbo_measurements storage layout and partition maintenance."""
+import json
+import os
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import MetaData, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from cor_pass.database import models as db_models
+from cor_pass.repository.energy.measurement_partitions import (
+    DEFAULT_PARTITION,
+    add_months,
+    expired_partitions,
+    list_partitions,
+    maintain_measurement_partitions,
+    months_between,
+    parse_partition_name,
+    partition_name,
+)
+
+
+# Размер сгенерированного набора для проверки планов; в CI можно поднять до миллионов
+PLAN_ROWS = int(os.getenv("COR_PLAN_TEST_ROWS", "20000"))
+POSTGRES_URL = os.getenv("COR_TEST_POSTGRES_URL")
+OBJECTS = 20
+T0 = datetime(2026, 1, 1)
+CM = db_models.CerboMeasurement
+
+
+def test_partition_names_and_month_math():
+    assert partition_name(date(2026, 3, 1)) == "cerbo_measurements_p202603"
+    assert parse_partition_name("cerbo_measurements_p202603") == date(2026, 3, 1)
+    for name in (DEFAULT_PARTITION, "cerbo_measurements_p2026", "register_samples"):
+        assert parse_partition_name(name) is None
+    assert add_months(date(2026, 11, 1), 3) == date(2027, 2, 1)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    assert months_between(date(2025, 11, 1), date(2026, 2, 1)) == [
+        date(2025, 11, 1), date(2025, 12, 1), date(2026, 1, 1), date(2026, 2, 1)
+    ]
+
+
+def test_expired_partitions_keep_current_and_retention_window():
+    names = [partition_name(m) for m in months_between(date(2025, 6, 1), date(2026, 12, 1))]
+    names.append(DEFAULT_PARTITION)
+    now = datetime(2026, 10, 16, 12, 0)
+
+    assert expired_partitions(names, now, 0) == []
+    expired = expired_partitions(names, now, 3)
+    # Октябрь и три предыдущих месяца остаются
+    assert expired[-1] == "cerbo_measurements_p202606"
+    assert "cerbo_measurements_p202607" not in expired
+    assert DEFAULT_PARTITION not in expired
+    assert len(expired) == 13
+
+
+def _partitioned_tables():
+    """Таблицы в раскладке миграции e5b3f0a9c712: измерения разбиты по measured_at."""
+    metadata = MetaData()
+    objects = db_models.EnergeticObject.__table__.to_metadata(metadata)
+    measurements = CM.__table__.to_metadata(metadata)
+    measurements.dialect_options["postgresql"]["partition_by"] = "RANGE (measured_at)"
+    return [objects, measurements]
+
+
+def test_model_table_is_not_partitioned_by_create_all():
+    # create_all не создаёт партиции, поэтому разбиение задаёт только миграция
+    assert "PARTITION BY" not in str(CreateTable(CM.__table__).compile(dialect=postgresql.dialect()))
+    partitioned = str(CreateTable(_partitioned_tables()[1]).compile(dialect=postgresql.dialect()))
+    assert "PARTITION BY RANGE (measured_at)" in partitioned
+
+
+def _history_query(object_name, start, end):
+    # Та же выборка, что в get_averaged_measurements_service / get_energy_measurements_service
+    return (
+        select(CM)
+        .where(CM.measured_at >= start, CM.measured_at <= end)
+        .where(CM.object_name == object_name)
+        .order_by(CM.measured_at.asc())
+    )
+
+
+def _keyset_query(object_id, start):
+    return (
+        select(CM)
+        .where(CM.energetic_object_id == object_id, CM.measured_at >= start)
+        .order_by(CM.measured_at.desc(), CM.id.desc())
+        .limit(50)
+    )
+
+
+def _literal_sql(query, dialect):
+    return str(query.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+
+@pytest.fixture
+async def measurements_engine(sqlite_engine):
+    engine = await sqlite_engine(CM.__table__)
+    async with engine.begin() as conn:
+        # Одно измерение на объект каждые 5 секунд; время в формате SQLAlchemy (с микросекундами)
+        await conn.execute(
+            text(
+                "WITH RECURSIVE seq(n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < :rows - 1) "
+                "INSERT INTO cerbo_measurements (id, energetic_object_id, created_at, measured_at, object_name, "
+                "general_battery_power, inverter_total_ac_output, ess_total_input_power, solar_total_pv_power, soc) "
+                "SELECT printf('m-%09d', n), printf('obj-%02d', n % :objects), :t0, "
+                "strftime('%Y-%m-%d %H:%M:%f', :t0, printf('+%d seconds', (n / :objects) * 5)) || '000', "
+                "printf('Object %02d', n % :objects), "
+                "n % 1000, n % 700, n % 500, n % 300, n % 100 FROM seq"
+            ),
+            {"rows": PLAN_ROWS, "objects": OBJECTS, "t0": T0.isoformat(sep=" ")},
+        )
+        await conn.execute(text("ANALYZE"))
+    return engine
+
+
+async def _sqlite_plan(engine, query):
+    async with engine.connect() as conn:
+        sql = _literal_sql(query, engine.sync_engine.dialect)
+        rows = (await conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))).all()
+    return " | ".join(row[-1] for row in rows)
+
+
+async def test_history_queries_use_time_indexes(measurements_engine):
+    start = T0 + timedelta(minutes=20)
+    plan = await _sqlite_plan(measurements_engine, _history_query("Object 03", start, start + timedelta(hours=1)))
+    assert "ix_cerbo_measurements_object_name_measured_at" in plan
+    assert "TEMP B-TREE" not in plan  # порядок по времени берётся из индекса
+
+    plan = await _sqlite_plan(measurements_engine, _keyset_query("obj-03", start))
+    assert "ix_cerbo_measurements_object_measured_at_id" in plan
+    assert "TEMP B-TREE" not in plan
+
+    async with measurements_engine.connect() as conn:
+        rows = (await conn.execute(_history_query("Object 03", start, start + timedelta(minutes=10)))).all()
+    assert len(rows) == 121  # 10 минут по 5 секунд, обе границы включительно
+
+
+@pytest.mark.skipif(not POSTGRES_URL, reason="COR_TEST_POSTGRES_URL (пустая тестовая БД) не задан")
+async def test_postgres_partition_pruning_and_retention():
+    engine = create_async_engine(POSTGRES_URL)
+    maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    tables = _partitioned_tables()
+    now = datetime(2026, 6, 15)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(tables[0].metadata.drop_all)
+            await conn.run_sync(tables[0].metadata.create_all)
+            await conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF cerbo_measurements DEFAULT"))
+            await conn.execute(
+                text("INSERT INTO energetic_objects (id, name, is_active) "
+                     "SELECT 'obj-' || lpad(n::text, 2, '0'), 'Object ' || lpad(n::text, 2, '0'), false "
+                     "FROM generate_series(0, :objects - 1) n"),
+                {"objects": OBJECTS},
+            )
+            # Строки, пришедшие до создания партиций, лежат в default
+            await conn.execute(
+                text("INSERT INTO cerbo_measurements SELECT 'early-' || n, 'obj-00', now(), "
+                     "timestamp '2026-06-01' + n * interval '1 minute', 'Object 00', 0, 0, 0, 0, 0 "
+                     "FROM generate_series(1, 100) n")
+            )
+
+        async with maker() as db:
+            result = await maintain_measurement_partitions(db, now=now, ahead_months=2, retention_months=0)
+        assert result["created"] == [partition_name(date(2026, m, 1)) for m in (6, 7, 8)]
+
+        async with maker() as db:
+            await db.execute(
+                text("CREATE TABLE cerbo_measurements_p202601 PARTITION OF cerbo_measurements "
+                     "FOR VALUES FROM ('2026-01-01') TO ('2026-02-01')")
+            )
+            await db.commit()
+            result = await maintain_measurement_partitions(db, now=now, ahead_months=2, retention_months=3)
+            assert result == {"created": [], "dropped": ["cerbo_measurements_p202601"]}
+            assert (await db.execute(text(f"SELECT count(*) FROM {DEFAULT_PARTITION}"))).scalar() == 0
+            assert (await db.execute(text("SELECT count(*) FROM cerbo_measurements_p202606"))).scalar() == 100
+
+        # Миллионы строк: 20 объектов раз в 5 секунд начиная со 2 июня
+        async with engine.begin() as conn:
+            await conn.execute(
+                text("INSERT INTO cerbo_measurements "
+                     "SELECT 'm-' || n, 'obj-' || lpad((n % :objects)::text, 2, '0'), now(), "
+                     "timestamp '2026-06-02' + (n / :objects) * interval '5 seconds', "
+                     "'Object ' || lpad((n % :objects)::text, 2, '0'), n % 1000, n % 700, n % 500, n % 300, n % 100 "
+                     "FROM generate_series(0, :rows - 1) n"),
+                {"objects": OBJECTS, "rows": max(PLAN_ROWS, 2_000_000)},
+            )
+            await conn.execute(text("ANALYZE cerbo_measurements"))
+
+        day = datetime(2026, 6, 4)
+        scans = await _pg_scans(engine, _history_query("Object 03", day, day + timedelta(days=1)))
+        # Окно в один день читает только июньскую партицию и только по индексу
+        assert [relation for relation, _ in scans] == ["cerbo_measurements_p202606"]
+        assert all("Index" in node_type for _, node_type in scans)
+
+        scans = dict(await _pg_scans(engine, _keyset_query("obj-03", day)))
+        assert "cerbo_measurements_p202601" not in scans
+        assert "Index" in scans["cerbo_measurements_p202606"]
+
+        async with maker() as db:
+            assert "cerbo_measurements_p202608" in await list_partitions(db)
+    finally:
+        async with engine.begin() as conn:
+            await conn.run_sync(tables[0].metadata.drop_all)
+        await engine.dispose()
+
+
+async def _pg_scans(engine, query):
+    """Пары (таблица, тип узла) для всех чтений таблиц в плане запроса."""
+    async with engine.connect() as conn:
+        sql = _literal_sql(query, engine.sync_engine.dialect)
+        plan = (await conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scans, stack = [], [plan]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if "Relation Name" in node:
+                scans.append((node["Relation Name"], node["Node Type"]))
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return sorted(scans)
@@ -0,0 +1,176 @@
+"""Tests for incrementally maintained Cerbo measurement rollups."""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from cor_pass.database import models as db_models
+from cor_pass.repository.energy.cerbo_service import (
+    get_averaged_measurements_service,
+    get_measurement_rollups_service,
+)
+from cor_pass.repository.energy.measurement_rollups import (
+    DAY,
+    HOUR,
+    MINUTE,
+    apply_measurement_rollups,
+    bucket_start,
+    choose_resolution,
+    rebuild_rollups,
+    rollup_rows,
+    rollups_cover,
+)
+
+
+T0 = datetime(2026, 10, 16, 10, 0, 0)
+Rollup = db_models.CerboMeasurementRollup
+
+
+@pytest.fixture
+async def db(sqlite_session):
+    return await sqlite_session(db_models.CerboMeasurement.__table__, Rollup.__table__)
+
+
+def _measurements(count, step_seconds=7, objects=("obj-1", "obj-2"), seed=1):
+    rng = random.Random(seed)
+    result = []
+    for i in range(count):
+        object_id = objects[i % len(objects)]
+        result.append({
+            "energetic_object_id": object_id,
+            "object_name": object_id.replace("obj", "Object"),
+            "measured_at": T0 + timedelta(seconds=(i // len(objects)) * step_seconds),
+            "general_battery_power": rng.uniform(-3000, 3000),
+            "inverter_total_ac_output": rng.uniform(0, 5000),
+            "ess_total_input_power": rng.uniform(-2000, 2000),
+            "solar_total_pv_power": rng.uniform(0, 8000),
+            "soc": None if i % 5 == 0 else rng.uniform(10, 100),
+        })
+    return result
+
+
+async def _rows(db):
+    rows = (await db.execute(select(Rollup))).scalars().all()
+    return {
+        (r.energetic_object_id, r.resolution_seconds, r.bucket_start): {
+            c.name: getattr(r, c.name) for c in Rollup.__table__.columns
+        }
+        for r in rows
+    }
+
+
+def _assert_rows_equal(actual, expected):
+    assert actual.keys() == expected.keys()
+    for key, row in expected.items():
+        for column, value in row.items():
+            if isinstance(value, float):
+                assert actual[key][column] == pytest.approx(value), (key, column)
+            else:
+                assert actual[key][column] == value, (key, column)
+
+
+def test_bucket_start_and_resolution_choice():
+    ts = datetime(2026, 10, 16, 13, 47, 12, 500)
+    assert bucket_start(ts, MINUTE) == datetime(2026, 10, 16, 13, 47)
+    assert bucket_start(ts, HOUR) == datetime(2026, 10, 16, 13, 0)
+    assert bucket_start(ts, DAY) == datetime(2026, 10, 16)
+
+    assert choose_resolution(T0, T0 + timedelta(minutes=30), 60) is None  # шаг 30 секунд
+    assert choose_resolution(T0, T0 + timedelta(hours=1), 60) == MINUTE
+    assert choose_resolution(T0, T0 + timedelta(days=1), 24) == HOUR
+    assert choose_resolution(T0, T0 + timedelta(days=30), 60) == HOUR  # шаг 12 часов
+    assert choose_resolution(T0, T0 + timedelta(days=365), 12) == DAY
+
+
+def test_rollup_rows_aggregate_all_resolutions():
+    measurements = _measurements(40)  # 20 измерений на объект раз в 7 секунд
+    rows = {(r["energetic_object_id"], r["resolution_seconds"], r["bucket_start"]): r for r in rollup_rows(measurements)}
+
+    hour = rows[("obj-1", HOUR, T0)]
+    own = [m for m in measurements if m["energetic_object_id"] == "obj-1"]
+    assert hour["sample_count"] == 20
+    assert hour["soc_count"] == sum(1 for m in own if m["soc"] is not None)
+    assert hour["solar_total_pv_power_sum"] == pytest.approx(sum(m["solar_total_pv_power"] for m in own))
+    assert hour["general_battery_power_min"] == min(m["general_battery_power"] for m in own)
+    assert hour["general_battery_power_last"] == own[-1]["general_battery_power"]
+    assert hour["last_measured_at"] == own[-1]["measured_at"]
+
+    minutes = [r for r in rows.values() if r["energetic_object_id"] == "obj-1" and r["resolution_seconds"] == MINUTE]
+    assert sum(r["sample_count"] for r in minutes) == 20
+    assert len(minutes) == 3  # 0..133 секунды
+
+
+async def test_incremental_batches_match_single_pass(db):
+    measurements = _measurements(600, step_seconds=5)
+    shuffled = measurements[:]
+    random.Random(7).shuffle(shuffled)  # пачки приходят вразнобой
+
+    for i in range(0, len(shuffled), 37):
+        await apply_measurement_rollups(db, shuffled[i:i + 37])
+        await db.commit()
+
+    expected = {(r["energetic_object_id"], r["resolution_seconds"], r["bucket_start"]): r for r in rollup_rows(measurements)}
+    _assert_rows_equal(await _rows(db), expected)
+
+
+async def test_averaged_service_reads_rollups_with_raw_results(db):
+    measurements = _measurements(720, step_seconds=10)  # час на два объекта
+    db.add_all(db_models.CerboMeasurement(**m) for m in measurements)
+    await db.commit()
+    window = dict(object_name="Object-1", start_date=T0, end_date=T0 + timedelta(hours=1), intervals=30)
+
+    raw = await get_averaged_measurements_service(db, **window)  # агрегатов ещё нет — исходные строки
+    await apply_measurement_rollups(db, measurements)
+    await db.commit()
+    from_rollups = await get_averaged_measurements_service(db, **window)
+
+    assert [p.measured_at for p in from_rollups] == [p.measured_at for p in raw]
+    for a, b in zip(from_rollups, raw):
+        assert a.id.startswith("rollup-60-")
+        for field in ("general_battery_power", "inverter_total_ac_output", "ess_total_input_power",
+                      "solar_total_pv_power", "soc"):
+            assert getattr(a, field) == pytest.approx(getattr(b, field))
+
+    points = await get_measurement_rollups_service(db, "Object-1", T0, T0 + timedelta(hours=1), 6)
+    own = [m for m in measurements if m["object_name"] == "Object-1"]
+    assert [p.sample_count for p in points] == [60] * 6
+    assert points[0].resolution_seconds == MINUTE
+    assert points[0].solar_total_pv_power.max == max(m["solar_total_pv_power"] for m in own[:60])
+    assert points[-1].soc.last == own[-1]["soc"]
+
+    with pytest.raises(ValueError):
+        await get_measurement_rollups_service(db, "Object-1", T0, T0 + timedelta(minutes=10), 60)
+
+
+async def test_averaged_service_ignores_rollups_missing_older_history(db):
+    measurements = _measurements(720, step_seconds=10)
+    db.add_all(db_models.CerboMeasurement(**m) for m in measurements)
+    # Агрегаты начались с середины часа (миграция без rebuild)
+    await apply_measurement_rollups(db, [m for m in measurements if m["measured_at"] >= T0 + timedelta(minutes=30)])
+    await db.commit()
+    window = dict(object_name="Object-1", start_date=T0, end_date=T0 + timedelta(hours=1), intervals=30)
+
+    assert not await rollups_cover(db, "Object-1", T0, T0 + timedelta(hours=1), MINUTE)
+    assert await rollups_cover(db, "Object-1", T0 + timedelta(minutes=40, seconds=15), T0 + timedelta(hours=1), MINUTE)
+
+    points = await get_averaged_measurements_service(db, **window)
+    assert len(points) == 30  # весь час, а не только вторая половина
+    assert not any(p.id.startswith("rollup-") for p in points)
+
+    # После rebuild агрегаты полные; начало периода без измерений вовсе им не мешает
+    await rebuild_rollups(db)
+    assert await rollups_cover(db, "Object-1", T0 - timedelta(hours=1), T0 + timedelta(hours=1), MINUTE)
+    points = await get_averaged_measurements_service(db, **window)
+    assert len(points) == 30 and all(p.id.startswith("rollup-") for p in points)
+
+
+async def test_rebuild_recreates_rollups(db):
+    measurements = _measurements(300, step_seconds=30)
+    db.add_all(db_models.CerboMeasurement(**m) for m in measurements)
+    await apply_measurement_rollups(db, measurements[:50])  # неполные агрегаты
+    await db.commit()
+
+    assert await rebuild_rollups(db) == 300
+    expected = {(r["energetic_object_id"], r["resolution_seconds"], r["bucket_start"]): r for r in rollup_rows(measurements)}
+    _assert_rows_equal(await _rows(db), expected)
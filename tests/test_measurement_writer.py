@@ -0,0 +1,201 @@
+"""Tests for the buffered, disk-spilling writer of full device measurements."""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, func, select
+
+from cor_pass.database import models as db_models
+from worker.measurement_writer import MeasurementWriter
+
+
+T0 = datetime(2026, 10, 16, 12, 0, 0)
+
+
+@pytest.fixture
+async def session_maker(sqlite_sessionmaker):
+    maker = await sqlite_sessionmaker(
+        db_models.CerboMeasurement.__table__, db_models.CerboMeasurementRollup.__table__
+    )
+    engine = maker.kw["bind"]
+    maker.commits = 0
+
+    @event.listens_for(engine.sync_engine, "commit")
+    def count_commits(conn):
+        maker.commits += 1
+
+    return maker
+
+
+class Outage:
+    """session_maker, который падает, пока down=True."""
+
+    def __init__(self, maker):
+        self.maker = maker
+        self.down = True
+
+    def __call__(self):
+        if self.down:
+            raise ConnectionError("db down")
+        return self.maker()
+
+
+def _measurement(i, object_id="obj-1"):
+    return {
+        "energetic_object_id": object_id,
+        "object_name": object_id.replace("obj", "Object"),
+        "measured_at": T0 + timedelta(seconds=2 * i),
+        "general_battery_power": float(i),
+        "inverter_total_ac_output": 100.0,
+        "ess_total_input_power": -50.0,
+        "solar_total_pv_power": 300.0,
+        "soc": 80.0,
+    }
+
+
+async def _count(maker, model=db_models.CerboMeasurement):
+    async with maker() as db:
+        return (await db.execute(select(func.count()).select_from(model))).scalar_one()
+
+
+async def test_measurements_from_all_objects_share_transactions(session_maker, tmp_path):
+    writer = MeasurementWriter(flush_size=50, flush_interval=60, max_pending=500,
+                               spool_dir=tmp_path / "spool", session_maker=session_maker)
+    for i in range(60):
+        for object_id in ("obj-1", "obj-2"):
+            await writer.submit(_measurement(i, object_id))
+    await writer.stop()
+
+    assert await _count(session_maker) == 120
+    assert session_maker.commits == 3  # 120 измерений пачками по 50, а не 120 транзакций
+    # Агрегаты пишутся в той же транзакции: 2 объекта x (2 минуты + час + сутки)
+    assert await _count(session_maker, db_models.CerboMeasurementRollup) == 8
+    stats = writer.get_stats()
+    assert stats["written"] == 120 and stats["pending"] == 0 and stats["spooled"] == 0
+
+
+async def test_overflow_spills_to_disk_and_replays_after_recovery(session_maker, tmp_path):
+    outage = Outage(session_maker)
+    spool = tmp_path / "spool"
+    writer = MeasurementWriter(flush_size=10, flush_interval=60, max_pending=20,
+                               spool_dir=spool, session_maker=outage)
+    for i in range(50):
+        await writer.submit(_measurement(i))
+    assert await writer.flush() is False
+
+    stats = writer.get_stats()
+    assert stats["pending"] == 20 and stats["spooled"] == 30
+    assert stats["spool_files"] == 3  # вытесняется пачками по flush_size, а не по одному
+
+    outage.down = False
+    assert await writer.flush() is True
+    await writer.replay_spool()
+    await writer.stop()
+    assert writer.get_stats()["replayed"] == 30
+
+    async with session_maker() as db:
+        stored = (await db.execute(select(db_models.CerboMeasurement.general_battery_power))).scalars().all()
+    assert sorted(stored) == [float(i) for i in range(50)]
+    assert list(spool.glob("*.jsonl")) == []
+
+
+async def test_stop_during_outage_keeps_measurements_for_next_start(session_maker, tmp_path):
+    outage = Outage(session_maker)
+    spool = tmp_path / "spool"
+    writer = MeasurementWriter(flush_size=10, flush_interval=60, max_pending=100,
+                               spool_dir=spool, session_maker=outage)
+    for i in range(25):
+        await writer.submit(_measurement(i))
+    await writer.stop()
+    assert len(list(spool.glob("*.jsonl"))) == 1
+
+    # Новый процесс воркера: БД снова доступна, файл дописывается одной транзакцией
+    restarted = MeasurementWriter(flush_size=10, flush_interval=60, max_pending=100,
+                                  spool_dir=spool, session_maker=session_maker)
+    assert await restarted.replay_spool() == 25
+    assert await _count(session_maker) == 25
+    assert session_maker.commits == 1
+
+
+async def test_spool_directory_is_bounded(session_maker, tmp_path):
+    spool = tmp_path / "spool"
+    writer = MeasurementWriter(flush_size=1, flush_interval=60, max_pending=1,
+                               spool_dir=spool, spool_max_mb=0, session_maker=Outage(session_maker))
+    for i in range(5):
+        await writer.submit(_measurement(i))
+
+    # Без места на диске остаётся только самый свежий файл
+    assert len(list(spool.glob("*.jsonl"))) == 1
+    assert writer.get_stats()["spool_dropped"] == 3
+    await writer.stop()
+
+
+async def test_rewriting_committed_rows_is_idempotent(session_maker, tmp_path):
+    writer = MeasurementWriter(flush_size=10, flush_interval=60, max_pending=100,
+                               spool_dir=tmp_path / "spool", session_maker=session_maker)
+    for i in range(10):
+        await writer.submit(_measurement(i))
+    rows = list(writer._buffer)
+    assert await writer.flush() is True
+
+    # Коммит прошёл, но ответ потерялся: та же пачка приходит ещё раз (из буфера или с диска)
+    writer._buffer.extend(rows)
+    assert await writer.flush() is True
+    writer._write_spool_file(rows)
+    await writer.replay_spool()
+    await writer.stop()
+
+    assert await _count(session_maker) == 10
+    async with session_maker() as db:
+        counts = (await db.execute(select(db_models.CerboMeasurementRollup.sample_count))).scalars().all()
+    # Агрегаты не удвоились: минута, час и сутки по 10 измерений
+    assert sorted(counts) == [10, 10, 10]
+    assert writer.get_stats()["rejected"] == 0
+
+
+async def test_rejected_spool_file_is_quarantined(session_maker, tmp_path):
+    spool = tmp_path / "spool"
+    writer = MeasurementWriter(flush_size=10, flush_interval=60, max_pending=100,
+                               spool_dir=spool, session_maker=session_maker)
+    broken = {**_measurement(0), "id": "broken", "general_battery_power": None,
+              "created_at": T0}
+    writer._write_spool_file([broken])
+    writer._write_spool_file([{**_measurement(1), "id": "good", "created_at": T0}])
+
+    # Файл, который БД не примет (NOT NULL), не блокирует следующий
+    assert await writer.replay_spool() == 1
+    assert await _count(session_maker) == 1
+    assert list(spool.glob("*.jsonl")) == []
+    assert len(list((spool / "rejected").glob("*.jsonl"))) == 1
+    assert writer.get_stats()["rejected"] == 1
+
+
+async def test_stop_during_write_keeps_the_batch(session_maker, tmp_path):
+    entered = asyncio.Event()
+
+    class HangingSession:
+        """Первая запись зависает, пока её не отменит stop()."""
+
+        calls = 0
+
+        def __call__(self):
+            self.calls += 1
+            return self if self.calls == 1 else session_maker()
+
+        async def __aenter__(self):
+            entered.set()
+            await asyncio.Event().wait()
+
+        async def __aexit__(self, *exc):
+            return False
+
+    writer = MeasurementWriter(flush_size=10, flush_interval=60, max_pending=100,
+                               spool_dir=tmp_path / "spool", session_maker=HangingSession())
+    for i in range(10):
+        await writer.submit(_measurement(i))
+    await asyncio.wait_for(entered.wait(), 5)
+    assert writer.get_stats()["pending"] == 0  # пачка уже в записи
+
+    await writer.stop()
+    assert await _count(session_maker) == 10
+    assert list((tmp_path / "spool").glob("*.jsonl")) == []
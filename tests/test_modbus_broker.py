@@ -0,0 +1,130 @@
+"""Tests for read coalescing, deduplication and queue metrics in ModbusBroker."""
+import asyncio
+
+import pytest
+
+from worker.modbus_broker import MAX_READ_REGISTERS, ModbusBroker, RequestPriority
+
+
+@pytest.fixture
+async def broker():
+    instance = ModbusBroker()
+    instance.calls = []
+    instance.fail_blocks = False
+
+    async def execute(request):
+        start, count = request.params["start"], request.params["count"]
+        instance.calls.append((start, count))
+        await asyncio.sleep(0.01)
+        if instance.fail_blocks and count > 2:
+            raise RuntimeError("ILLEGAL DATA ADDRESS")
+        return {"ok": True, "data": [start + i for i in range(count)]}
+
+    instance._execute_request = execute
+    yield instance
+    await instance.stop_all_workers()
+
+
+def _read(broker, start, count=1, **kwargs):
+    params = {"start": start, "count": count, "func_code": 4}
+    return broker.submit_request(
+        protocol="modbus_tcp", host="10.0.0.1", port=502, operation="read", params=params, **kwargs
+    )
+
+
+def _stats(broker):
+    return broker.get_stats("modbus_tcp", "10.0.0.1", 502)
+
+
+async def test_adjacent_reads_are_coalesced(broker):
+    results = await asyncio.gather(
+        _read(broker, 840), _read(broker, 842), _read(broker, 841),
+        _read(broker, 843, 2), _read(broker, 900),
+    )
+
+    assert [r["data"] for r in results] == [[840], [842], [841], [843, 844], [900]]
+    assert sorted(broker.calls) == [(840, 5), (900, 1)]
+    stats = _stats(broker)
+    assert stats["block_reads"] == 1
+    assert stats["coalesced_requests"] == 3
+    assert stats["completed_requests"] == 5
+
+
+async def test_block_respects_protocol_limit(broker):
+    starts = range(0, MAX_READ_REGISTERS + 25, 25)
+    await asyncio.gather(*(_read(broker, start, 25) for start in starts))
+
+    assert all(count <= MAX_READ_REGISTERS for _, count in broker.calls)
+    assert sum(count for _, count in broker.calls) == len(starts) * 25
+
+
+async def test_identical_reads_share_one_request(broker):
+    first, second, third = await asyncio.gather(
+        _read(broker, 10, 2), _read(broker, 10, 2), _read(broker, 10, 2, slave_id=5)
+    )
+
+    assert first == second == {"ok": True, "data": [10, 11]}
+    assert first["data"] is not second["data"]
+    # Другой slave - отдельное чтение
+    assert sorted(broker.calls) == [(10, 2), (10, 2)]
+    assert _stats(broker)["deduplicated_requests"] == 1
+
+    # После завершения чтение выполняется заново
+    await _read(broker, 10, 2)
+    assert len(broker.calls) == 3
+
+
+async def test_higher_priority_read_does_not_wait_behind_polling(broker):
+    busy = asyncio.create_task(_read(broker, 0, priority=RequestPriority.POLLING))
+    await asyncio.sleep(0.003)  # первое чтение уже выполняется
+    polling = [
+        asyncio.create_task(_read(broker, start, priority=RequestPriority.POLLING))
+        for start in (100, 200, 300)
+    ]
+    await asyncio.sleep(0)
+    user = asyncio.create_task(_read(broker, 300, priority=RequestPriority.USER_READ))
+    await asyncio.sleep(0)
+    # Фоновый опрос того же регистра присоединяется к пользовательскому чтению
+    late_polling = asyncio.create_task(_read(broker, 300, priority=RequestPriority.POLLING))
+
+    results = await asyncio.gather(user, late_polling, busy, *polling)
+
+    assert [r["data"] for r in results[:2]] == [[300], [300]]
+    # Пользовательское чтение выполнено сразу после текущего, вместе с фоновым того же регистра
+    assert broker.calls[:2] == [(0, 1), (300, 1)]
+    assert broker.calls.count((300, 1)) == 1
+    assert _stats(broker)["deduplicated_requests"] == 1
+
+
+async def test_failed_block_falls_back_to_single_reads(broker):
+    broker.fail_blocks = True
+    results = await asyncio.gather(_read(broker, 1), _read(broker, 2), _read(broker, 3))
+
+    assert [r["data"] for r in results] == [[1], [2], [3]]
+    assert broker.calls[0] == (1, 3)
+    assert sorted(broker.calls[1:]) == [(1, 1), (2, 1), (3, 1)]
+
+
+async def test_queue_depth_and_wait_per_priority(broker):
+    polling = [asyncio.create_task(_read(broker, 0, priority=RequestPriority.POLLING))]
+    await asyncio.sleep(0.003)  # первое чтение уже выполняется
+    polling += [
+        asyncio.create_task(_read(broker, 100 * i, priority=RequestPriority.POLLING))
+        for i in (1, 2)
+    ]
+    user = asyncio.create_task(_read(broker, 5000, priority=RequestPriority.USER_READ))
+    await asyncio.sleep(0.001)
+
+    priorities = _stats(broker)["priorities"]
+    assert priorities["POLLING"]["queue_depth"] == 2
+    assert priorities["USER_READ"]["queue_depth"] == 1
+
+    await asyncio.gather(user, *polling)
+    priorities = _stats(broker)["priorities"]
+    assert priorities["POLLING"]["queue_depth"] == priorities["USER_READ"]["queue_depth"] == 0
+    assert priorities["POLLING"]["dequeued"] == 3
+    assert priorities["USER_READ"]["dequeued"] == 1
+    # Пользовательское чтение обогнало два фоновых
+    assert broker.calls[1] == (5000, 1)
+    assert priorities["POLLING"]["wait_max_s"] >= 0.015
+    assert broker.get_all_stats()["tcp:10.0.0.1:502"]["priorities"] == priorities
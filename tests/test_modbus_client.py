@@ -0,0 +1,191 @@
+"""Tests for the asyncio Modbus RTU-over-TCP client against a local fake inverter."""
+import asyncio
+import struct
+
+import pytest
+
+from worker.modbus_client import ModbusTCP
+
+
+def _crc(data: bytes) -> bytes:
+    return struct.pack("<H", ModbusTCP.modbus_crc16(data))
+
+
+class FakeInverter:
+    """RTU-over-TCP сервер: значение регистра равно его адресу."""
+
+    def __init__(self, slave_id: int = 1):
+        self.slave_id = slave_id
+        self.chunked = False
+        self.silent = False
+        self.delay = 0.0
+        self.exception_code = None
+        self.corrupt = False
+        self.connections = 0
+        self.written = {}
+        self.server = None
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readexactly(2)
+                func = head[1]
+                body = await reader.readexactly(4)
+                if func == 16:
+                    body += await reader.readexactly(1)
+                    body += await reader.readexactly(body[-1])
+                await reader.readexactly(2)
+                if self.silent:
+                    continue
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                await self._send(writer, self._respond(func, body))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _respond(self, func: int, body: bytes) -> bytes:
+        address, count = struct.unpack(">HH", body[:4])
+        if self.exception_code is not None:
+            frame = bytes([self.slave_id, func | 0x80, self.exception_code])
+        elif func in (3, 4):
+            values = [(address + i) & 0xFFFF for i in range(count)]
+            frame = bytes([self.slave_id, func, count * 2]) + struct.pack(f">{count}H", *values)
+        else:
+            if func == 6:
+                self.written[address] = count
+            else:
+                values = struct.unpack(f">{count}H", body[5:])
+                self.written.update({address + i: v for i, v in enumerate(values)})
+            frame = bytes([self.slave_id, func]) + body[:4]
+        crc = _crc(frame)
+        if self.corrupt:
+            crc = bytes([crc[0] ^ 0xFF, crc[1]])
+        return frame + crc
+
+    async def _send(self, writer, data: bytes):
+        # В режиме chunked ответ приходит несколькими TCP-сегментами
+        step = 3 if self.chunked else len(data)
+        for i in range(0, len(data), step):
+            writer.write(data[i:i + step])
+            await writer.drain()
+            if self.chunked:
+                await asyncio.sleep(0.001)
+
+
+@pytest.fixture
+async def inverter():
+    fake = FakeInverter()
+    port = await fake.start()
+    yield fake, port
+    await fake.stop()
+
+
+async def test_read_assembles_full_frame(inverter):
+    fake, port = inverter
+    fake.chunked = True
+    client = ModbusTCP("127.0.0.1", port, timeout=1)
+    try:
+        first = await client.read(start=500, count=60)
+        second = await client.read(start=10, count=2, func=4)
+    finally:
+        await client.close()
+
+    assert first == {"ok": True, "data": list(range(500, 560))}
+    assert second == {"ok": True, "data": [10, 11]}
+    assert fake.connections == 1
+
+
+async def test_writes_and_exception_response(inverter):
+    fake, port = inverter
+    client = ModbusTCP("127.0.0.1", port, timeout=1)
+    try:
+        assert (await client.write_single(address=142, value=7))["ok"]
+        assert (await client.write_multiple(address=200, values=[1, 2, 3]))["ok"]
+        fake.exception_code = 2
+        result = await client.read(start=9999, count=1)
+    finally:
+        await client.close()
+
+    assert fake.written == {142: 7, 200: 1, 201: 2, 202: 3}
+    assert result == {"ok": False, "error": "Modbus исключение: код 2"}
+
+
+async def test_timeout_reconnects_and_does_not_block_loop(inverter):
+    fake, port = inverter
+    fake.silent = True
+    client = ModbusTCP("127.0.0.1", port, timeout=0.2)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    try:
+        result = await client.read(start=1, count=1)
+        assert result == {"ok": False, "error": "Таймаут - устройство не ответило"}
+        assert ticks >= 5
+        assert not client.connected
+
+        fake.silent = False
+        assert await client.read(start=1, count=1) == {"ok": True, "data": [1]}
+        assert fake.connections == 2
+    finally:
+        task.cancel()
+        await client.close()
+
+
+async def test_cancelled_read_does_not_leave_late_reply(inverter):
+    fake, port = inverter
+    fake.delay = 0.2
+    client = ModbusTCP("127.0.0.1", port, timeout=5)
+    try:
+        # Брокер ограничивает вызов своим wait_for, короче таймаута клиента
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client.read(start=1, count=1), timeout=0.05)
+        assert not client.connected
+
+        fake.delay = 0.0
+        await asyncio.sleep(0.3)  # поздний ответ на отменённый запрос уже пришёл бы
+        assert await client.read(start=7, count=1) == {"ok": True, "data": [7]}
+        assert fake.connections == 2
+    finally:
+        await client.close()
+
+
+async def test_crc_error_reconnects(inverter):
+    fake, port = inverter
+    fake.corrupt = True
+    client = ModbusTCP("127.0.0.1", port, timeout=1)
+    try:
+        result = await client.read(start=3, count=1)
+        assert not result["ok"] and result["error"].startswith("Ошибка CRC")
+        assert not client.connected
+
+        fake.corrupt = False
+        assert await client.read(start=3, count=1) == {"ok": True, "data": [3]}
+        assert fake.connections == 2
+    finally:
+        await client.close()
+
+
+async def test_connect_failure_backs_off():
+    client = ModbusTCP("127.0.0.1", 1, timeout=0.5)
+    first = await client.read(start=0, count=1)
+    second = await client.read(start=0, count=1)
+
+    assert first == {"ok": False, "error": "Ошибка подключения"}
+    assert second["ok"] is False and "повтор через" in second["error"]
@@ -0,0 +1,87 @@
+"""Tests for MPR slice windowing, rendering and caching."""
+import numpy as np
+from pydicom.dataset import Dataset
+
+from cor_pass.services.laboratory import mpr_render
+from cor_pass.services.laboratory.mpr_render import (
+    clamp_index,
+    extract_plane,
+    get_slice,
+    mpr_etag,
+    mpr_key,
+    resolve_window,
+    window_to_uint8,
+)
+
+
+def _reference_window(img, low, width):
+    clipped = np.clip(img, low, low + width)
+    return (((clipped - low) / (width + 1e-5)) * 255).astype(np.uint8)
+
+
+def test_lut_window_matches_direct_formula():
+    img = np.arange(-1024, 3072, dtype=np.float32).reshape(64, 64)
+    for low, width in ((-160.0, 400.0), (-1024.0, 4095.0), (40.0, 1.0)):
+        assert np.array_equal(window_to_uint8(img, low, width), _reference_window(img, low, width))
+
+
+def test_fractional_values_match_direct_formula():
+    # RescaleSlope 0.5 и интерполяция дают дробные значения — LUT их бы усёк
+    img = (np.arange(-2048, 2048, dtype=np.float32) * 0.37).reshape(64, 64)
+    for low, width in ((-160.0, 400.0), (-300.5, 10.25)):
+        assert np.array_equal(window_to_uint8(img, low, width), _reference_window(img, low, width))
+
+    integers = np.arange(-100, 156, dtype=np.int16).reshape(16, 16)
+    assert np.array_equal(window_to_uint8(integers, -50.0, 100.0), _reference_window(integers, -50.0, 100.0))
+
+
+def test_resolve_window_modes():
+    img = np.array([[0.0, 100.0]], dtype=np.float32)
+    ds = Dataset()
+    ds.WindowCenter = 40
+    ds.WindowWidth = 400
+
+    assert resolve_window(img, ds, "auto") == (-160.0, 400.0)
+    assert resolve_window(img, ds, "window", window_center=0, window_width=100) == (-50.0, 100)
+    assert resolve_window(img, ds, "raw") == (0.0, 100.0)
+    # Без тегов окна — растяжение по min/max
+    assert resolve_window(img, Dataset(), "auto") == (0.0, 100.0)
+
+
+def test_extract_plane_and_clamp():
+    volume = np.arange(2 * 3 * 4, dtype=np.float32).reshape(2, 3, 4)
+    assert clamp_index(volume, "axial", 10) == 1
+    assert clamp_index(volume, "sagittal", -5) == 0
+    assert extract_plane(volume, "axial", 1).shape == (3, 4)
+    assert extract_plane(volume, "sagittal", 0).shape == (2, 3)
+    assert extract_plane(volume, "coronal", 2).shape == (2, 4)
+
+
+def test_key_ignores_irrelevant_params():
+    assert mpr_key("s", "axial", 0, "auto", 1.0, 2.0, 512, "png", 50) == mpr_key(
+        "s", "axial", 0, "auto", None, None, 512, "png", 90
+    )
+    assert mpr_etag(mpr_key("s", "axial", 0, "raw", None, None, 512, "png", 85)) != mpr_etag(
+        mpr_key("t", "axial", 0, "raw", None, None, 512, "png", 85)
+    )
+
+
+def test_get_slice_renders_once(monkeypatch):
+    volume = np.random.default_rng(0).normal(size=(4, 16, 16)).astype(np.float32)
+    calls = []
+    original = mpr_render.render_slice
+
+    def counting_render(*args, **kwargs):
+        calls.append(args)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(mpr_render, "render_slice", counting_render)
+    mpr_render.mpr_cache.clear()
+    key = mpr_key("series", "axial", 1, "raw", None, None, 32, "jpeg", 80)
+
+    first = get_slice(key, volume, Dataset())
+    second = get_slice(key, volume, Dataset())
+
+    assert first == second
+    assert first[:2] == b"\xff\xd8"
+    assert len(calls) == 1
@@ -0,0 +1,240 @@
+"""Tests for keyset pagination with signed cursors."""
+import base64
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import Column, Date, Integer, MetaData, String, Table, select
+
+from cor_pass.config.config import settings
+from cor_pass.database import models as db_models
+from cor_pass.database.models import PatientClinicStatus, PatientStatus
+from cor_pass.repository.doctor import doctor as doctor_repository
+from cor_pass.repository.energy.cerbo_service import (
+    get_device_measurements_by_object_paginated,
+    get_device_measurements_paginated,
+)
+from cor_pass.repository.shared.pagination import (
+    SortKey,
+    TotalMode,
+    decode_cursor,
+    encode_cursor,
+    paginate,
+)
+
+
+people = Table(
+    "people",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("name", String),
+    Column("birth_date", Date, nullable=True),
+)
+
+
+@pytest.fixture
+async def db(sqlite_session):
+    return await sqlite_session(
+        db_models.CerboMeasurement.__table__,
+        db_models.Patient.__table__,
+        db_models.DoctorPatientStatus.__table__,
+        db_models.PatientClinicStatusModel.__table__,
+        people,
+    )
+
+
+def test_cursor_round_trip_and_tampering():
+    values = [datetime(2026, 5, 1, 12, 30), datetime(2026, 5, 1).date(), "abc", 7, None]
+    cursor = encode_cursor("list", values)
+    assert decode_cursor(cursor, "list") == values
+
+    payload, signature = cursor.split(".")
+    for bad in (f"{payload}x.{signature}", f"{payload}.{signature[:-2]}AA", "garbage", ""):
+        with pytest.raises(HTTPException) as exc:
+            decode_cursor(bad, "list")
+        assert exc.value.status_code == 400
+    # Курсор одного списка не принимается другим
+    with pytest.raises(HTTPException):
+        decode_cursor(cursor, "other")
+
+
+async def _walk(db, query, keys, limit, **kwargs):
+    pages, cursor = [], None
+    while True:
+        page = await paginate(db, query, keys, "test", limit, cursor=cursor, **kwargs)
+        pages.append(page)
+        cursor = page.next_cursor
+        if cursor is None:
+            return pages
+
+
+async def test_measurement_pages_follow_cursor(db):
+    start = datetime(2026, 1, 1)
+    # Две пары с одинаковым measured_at проверяют разрыв связей по id
+    times = [start + timedelta(minutes=i // 2) for i in range(11)]
+    db.add_all(
+        db_models.CerboMeasurement(
+            id=f"m{i:02d}",
+            energetic_object_id="obj-1" if i != 5 else "obj-2",
+            measured_at=moment,
+            general_battery_power=0,
+            inverter_total_ac_output=0,
+            ess_total_input_power=0,
+            solar_total_pv_power=0,
+        )
+        for i, moment in enumerate(times)
+    )
+    await db.commit()
+
+    seen, cursor = [], None
+    while True:
+        page = await get_device_measurements_by_object_paginated(
+            db, page_size=3, energetic_object_id="obj-1", cursor=cursor
+        )
+        assert page.total_count == 10 and not page.total_is_estimate
+        seen.extend(m.id for m in page.items)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    expected = sorted(
+        (m for m in (f"m{i:02d}" for i in range(11)) if m != "m05"),
+        key=lambda m: (times[int(m[1:])], m),
+        reverse=True,
+    )
+    assert seen == expected
+
+    # Номер страницы по-прежнему работает и отдаёт курсор дальше
+    legacy = await get_device_measurements_by_object_paginated(
+        db, page=2, page_size=3, energetic_object_id="obj-1"
+    )
+    assert [m.id for m in legacy.items] == expected[3:6]
+    following = await get_device_measurements_by_object_paginated(
+        db, page_size=3, energetic_object_id="obj-1", cursor=legacy.next_cursor
+    )
+    assert [m.id for m in following.items] == expected[6:9]
+
+    # Курсор привязан к списку и его фильтрам
+    for other in (
+        get_device_measurements_by_object_paginated(
+            db, page_size=3, energetic_object_id="obj-2", cursor=legacy.next_cursor
+        ),
+        get_device_measurements_by_object_paginated(
+            db, page_size=3, energetic_object_id="obj-1", start_date=start, cursor=legacy.next_cursor
+        ),
+        get_device_measurements_paginated(db, page_size=3, cursor=legacy.next_cursor),
+    ):
+        with pytest.raises(HTTPException) as error:
+            await other
+        assert error.value.status_code == 400
+
+
+async def test_nullable_mixed_keys_and_estimated_total(db, monkeypatch):
+    birth = datetime(2000, 1, 1).date()
+    rows = [
+        {"id": i, "name": n, "birth_date": d}
+        for i, (n, d) in enumerate(
+            [
+                ("b", birth),
+                ("a", None),
+                ("a", birth + timedelta(days=1)),
+                ("c", None),
+                ("b", birth),
+                ("a", birth),
+            ]
+        )
+    ]
+    await db.execute(people.insert(), rows)
+    await db.commit()
+
+    keys = [
+        SortKey(people.c.birth_date, descending=True, nullable=True),
+        SortKey(people.c.name),
+        SortKey(people.c.id, descending=True),
+    ]
+    query = select(people.c.id)
+    expected = (
+        await db.scalars(
+            query.order_by(people.c.birth_date.desc().nulls_last(), people.c.name, people.c.id.desc())
+        )
+    ).all()
+
+    monkeypatch.setattr(settings, "pagination_estimate_cap", 4)
+    pages = await _walk(db, query, keys, 2, total=TotalMode.ESTIMATE, scalars=True)
+    assert [i for page in pages for i in page.items] == expected
+    assert pages[0].total_count == 4 and pages[0].total_is_estimate
+
+    pages = await _walk(db, query, keys, 4, total=TotalMode.NONE)
+    assert [row[0] for page in pages for row in page.items] == expected
+    assert pages[0].total_count is None
+
+
+async def test_patient_listing_follows_cursor_and_filters(db, monkeypatch):
+    monkeypatch.setattr(settings, "aes_key", base64.b64encode(b"0" * 16).decode())
+    monkeypatch.setattr(doctor_repository, "get_patient_list_cases", _no_cases)
+    born = datetime(1990, 1, 1).date()
+    db.add_all(
+        db_models.Patient(
+            id=f"p{i}",
+            patient_cor_id=f"cor-{i}",
+            sex="M" if i % 2 else "F",
+            # Одинаковые и пустые даты проверяют разрыв связей по id
+            birth_date=None if i == 6 else born + timedelta(days=i // 2),
+        )
+        for i in range(7)
+    )
+    db.add_all(
+        db_models.DoctorPatientStatus(
+            id=f"s-{doctor}-{i}", patient_id=f"p{i}", doctor_id=doctor, status=PatientStatus.registered
+        )
+        for doctor, patients in (("d1", range(5)), ("d2", (1, 3)))
+        for i in patients
+    )
+    db.add(
+        db_models.PatientClinicStatusModel(
+            id="c-2", patient_id="p2", patient_status_for_clinic=PatientClinicStatus.diagnosed
+        )
+    )
+    await db.commit()
+
+    async def walk(**kwargs):
+        rows, cursor = [], None
+        while True:
+            page = await doctor_repository.get_patients_with_optional_status(
+                db, limit=2, cursor=cursor, **kwargs
+            )
+            rows.extend((p.id, p.doctor_status, p.clinic_status) for p in page.patients)
+            cursor = page.next_cursor
+            if cursor is None:
+                return rows, page
+
+    # Все пациенты: у p1 и p3 по строке на каждого врача
+    everyone = await doctor_repository.get_patients_with_optional_status(
+        db, sort_by="birth_date", limit=100
+    )
+    rows, last_page = await walk(sort_by="birth_date")
+    assert rows == [(p.id, p.doctor_status, p.clinic_status) for p in everyone.patients]
+    assert len(rows) == last_page.total_count == 9
+    assert [row[0] for row in rows][-1] == "p6"  # без даты рождения — в конце
+    assert ("p2", PatientStatus.registered, PatientClinicStatus.diagnosed) in rows
+
+    doctor = SimpleNamespace(id="d1")
+    own, _ = await walk(doctor=doctor, filter_by_doctor=True, sex_filters=["M"], sort_order="asc")
+    assert [row[0] for row in own] == ["p1", "p3"]
+
+    # Курсор, выданный при одних фильтрах, не принимается при других
+    page = await doctor_repository.get_patients_with_optional_status(
+        db, doctor=doctor, filter_by_doctor=True, limit=1
+    )
+    for kwargs in ({"sex_filters": ["F"]}, {"doctor_status_filters": [PatientStatus.diagnosed]}, {}):
+        if kwargs:
+            kwargs.update(doctor=doctor, filter_by_doctor=True)
+        with pytest.raises(HTTPException) as error:
+            await doctor_repository.get_patients_with_optional_status(
+                db, limit=1, cursor=page.next_cursor, **kwargs
+            )
+        assert error.value.status_code == 400
+
+
+async def _no_cases(db, patient_id):
+    return []
@@ -0,0 +1,187 @@
+"""Tests for batched label printing against a local fake printer."""
+import asyncio
+import json
+
+import pytest
+
+from cor_pass.schemas import PrintLabel
+from cor_pass.services.laboratory.print_jobs import PrintJobDispatcher
+
+
+class FakePrinter:
+    """Минимальный HTTP-сервер с API принтера: POST /task/new {"labels": [...]}."""
+
+    def __init__(self, fail_first: int = 0):
+        self.fail_first = fail_first
+        self.hang_up = False  # принять пачку и оборвать связь без ответа
+        self.requests = []
+        self.connections = 0
+        self.active = 0
+        self.max_active = 0
+        self.server = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"{host}:{port}"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode().strip()
+                    if not line:
+                        break
+                    name, value = line.split(":", 1)
+                    headers[name.lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                if self.hang_up:
+                    self.requests.append([label["uuid"] for label in json.loads(body)["labels"]])
+                    break
+                status, text = await self._respond(json.loads(body)["labels"])
+                payload = text.encode()
+                writer.write(
+                    f"HTTP/1.1 {status} X\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, labels):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.01)
+            self.requests.append([label["uuid"] for label in labels])
+            if len(self.requests) <= self.fail_first:
+                return 503, "busy"
+            if any("BAD" in label["content"] for label in labels):
+                return 422, "bad label"
+            return 200, "ok"
+        finally:
+            self.active -= 1
+
+
+def _labels(n: int, bad=()):
+    return [
+        PrintLabel(model_id=8, content="BAD" if i in bad else f"label-{i}", uuid=f"id-{i}")
+        for i in range(n)
+    ]
+
+
+def _dispatcher(**overrides):
+    params = dict(
+        batch_size=10,
+        per_printer_concurrency=2,
+        max_connections=4,
+        retries=2,
+        retry_delay=0.001,
+        timeout=5.0,
+        task_url="http://{printer_ip}/task/new",
+    )
+    params.update(overrides)
+    return PrintJobDispatcher(**params)
+
+
+@pytest.fixture
+async def printer():
+    fake = FakePrinter()
+    address = await fake.start()
+    yield fake, address
+    await fake.stop()
+
+
+async def test_labels_are_sent_in_batches_over_pooled_connections(printer):
+    fake, address = printer
+    dispatcher = _dispatcher()
+    try:
+        job = await dispatcher.submit(address, _labels(40))
+    finally:
+        await dispatcher.aclose()
+
+    assert job.success
+    assert job.printed == [f"id-{i}" for i in range(40)]
+    assert sorted(len(batch) for batch in fake.requests) == [10, 10, 10, 10]
+    assert fake.max_active <= 2
+    assert fake.connections <= 2
+
+
+async def test_transient_failure_is_retried(printer):
+    fake, address = printer
+    fake.fail_first = 2
+    dispatcher = _dispatcher(per_printer_concurrency=1)
+    try:
+        job = await dispatcher.submit(address, _labels(5))
+    finally:
+        await dispatcher.aclose()
+
+    assert job.success
+    assert [r.attempts for r in job.results] == [3] * 5
+
+
+async def test_rejected_label_is_isolated(printer):
+    fake, address = printer
+    dispatcher = _dispatcher()
+    try:
+        job = await dispatcher.submit(address, _labels(6, bad={3}))
+    finally:
+        await dispatcher.aclose()
+
+    assert not job.success
+    assert [r.uuid for r in job.failed] == ["id-3"]
+    assert job.failed[0].status_code == 422
+    assert job.printed == ["id-0", "id-1", "id-2", "id-4", "id-5"]
+
+
+async def test_exhausted_server_errors_do_not_split_the_batch(printer):
+    fake, address = printer
+    fake.fail_first = 100
+    dispatcher = _dispatcher(retries=1)
+    try:
+        job = await dispatcher.submit(address, _labels(4))
+    finally:
+        await dispatcher.aclose()
+
+    assert [r.success for r in job.results] == [False] * 4
+    assert all(r.status_code == 503 and r.attempts == 2 for r in job.results)
+    # Только повторы всей пачки, без поштучной отправки
+    assert [len(batch) for batch in fake.requests] == [4, 4]
+
+
+async def test_lost_response_is_not_resent(printer):
+    fake, address = printer
+    fake.hang_up = True
+    dispatcher = _dispatcher(retries=2)
+    try:
+        job = await dispatcher.submit(address, _labels(3))
+    finally:
+        await dispatcher.aclose()
+
+    # Принтер мог уже напечатать пачку — повтор дал бы дубликаты меток
+    assert fake.requests == [["id-0", "id-1", "id-2"]]
+    assert [r.success for r in job.results] == [False] * 3
+    assert all(r.outcome_unknown and r.attempts == 1 for r in job.results)
+    assert job.to_dict()["labels"][0]["outcome_unknown"] is True
+
+
+async def test_unreachable_printer_fails_every_label():
+    dispatcher = _dispatcher(retries=1)
+    try:
+        job = await dispatcher.submit("127.0.0.1:1", _labels(3))
+    finally:
+        await dispatcher.aclose()
+
+    assert [r.success for r in job.results] == [False] * 3
+    assert all(r.status_code is None and r.attempts == 2 for r in job.results)
+    assert not any(r.outcome_unknown for r in job.results)
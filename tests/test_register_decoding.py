@@ -0,0 +1,78 @@
+"""Tests for table-driven CRC16 and compiled register decode plans."""
+import random
+
+import pytest
+
+from worker.bench_register_decoding import block_groups, legacy_crc16, legacy_decode, run
+from worker.register_decoding import DecodePlan, compile_device_plans, modbus_crc16
+
+
+def test_table_crc_matches_bitwise():
+    rnd = random.Random(1)
+    for length in (0, 1, 6, 8, 125, 256):
+        data = bytes(rnd.randrange(256) for _ in range(length))
+        assert modbus_crc16(data) == legacy_crc16(data)
+    # Известное значение: запрос 01 03 00 00 00 0A -> CRC C5CD
+    assert modbus_crc16(bytes.fromhex("01030000000a")) == 0xCDC5
+
+
+SYNTHETIC = [
+    {"name": "u16", "offset": 0, "type": "uint16", "scale": 0.1},
+    {"name": "s16", "offset": 1, "type": "int16", "scale": 0.01},
+    {"name": "s32", "offset": 2, "type": "int32", "scale": 1},
+    {"name": "u32", "offset": 4, "type": "uint32", "scale": 0.5},
+    {"name": "flag3", "offset": 6, "type": "uint16", "bit": 3},
+    {"name": "flag15", "offset": 6, "type": "uint16", "bit": 15},
+    {"name": "signed_view", "offset": 6, "type": "int16"},
+    {"name": "overlap32", "offset": 5, "type": "int32"},
+    {"name": "odd_type", "offset": 7, "type": "float32"},
+    {"name": "tail32", "offset": 8, "type": "int32", "scale": 2},
+    {"name": "outside", "offset": 9, "type": "uint16"},
+]
+
+
+@pytest.mark.parametrize(
+    "fields,count", [(SYNTHETIC, 9)] + [(g["registers"], g["count"]) for g in block_groups()]
+)
+def test_plan_matches_legacy_decoding(fields, count):
+    rnd = random.Random(count)
+    plan = DecodePlan(fields, count)
+    for _ in range(200):
+        block = [rnd.choice([0, 0x7FFF, 0x8000, 0xFFFF, rnd.randrange(0x10000)]) for _ in range(count)]
+        assert plan.decode(block) == legacy_decode(fields, block)
+        # Короткий ответ: поля за пределами пропускаются, как раньше
+        short = block[: count - 2]
+        assert plan.decode(short) == legacy_decode(fields, short)
+
+
+def test_device_plans_cover_both_layouts():
+    deye = {
+        "register_groups": {
+            "battery": {"start_address": 586, "count": 2, "registers": [
+                {"name": "temp", "offset": 0, "type": "int16", "scale": 0.1},
+                {"name": "soc", "offset": 1},
+            ]},
+        }
+    }
+    victron = {
+        "register_groups": {
+            "battery": {"registers": [
+                {"name": "current", "address": 841, "type": "int16", "scale": 0.1},
+                {"name": "energy", "address": 850, "count": 2, "type": "uint32"},
+            ]},
+        }
+    }
+    assert compile_device_plans(deye)["battery"].decode([0xFFF6, 80]) == {"temp": -1.0, "soc": 80}
+    plans = compile_device_plans(victron)["battery"]
+    assert plans["current"].decode([0xFFEC]) == {"current": -2.0}
+    assert plans["energy"].decode([1, 2]) == {"energy": 65538}
+    # Пустой ответ регистра Victron, как и прежде, даёт 0 * scale
+    assert plans["current"].decode([]) == {"current": 0.0}
+    assert plans["energy"].decode([]) == {"energy": 0}
+    assert compile_device_plans(deye)["battery"].decode([]) == {}
+
+
+def test_benchmark_runs():
+    results = run(number=10)
+    assert set(results) == {"crc16_legacy_us", "crc16_table_us", "decode_legacy_us", "decode_plan_us"}
+    assert all(value > 0 for value in results.values())
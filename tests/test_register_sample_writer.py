@@ -0,0 +1,131 @@
+"""Tests for buffered batch persistence of polled register values."""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, func, select
+
+from cor_pass.database import models as db_models
+from cor_pass.repository.energy.register_samples import get_register_samples
+from worker.register_sample_writer import RegisterSampleWriter
+
+
+T0 = datetime(2026, 10, 16, 12, 0, 0)
+
+
+@pytest.fixture
+async def session_maker(sqlite_sessionmaker):
+    maker = await sqlite_sessionmaker(db_models.RegisterSample.__table__)
+    engine = maker.kw["bind"]
+    maker.inserts = []
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def count_inserts(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT"):
+            maker.inserts.append(statement)
+
+    return maker
+
+
+async def _count(maker):
+    async with maker() as db:
+        return (await db.execute(select(func.count()).select_from(db_models.RegisterSample))).scalar_one()
+
+
+async def test_values_are_written_in_batches(session_maker):
+    writer = RegisterSampleWriter(flush_size=50, flush_interval=60, max_pending=500, session_maker=session_maker)
+    values = {f"reg_{i}": i * 0.5 for i in range(10)}
+    values.update({"object_name": "Obj", "measured_at": T0, "broken": float("nan"), "gen_relay": True})
+
+    for cycle in range(10):
+        accepted = await writer.submit("obj-1", values, T0 + timedelta(seconds=cycle))
+        assert accepted == 11  # 10 чисел и bool; строки, datetime и NaN пропущены
+    await writer.stop()
+
+    assert await _count(session_maker) == 110
+    # 110 строк по 50 — три INSERT, а не по одному на значение
+    assert len(session_maker.inserts) == 3
+    async with session_maker() as db:
+        history = await get_register_samples(db, "obj-1", "reg_4")
+    assert [(s.measured_at, s.value) for s in history] == [(T0 + timedelta(seconds=c), 2.0) for c in range(10)]
+    assert writer.get_stats()["written"] == 110 and writer.get_stats()["pending"] == 0
+
+
+async def _wait_for(predicate, timeout=5.0):
+    """Ждёт, пока фоновая запись дойдёт до нужного состояния, без расчёта на тайминги."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < deadline, "фоновая запись не дошла до ожидаемого состояния"
+        await asyncio.sleep(0.005)
+
+
+async def test_flush_by_size_and_interval(session_maker):
+    writer = RegisterSampleWriter(flush_size=20, flush_interval=0.2, max_pending=200, session_maker=session_maker)
+    try:
+        await writer.submit("obj-1", {f"r{i}": i for i in range(25)}, T0)
+        # Набрали flush_size — запись сразу, не дожидаясь интервала
+        await _wait_for(lambda: writer.get_stats()["written"] == 25)
+        assert await _count(session_maker) == 25
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await writer.submit("obj-1", {"r0": 1}, T0 + timedelta(seconds=1))
+        assert writer.get_stats()["pending"] == 1  # меньше flush_size — ждёт интервала
+        await _wait_for(lambda: writer.get_stats()["written"] == 26)
+        assert loop.time() - started >= 0.1
+        assert await _count(session_maker) == 26
+    finally:
+        await writer.stop()
+
+
+async def test_failed_flush_keeps_rows_and_rewrite_is_idempotent(session_maker):
+    calls = {"n": 0}
+
+    def flaky():
+        calls["n"] += 1
+        if calls["n"] == 1:
+            raise ConnectionError("db down")
+        return session_maker()
+
+    writer = RegisterSampleWriter(flush_size=10, flush_interval=60, max_pending=100, session_maker=flaky)
+    await writer.submit("obj-1", {"a": 1, "b": 2}, T0)
+    assert await writer.flush() is False
+    assert writer.get_stats()["pending"] == 2
+
+    await writer.submit("obj-1", {"a": 1}, T0)  # тот же ключ и время — не дубль
+    await writer.stop()
+    assert await _count(session_maker) == 2
+    assert writer.get_stats()["failed_flushes"] == 1
+
+
+async def test_backpressure_waits_then_drops_oldest():
+    release = asyncio.Event()
+
+    class SlowSession:
+        async def __aenter__(self):
+            await release.wait()
+            raise ConnectionError("db down")
+
+        async def __aexit__(self, *exc):
+            return False
+
+    writer = RegisterSampleWriter(flush_size=5, flush_interval=0.05, max_pending=10, session_maker=SlowSession)
+    await writer.submit("obj-1", {f"r{i}": i for i in range(10)}, T0)
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await writer.submit("obj-1", {"new_1": 1, "new_2": 2}, T0 + timedelta(seconds=1))
+    waited = loop.time() - started
+
+    stats = writer.get_stats()
+    assert waited >= 0.05  # submit ждал записи, прежде чем отбросить
+    # Пачка, которая пишется, тоже занимает место: отброшены ровно два старых значения
+    assert stats["backpressure_waits"] == 1
+    assert stats["dropped"] == 2
+    assert stats["pending"] == 10
+    assert [row["register_key"] for row in list(writer._buffer)[-2:]] == ["new_1", "new_2"]
+
+    release.set()
+    await writer.stop()
+    assert writer._task is None
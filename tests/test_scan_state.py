@@ -0,0 +1,115 @@
+"""Tests for the scan worker's incremental reconciliation state."""
+import sqlite3
+
+from scan_worker.scan_state import ScanFile, ScanKey, ScanStateStore, index_pending
+
+
+def _parse(path: str):
+    name = path.rsplit("/", 1)[-1]
+    if not name.startswith("S25"):
+        return None
+    case_code, glass_number = name[:-4].split("_")
+    return {
+        "case_code": case_code,
+        "sample": "A",
+        "cassette": "A1",
+        "glass_number": int(glass_number),
+        "staining": "H&E",
+        "cor_id": "COR1M",
+    }
+
+
+def test_only_new_or_changed_files_are_parsed(tmp_path):
+    state = ScanStateStore(str(tmp_path / "state.sqlite3"))
+    calls = []
+
+    def parse(path):
+        calls.append(path)
+        return _parse(path)
+
+    files = [ScanFile("d/S25R00001_0.svs", 10, 1.0), ScanFile("d/readme.txt", 1, 1.0)]
+    state.record_files(state.changed_files(files), parse)
+    assert len(calls) == 2
+
+    assert state.changed_files(files) == []
+    touched = [ScanFile("d/S25R00001_0.svs", 12, 2.0), files[1]]
+    assert state.changed_files(touched) == [touched[0]]
+
+
+def test_pending_excludes_matched_and_unparsed(tmp_path):
+    state = ScanStateStore(str(tmp_path / "state.sqlite3"))
+    state.record_files(
+        [
+            ScanFile("d/S25R00001_0.svs", 10, 1.0),
+            ScanFile("d/S25R00001_1.svs", 10, 1.0),
+            ScanFile("d/junk.svs", 10, 1.0),
+        ],
+        _parse,
+    )
+    assert {p.path for p in state.pending()} == {"d/S25R00001_0.svs", "d/S25R00001_1.svs"}
+
+    state.mark_matched(["d/S25R00001_0.svs"], "glass-1")
+
+    assert [p.path for p in state.pending()] == ["d/S25R00001_1.svs"]
+
+
+def test_folder_mtime_tracking(tmp_path):
+    state = ScanStateStore(str(tmp_path / "state.sqlite3"))
+    assert state.folder_changed("scans/2025-01-01", 5.0)
+    state.remember_folder("scans/2025-01-01", 5.0)
+    assert not state.folder_changed("scans/2025-01-01", 5.0)
+    assert state.folder_changed("scans/2025-01-01", 6.0)
+
+
+def test_index_pending_prefers_latest_rescan(tmp_path):
+    state = ScanStateStore(str(tmp_path / "state.sqlite3"))
+    state.record_files(
+        [ScanFile("old/S25R00001_0.svs", 10, 1.0), ScanFile("new/S25R00001_0.svs", 10, 9.0)],
+        _parse,
+    )
+
+    index = index_pending(state.pending())
+
+    key = ScanKey("S25R00001", "A", "A1", 0, "H&E")
+    assert [p.path for p in index[key]] == ["new/S25R00001_0.svs", "old/S25R00001_0.svs"]
+
+
+def test_unmatched_files_back_off_until_changed(tmp_path):
+    state = ScanStateStore(str(tmp_path / "state.sqlite3"))
+    scan = ScanFile("d/S25R00001_0.svs", 10, 1.0)
+    state.record_files([scan], _parse)
+
+    # Паузы 10, 20, 40, затем предел 50 секунд
+    now = 1000.0
+    for delay in (10, 20, 40, 50, 50):
+        state.mark_unmatched([scan.path], base_delay=10, max_delay=50, now=now)
+        assert state.pending(now=now + delay - 1) == []
+        assert [p.path for p in state.pending(now=now + delay)] == [scan.path]
+        now += delay
+
+    # Изменённый файл снова проверяется сразу
+    state.mark_unmatched([scan.path], base_delay=10, max_delay=50, now=now)
+    changed = ScanFile(scan.path, 12, 2.0)
+    state.record_files(state.changed_files([changed]), _parse)
+    assert [p.path for p in state.pending(now=now)] == [scan.path]
+
+
+def test_state_from_older_schema_is_upgraded(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE scan_files (path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL, "
+        "case_code TEXT, sample TEXT, cassette TEXT, glass_number INTEGER, staining TEXT, "
+        "cor_id TEXT, glass_id TEXT, seen_at REAL NOT NULL)"
+    )
+    conn.execute(
+        "INSERT INTO scan_files VALUES ('d/S25R00001_0.svs', 10, 1.0, 'S25R00001', 'A', 'A1', 0, 'H&E', "
+        "'COR1M', NULL, 1.0)"
+    )
+    conn.commit()
+    conn.close()
+
+    state = ScanStateStore(path)
+    assert [p.path for p in state.pending()] == ["d/S25R00001_0.svs"]
+    state.mark_unmatched(["d/S25R00001_0.svs"], base_delay=10, max_delay=50, now=0.0)
+    assert state.pending(now=5.0) == []
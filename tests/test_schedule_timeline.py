@@ -0,0 +1,121 @@
+"""Tests for the in-memory schedule timeline and worker wake-ups."""
+import asyncio
+from datetime import datetime, time, timedelta, timezone
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
+
+from cor_pass.services.energy.schedule_timeline import ScheduleTimeline
+from worker.schedule_engine import consume_invalidation, invalidate_schedules, wait_for_schedule_check
+
+
+KYIV = ZoneInfo("Europe/Kiev")
+
+
+def _schedule(schedule_id, start, end, is_manual_mode=False):
+    return SimpleNamespace(
+        id=schedule_id,
+        start_time=time(*start),
+        end_time=time(*end),
+        grid_feed_w=5000,
+        battery_level_percent=40,
+        charge_battery_value=300,
+        is_manual_mode=is_manual_mode,
+    )
+
+
+def _local(*args):
+    return datetime(*args, tzinfo=KYIV)
+
+
+def legacy_active(schedules, now_time):
+    """Выбор активного расписания прежним циклом energetic_schedule_task_worker."""
+    for schedule in sorted(schedules, key=lambda s: s.start_time):
+        if schedule.is_manual_mode:
+            continue
+        if schedule.start_time <= schedule.end_time:
+            if schedule.start_time <= now_time < schedule.end_time:
+                return schedule.id
+        elif now_time >= schedule.start_time or now_time < schedule.end_time:
+            return schedule.id
+    return None
+
+
+SCHEDULES = [
+    _schedule("night", (23, 0), (6, 0)),
+    _schedule("morning", (7, 30), (9, 0)),
+    _schedule("overlap", (8, 0), (10, 0)),
+    _schedule("manual", (12, 0), (13, 0), is_manual_mode=True),
+]
+
+
+def test_active_schedule_matches_legacy_selection_every_minute():
+    timeline = ScheduleTimeline(SCHEDULES, "Europe/Kiev")
+    now = _local(2026, 10, 16, 0, 0)
+    for _ in range(24 * 60):
+        active = timeline.active_at(now)
+        assert (active.id if active else None) == legacy_active(SCHEDULES, now.time())
+        now += timedelta(minutes=1)
+
+
+def test_state_only_changes_at_next_transition():
+    timeline = ScheduleTimeline(SCHEDULES, "Europe/Kiev")
+    now = _local(2026, 10, 16, 5, 17).astimezone(timezone.utc)
+    wakeups = []
+    for _ in range(8):
+        due = timeline.next_transition(now)
+        # Между пробуждениями активное расписание не меняется
+        probe = now
+        while probe < due:
+            assert timeline.active_at(probe) == timeline.active_at(now)
+            probe += timedelta(minutes=1)
+        wakeups.append(due.astimezone(KYIV).strftime("%H:%M"))
+        now = due
+    assert wakeups == ["06:00", "07:30", "08:00", "09:00", "10:00", "23:00", "06:00", "07:30"]
+
+
+def test_manual_only_objects_have_no_transitions():
+    timeline = ScheduleTimeline([SCHEDULES[-1]], "Europe/Kiev")
+    assert timeline.next_transition(datetime.now(timezone.utc)) is None
+    assert timeline.active_at(datetime.now(timezone.utc)) is None
+
+
+def test_spring_forward_wakes_at_clock_change():
+    # 29.03.2026 в Киеве 03:00 -> 04:00: времени 03:30 в этот день нет
+    timeline = ScheduleTimeline([_schedule("early", (3, 30), (5, 0))], "Europe/Kiev")
+    now = _local(2026, 3, 29, 2, 0).astimezone(timezone.utc)
+    while timeline.active_at(now) is None:
+        now = timeline.next_transition(now)
+    # Как при опросе: окно включается, как только местное время перешло 03:30
+    assert now.astimezone(KYIV).strftime("%H:%M") == "04:00"
+    assert now == datetime(2026, 3, 29, 1, 0, tzinfo=timezone.utc)
+
+
+def test_fall_back_revisits_repeated_hour():
+    # 25.10.2026 в Киеве 04:00 -> 03:00: час 03:00-04:00 проходит дважды
+    timeline = ScheduleTimeline([_schedule("repeat", (3, 15), (3, 45))], "Europe/Kiev")
+    now = _local(2026, 10, 25, 2, 0).astimezone(timezone.utc)
+    states = []
+    for _ in range(5):
+        now = timeline.next_transition(now)
+        active = timeline.active_at(now)
+        states.append((now.astimezone(KYIV).strftime("%H:%M"), active.id if active else None))
+    # 03:00 — сам перевод часов: проверка без смены состояния
+    assert states == [
+        ("03:15", "repeat"), ("03:45", None), ("03:00", None), ("03:15", "repeat"), ("03:45", None),
+    ]
+
+
+async def test_invalidation_wakes_waiting_task_early():
+    consume_invalidation("obj-1")
+    far_future = datetime.now(timezone.utc) + timedelta(hours=1)
+
+    waiter = asyncio.create_task(wait_for_schedule_check("obj-1", far_future, max_wait=3600))
+    await asyncio.sleep(0)
+    invalidate_schedules("obj-1")
+    assert await asyncio.wait_for(waiter, 1) is True
+    assert consume_invalidation("obj-1") is True
+    assert consume_invalidation("obj-1") is False
+
+    # Без изменений задача просыпается к сроку перехода
+    due = datetime.now(timezone.utc) + timedelta(milliseconds=50)
+    assert await wait_for_schedule_check("obj-1", due, max_wait=3600) is False
@@ -0,0 +1,93 @@
+"""Tests for SVS slide handle and tile caches."""
+import os
+
+import pytest
+
+from cor_pass.services.laboratory import slide_cache
+from cor_pass.services.laboratory.slide_cache import SlideHandleCache, TileCache
+
+
+class FakeSlide:
+    opened = 0
+
+    def __init__(self, path):
+        FakeSlide.opened += 1
+        self.path = path
+
+
+@pytest.fixture
+def fake_openslide(monkeypatch):
+    FakeSlide.opened = 0
+    monkeypatch.setattr(slide_cache, "OpenSlide", FakeSlide)
+    return FakeSlide
+
+
+def test_tile_cache_is_bounded_by_bytes():
+    cache = TileCache(max_bytes=10)
+    cache.put("a", b"12345")
+    cache.put("b", b"12345")
+    assert cache.get("a") == b"12345"  # "a" становится самым свежим
+
+    cache.put("c", b"12345")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"12345"
+    assert cache.get("c") == b"12345"
+    stats = cache.stats()
+    assert stats["bytes"] == 10
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+
+
+def test_tile_cache_skips_oversized_tiles():
+    cache = TileCache(max_bytes=4)
+    cache.put("big", b"12345")
+    assert cache.get("big") is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_slide_handles_reused_until_file_changes(tmp_path, fake_openslide):
+    path = tmp_path / "slide.svs"
+    path.write_bytes(b"v1")
+    cache = SlideHandleCache(max_handles=2)
+
+    first = cache.get(str(path))
+    assert cache.get(str(path)) is first
+    assert fake_openslide.opened == 1
+
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert cache.get(str(path)) is not first
+    assert fake_openslide.opened == 2
+    assert cache.stats()["size"] == 1
+
+
+def test_slide_handles_evict_least_recently_used(tmp_path, fake_openslide):
+    paths = []
+    for name in ("a.svs", "b.svs", "c.svs"):
+        p = tmp_path / name
+        p.write_bytes(b"x")
+        paths.append(str(p))
+    cache = SlideHandleCache(max_handles=2)
+
+    cache.get(paths[0])
+    cache.get(paths[1])
+    cache.get(paths[0])
+    cache.get(paths[2])
+
+    assert cache.stats()["evictions"] == 1
+    cache.get(paths[0])
+    assert fake_openslide.opened == 3  # "a" остался в кэше, вытеснен "b"
+
+
+def test_find_user_slide_tracks_directory_changes(tmp_path):
+    assert slide_cache.find_user_slide(str(tmp_path / "missing")) is None
+    assert slide_cache.find_user_slide(str(tmp_path)) is None
+
+    (tmp_path / "scan.svs").write_bytes(b"x")
+    stat = os.stat(tmp_path)
+    os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert slide_cache.find_user_slide(str(tmp_path)) == str(tmp_path / "scan.svs")
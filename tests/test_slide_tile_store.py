@@ -0,0 +1,47 @@
+"""Tests for the on-disk pre-rendered slide tile store."""
+import os
+
+from cor_pass.services.laboratory.slide_tile_store import (
+    LAST_USED_MARKER,
+    SlideTileStore,
+    slide_store_key,
+)
+
+
+def _write_tiles(payload: bytes):
+    def build(target_dir: str) -> None:
+        level_dir = os.path.join(target_dir, "0")
+        os.makedirs(level_dir)
+        with open(os.path.join(level_dir, "0_0.jpeg"), "wb") as f:
+            f.write(payload)
+    return build
+
+
+def test_store_key_matches_unc_and_local_paths():
+    unc = "\\\\10.0.0.1\\share\\scans\\2025-01-01\\S25R00001_A1.svs"
+    local = "/app/dicom_users_data/USER/slides/S25R00001_A1.svs"
+    assert slide_store_key(unc, 100) == slide_store_key(local, 100)
+    assert slide_store_key(local, 100) != slide_store_key(local, 101)
+
+
+def test_write_and_read_tile(tmp_path):
+    store = SlideTileStore(root=str(tmp_path), max_bytes=1024)
+    assert store.read_tile("k", 0, 0, 0) is None
+
+    store.write_slide("k", _write_tiles(b"tile"))
+
+    assert store.has_slide("k")
+    assert store.read_tile("k", 0, 0, 0) == b"tile"
+    assert not [n for n in os.listdir(tmp_path) if n.startswith(".tmp-")]
+
+
+def test_enforce_limit_evicts_least_recently_used(tmp_path):
+    store = SlideTileStore(root=str(tmp_path), max_bytes=10)
+    store.write_slide("old", _write_tiles(b"x" * 6))
+    os.utime(os.path.join(tmp_path, "old", LAST_USED_MARKER), (1, 1))
+
+    store.write_slide("new", _write_tiles(b"y" * 6))
+
+    assert not store.has_slide("old")
+    assert store.has_slide("new")
+    assert store.total_bytes() == 6
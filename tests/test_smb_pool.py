@@ -0,0 +1,128 @@
+"""Tests for the pooled SMB connection manager against a fake transport."""
+import threading
+import time
+
+import pytest
+from smb.base import NotConnectedError
+
+from cor_pass.services.shared.smb_pool import SMBConnectionPool, SMBPoolTimeout
+
+
+class FakeConnection:
+    def __init__(self, alive: bool = True):
+        self.alive = alive
+        self.closed = False
+        self.calls = 0
+
+    def echo(self, data, timeout=None):
+        if not self.alive:
+            raise NotConnectedError("connection lost")
+        return data
+
+    def close(self):
+        self.closed = True
+
+
+class FakeFactory:
+    def __init__(self):
+        self.connections = []
+
+    def __call__(self):
+        conn = FakeConnection()
+        self.connections.append(conn)
+        return conn
+
+
+def test_connection_is_reused():
+    factory = FakeFactory()
+    pool = SMBConnectionPool(factory=factory, max_size=2)
+
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+
+    assert first is second
+    assert len(factory.connections) == 1
+    assert pool.stats()["idle"] == 1
+
+
+def test_max_size_blocks_until_release():
+    factory = FakeFactory()
+    pool = SMBConnectionPool(factory=factory, max_size=1, acquire_timeout=2)
+    conn = pool.acquire()
+
+    threading.Timer(0.1, pool.release, args=(conn,)).start()
+    started = time.monotonic()
+    again = pool.acquire()
+
+    assert again is conn
+    assert time.monotonic() - started >= 0.05
+    assert len(factory.connections) == 1
+
+
+def test_acquire_times_out_when_pool_exhausted():
+    pool = SMBConnectionPool(factory=FakeFactory(), max_size=1, acquire_timeout=0.05)
+    pool.acquire()
+    with pytest.raises(SMBPoolTimeout):
+        pool.acquire()
+
+
+def test_idle_connections_expire():
+    factory = FakeFactory()
+    pool = SMBConnectionPool(factory=factory, max_size=2, idle_timeout=0)
+    with pool.connection():
+        pass
+    time.sleep(0.01)
+    with pool.connection():
+        pass
+
+    assert len(factory.connections) == 2
+    assert factory.connections[0].closed
+
+
+def test_dead_idle_connection_is_replaced_after_health_check():
+    factory = FakeFactory()
+    pool = SMBConnectionPool(factory=factory, max_size=2, health_check_interval=0)
+    with pool.connection() as conn:
+        pass
+    conn.alive = False
+    time.sleep(0.01)
+
+    with pool.connection() as fresh:
+        pass
+
+    assert fresh is not conn
+    assert conn.closed
+    assert pool.stats()["discarded"] == 1
+
+
+def test_run_reconnects_on_connection_error():
+    factory = FakeFactory()
+    pool = SMBConnectionPool(factory=factory, max_size=2)
+    attempts = []
+
+    def operation(conn):
+        attempts.append(conn)
+        if len(attempts) == 1:
+            raise NotConnectedError("dropped")
+        return "ok"
+
+    assert pool.run(operation) == "ok"
+    assert attempts[0] is not attempts[1]
+    assert attempts[0].closed
+    assert pool.stats() == {
+        "idle": 1, "in_use": 0, "max_size": 2, "created": 2, "discarded": 1,
+    }
+
+
+def test_operation_errors_keep_connection():
+    factory = FakeFactory()
+    pool = SMBConnectionPool(factory=factory, max_size=1)
+
+    with pytest.raises(ValueError):
+        with pool.connection():
+            raise ValueError("file not found")
+
+    assert pool.stats()["idle"] == 1
+    assert not factory.connections[0].closed
@@ -0,0 +1,150 @@
+"""Tests for ranged SMB reads, the block cache and the local slide cache."""
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from cor_pass.services.shared.smb_pool import SMBConnectionPool
+from cor_pass.services.shared.smb_stream import (
+    BlockCache,
+    LocalSlideCache,
+    SMBFileInfo,
+    SMBRangeReader,
+    link_or_copy,
+    parse_range_header,
+)
+
+
+class FakeShareConnection:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.reads = []
+
+    def getAttributes(self, share, path):
+        return SimpleNamespace(file_size=len(self.data), last_write_time=1000.0)
+
+    def retrieveFileFromOffset(self, share, path, fileobj, offset, max_length):
+        self.reads.append((offset, max_length))
+        chunk = self.data[offset:offset + max_length]
+        fileobj.write(chunk)
+        return None, len(chunk)
+
+    def echo(self, data, timeout=None):
+        return data
+
+    def close(self):
+        pass
+
+
+def _reader(tmp_path, data: bytes, block_size: int = 4):
+    conn = FakeShareConnection(data)
+    pool = SMBConnectionPool(factory=lambda: conn, max_size=1)
+    cache = BlockCache(root=str(tmp_path / "blocks"), block_size=block_size, max_bytes=1024)
+    return SMBRangeReader(pool, cache), conn
+
+
+def test_parse_range_header():
+    assert parse_range_header(None, 100) is None
+    assert parse_range_header("bytes=0-9", 100) == (0, 9)
+    assert parse_range_header("bytes=90-", 100) == (90, 99)
+    assert parse_range_header("bytes=-10", 100) == (90, 99)
+    assert parse_range_header("bytes=50-500", 100) == (50, 99)
+    assert parse_range_header("bytes=0-1,5-6", 100) is None
+    with pytest.raises(ValueError):
+        parse_range_header("bytes=100-", 100)
+
+
+def test_reads_only_needed_blocks_and_caches_them(tmp_path):
+    data = bytes(range(40))
+    reader, conn = _reader(tmp_path, data)
+    info = reader.stat("scans/slide.svs")
+
+    assert reader.read(info, 5, 10) == data[5:11]
+    # Блоки 1 и 2 (байты 4..11) одним запросом
+    assert conn.reads == [(4, 8)]
+
+    assert reader.read(info, 6, 9) == data[6:10]
+    assert conn.reads == [(4, 8)]
+
+    assert reader.read(info, 30, 39) == data[30:40]
+    assert conn.reads[-1] == (28, 12)
+
+
+def test_partial_last_block(tmp_path):
+    data = b"0123456789"
+    reader, _ = _reader(tmp_path, data)
+    info = reader.stat("scans/slide.svs")
+    assert reader.read(info, 0, 9) == data
+
+
+def test_local_slide_cache_downloads_once(tmp_path):
+    cache = LocalSlideCache(root=str(tmp_path), max_bytes=1024)
+    info = SMBFileInfo("scans/Slide.SVS", 4, 1000.0)
+    downloads = []
+
+    def download(target):
+        downloads.append(target)
+        with open(target, "wb") as f:
+            f.write(b"data")
+
+    first = cache.ensure(info, download)
+    second = cache.ensure(info, download)
+
+    assert first == second
+    assert first.endswith(".svs")
+    assert len(downloads) == 1
+    with open(first, "rb") as f:
+        assert f.read() == b"data"
+
+    changed = SMBFileInfo("scans/Slide.SVS", 4, 2000.0)
+    assert cache.path_for(changed) != first
+
+
+def test_local_slide_cache_rejects_truncated_download(tmp_path):
+    cache = LocalSlideCache(root=str(tmp_path), max_bytes=1024)
+    info = SMBFileInfo("scans/slide.svs", 10, 1000.0)
+
+    def download(target):
+        with open(target, "wb") as f:
+            f.write(b"short")
+
+    with pytest.raises(RuntimeError):
+        cache.ensure(info, download)
+    assert not [n for n in os.listdir(tmp_path) if not n.startswith(".")]
+
+
+def test_local_slide_cache_evicts_least_recently_used(tmp_path):
+    cache = LocalSlideCache(root=str(tmp_path), max_bytes=10)
+    old = SMBFileInfo("old.svs", 6, 1.0)
+    new = SMBFileInfo("new.svs", 6, 1.0)
+
+    def download(target):
+        with open(target, "wb") as f:
+            f.write(b"x" * 6)
+
+    old_path = cache.ensure(old, download)
+    os.utime(cache.usage_path(old_path), (1, 1))
+    new_path = cache.ensure(new, download)
+
+    assert os.path.exists(new_path)
+    assert not os.path.exists(old_path)
+    assert not os.path.exists(cache.usage_path(old_path))
+
+
+def test_cache_hit_does_not_touch_hard_linked_copy(tmp_path):
+    cache = LocalSlideCache(root=str(tmp_path / "cache"), max_bytes=1024)
+    info = SMBFileInfo("scans/slide.svs", 4, 1000.0)
+
+    def download(target):
+        with open(target, "wb") as f:
+            f.write(b"data")
+
+    cached = cache.ensure(info, download)
+    user_copy = str(tmp_path / "slide.svs")
+    link_or_copy(cached, user_copy)
+    os.utime(user_copy, (1000, 1000))
+
+    # Повторное использование кэша не меняет mtime слайда пользователя (и его версию)
+    assert cache.ensure(info, download) == cached
+    assert os.stat(user_copy).st_mtime == 1000
+    assert os.stat(cache.usage_path(cached)).st_mtime > 1000
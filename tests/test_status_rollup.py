@@ -0,0 +1,111 @@
+"""Tests for the maintained print/scan counters of samples and cases."""
+import pytest
+from sqlalchemy import delete, select, update
+
+from cor_pass.database import models as db_models
+from cor_pass.repository.laboratory.status_rollup import (
+    find_rollup_mismatches,
+    rebuild_rollups,
+    refresh_rollups,
+)
+
+
+TABLES = [
+    db_models.Case.__table__,
+    db_models.Sample.__table__,
+    db_models.Cassette.__table__,
+    db_models.Glass.__table__,
+    db_models.CaseWorklist.__table__,
+]
+
+
+@pytest.fixture
+async def db(sqlite_session):
+    return await sqlite_session(*TABLES)
+
+
+async def _case_tree(db, glasses_per_sample=(2, 1)):
+    case = db_models.Case(case_code="S25B00001")
+    db.add(case)
+    await db.flush()
+    samples = []
+    for i, n_glasses in enumerate(glasses_per_sample):
+        sample = db_models.Sample(case_id=case.id, sample_number="AB"[i])
+        db.add(sample)
+        await db.flush()
+        cassette = db_models.Cassette(sample_id=sample.id, cassette_number=f"{sample.sample_number}1")
+        db.add(cassette)
+        await db.flush()
+        db.add_all(
+            db_models.Glass(cassette_id=cassette.id, glass_number=g) for g in range(n_glasses)
+        )
+        samples.append(sample)
+    await db.commit()
+    return case, samples
+
+
+async def test_refresh_counts_and_statuses(db):
+    case, (sample_a, sample_b) = await _case_tree(db)
+    await refresh_rollups(db, sample_ids=[sample_a.id, sample_b.id])
+    await db.commit()
+
+    assert (case.bank_count, case.cassette_count, case.glass_count) == (2, 2, 3)
+    assert case.glass_printed_count == 0
+    assert case.is_printed_glass is False
+
+    await db.execute(
+        update(db_models.Glass).values(is_printed=True, scan_url="\\\\smb\\a.svs")
+    )
+    await db.execute(
+        update(db_models.Cassette)
+        .where(db_models.Cassette.sample_id == sample_a.id)
+        .values(is_printed=True)
+    )
+    await refresh_rollups(db, sample_ids=[sample_a.id, sample_b.id])
+    await db.commit()
+
+    # Объекты сессии обновлены без повторной загрузки
+    assert sample_a.glass_printed_count == 2 and sample_a.is_printed_glass is True
+    assert sample_a.is_printed_cassette is True and sample_b.is_printed_cassette is False
+    assert case.glass_printed_count == case.glass_scanned_count == 3
+    assert case.is_printed_glass is True
+    assert case.is_printed_cassette is False
+
+
+async def test_refresh_by_cassette_and_deleted_sample(db):
+    case, (sample_a, sample_b) = await _case_tree(db, glasses_per_sample=(1, 1))
+    await refresh_rollups(db, sample_ids=[sample_a.id, sample_b.id])
+    cassette = await db.scalar(
+        select(db_models.Cassette.id).where(db_models.Cassette.sample_id == sample_b.id)
+    )
+    await db.execute(update(db_models.Glass).values(is_printed=True))
+    await refresh_rollups(db, cassette_ids=[cassette])
+    await db.commit()
+
+    assert sample_b.glass_printed_count == 1
+    assert sample_a.glass_printed_count == 0
+    assert case.glass_printed_count == 1
+
+    await db.execute(delete(db_models.Glass).where(db_models.Glass.cassette_id == cassette))
+    await db.execute(delete(db_models.Cassette).where(db_models.Cassette.id == cassette))
+    await db.execute(delete(db_models.Sample).where(db_models.Sample.id == sample_b.id))
+    await refresh_rollups(db, case_ids=[case.id])
+    await db.commit()
+
+    assert (case.bank_count, case.glass_count, case.glass_printed_count) == (1, 1, 0)
+
+
+async def test_checker_and_rebuild(db):
+    case, samples = await _case_tree(db)
+    await rebuild_rollups(db, batch_size=1)
+    assert await find_rollup_mismatches(db) == {"samples": [], "cases": []}
+
+    await db.execute(
+        update(db_models.Sample).where(db_models.Sample.id == samples[0].id).values(glass_count=7)
+    )
+    await db.execute(update(db_models.Case).values(glass_scanned_count=5))
+    await db.commit()
+    assert await find_rollup_mismatches(db) == {"samples": [samples[0].id], "cases": [case.id]}
+
+    assert await rebuild_rollups(db, batch_size=1) == {"samples": 2, "cases": 1}
+    assert await find_rollup_mismatches(db) == {"samples": [], "cases": []}
@@ -0,0 +1,99 @@
+"""
+Микробенчмарк CRC16 и декодирования регистров.
+
+Сравнивает прежние реализации (побитовый CRC, поштучное декодирование
+регистров с разбором типа из конфига) с worker.register_decoding на
+группах из worker/modbus_configs/*.json:
+
+    python -m worker.bench_register_decoding [--number 20000]
+"""
+
+import argparse
+import json
+import random
+import timeit
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+from worker.register_decoding import DecodePlan, modbus_crc16
+
+
+CONFIGS_DIR = Path(__file__).parent / "modbus_configs"
+
+
+def legacy_crc16(data: bytes) -> int:
+    """Прежний побитовый CRC16 (эталон для сравнения)."""
+    crc = 0xFFFF
+    for b in data:
+        crc ^= b
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if (crc & 1) else crc >> 1
+    return crc
+
+
+def legacy_decode(registers: Sequence[dict], raw_registers: List[int]) -> Dict[str, float]:
+    """Прежнее поштучное декодирование группы по offset (эталон для сравнения)."""
+    values = {}
+    for register in registers:
+        offset = register.get("offset", 0)
+        reg_type = register.get("type", "uint16")
+        scale = register.get("scale", 1.0)
+        bit_index = register.get("bit", None)
+        if offset >= len(raw_registers):
+            continue
+        raw_value = raw_registers[offset]
+        if reg_type == "int16":
+            value = raw_value - 0x10000 if raw_value >= 0x8000 else raw_value
+        elif reg_type == "uint16":
+            value = raw_value
+        elif reg_type == "int32" and offset + 1 < len(raw_registers):
+            combined = (raw_registers[offset] << 16) | raw_registers[offset + 1]
+            value = combined - 0x100000000 if combined >= 0x80000000 else combined
+        elif reg_type == "uint32" and offset + 1 < len(raw_registers):
+            value = (raw_registers[offset] << 16) | raw_registers[offset + 1]
+        else:
+            value = raw_value
+        if bit_index is not None:
+            value = (int(value) >> bit_index) & 1
+        values[register["name"]] = value * scale
+    return values
+
+
+def block_groups() -> List[dict]:
+    """Группы, которые читаются блоком (start_address/count), из всех конфигов."""
+    groups = []
+    for path in sorted(CONFIGS_DIR.glob("*.json")):
+        config = json.loads(path.read_text(encoding="utf-8"))
+        for group in config.get("register_groups", {}).values():
+            if group.get("start_address") is not None and group.get("count") is not None:
+                groups.append(group)
+    return groups
+
+
+def run(number: int) -> Dict[str, float]:
+    """Возвращает микросекунды на операцию для каждого варианта."""
+    rnd = random.Random(0)
+    frame = bytes(rnd.randrange(256) for _ in range(3 + 2 * 60))
+    groups = block_groups()
+    blocks = [[rnd.randrange(0x10000) for _ in range(g["count"])] for g in groups]
+    plans = [DecodePlan.from_group(g) for g in groups]
+
+    def per_op(stmt) -> float:
+        return timeit.timeit(stmt, number=number) / number * 1e6
+
+    return {
+        "crc16_legacy_us": per_op(lambda: legacy_crc16(frame)),
+        "crc16_table_us": per_op(lambda: modbus_crc16(frame)),
+        "decode_legacy_us": per_op(
+            lambda: [legacy_decode(g["registers"], b) for g, b in zip(groups, blocks)]
+        ),
+        "decode_plan_us": per_op(lambda: [p.decode(b) for p, b in zip(plans, blocks)]),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+    for name, value in run(args.number).items():
+        print(f"{name:>20}: {value:8.2f}")
@@ -0,0 +1,187 @@
+"""
+Параллельный опрос независимых юнитов одного устройства.
+
+CollectionPlanner запускает чтения юнитов (батарея, инвертор, ESS, каждый
+MPPT-контроллер) одновременно, но не больше max_concurrency запросов на
+устройство. Каждое чтение получает свободное подключение из переданного
+списка: клиент pymodbus выполняет запросы строго по одному, поэтому
+реальная параллельность равна числу подключений. Ошибка одного юнита не
+прерывает цикл: его значение в отчёте помечается MISSING, а задержка
+каждого юнита попадает в отчёт и в накопленную статистику планировщика.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Sequence
+
+
+class _Missing:
+    """Маркер юнита, значение которого не удалось прочитать."""
+
+    def __repr__(self) -> str:
+        return "MISSING"
+
+    def __bool__(self) -> bool:
+        return False
+
+
+MISSING = _Missing()
+
+# Чтение юнита получает подключение, через которое его нужно выполнить
+UnitRead = Callable[[Any], Awaitable[Any]]
+
+
+@dataclass
+class UnitResult:
+    unit: str
+    value: Any
+    latency_s: float
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.value is not MISSING
+
+
+@dataclass
+class CollectionReport:
+    """Результат одного цикла опроса: значения и задержки по юнитам."""
+
+    results: Dict[str, UnitResult] = field(default_factory=dict)
+    elapsed_s: float = 0.0
+
+    @property
+    def values(self) -> Dict[str, Any]:
+        return {unit: r.value for unit, r in self.results.items()}
+
+    @property
+    def missing(self) -> List[str]:
+        return [unit for unit, r in self.results.items() if not r.ok]
+
+    @property
+    def latencies(self) -> Dict[str, float]:
+        return {unit: r.latency_s for unit, r in self.results.items()}
+
+    def get(self, unit: str) -> Any:
+        result = self.results.get(unit)
+        return result.value if result is not None else MISSING
+
+    def summary(self) -> str:
+        """Короткая строка для лога: время цикла, самые медленные и пропущенные юниты."""
+        slowest = sorted(self.results.values(), key=lambda r: r.latency_s, reverse=True)[:3]
+        parts = [f"{self.elapsed_s * 1000:.0f}ms", f"{len(self.results) - len(self.missing)}/{len(self.results)} ok"]
+        parts.append("slowest " + ", ".join(f"{r.unit}={r.latency_s * 1000:.0f}ms" for r in slowest))
+        if self.missing:
+            parts.append(f"missing {self.missing}")
+        return "; ".join(parts)
+
+
+class CollectionPlanner:
+    """
+    Параллельное чтение юнитов одного устройства с ограничением конкурентности.
+
+    Семафор общий для всех вызовов gather() этого планировщика, поэтому
+    ограничение действует на устройство целиком, а не на отдельный цикл.
+    """
+
+    def __init__(self, device: str, max_concurrency: int = 4, timeout: Optional[float] = None):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency должен быть >= 1")
+        self.device = device
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight = 0
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    async def read_unit(self, unit: str, read: UnitRead, lanes: asyncio.Queue) -> UnitResult:
+        """Читает один юнит; исключение и таймаут превращаются в MISSING."""
+        async with self._semaphore:
+            client = await lanes.get()
+            self._in_flight += 1
+            started = time.perf_counter()
+            try:
+                if self.timeout is not None:
+                    value = await asyncio.wait_for(read(client), self.timeout)
+                else:
+                    value = await read(client)
+                result = UnitResult(unit, value, time.perf_counter() - started)
+            except asyncio.TimeoutError:
+                result = UnitResult(unit, MISSING, time.perf_counter() - started, "timeout")
+            except Exception as e:
+                result = UnitResult(unit, MISSING, time.perf_counter() - started, str(e) or type(e).__name__)
+            finally:
+                self._in_flight -= 1
+                lanes.put_nowait(client)
+        self._record(result)
+        return result
+
+    async def gather(self, reads: Mapping[str, UnitRead], clients: Sequence[Any]) -> CollectionReport:
+        """
+        Запускает все чтения одновременно и собирает отчёт в порядке reads.
+
+        Одно подключение из clients в каждый момент занято не больше чем
+        одним чтением.
+        """
+        if not clients:
+            raise ValueError("Нужно хотя бы одно подключение")
+        lanes: asyncio.Queue = asyncio.Queue()
+        for client in clients:
+            lanes.put_nowait(client)
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(self.read_unit(unit, read, lanes) for unit, read in reads.items())
+        )
+        return CollectionReport(
+            results={r.unit: r for r in results},
+            elapsed_s=time.perf_counter() - started,
+        )
+
+    def _record(self, result: UnitResult):
+        stats = self._stats.setdefault(
+            result.unit,
+            {"reads": 0, "failures": 0, "latency_last_s": 0.0, "latency_total_s": 0.0, "latency_max_s": 0.0},
+        )
+        stats["reads"] += 1
+        if not result.ok:
+            stats["failures"] += 1
+        stats["latency_last_s"] = result.latency_s
+        stats["latency_total_s"] += result.latency_s
+        stats["latency_max_s"] = max(stats["latency_max_s"], result.latency_s)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Накопленная статистика: задержки и число ошибок по каждому юниту."""
+        units = {
+            unit: {
+                "reads": int(s["reads"]),
+                "failures": int(s["failures"]),
+                "latency_last_s": round(s["latency_last_s"], 4),
+                "latency_avg_s": round(s["latency_total_s"] / s["reads"], 4),
+                "latency_max_s": round(s["latency_max_s"], 4),
+            }
+            for unit, s in self._stats.items()
+        }
+        return {
+            "device": self.device,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "units": units,
+        }
+
+
+# Планировщики по устройствам (object_id), чтобы все задачи одного объекта
+# делили одно ограничение конкурентности
+_planners: Dict[str, CollectionPlanner] = {}
+
+
+def get_collection_planner(device: str, max_concurrency: int = 4, timeout: Optional[float] = None) -> CollectionPlanner:
+    planner = _planners.get(device)
+    if planner is None:
+        planner = CollectionPlanner(device, max_concurrency, timeout)
+        _planners[device] = planner
+    return planner
+
+
+def get_all_collection_stats() -> Dict[str, Dict[str, Any]]:
+    return {device: planner.get_stats() for device, planner in _planners.items()}
@@ -1,14 +1,17 @@
+from functools import partial
 from typing import Any, Dict, Optional
 from uuid import UUID
 
 from fastapi import HTTPException
 from loguru import logger
 from pymodbus.client import AsyncModbusTcpClient
+from worker.collection_planner import MISSING, CollectionPlanner, CollectionReport, UnitRead
 from worker.modbus_client import (
     BATTERY_ID,
     INVERTER_ID,
     ESS_UNIT_ID,
     REGISTERS,
+    SOLAR_CHARGER_SLAVE_IDS,
     decode_signed_16,
     decode_signed_32,
     register_modbus_error, 
@@ -172,43 +175,65 @@ async def collect_ess_ac_data(
         )
         raise
 
-# new
-async def get_solarchargers_current_sum(modbus_client: AsyncModbusTcpClient, transaction_id: UUID
-) -> Dict[str, Any]:
+SOLAR_PV_POWER_REGISTER = 3730
+
+
+async def read_solarcharger_power(modbus_client: AsyncModbusTcpClient, slave: int) -> int:
+    """Чтение регистра 3730 (PV мощность) одного MPPT."""
+    res = await modbus_client.read_input_registers(address=SOLAR_PV_POWER_REGISTER, count=1, slave=slave)
+    if res.isError() or not hasattr(res, "registers"):
+        raise ConnectionError(f"Modbus error: Failed to read register {SOLAR_PV_POWER_REGISTER} from slave {slave}")
+    return res.registers[0]
+
+
+def solarcharger_reads() -> Dict[str, UnitRead]:
+    """Чтения MPPT для CollectionPlanner: юнит charger_<slave> на каждый slave."""
+    return {
+        f"charger_{slave}": partial(read_solarcharger_power, slave=slave)
+        for slave in SOLAR_CHARGER_SLAVE_IDS
+    }
+
+
+def summarize_solarchargers(report: CollectionReport, transaction_id: UUID) -> Dict[str, Any]:
     """
-    Чтение регистров 3730 с MPPT для всех UID и суммирование их значений
+    Суммирует мощность MPPT из отчёта планировщика.
+
+    Не ответившие MPPT в сумму не входят; если не ответил ни один,
+    solar_total_pv_power = None, а не 0.
     """
-    try:
-        slave_ids = list(range(1, 14)) + [100]
-        results = {}
-        total_power = 0  
-
-        for slave in slave_ids:
-            try:
-                res = await modbus_client.read_input_registers(address=3730, count=1, slave=slave)
-                if res.isError() or not hasattr(res, "registers"):
-                    results[f"charger_{slave}"] = None
-                    logger.warning(f"⚠️ Ошибка чтения регистра 3730 у slave {slave}")
-                else:
-                    value = res.registers[0]
-                    results[f"charger_{slave}"] = value
-                    total_power += value
-
-            except Exception as e:
-                logger.warning(
-                    f"[{transaction_id}] Exception while reading slave {slave} data: {e}",
-                    exc_info=True,
-                    extra={"slave_id": slave},
-                )
+    total_power = 0
+    responded = 0
+    for slave in SOLAR_CHARGER_SLAVE_IDS:
+        unit = f"charger_{slave}"
+        value = report.get(unit)
+        if value is MISSING:
+            error = report.results[unit].error if unit in report.results else "not polled"
+            logger.warning(f"[{transaction_id}] ⚠️ Ошибка чтения регистра {SOLAR_PV_POWER_REGISTER} у slave {slave}: {error}")
+            continue
+        responded += 1
+        total_power += value
+
+    if not responded:
+        register_modbus_error()
+        return {"solar_total_pv_power": None}
+    return {"solar_total_pv_power": total_power}
 
-        return {"solar_total_pv_power": total_power}
 
-    except Exception as e:
-        register_modbus_error()
-        logger.error(
-            f"[{transaction_id}] Overall error during MPPT polling, Общая ошибка при опросе регистров 3730: {e}", exc_info=True
-        )
-        raise
+async def get_solarchargers_current_sum(
+    modbus_client: AsyncModbusTcpClient,
+    transaction_id: UUID,
+    planner: Optional[CollectionPlanner] = None,
+) -> Dict[str, Any]:
+    """
+    Чтение регистров 3730 с MPPT для всех UID и суммирование их значений.
+
+    MPPT опрашиваются параллельно через planner (по умолчанию — отдельный
+    планировщик на одно подключение).
+    """
+    planner = planner or CollectionPlanner("solarchargers", max_concurrency=1)
+    report = await planner.gather(solarcharger_reads(), [modbus_client])
+    logger.debug(f"[{transaction_id}] MPPT: {report.summary()}")
+    return summarize_solarchargers(report, transaction_id)
 
 
 async def get_battery_status(modbus_client: AsyncModbusTcpClient, transaction_id: UUID) -> Dict[str, Any]: 
@@ -1,8 +1,10 @@
 from datetime import datetime, timedelta
 from typing import List, Optional, Tuple
 from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 from cor_pass.database.models import CerboMeasurement, EnergeticSchedule
+from cor_pass.repository.energy.measurement_rollups import apply_measurement_rollups
 from cor_pass.schemas import (
     EnergeticScheduleBase,
     EnergeticScheduleCreate,
@@ -19,6 +21,7 @@ async def create_full_device_measurement(
     try:
         db_measurement = CerboMeasurement(**data.model_dump())
         db.add(db_measurement)
+        await apply_measurement_rollups(db, [data.model_dump()])
         await db.commit()
         await db.refresh(db_measurement)
         return FullDeviceMeasurementResponse.model_validate(db_measurement)
@@ -27,6 +30,38 @@ async def create_full_device_measurement(
         raise
 
 
+# SQLite ограничивает число параметров в запросе (999 в старых сборках)
+MEASUREMENT_INSERT_CHUNK_ROWS = 999 // len(CerboMeasurement.__table__.columns)
+
+
+def _measurement_insert(db: AsyncSession):
+    dialect = db.get_bind().dialect.name
+    return (postgresql if dialect == "postgresql" else sqlite).insert(CerboMeasurement)
+
+
+async def create_full_device_measurements(db: AsyncSession, rows: List[dict]) -> int:
+    """
+    Записывает пачку измерений multi-row INSERT'ами и добавляет их в агрегаты.
+
+    Строки — поля CerboMeasurement вместе с id и created_at. Уже записанные
+    строки (повтор пачки, чей коммит прошёл, а ответ потерялся) пропускаются
+    и в агрегаты повторно не попадают. Коммит — на вызывающем. Возвращает
+    число новых строк.
+    """
+    inserted_ids = set()
+    for i in range(0, len(rows), MEASUREMENT_INSERT_CHUNK_ROWS):
+        stmt = (
+            _measurement_insert(db)
+            .values(rows[i:i + MEASUREMENT_INSERT_CHUNK_ROWS])
+            .on_conflict_do_nothing(index_elements=["id", "measured_at"])
+            .returning(CerboMeasurement.id)
+        )
+        inserted_ids.update((await db.execute(stmt)).scalars().all())
+    inserted = [row for row in rows if row["id"] in inserted_ids]
+    await apply_measurement_rollups(db, inserted)
+    return len(inserted)
+
+
 async def get_device_measurements_paginated(
     db: AsyncSession,
     page: int = 1,
@@ -3,17 +3,36 @@ from typing import Optional
 
 from loguru import logger
 from cor_pass.config.config import settings
+from cor_pass.database.db import async_session_maker
+from cor_pass.repository.energy.measurement_partitions import maintain_measurement_partitions
+from worker.measurement_writer import get_measurement_writer
 from worker.polling_manager import PollingManager
+from worker.schedule_engine import listen_schedule_changes
 
 
 CHECK_INTERVAL = 5
 polling_manager = PollingManager()
 
+
+async def run_partition_maintenance():
+    """Создаёт будущие и удаляет просроченные партиции cerbo_measurements."""
+    try:
+        async with async_session_maker() as db:
+            await maintain_measurement_partitions(db)
+    except Exception as e:
+        logger.error(f"Error in cerbo_measurements partition maintenance: {e}", exc_info=True)
+
+
 async def main_worker_entrypoint():
     """
     Главный цикл воркера
     Периодически синхронизирует задачи опроса из БД
+    и обслуживает партиции cerbo_measurements
     """
+    loop = asyncio.get_running_loop()
+    next_partition_check = loop.time()
+    # Изменения расписаний из API будят задачи расписаний сразу
+    schedule_listener = asyncio.create_task(listen_schedule_changes())
     try:
         while True:
             try:
@@ -23,8 +42,19 @@ async def main_worker_entrypoint():
             except Exception as e:
                 logger.error(f"Error in main loop: {e}", exc_info=True)
 
+            if loop.time() >= next_partition_check:
+                await run_partition_maintenance()
+                next_partition_check = loop.time() + settings.cerbo_partition_check_interval
+
             await asyncio.sleep(CHECK_INTERVAL)
     finally:
+        schedule_listener.cancel()
+
+        # Дописываем буферы измерений и истории регистров
+        logger.info("🛑 Shutting down worker, flushing measurements and register samples...")
+        await get_measurement_writer().stop()
+        await polling_manager.sample_writer.stop()
+        
         # Закрываем все Modbus клиенты при остановке
         from worker.modbus_client import close_all_modbus_clients
         logger.info("🛑 Shutting down worker, closing all Modbus clients...")
@@ -0,0 +1,284 @@
+"""
+Буферизованная запись полных измерений Cerbo в cerbo_measurements.
+
+Задачи сбора всех объектов отдают измерения в submit(), а фоновая задача
+пишет накопленное одной транзакцией на flush_size измерений (multi-row
+INSERT плюс агрегаты cerbo_measurement_rollups): когда буфер набрал
+flush_size измерений или прошло flush_interval секунд с прошлой записи.
+
+Буфер в памяти ограничен max_pending измерениями. Если БД недоступна и
+буфер переполнился, самые старые измерения сохраняются на диск пачками
+по flush_size в spool_dir (JSON Lines, один файл — одна транзакция при
+повторной записи); при остановке туда же уходит всё, что не удалось
+записать. Файлы
+дописываются в БД, как только запись снова проходит, в том числе после
+перезапуска воркера. Папка ограничена spool_max_mb: при переполнении
+удаляются самые старые файлы.
+
+Повторная запись идемпотентна: уже записанные измерения пропускаются.
+Пачку или файл, которые БД отвергает не из-за связи (ошибка данных),
+повторять бесполезно — они переносятся в spool_dir/rejected для разбора
+и не блокируют запись остальных.
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Mapping, Optional
+
+from loguru import logger
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+
+from cor_pass.config.config import settings
+from worker.db_operations import create_full_device_measurements
+
+
+_DATETIME_FIELDS = ("measured_at", "created_at")
+REJECTED_DIR = "rejected"
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """Ошибка связи с БД (стоит повторить позже), а не отказ принять данные."""
+    if isinstance(error, (OSError, asyncio.TimeoutError, OperationalError, InterfaceError)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+class MeasurementWriter:
+    def __init__(
+        self,
+        flush_size: int = 200,
+        flush_interval: float = 5.0,
+        max_pending: int = 5000,
+        spool_dir: str = "measurement_spool",
+        spool_max_mb: int = 512,
+        session_maker: Optional[Callable] = None,
+    ):
+        if flush_size < 1 or max_pending < flush_size:
+            raise ValueError("Нужно 1 <= flush_size <= max_pending")
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.spool_dir = Path(spool_dir)
+        self.spool_max_bytes = spool_max_mb * 1024 * 1024
+        if session_maker is None:
+            from cor_pass.database.db import async_session_maker as session_maker
+        self._session_maker = session_maker
+        self._buffer: Deque[dict] = deque()
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "written": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "spooled": 0,
+            "replayed": 0,
+            "spool_dropped": 0,
+            "rejected": 0,
+            "last_flush_s": 0.0,
+        }
+
+    def start(self):
+        """Запускает фоновую запись (вызывается автоматически из submit)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновую запись, дописывает буфер, недописанное сохраняет на диск."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if not await self.flush() and self._buffer:
+            count = len(self._buffer)
+            await self._spool(list(self._buffer))
+            self._buffer.clear()
+            logger.warning(f"⚠️ БД недоступна при остановке: {count} измерений сохранены в {self.spool_dir}")
+
+    async def submit(self, measurement: Mapping[str, Any]) -> None:
+        """
+        Ставит измерение (поля CerboMeasurement) в очередь на запись.
+
+        id и created_at назначаются здесь, чтобы повторная запись из буфера
+        или с диска давала ту же строку.
+        """
+        row = dict(measurement)
+        row.setdefault("id", str(uuid.uuid4()))
+        row.setdefault("created_at", datetime.now())
+        self.start()
+        self._buffer.append(row)
+        if len(self._buffer) > self.max_pending:
+            # Сбрасываем на диск пачкой flush_size: один файл — одна транзакция при дописывании
+            evict = max(self.flush_size, len(self._buffer) - self.max_pending)
+            overflow = [self._buffer.popleft() for _ in range(evict)]
+            await self._spool(overflow)
+        if len(self._buffer) >= self.flush_size:
+            self._flush_requested.set()
+
+    async def _run(self):
+        await self.replay_spool()
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            if await self.flush():
+                await self.replay_spool()
+            else:
+                # БД недоступна — не повторяем чаще, чем раз в flush_interval
+                await asyncio.sleep(self.flush_interval)
+
+    async def _write(self, rows: List[dict]) -> None:
+        async with self._session_maker() as db:
+            await create_full_device_measurements(db, rows)
+            await db.commit()
+
+    async def flush(self) -> bool:
+        """Пишет весь буфер пачками по flush_size. False — запись не удалась, измерения остались в буфере."""
+        async with self._flush_lock:
+            while self._buffer:
+                batch = [self._buffer.popleft() for _ in range(min(self.flush_size, len(self._buffer)))]
+                started = time.perf_counter()
+                try:
+                    await self._write(batch)
+                except asyncio.CancelledError:
+                    # stop() отменил запись на середине: пачка остаётся в буфере, её допишет stop()
+                    self._buffer.extendleft(reversed(batch))
+                    raise
+                except Exception as e:
+                    self._stats["failed_flushes"] += 1
+                    if not is_connection_error(e):
+                        await self._reject(batch, e)
+                        continue
+                    logger.error(f"❌ Ошибка записи {len(batch)} измерений: {e}")
+                    self._buffer.extendleft(reversed(batch))
+                    return False
+                self._stats["written"] += len(batch)
+                self._stats["flushes"] += 1
+                self._stats["last_flush_s"] = round(time.perf_counter() - started, 4)
+            return True
+
+    def _spool_files(self) -> List[Path]:
+        if not self.spool_dir.is_dir():
+            return []
+        return sorted(self.spool_dir.glob("*.jsonl"))
+
+    @staticmethod
+    def _dump_rows(directory: Path, rows: List[dict]) -> Path:
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{time.time_ns():020d}.jsonl"
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps({
+                    key: value.isoformat() if key in _DATETIME_FIELDS else value
+                    for key, value in row.items()
+                }) + "\n")
+        tmp.replace(path)
+        return path
+
+    def _write_spool_file(self, rows: List[dict]) -> None:
+        self._dump_rows(self.spool_dir, rows)
+
+        files = self._spool_files()
+        sizes = {file: file.stat().st_size for file in files}
+        total = sum(sizes.values())
+        for file in files[:-1]:
+            if total <= self.spool_max_bytes:
+                break
+            with file.open(encoding="utf-8") as f:
+                self._stats["spool_dropped"] += sum(1 for _ in f)
+            total -= sizes[file]
+            file.unlink()
+            logger.warning(f"⚠️ Папка {self.spool_dir} переполнена, удалён {file.name}")
+
+    async def _spool(self, rows: List[dict]) -> None:
+        await asyncio.to_thread(self._write_spool_file, rows)
+        self._stats["spooled"] += len(rows)
+
+    async def _reject(self, rows: List[dict], error: Exception) -> None:
+        path = await asyncio.to_thread(self._dump_rows, self.spool_dir / REJECTED_DIR, rows)
+        self._stats["rejected"] += len(rows)
+        logger.error(f"❌ БД отвергла {len(rows)} измерений ({error}), сохранены в {path}")
+
+    def _quarantine(self, path: Path, count: int, error: Exception) -> None:
+        rejected = self.spool_dir / REJECTED_DIR
+        rejected.mkdir(exist_ok=True)
+        path.replace(rejected / path.name)
+        self._stats["rejected"] += count
+        logger.error(f"❌ Не удалось записать {path.name} ({error}), файл перенесён в {rejected}")
+
+    @staticmethod
+    def _read_spool_file(path: Path) -> List[dict]:
+        rows = []
+        with path.open(encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                for key in _DATETIME_FIELDS:
+                    row[key] = datetime.fromisoformat(row[key])
+                rows.append(row)
+        return rows
+
+    async def replay_spool(self) -> int:
+        """Дописывает в БД сохранённые на диск измерения. Возвращает число записанных."""
+        replayed = 0
+        async with self._flush_lock:
+            for path in self._spool_files():
+                try:
+                    rows = await asyncio.to_thread(self._read_spool_file, path)
+                except FileNotFoundError:
+                    continue  # удалён при переполнении папки
+                except (ValueError, KeyError) as e:
+                    self._quarantine(path, 0, e)
+                    continue
+                try:
+                    await self._write(rows)
+                except Exception as e:
+                    if is_connection_error(e):
+                        logger.error(f"❌ Не удалось дописать {path.name} из {self.spool_dir}: {e}")
+                        break
+                    # Файл, который БД не примет, не должен блокировать следующие
+                    self._quarantine(path, len(rows), e)
+                    continue
+                path.unlink()
+                replayed += len(rows)
+        if replayed:
+            self._stats["replayed"] += replayed
+            logger.info(f"✅ Дописано {replayed} измерений из {self.spool_dir}")
+        return replayed
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "pending": len(self._buffer),
+            "spool_files": len(self._spool_files()),
+            "flush_size": self.flush_size,
+            "flush_interval": self.flush_interval,
+            "max_pending": self.max_pending,
+        }
+
+
+_writer: Optional[MeasurementWriter] = None
+
+
+def get_measurement_writer() -> MeasurementWriter:
+    """Общий для воркера писатель cerbo_measurements с параметрами из настроек."""
+    global _writer
+    if _writer is None:
+        _writer = MeasurementWriter(
+            flush_size=settings.measurement_flush_size,
+            flush_interval=settings.measurement_flush_interval,
+            max_pending=settings.measurement_max_pending,
+            spool_dir=settings.measurement_spool_dir,
+            spool_max_mb=settings.measurement_spool_max_mb,
+        )
+    return _writer
@@ -3,10 +3,15 @@ Modbus Request Broker - централизованный обработчик з
 
 Паттерн: Command Queue с приоритизацией.
 Обеспечивает строгую очерёдность и сериализацию всех операций с Modbus устройствами.
+
+Чтения объединяются: одинаковое чтение, которое уже ждёт в очереди или
+выполняется, не ставится повторно — вызывающие получают общий результат;
+стоящие в очереди чтения того же slave/функции, смежные или пересекающиеся
+с выбранным, выполняются одним блочным запросом (до 125 регистров).
 """
 import asyncio
-from typing import Optional, Dict, Any, Union, Callable, Awaitable
-from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Tuple, Union, Callable, Awaitable
+from dataclasses import dataclass, field, replace
 from enum import IntEnum
 from datetime import datetime
 from loguru import logger
@@ -18,6 +23,10 @@ from .modbus_client import (
 )
 
 
+# Максимум регистров в одном чтении (функции 3/4 Modbus)
+MAX_READ_REGISTERS = 125
+
+
 class RequestPriority(IntEnum):
     """Приоритеты запросов (меньше = выше приоритет)."""
     CRITICAL = 0      # Критичные операции
@@ -54,6 +63,18 @@ class ModbusRequest:
     # Метаданные
     request_id: str = field(compare=False, default="")
     timeout: float = field(compare=False, default=10.0)
+    enqueued_at: float = field(compare=False, default=0.0)  # loop.time() постановки в очередь
+    
+    @property
+    def read_range(self) -> Tuple[int, int]:
+        """[start, end) читаемых регистров."""
+        start = self.params["start"]
+        return start, start + self.params["count"]
+    
+    @property
+    def merge_key(self) -> tuple:
+        """Чтения с одинаковым ключом можно объединять в один блок."""
+        return (self.protocol, self.slave_id, self.params.get("func_code", 3))
 
 
 class ModbusBroker:
@@ -65,7 +86,8 @@ class ModbusBroker:
     - Один воркер на устройство (host:port)
     - Автоматическое управление воркерами (создание/остановка)
     - Таймауты на уровне запросов
-    - Метрики и статистика
+    - Дедупликация одинаковых чтений и объединение смежных в блоки
+    - Метрики и статистика, включая глубину очереди и ожидание по приоритетам
     """
     
     def __init__(self):
@@ -81,6 +103,13 @@ class ModbusBroker:
         # Статистика
         self._stats: Dict[str, Dict[str, int]] = {}
         
+        # Ожидающие запросы и время ожидания: device_key -> priority -> значения
+        self._queued: Dict[str, Dict[int, int]] = {}
+        self._wait_stats: Dict[str, Dict[int, Dict[str, float]]] = {}
+        
+        # Одинаковые чтения в очереди/в работе: ключ чтения -> запрос
+        self._inflight_reads: Dict[tuple, ModbusRequest] = {}
+        
         # Глобальная блокировка для управления воркерами
         self._management_lock = asyncio.Lock()
         
@@ -102,6 +131,13 @@ class ModbusBroker:
                 "failed_requests": 0,
                 "timeout_requests": 0,
                 "queue_size": 0,
+                "deduplicated_requests": 0,
+                "coalesced_requests": 0,
+                "block_reads": 0,
+            }
+            self._queued[device_key] = {p: 0 for p in RequestPriority}
+            self._wait_stats[device_key] = {
+                p: {"count": 0, "total_s": 0.0, "max_s": 0.0} for p in RequestPriority
             }
     
     async def _ensure_worker(self, device_key: str, protocol: str, host: str, port: int, slave_id: int = 1, object_id: Optional[str] = None):
@@ -153,49 +189,24 @@ class ModbusBroker:
                 except asyncio.TimeoutError:
                     continue
                 
+                block = [request]
+                if request.operation == "read":
+                    block += self._take_mergeable_reads(queue, request)
+                
                 # Обновляем статистику очереди
                 self._stats[device_key]["queue_size"] = queue.qsize()
-                self._stats[device_key]["total_requests"] += 1
+                now = asyncio.get_running_loop().time()
+                for item in block:
+                    self._record_dequeue(device_key, item, now)
                 
-                logger.debug(
-                    f"📨 [{device_key}] Processing request {request.request_id} "
-                    f"(priority={request.priority}, queue_size={queue.qsize()})"
-                )
-                
-                # Обрабатываем запрос с таймаутом
                 try:
-                    result = await asyncio.wait_for(
-                        self._execute_request(request),
-                        timeout=request.timeout
-                    )
-                    
-                    if not request.future.done():
-                        request.future.set_result(result)
-                    
-                    self._stats[device_key]["completed_requests"] += 1
-                    
-                except asyncio.TimeoutError:
-                    logger.warning(
-                        f"⏱️ [{device_key}] Request {request.request_id} timeout "
-                        f"({request.timeout}s)"
-                    )
-                    if not request.future.done():
-                        request.future.set_exception(
-                            TimeoutError(f"Modbus request timeout after {request.timeout}s")
-                        )
-                    self._stats[device_key]["timeout_requests"] += 1
-                    
-                except Exception as e:
-                    logger.error(
-                        f"❌ [{device_key}] Request {request.request_id} failed: {e}",
-                        exc_info=True
-                    )
-                    if not request.future.done():
-                        request.future.set_exception(e)
-                    self._stats[device_key]["failed_requests"] += 1
-                
+                    if len(block) == 1:
+                        await self._process_request(device_key, request)
+                    else:
+                        await self._process_read_block(device_key, block)
                 finally:
-                    queue.task_done()
+                    for _ in block:
+                        queue.task_done()
         
         except asyncio.CancelledError:
             logger.info(f"🛑 [{device_key}] Worker cancelled")
@@ -203,6 +214,130 @@ class ModbusBroker:
         except Exception as e:
             logger.error(f"❗ [{device_key}] Worker crashed: {e}", exc_info=True)
     
+    def _record_dequeue(self, device_key: str, request: ModbusRequest, now: float):
+        """Учитывает взятый из очереди запрос в метриках по приоритетам."""
+        priority = RequestPriority(request.priority)
+        self._queued[device_key][priority] -= 1
+        wait = max(now - request.enqueued_at, 0.0)
+        wait_stats = self._wait_stats[device_key][priority]
+        wait_stats["count"] += 1
+        wait_stats["total_s"] += wait
+        wait_stats["max_s"] = max(wait_stats["max_s"], wait)
+        self._stats[device_key]["total_requests"] += 1
+    
+    def _take_mergeable_reads(
+        self, queue: asyncio.PriorityQueue, head: ModbusRequest
+    ) -> List[ModbusRequest]:
+        """
+        Забирает из очереди чтения, которые вместе с head образуют непрерывный
+        диапазон не длиннее MAX_READ_REGISTERS. Остальное возвращается в очередь.
+        """
+        pending = []
+        while True:
+            try:
+                pending.append(queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        
+        # Запросы с равными priority/timestamp равны при сравнении, поэтому учёт по id()
+        low, high = head.read_range
+        taken: Dict[int, ModbusRequest] = {}
+        candidates = [
+            r for r in pending if r.operation == "read" and r.merge_key == head.merge_key
+        ]
+        extended = True
+        while extended:
+            extended = False
+            for candidate in candidates:
+                start, end = candidate.read_range
+                if id(candidate) in taken or start > high or end < low:
+                    continue
+                if max(high, end) - min(low, start) <= MAX_READ_REGISTERS:
+                    low, high = min(low, start), max(high, end)
+                    taken[id(candidate)] = candidate
+                    extended = True
+        
+        for item in pending:
+            if id(item) not in taken:
+                queue.put_nowait(item)
+                queue.task_done()  # put_nowait снова увеличил счётчик незавершённых
+        return list(taken.values())
+    
+    async def _process_request(self, device_key: str, request: ModbusRequest):
+        """Выполняет один запрос и передаёт результат в его future."""
+        logger.debug(
+            f"📨 [{device_key}] Processing request {request.request_id} "
+            f"(priority={request.priority})"
+        )
+        try:
+            result = await asyncio.wait_for(
+                self._execute_request(request),
+                timeout=request.timeout
+            )
+            
+            if not request.future.done():
+                request.future.set_result(result)
+            
+            self._stats[device_key]["completed_requests"] += 1
+            
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"⏱️ [{device_key}] Request {request.request_id} timeout "
+                f"({request.timeout}s)"
+            )
+            if not request.future.done():
+                request.future.set_exception(
+                    TimeoutError(f"Modbus request timeout after {request.timeout}s")
+                )
+            self._stats[device_key]["timeout_requests"] += 1
+            
+        except Exception as e:
+            logger.error(
+                f"❌ [{device_key}] Request {request.request_id} failed: {e}",
+                exc_info=True
+            )
+            if not request.future.done():
+                request.future.set_exception(e)
+            self._stats[device_key]["failed_requests"] += 1
+    
+    async def _process_read_block(self, device_key: str, block: List[ModbusRequest]):
+        """
+        Выполняет смежные чтения одним запросом и раздаёт каждому его срез.
+        Если блочное чтение не удалось (например, устройство отвергло часть
+        адресов), чтения выполняются по отдельности.
+        """
+        low = min(r.read_range[0] for r in block)
+        high = max(r.read_range[1] for r in block)
+        head = min(block)
+        merged = replace(
+            head,
+            params={**head.params, "start": low, "count": high - low},
+            future=asyncio.get_running_loop().create_future(),
+            request_id=f"block_{low}_{high}",
+            timeout=max(r.timeout for r in block),
+        )
+        try:
+            result = await asyncio.wait_for(self._execute_request(merged), timeout=merged.timeout)
+            data = result["data"]
+            if len(data) < high - low:
+                raise RuntimeError(f"short block response: {len(data)} of {high - low}")
+        except Exception as e:
+            logger.warning(
+                f"⚠️ [{device_key}] Block read {low}-{high} failed ({e!r}), "
+                f"reading {len(block)} requests separately"
+            )
+            for request in block:
+                await self._process_request(device_key, request)
+            return
+        
+        self._stats[device_key]["block_reads"] += 1
+        self._stats[device_key]["coalesced_requests"] += len(block) - 1
+        for request in block:
+            start, end = request.read_range
+            if not request.future.done():
+                request.future.set_result({"ok": True, "data": data[start - low:end - low]})
+            self._stats[device_key]["completed_requests"] += 1
+    
     async def _execute_request(self, request: ModbusRequest) -> Dict[str, Any]:
         """Выполняет Modbus запрос."""
         # Получаем клиент
@@ -241,7 +376,7 @@ class ModbusBroker:
         
         # Modbus OVER TCP
         if isinstance(client, ModbusTCP):
-            result = client.read(start=start, count=count, func=func_code)
+            result = await client.read(start=start, count=count, func=func_code)
             
             if not result.get("ok"):
                 raise RuntimeError(result.get("error", "Unknown error"))
@@ -273,7 +408,7 @@ class ModbusBroker:
         
         # Modbus OVER TCP
         if isinstance(client, ModbusTCP):
-            result = client.write_single(address=address, value=value)
+            result = await client.write_single(address=address, value=value)
             
             if not result.get("ok"):
                 raise RuntimeError(result.get("error", "Unknown error"))
@@ -300,7 +435,7 @@ class ModbusBroker:
         
         # Modbus OVER TCP
         if isinstance(client, ModbusTCP):
-            result = client.write_multiple(address=address, values=values)
+            result = await client.write_multiple(address=address, values=values)
             
             if not result.get("ok"):
                 raise RuntimeError(result.get("error", "Unknown error"))
@@ -356,6 +491,20 @@ class ModbusBroker:
         # Гарантируем что воркер запущен
         await self._ensure_worker(device_key, protocol, host, port, slave_id, object_id)
         
+        # Такое же чтение уже ждёт или выполняется - ждём его результат.
+        # К чтению с более низким приоритетом не присоединяемся: иначе
+        # пользовательский запрос стоял бы в очереди за фоновым опросом
+        read_key = None
+        if operation == "read":
+            read_key = (
+                device_key, slave_id, params.get("func_code", 3), params["start"], params["count"]
+            )
+            shared = self._inflight_reads.get(read_key)
+            if shared is not None and not shared.future.done() and shared.priority <= priority:
+                self._stats[device_key]["deduplicated_requests"] += 1
+                result = await asyncio.wait_for(asyncio.shield(shared.future), timeout=timeout)
+                return {**result, "data": list(result["data"])}
+        
         # Создаём запрос
         request = ModbusRequest(
             priority=priority,
@@ -368,10 +517,18 @@ class ModbusBroker:
             params=params,
             timeout=timeout,
             request_id=request_id or f"{operation}_{datetime.now().timestamp()}",
+            enqueued_at=asyncio.get_running_loop().time(),
         )
+        if read_key is not None:
+            self._inflight_reads[read_key] = request
+            request.future.add_done_callback(
+                lambda future: self._inflight_reads.pop(read_key, None)
+                if self._inflight_reads.get(read_key) is request else None
+            )
         
         # Добавляем в очередь
         queue = self._queues[device_key]
+        self._queued[device_key][RequestPriority(priority)] += 1
         await queue.put(request)
         
         logger.debug(
@@ -379,8 +536,9 @@ class ModbusBroker:
             f"(priority={priority}, queue_size={queue.qsize()})"
         )
         
-        # Ждём результат
-        result = await request.future
+        # Ждём результат; shield - чтобы отмена вызывающего не отменила
+        # общий результат для тех, кто присоединился к этому чтению
+        result = await asyncio.shield(request.future)
         return result
     
     async def stop_worker(self, protocol: str, host: str, port: int, object_id: Optional[str] = None):
@@ -425,14 +583,30 @@ class ModbusBroker:
         
         logger.info("✅ All Modbus workers stopped")
     
-    def get_stats(self, protocol: str, host: str, port: int, object_id: Optional[str] = None) -> Dict[str, int]:
+    def _device_stats(self, device_key: str) -> Dict[str, Any]:
+        if device_key not in self._stats:
+            return {}
+        stats: Dict[str, Any] = self._stats[device_key].copy()
+        priorities = {}
+        for priority in RequestPriority:
+            wait = self._wait_stats[device_key][priority]
+            priorities[priority.name] = {
+                "queue_depth": self._queued[device_key][priority],
+                "dequeued": int(wait["count"]),
+                "wait_avg_s": wait["total_s"] / wait["count"] if wait["count"] else 0.0,
+                "wait_max_s": wait["max_s"],
+            }
+        stats["priorities"] = priorities
+        return stats
+    
+    def get_stats(self, protocol: str, host: str, port: int, object_id: Optional[str] = None) -> Dict[str, Any]:
         """Возвращает статистику для устройства."""
         device_key = self._make_device_key(protocol, host, port, object_id)
-        return self._stats.get(device_key, {}).copy()
+        return self._device_stats(device_key)
     
-    def get_all_stats(self) -> Dict[str, Dict[str, int]]:
+    def get_all_stats(self) -> Dict[str, Dict[str, Any]]:
         """Возвращает статистику для всех устройств."""
-        return {k: v.copy() for k, v in self._stats.items()}
+        return {k: self._device_stats(k) for k in self._stats}
 
 
 # Глобальный экземпляр брокера
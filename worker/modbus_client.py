@@ -1,12 +1,12 @@
-from typing import Optional, Dict, Union
+from typing import Optional, Dict, List, Union
 import asyncio
 import os
 from loguru import logger
 from pymodbus.client import AsyncModbusTcpClient
 from datetime import datetime
-import socket
 import struct
-from threading import Lock
+
+from worker.register_decoding import modbus_crc16
 
 error_count = 0
 _error_stats: Dict[str, Dict] = {}
@@ -19,6 +19,11 @@ _modbus_tcp_clients: Dict[str, AsyncModbusTcpClient] = {}
 # Modbus OVER_TCP protocol - строго 1 клиент на энергообъект
 _modbus_over_tcp_clients: Dict[str, 'ModbusTCP'] = {}
 
+# Дополнительные подключения Modbus TCP для параллельного опроса юнитов:
+# клиент pymodbus выполняет запросы по одному, поэтому параллельные чтения
+# одного Cerbo идут через несколько подключений
+_modbus_tcp_read_lanes: Dict[str, List[AsyncModbusTcpClient]] = {}
+
 # Конфигурация Modbus (используется как дефолтный порт если не указан в объекте)
 DEFAULT_MODBUS_PORT = 502
 BATTERY_ID = 225
@@ -89,53 +94,148 @@ CONNECT_MAX_DELAY = 8.0
 
 class ModbusTCP:
     """
-    Modbus OVER TCP клиент для инверторов Deye.
+    Modbus OVER TCP клиент для инверторов Deye (RTU-кадры поверх TCP).
     Каждый энергообъект должен иметь свой экземпляр класса.
+
+    Работает на asyncio-потоках: запрос и ответ ограничены таймаутом, ответ
+    дочитывается ровно до длины кадра, которую задают функция и счётчик
+    байт в заголовке. Операции сериализуются asyncio.Lock, поэтому медленный
+    инвертор задерживает только свои запросы. После неудачного подключения
+    следующие попытки откладываются с экспоненциальной паузой.
     """
-    
-    def __init__(self, host: str, port: int = 502, slave_id: int = 1, timeout: int = 3):
+
+    def __init__(self, host: str, port: int = 502, slave_id: int = 1, timeout: float = 3):
         self.host = host
         self.port = port
         self.slave_id = slave_id
         self.timeout = timeout
-        self.sock = None
-        self.lock = Lock()
-
-    @staticmethod
-    def modbus_crc16(data: bytes) -> int:
-        """Вычисляет CRC16 для Modbus."""
-        crc = 0xFFFF
-        for b in data:
-            crc ^= b
-            for _ in range(8):
-                crc = (crc >> 1) ^ 0xA001 if (crc & 1) else crc >> 1
-        return crc
-
-    def connect(self) -> bool:
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.lock = asyncio.Lock()
+        self._reconnect_delay = 0.0
+        self._next_connect_at = 0.0
+
+    modbus_crc16 = staticmethod(modbus_crc16)
+
+    @property
+    def connected(self) -> bool:
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def connect(self) -> bool:
         """Подключается к Modbus серверу."""
-        self.close()
+        await self.close()
+        loop = asyncio.get_running_loop()
         try:
-            s = socket.create_connection((self.host, self.port), timeout=self.timeout)
-            s.settimeout(self.timeout)
-            self.sock = s
-            logger.info(f"[ModbusTCP] ✅ Подключено к {self.host}:{self.port}")
-            return True
-        except Exception as e:
-            logger.error(f"[ModbusTCP] ❌ Ошибка подключения к {self.host}:{self.port}: {e}")
-            self.sock = None
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), timeout=self.timeout
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            self._reconnect_delay = min(
+                max(self._reconnect_delay * 2, CONNECT_BASE_DELAY), CONNECT_MAX_DELAY
+            )
+            self._next_connect_at = loop.time() + self._reconnect_delay
+            logger.error(f"[ModbusTCP] ❌ Ошибка подключения к {self.host}:{self.port}: {e!r}")
             return False
+        self._reconnect_delay = 0.0
+        self._next_connect_at = 0.0
+        logger.info(f"[ModbusTCP] ✅ Подключено к {self.host}:{self.port}")
+        return True
 
-    def close(self):
+    async def close(self):
         """Закрывает соединение."""
-        if self.sock:
-            try:
-                self.sock.close()
-                logger.debug(f"[ModbusTCP] 🔌 Соединение закрыто для {self.host}:{self.port}")
-            except Exception as e:
-                logger.warning(f"[ModbusTCP] ⚠️ Ошибка при закрытии соединения: {e}")
-        self.sock = None
+        writer, self.reader, self.writer = self.writer, None, None
+        if writer is None:
+            return
+        try:
+            writer.close()
+            await writer.wait_closed()
+            logger.debug(f"[ModbusTCP] 🔌 Соединение закрыто для {self.host}:{self.port}")
+        except Exception as e:
+            logger.warning(f"[ModbusTCP] ⚠️ Ошибка при закрытии соединения: {e}")
 
-    def read(self, start: int, count: int, func: int = 3) -> Dict:
+    async def _ensure_connected(self) -> Optional[str]:
+        if self.connected:
+            return None
+        wait = self._next_connect_at - asyncio.get_running_loop().time()
+        if wait > 0:
+            return f"Ошибка подключения (повтор через {wait:.1f}s)"
+        if not await self.connect():
+            return "Ошибка подключения"
+        return None
+
+    def _frame(self, body: bytes) -> bytes:
+        return body + struct.pack("<H", self.modbus_crc16(body))
+
+    async def _read_response(self, func: int, fixed_length: Optional[int]) -> bytes:
+        """
+        Читает один кадр ответа. fixed_length — полная длина ответа для
+        функций записи; для чтения длина берётся из байта счётчика.
+        """
+        head = await self.reader.readexactly(3)
+        if head[1] & 0x80:
+            rest = await self.reader.readexactly(2)  # код исключения уже в head[2], дальше CRC
+        elif fixed_length is None:
+            rest = await self.reader.readexactly(head[2] + 2)
+        else:
+            rest = await self.reader.readexactly(fixed_length - 3)
+        return head + rest
+
+    def _crc_error(self, response: bytes) -> Optional[str]:
+        recv_crc = response[-2] | (response[-1] << 8)
+        calc_crc = self.modbus_crc16(response[:-2])
+        if calc_crc != recv_crc:
+            return f"Ошибка CRC: ожидалось {hex(calc_crc)}, получено {hex(recv_crc)}"
+        return None
+
+    def _check_response(self, response: bytes, func: int) -> Optional[str]:
+        if response[0] != self.slave_id:
+            return f"Ответ от другого устройства: slave {response[0]}"
+        if response[1] == func | 0x80:
+            return f"Modbus исключение: код {response[2]}"
+        if response[1] != func:
+            return f"Неожиданная функция в ответе: {response[1]}"
+        return None
+
+    async def _transaction(
+        self, request: bytes, func: int, fixed_length: Optional[int] = None
+    ) -> Dict:
+        """Отправляет кадр и читает ответ; при сбое соединение закрывается."""
+        error = await self._ensure_connected()
+        if error:
+            return {"ok": False, "error": error}
+        try:
+            self.writer.write(request)
+            await asyncio.wait_for(self.writer.drain(), timeout=self.timeout)
+            response = await asyncio.wait_for(
+                self._read_response(func, fixed_length), timeout=self.timeout
+            )
+        except asyncio.TimeoutError:
+            # Поздний ответ сдвинул бы следующие кадры, поэтому переподключаемся
+            await self.close()
+            return {"ok": False, "error": "Таймаут - устройство не ответило"}
+        except asyncio.CancelledError:
+            # Отмена снаружи (wait_for брокера) посреди кадра — по той же причине
+            await self.close()
+            raise
+        except asyncio.IncompleteReadError:
+            await self.close()
+            return {"ok": False, "error": "Соединение закрыто до получения полного ответа"}
+        except OSError as e:
+            await self.close()
+            return {"ok": False, "error": f"Ошибка обмена с устройством: {e}"}
+
+        error = self._crc_error(response)
+        if error:
+            # Кадр повреждён, длина могла быть прочитана неверно — граница
+            # следующего ответа неизвестна, поэтому переподключаемся
+            await self.close()
+            return {"ok": False, "error": error}
+        error = self._check_response(response, func)
+        if error:
+            return {"ok": False, "error": error}
+        return {"ok": True, "response": response}
+
+    async def read(self, start: int, count: int, func: int = 3) -> Dict:
         """
         Читает регистры Modbus.
         
@@ -147,54 +247,23 @@ class ModbusTCP:
         Returns:
             Dict с результатом: {"ok": bool, "data": list или "error": str}
         """
-        with self.lock:
-            # Если нет соединения - пытаемся подключиться
-            if not self.sock:
-                if not self.connect():
-                    return {"ok": False, "error": "Ошибка подключения"}
-
-            # Формируем запрос
-            frame = struct.pack(">B B H H", self.slave_id, func, start, count)
-            crc = self.modbus_crc16(frame)
-            frame += struct.pack("<H", crc)
-
-            try:
-                self.sock.sendall(frame)
-            except Exception as e:
-                self.close()
-                return {"ok": False, "error": f"Ошибка отправки запроса: {str(e)}"}
-
-            try:
-                response = self.sock.recv(256)
-            except socket.timeout:
-                return {"ok": False, "error": "Таймаут - устройство не ответило"}
-            except Exception as e:
-                self.close()
-                return {"ok": False, "error": f"Ошибка при получении ответа: {str(e)}"}
-
-            if not response:
-                return {"ok": False, "error": "Ответ пустой - устройство не ответило"}
-
-            # Проверяем CRC
-            data = response[:-2]
-            recv_crc = (response[-1] << 8) | response[-2]
-            calc_crc = self.modbus_crc16(data)
-
-            if calc_crc != recv_crc:
-                return {"ok": False, "error": f"Ошибка CRC: ожидалось {hex(calc_crc)}, получено {hex(recv_crc)}"}
-
-            # Парсим ответ
-            try:
-                byte_count = response[2]
-                values = []
-                for i in range(0, byte_count, 2):
-                    v = (response[3 + i] << 8) | response[4 + i]
-                    values.append(v)
-                return {"ok": True, "data": values}
-            except Exception as e:
-                return {"ok": False, "error": f"Некорректный формат ответа: {str(e)}"}
+        async with self.lock:
+            result = await self._transaction(
+                self._frame(struct.pack(">B B H H", self.slave_id, func, start, count)), func
+            )
+        if not result["ok"]:
+            return result
+
+        response = result["response"]
+        byte_count = response[2]
+        if byte_count != count * 2:
+            return {
+                "ok": False,
+                "error": f"Некорректный формат ответа: {byte_count} байт вместо {count * 2}",
+            }
+        return {"ok": True, "data": list(struct.unpack(f">{count}H", response[3:3 + byte_count]))}
 
-    def write_single(self, address: int, value: int) -> Dict:
+    async def write_single(self, address: int, value: int) -> Dict:
         """
         Записывает одиночный регистр.
         
@@ -205,24 +274,17 @@ class ModbusTCP:
         Returns:
             Dict с результатом
         """
-        with self.lock:
-            if not self.sock:
-                if not self.connect():
-                    return {"ok": False, "error": "Ошибка подключения"}
-
-            frame = struct.pack(">B B H H", self.slave_id, 6, address, value)
-            crc = self.modbus_crc16(frame)
-            frame += struct.pack("<H", crc)
-
-            try:
-                self.sock.sendall(frame)
-                resp = self.sock.recv(256)
-                return {"ok": True, "data": resp.hex()}
-            except Exception as e:
-                self.close()
-                return {"ok": False, "error": f"Ошибка записи регистра: {str(e)}"}
-
-    def write_multiple(self, address: int, values: list) -> Dict:
+        async with self.lock:
+            result = await self._transaction(
+                self._frame(struct.pack(">B B H H", self.slave_id, 6, address, value)),
+                6,
+                fixed_length=8,
+            )
+        if not result["ok"]:
+            return result
+        return {"ok": True, "data": result["response"].hex()}
+
+    async def write_multiple(self, address: int, values: list) -> Dict:
         """
         Записывает несколько регистров.
         
@@ -233,28 +295,13 @@ class ModbusTCP:
         Returns:
             Dict с результатом
         """
-        with self.lock:
-            if not self.sock:
-                if not self.connect():
-                    return {"ok": False, "error": "Ошибка подключения"}
-
-            count = len(values)
-            byte_count = count * 2
-            frame = struct.pack(">B B H H B", self.slave_id, 16, address, count, byte_count)
-
-            for v in values:
-                frame += struct.pack(">H", v)
-
-            crc = self.modbus_crc16(frame)
-            frame += struct.pack("<H", crc)
-
-            try:
-                self.sock.sendall(frame)
-                resp = self.sock.recv(256)
-                return {"ok": True, "data": resp.hex()}
-            except Exception as e:
-                self.close()
-                return {"ok": False, "error": f"Ошибка записи: {str(e)}"}
+        count = len(values)
+        body = struct.pack(f">B B H H B {count}H", self.slave_id, 16, address, count, count * 2, *values)
+        async with self.lock:
+            result = await self._transaction(self._frame(body), 16, fixed_length=8)
+        if not result["ok"]:
+            return result
+        return {"ok": True, "data": result["response"].hex()}
 
 
 async def get_or_create_modbus_client(
@@ -363,17 +410,17 @@ async def get_or_create_modbus_client(
             while attempt <= CONNECT_MAX_RETRIES:
                 new_client = ModbusTCP(host=ip_address, port=port, slave_id=slave_id, timeout=3)
                 try:
-                    if new_client.connect():
+                    if await new_client.connect():
                         logger.info(f"[{object_key}] ✅ Modbus OVER TCP клиент {object_key} создан и подключен (attempt {attempt+1})")
                         _modbus_over_tcp_clients[object_key] = new_client
                         return new_client
                     else:
                         last_error = "connect() returned False"
-                        new_client.close()
+                        await new_client.close()
                 except Exception as e:
                     last_error = str(e)
                     try:
-                        new_client.close()
+                        await new_client.close()
                     except Exception:
                         pass
 
@@ -395,6 +442,54 @@ async def get_or_create_modbus_client(
         return None
 
 
+async def get_modbus_read_lanes(
+    ip_address: str,
+    port: int = None,
+    object_id: str = None,
+    count: int = 1,
+) -> List[AsyncModbusTcpClient]:
+    """
+    Возвращает до count подключений Modbus TCP к одному устройству.
+
+    Первое подключение — общий клиент из get_or_create_modbus_client,
+    остальные создаются по одной попытке без повторов: если устройство не
+    принимает больше подключений, опрос просто идёт через меньшее их число.
+    Пустой список — основной клиент недоступен.
+    """
+    primary = await get_or_create_modbus_client(
+        protocol="modbus_tcp", ip_address=ip_address, port=port, object_id=object_id
+    )
+    if not primary or not primary.connected:
+        return []
+
+    port = port or DEFAULT_MODBUS_PORT
+    client_key = f"{ip_address}:{port}"
+    lanes = [lane for lane in _modbus_tcp_read_lanes.get(client_key, []) if lane.connected]
+    while len(lanes) < count - 1:
+        lane = AsyncModbusTcpClient(host=ip_address, port=port, timeout=5)
+        try:
+            await lane.connect()
+        except Exception as e:
+            logger.warning(f"[{object_id or client_key}] ⚠️ Дополнительное подключение к {client_key} не создано: {e}")
+        if not lane.connected:
+            try:
+                await lane.close()
+            except Exception:
+                pass
+            break
+        lanes.append(lane)
+    _modbus_tcp_read_lanes[client_key] = lanes
+    return [primary] + lanes[: count - 1]
+
+
+async def _close_read_lanes(client_key: str):
+    for lane in _modbus_tcp_read_lanes.pop(client_key, []):
+        try:
+            await lane.close()
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка при закрытии дополнительного подключения {client_key}: {e}")
+
+
 async def close_modbus_client(protocol: str, ip_address: str, port: int = None, object_id: str = None):
     """
     Закрывает и удаляет Modbus клиент.
@@ -411,6 +506,7 @@ async def close_modbus_client(protocol: str, ip_address: str, port: int = None,
     
     if protocol == "modbus_tcp":
         client_key = f"{ip_address}:{port}"
+        await _close_read_lanes(client_key)
         if client_key in _modbus_tcp_clients:
             try:
                 await _modbus_tcp_clients[client_key].close()
@@ -424,7 +520,7 @@ async def close_modbus_client(protocol: str, ip_address: str, port: int = None,
         object_key = object_id or f"{ip_address}:{port}"
         if object_key in _modbus_over_tcp_clients:
             try:
-                _modbus_over_tcp_clients[object_key].close()
+                await _modbus_over_tcp_clients[object_key].close()
                 logger.info(f"🔌 Modbus OVER TCP клиент {object_key} закрыт")
             except Exception as e:
                 logger.warning(f"⚠️ Ошибка при закрытии Modbus OVER TCP клиента {object_key}: {e}")
@@ -447,11 +543,13 @@ async def close_all_modbus_clients():
         except Exception as e:
             logger.warning(f"⚠️ Ошибка при закрытии Modbus TCP клиента {client_key}: {e}")
     _modbus_tcp_clients.clear()
+    for client_key in list(_modbus_tcp_read_lanes):
+        await _close_read_lanes(client_key)
     
     # Закрываем Modbus OVER TCP клиентов
     for object_key, client in list(_modbus_over_tcp_clients.items()):
         try:
-            client.close()
+            await client.close()
             logger.info(f"🔌 Modbus OVER TCP клиент {object_key} закрыт")
         except Exception as e:
             logger.warning(f"⚠️ Ошибка при закрытии Modbus OVER TCP клиента {object_key}: {e}")
@@ -13,6 +13,7 @@ from .modbus_client import (
     ModbusTCP,
 )
 from .modbus_broker import get_broker, RequestPriority
+from .collection_planner import get_all_collection_stats
 
 router = APIRouter(prefix="/modbus", tags=["Modbus"])
 
@@ -87,7 +88,7 @@ async def modbus_read(
                     detail="Неверный тип клиента для modbus_over_tcp"
                 )
             
-            result = client.read(start=start, count=count, func=func_code)
+            result = await client.read(start=start, count=count, func=func_code)
             
             if not result.get("ok"):
                 raise HTTPException(
@@ -228,7 +229,7 @@ async def modbus_write_single(
                     detail="Неверный тип клиента для modbus_over_tcp"
                 )
             
-            result = client.write_single(address=address, value=value)
+            result = await client.write_single(address=address, value=value)
             
             if not result.get("ok"):
                 raise HTTPException(
@@ -341,7 +342,7 @@ async def modbus_write_multiple(
                     detail="Неверный тип клиента для modbus_over_tcp"
                 )
             
-            result = client.write_multiple(address=address, values=values)
+            result = await client.write_multiple(address=address, values=values)
             
             if not result.get("ok"):
                 raise HTTPException(
@@ -463,3 +464,28 @@ async def get_broker_stats(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка сервера: {str(e)}"
         )
+
+
+@router.get("/collection/stats")
+async def get_collection_stats(object_id: Optional[str] = None):
+    """
+    Задержки и ошибки параллельного опроса юнитов по объектам.
+    
+    Args:
+        object_id: Фильтр по ID объекта (опционально)
+        
+    Returns:
+        Для каждого юнита: число чтений и ошибок, последняя/средняя/максимальная задержка
+    """
+    all_stats = get_all_collection_stats()
+    if object_id:
+        if object_id not in all_stats:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Объект {object_id} не опрашивается"
+            )
+        return all_stats[object_id]
+    return {
+        "devices": all_stats,
+        "total_devices": len(all_stats)
+    }
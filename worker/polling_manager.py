@@ -13,7 +13,9 @@ from sqlalchemy import select
 from cor_pass.database.db import async_session_maker
 from cor_pass.database.models import DevicePollingTask, EnergeticObject
 from cor_pass.database.models.enums import PollingTaskType
-from worker.modbus_client import decode_signed_16, decode_signed_32, register_modbus_error, register_modbus_success
+from worker.modbus_client import register_modbus_error, register_modbus_success
+from worker.register_decoding import compile_device_plans
+from worker.register_sample_writer import get_register_sample_writer
 
 
 class PollingManager:
@@ -37,6 +39,12 @@ class PollingManager:
         # Кэш загруженных конфигов: filename -> config dict
         self.modbus_configs_cache: Dict[str, dict] = {}
         
+        # Скомпилированные планы декодирования: filename -> {group: plan}
+        self.decode_plans_cache: Dict[str, Dict[str, Any]] = {}
+        
+        # Пакетная запись опрошенных значений в register_samples
+        self.sample_writer = get_register_sample_writer()
+        
         # Регистрация обработчиков типов задач
         self.task_handlers: Dict[str, Callable] = {
             PollingTaskType.CERBO_COLLECTION.value: self._run_cerbo_collection_task,
@@ -59,6 +67,7 @@ class PollingManager:
         try:
             with open(config_path, 'r', encoding='utf-8') as f:
                 config = json.load(f)
+                self.decode_plans_cache[config_filename] = compile_device_plans(config)
                 self.modbus_configs_cache[config_filename] = config
                 logger.info(f"Loaded Modbus config: {config_filename}")
                 return config
@@ -251,6 +260,7 @@ class PollingManager:
         if not modbus_config:
             logger.error(f"[{task_id}] Failed to load Modbus config: {modbus_config_file}")
             return
+        decode_plans = self.decode_plans_cache[modbus_config_file]
         
         logger.debug(
             f"[{task_id}] Starting MODBUS_REGISTERS task for {object_name} "
@@ -358,50 +368,12 @@ class PollingManager:
                             
                             register_modbus_success(object_id)
                             
-                            # Обрабатываем каждый регистр в группе
-                            for register in group.get("registers", []):
-                                try:
-                                    offset = register.get("offset", 0)
-                                    reg_type = register.get("type", "uint16")
-                                    scale = register.get("scale", 1.0)
-                                    name = register["name"]
-                                    bit_index = register.get("bit", None)  # Индекс бита для извлечения
-                                    
-                                    if offset >= len(raw_registers):
-                                        logger.warning(f"[{task_id}] Offset {offset} out of range for {name}")
-                                        continue
-                                    
-                                    raw_value = raw_registers[offset]
-                                    
-                                    # Декодируем значение
-                                    if reg_type == "int16":
-                                        value = decode_signed_16(raw_value)
-                                    elif reg_type == "uint16":
-                                        value = raw_value
-                                    elif reg_type == "int32" and offset + 1 < len(raw_registers):
-                                        value = decode_signed_32(raw_registers[offset], raw_registers[offset + 1])
-                                    elif reg_type == "uint32" and offset + 1 < len(raw_registers):
-                                        value = (raw_registers[offset] << 16) | raw_registers[offset + 1]
-                                    else:
-                                        value = raw_value
-                                    
-                                    # Если нужно извлечь конкретный бит
-                                    if bit_index is not None:
-                                        logger.debug(f"[{task_id}] Bit extraction for {name}: raw={value}, bit_index={bit_index}, extracted={(int(value) >> bit_index) & 1}")
-                                        value = (int(value) >> bit_index) & 1
-                                    
-                                    # Применяем масштабирование
-                                    scaled_value = value * scale
-                                    collected_data[name] = scaled_value
-                                    
-                                    # logger.debug(
-                                    #     f"[{task_id}] {name}={scaled_value} (raw={raw_value}, scale={scale}, bit={bit_index})"
-                                    # )
-                                    
-                                except Exception as e:
-                                    logger.error(
-                                        f"[{task_id}] Error processing register {register.get('name')}: {e}"
-                                    )
+                            # Декодируем всю группу по скомпилированному плану
+                            if len(raw_registers) < count:
+                                logger.warning(
+                                    f"[{task_id}] Group '{group_name}': got {len(raw_registers)} of {count} registers"
+                                )
+                            collected_data.update(decode_plans[group_name].decode(raw_registers))
                             
                         except TimeoutError:
                             logger.warning(f"[{task_id}] Timeout reading group '{group_name}'")
@@ -412,94 +384,32 @@ class PollingManager:
                             )
                             register_modbus_error(object_id)
                     
-                    # Для modbus_tcp (Victron) читаем регистры по отдельности
+                    # Для modbus_tcp (Victron) регистры группы запрашиваются
+                    # одновременно: брокер объединит смежные в блочные чтения
                     else:
-                        for register in group.get("registers", []):
-                            try:
-                                # Чтение регистра
-                                address = register["address"]
-                                count = register.get("count", 1)
-                                reg_type = register.get("type", "uint16")
-                                scale = register.get("scale", 1.0)
-                                name = register["name"]
-                                bit_index = register.get("bit", None)  # Индекс бита для извлечения
-                                
-                                # Определяем func_code из типа функции
-                                func_code = 4  # input registers по умолчанию
-                                if "function" in register:
-                                    if register["function"] == "holding":
-                                        func_code = 3
-                                
-                                # Используем брокер с приоритетом POLLING
-                                result = await broker.submit_request(
-                                    protocol=protocol,
-                                    host=ip_address,
-                                    port=port,
-                                    operation="read",
-                                    params={"start": address, "count": count, "func_code": func_code},
-                                    slave_id=slave_id,
-                                    object_id=object_id,
-                                    priority=RequestPriority.POLLING,
-                                    timeout=8.0,
-                                    request_id=f"polling_{task_id}_{name}",
-                                )
-                                
-                                registers_data = result.get("data", [])
-                                
-                                register_modbus_success(object_id)
-                                
-                                # Декодируем значение в зависимости от типа
-                                raw_value = registers_data[0] if len(registers_data) > 0 else 0
-                                
-                                if reg_type == "int16":
-                                    value = decode_signed_16(raw_value)
-                                elif reg_type == "uint16":
-                                    value = raw_value
-                                elif reg_type == "int32" and len(registers_data) >= 2:
-                                    value = decode_signed_32(registers_data[0], registers_data[1])
-                                elif reg_type == "uint32" and len(registers_data) >= 2:
-                                    value = (registers_data[0] << 16) | registers_data[1]
-                                else:
-                                    value = raw_value
-                                
-                                # Если нужно извлечь конкретный бит
-                                if bit_index is not None:
-                                    logger.debug(f"[{task_id}] Bit extraction for {name}: raw={value}, bit_index={bit_index}, extracted={(int(value) >> bit_index) & 1}")
-                                    value = (int(value) >> bit_index) & 1
-                                
-                                # Применяем масштабирование
-                                scaled_value = value * scale
-                                
-                                collected_data[name] = scaled_value
-                                
-                                # logger.debug(
-                                #     f"[{task_id}] Read {name}={scaled_value} "
-                                #     f"(raw={raw_value}, scale={scale}, bit={bit_index})"
-                                # )
-                                
-                            except TimeoutError:
-                                logger.warning(f"[{task_id}] Timeout reading register {register.get('name')}")
-                                register_modbus_error(object_id)
-                            except Exception as e:
-                                logger.error(
-                                    f"[{task_id}] Error reading register {register.get('name')}: {e}"
-                                )
-                                register_modbus_error(object_id)
+                        await asyncio.gather(*(
+                            self._read_victron_register(
+                                broker, task_id, register, decode_plans[group_name], collected_data,
+                                protocol=protocol, ip_address=ip_address, port=port,
+                                slave_id=slave_id, object_id=object_id,
+                            )
+                            for register in group.get("registers", [])
+                        ))
                 
                 if collected_data:
                     # Регистрируем успешное чтение
                     register_modbus_success(object_id)
                     
+                    measured_at = datetime.now()
+                    
+                    # Сохраняем историю значений (пакетами, в фоне)
+                    await self.sample_writer.submit(object_id, collected_data, measured_at)
+                    
                     # Добавляем метаданные
-                    collected_data["measured_at"] = datetime.now()
+                    collected_data["measured_at"] = measured_at
                     collected_data["object_name"] = object_name
                     collected_data["energetic_object_id"] = object_id
                     
-                    # logger.info(
-                    #     f"[{task_id}] Collected {len(collected_data)} values from {object_name}"
-                    # )
-                
-                    # Пока просто логируем
                     logger.debug(f"[{task_id}] Data: {collected_data}")
                     
                     # Проверяем gen_relay для уведомлений в Telegram
@@ -543,6 +453,64 @@ class PollingManager:
             
             await asyncio.sleep(interval)
     
+    async def _read_victron_register(
+        self,
+        broker,
+        task_id: str,
+        register: dict,
+        plans: Dict[str, Any],
+        collected_data: dict,
+        protocol: str,
+        ip_address: str,
+        port: int,
+        slave_id: int,
+        object_id: str,
+    ):
+        """Читает один регистр через брокер и добавляет значение в collected_data."""
+        from worker.modbus_broker import RequestPriority
+        
+        try:
+            # Чтение регистра
+            address = register["address"]
+            count = register.get("count", 1)
+            name = register["name"]
+            
+            # Определяем func_code из типа функции
+            func_code = 4  # input registers по умолчанию
+            if "function" in register:
+                if register["function"] == "holding":
+                    func_code = 3
+            
+            # Используем брокер с приоритетом POLLING
+            result = await broker.submit_request(
+                protocol=protocol,
+                host=ip_address,
+                port=port,
+                operation="read",
+                params={"start": address, "count": count, "func_code": func_code},
+                slave_id=slave_id,
+                object_id=object_id,
+                priority=RequestPriority.POLLING,
+                timeout=8.0,
+                request_id=f"polling_{task_id}_{name}",
+            )
+            
+            registers_data = result.get("data", [])
+            
+            register_modbus_success(object_id)
+            
+            # Декодируем значение по скомпилированному плану регистра
+            collected_data.update(plans[name].decode(registers_data))
+            
+        except TimeoutError:
+            logger.warning(f"[{task_id}] Timeout reading register {register.get('name')}")
+            register_modbus_error(object_id)
+        except Exception as e:
+            logger.error(
+                f"[{task_id}] Error reading register {register.get('name')}: {e}"
+            )
+            register_modbus_error(object_id)
+    
     async def _run_custom_command_task(
         self,
         task_id: str,
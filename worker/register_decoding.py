@@ -0,0 +1,170 @@
+"""
+Быстрый CRC16 и декодирование блоков регистров по JSON-конфигам устройств.
+
+- modbus_crc16 считает CRC по таблице на 256 значений: один поиск на байт
+  вместо восьми сдвигов;
+- DecodePlan компилируется один раз из группы регистров конфига
+  (worker/modbus_configs/*.json). Блок регистров упаковывается в байты и
+  распаковывается одним struct-вызовом сразу в знаковые/беззнаковые
+  16/32-битные значения, а биты и масштаб применяются по готовому списку
+  полей, без разбора типов из конфига на каждом цикле опроса.
+"""
+
+import struct
+from operator import itemgetter, mul
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+
+def _crc16_table() -> List[int]:
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if (crc & 1) else crc >> 1
+        table.append(crc)
+    return table
+
+
+CRC16_TABLE = _crc16_table()
+
+
+def modbus_crc16(data: bytes) -> int:
+    """Вычисляет CRC16 для Modbus RTU по таблице."""
+    crc = 0xFFFF
+    table = CRC16_TABLE
+    for b in data:
+        crc = (crc >> 8) ^ table[(crc ^ b) & 0xFF]
+    return crc
+
+
+# Тип регистра из конфига -> (символ struct, число регистров)
+_TYPE_CODES = {
+    "uint16": ("H", 1),
+    "int16": ("h", 1),
+    "uint32": ("I", 2),
+    "int32": ("i", 2),
+}
+
+
+class _Field(NamedTuple):
+    name: str
+    slot: int
+    bit: Optional[int]
+    scale: float
+
+
+class DecodePlan:
+    """
+    Скомпилированное декодирование блока из count регистров.
+
+    Каждое поле — offset от начала блока, тип (uint16/int16/uint32/int32;
+    неизвестный тип читается как uint16), необязательный бит и масштаб.
+    Результат совпадает с прежним поштучным декодированием: 32-битное поле
+    в последнем регистре блока читается как 16-битное, поля за пределами
+    блока пропускаются. С empty_as_zero пустой ответ декодируется как один
+    нулевой регистр (так прежде читались отдельные регистры Victron).
+    """
+
+    def __init__(self, fields: Sequence[dict], count: int, empty_as_zero: bool = False):
+        self.count = count
+        self.empty_as_zero = empty_as_zero
+        self._source = list(fields)
+        self._short_plans: Dict[int, "DecodePlan"] = {}
+        self._pack = struct.Struct(f">{count}H")
+
+        # Слот — уникальная пара (offset, символ struct), отсортированная по offset
+        typed = []
+        for field in self._source:
+            offset = field.get("offset", 0)
+            if offset >= count:
+                continue
+            code, width = _TYPE_CODES.get(field.get("type", "uint16"), ("H", 1))
+            if offset + width > count:
+                code = "H"
+            typed.append((field, (offset, code)))
+        slots = sorted({key for _, key in typed})
+        index = {key: i for i, key in enumerate(slots)}
+        self._fields = [
+            _Field(field["name"], index[key], field.get("bit"), field.get("scale", 1.0))
+            for field, key in typed
+        ]
+        self._names = [f.name for f in self._fields]
+        self._scales = [f.scale for f in self._fields]
+        self._bits = [(i, f.bit) for i, f in enumerate(self._fields) if f.bit is not None]
+        field_slots = [f.slot for f in self._fields]
+        if field_slots == list(range(len(slots))):
+            self._select = None  # поля совпадают со слотами по порядку
+        elif len(field_slots) == 1:
+            self._select = lambda raw, slot=field_slots[0]: (raw[slot],)
+        else:
+            self._select = itemgetter(*field_slots)
+        self._slots = [(struct.Struct(f">{code}"), offset * 2) for offset, code in slots]
+        self._unpack = self._single_pass_struct(slots)
+
+    @staticmethod
+    def _single_pass_struct(slots: List[tuple]) -> Optional[struct.Struct]:
+        """Один формат struct для всех слотов, если они не перекрываются."""
+        fmt, position = ">", 0
+        for offset, code in slots:
+            if offset < position:
+                return None
+            if offset > position:
+                fmt += f"{(offset - position) * 2}x"
+            fmt += code
+            position = offset + (2 if code in "Ii" else 1)
+        return struct.Struct(fmt)
+
+    @classmethod
+    def from_group(cls, group: dict) -> "DecodePlan":
+        """План для группы с start_address/count и полями по offset (Deye)."""
+        return cls(group.get("registers", []), group["count"])
+
+    @classmethod
+    def from_register(cls, register: dict) -> "DecodePlan":
+        """План для одного регистра, читаемого отдельным запросом (Victron)."""
+        count = register.get("count", 1)
+        return cls([{**register, "offset": 0}], count, empty_as_zero=True)
+
+    def decode(self, registers: Sequence[int]) -> Dict[str, float]:
+        """Декодирует блок регистров в {имя: значение с учётом бита и масштаба}."""
+        if not registers and self.empty_as_zero:
+            registers = (0,)
+        if len(registers) < self.count:
+            return self._short_plan(len(registers)).decode(registers)
+        data = self._pack.pack(*registers[: self.count])
+        if self._unpack is not None:
+            raw = self._unpack.unpack(data)
+        else:
+            raw = [slot.unpack_from(data, start)[0] for slot, start in self._slots]
+        values = raw if self._select is None else self._select(raw)
+        if self._bits:
+            values = list(values)
+            for i, bit in self._bits:
+                values[i] = (values[i] >> bit) & 1
+        return dict(zip(self._names, map(mul, values, self._scales)))
+
+    def _short_plan(self, count: int) -> "DecodePlan":
+        # Ответ короче ожидаемого: поля, которые не поместились, пропускаются
+        if count not in self._short_plans:
+            self._short_plans[count] = DecodePlan(self._source, count)
+        return self._short_plans[count]
+
+
+def compile_device_plans(config: dict) -> Dict[str, object]:
+    """
+    Планы декодирования всех групп конфига устройства.
+
+    Для групп со start_address/count (чтение блоком) — DecodePlan группы;
+    для групп с адресом у каждого регистра — {имя регистра: DecodePlan}.
+    """
+    plans: Dict[str, object] = {}
+    for group_name, group in config.get("register_groups", {}).items():
+        if group.get("start_address") is not None and group.get("count") is not None:
+            plans[group_name] = DecodePlan.from_group(group)
+        else:
+            plans[group_name] = {
+                register["name"]: DecodePlan.from_register(register)
+                for register in group.get("registers", [])
+                if "address" in register
+            }
+    return plans
@@ -0,0 +1,186 @@
+"""
+Буферизованная запись опрошенных регистров в register_samples.
+
+Задачи опроса отдают значения цикла в submit(), а фоновая задача пишет
+накопленное пачками по flush_size строк: когда буфер набрал flush_size
+строк или прошло flush_interval секунд с прошлой записи. Буфер ограничен
+max_pending строками, считая пачку, которая пишется прямо сейчас: при
+переполнении submit() ждёт записи (не дольше flush_interval), а если БД
+так и не освободила место — отбрасываются самые старые строки, чтобы
+опрос не останавливался и память не росла.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, Mapping, Optional
+
+from loguru import logger
+
+from cor_pass.config.config import settings
+from cor_pass.repository.energy.register_samples import insert_register_samples
+
+
+class RegisterSampleWriter:
+    def __init__(
+        self,
+        flush_size: int = 500,
+        flush_interval: float = 5.0,
+        max_pending: int = 20000,
+        session_maker: Optional[Callable] = None,
+    ):
+        if flush_size < 1 or max_pending < flush_size:
+            raise ValueError("Нужно 1 <= flush_size <= max_pending")
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        if session_maker is None:
+            from cor_pass.database.db import async_session_maker as session_maker
+        self._session_maker = session_maker
+        self._buffer: Deque[dict] = deque()
+        # Строки пачки, которая пишется сейчас: тоже занимают место в буфере
+        self._in_flight = 0
+        self._flush_requested = asyncio.Event()
+        self._space_freed = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "written": 0,
+            "dropped": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "backpressure_waits": 0,
+            "last_flush_s": 0.0,
+        }
+
+    def start(self):
+        """Запускает фоновую запись (вызывается автоматически из submit)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновую запись и дописывает остаток буфера."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if not await self.flush():
+            logger.error(f"❌ При остановке не записано {len(self._buffer)} значений регистров")
+
+    async def submit(self, object_id: str, values: Mapping[str, Any], measured_at: datetime) -> int:
+        """
+        Ставит числовые значения цикла опроса в очередь на запись.
+
+        Нечисловые значения (метаданные, строки) и NaN пропускаются.
+        Возвращает число принятых значений.
+        """
+        rows = [
+            {"energetic_object_id": object_id, "register_key": key, "measured_at": measured_at, "value": float(value)}
+            for key, value in values.items()
+            if isinstance(value, (int, float)) and math.isfinite(value)
+        ]
+        if not rows:
+            return 0
+        self.start()
+        if self._pending() + len(rows) > self.max_pending:
+            await self._wait_for_space(len(rows))
+        self._buffer.extend(rows)
+        if len(self._buffer) >= self.flush_size:
+            self._flush_requested.set()
+        return len(rows)
+
+    async def _wait_for_space(self, needed: int):
+        self._stats["backpressure_waits"] += 1
+        self._flush_requested.set()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        while self._pending() + needed > self.max_pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                self._drop_oldest(self._pending() + needed - self.max_pending)
+                return
+            self._space_freed.clear()
+            try:
+                await asyncio.wait_for(self._space_freed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    def _pending(self) -> int:
+        return len(self._buffer) + self._in_flight
+
+    def _drop_oldest(self, count: int):
+        count = min(count, len(self._buffer))
+        for _ in range(count):
+            self._buffer.popleft()
+        self._stats["dropped"] += count
+        logger.warning(f"⚠️ Буфер register_samples переполнен, отброшено {count} старых значений")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            if not await self.flush():
+                # БД недоступна — не повторяем чаще, чем раз в flush_interval
+                await asyncio.sleep(self.flush_interval)
+
+    async def flush(self) -> bool:
+        """Пишет весь буфер пачками по flush_size. False — запись не удалась, строки остались в буфере."""
+        async with self._flush_lock:
+            while self._buffer:
+                batch = [self._buffer.popleft() for _ in range(min(self.flush_size, len(self._buffer)))]
+                self._in_flight = len(batch)
+                started = time.perf_counter()
+                try:
+                    async with self._session_maker() as db:
+                        await insert_register_samples(db, batch)
+                        await db.commit()
+                except asyncio.CancelledError:
+                    # Остановка посреди записи: пачка остаётся в буфере для stop()
+                    self._buffer.extendleft(reversed(batch))
+                    raise
+                except Exception as e:
+                    logger.error(f"❌ Ошибка записи {len(batch)} значений регистров: {e}")
+                    self._stats["failed_flushes"] += 1
+                    self._buffer.extendleft(reversed(batch))
+                    if len(self._buffer) > self.max_pending:
+                        self._drop_oldest(len(self._buffer) - self.max_pending)
+                    return False
+                finally:
+                    self._in_flight = 0
+                self._stats["written"] += len(batch)
+                self._stats["flushes"] += 1
+                self._stats["last_flush_s"] = round(time.perf_counter() - started, 4)
+                self._space_freed.set()
+            return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "pending": self._pending(),
+            "flush_size": self.flush_size,
+            "flush_interval": self.flush_interval,
+            "max_pending": self.max_pending,
+        }
+
+
+_writer: Optional[RegisterSampleWriter] = None
+
+
+def get_register_sample_writer() -> RegisterSampleWriter:
+    """Общий для воркера писатель register_samples с параметрами из настроек."""
+    global _writer
+    if _writer is None:
+        _writer = RegisterSampleWriter(
+            flush_size=settings.register_samples_flush_size,
+            flush_interval=settings.register_samples_flush_interval,
+            max_pending=settings.register_samples_max_pending,
+        )
+    return _writer
@@ -0,0 +1,90 @@
+"""
+Ожидание следующей проверки расписаний в воркере.
+
+Задача расписаний объекта перестраивает ScheduleTimeline только при
+изменении расписаний и спит до ближайшего перехода. Разбудить её раньше
+может invalidate_schedules(): его вызывает подписчик Redis-канала
+SCHEDULE_CHANGES_CHANNEL, в который API публикует id объекта при
+создании, изменении и удалении расписаний. Если сообщение потерялось
+(Redis недоступен), таймлайн всё равно перечитывается не реже раза в
+schedule_resync_interval секунд.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from loguru import logger
+
+from cor_pass.services.energy.schedule_timeline import SCHEDULE_CHANGES_CHANNEL
+
+
+# object_id -> событие «расписания объекта изменились»
+_changed: Dict[str, asyncio.Event] = {}
+LISTENER_RETRY_SECONDS = 5
+
+
+def _event(object_id: str) -> asyncio.Event:
+    event = _changed.get(object_id)
+    if event is None:
+        event = _changed[object_id] = asyncio.Event()
+    return event
+
+
+def invalidate_schedules(object_id: Optional[str] = None) -> None:
+    """Помечает таймлайн объекта (или всех объектов при None) устаревшим."""
+    if object_id is None:
+        for event in _changed.values():
+            event.set()
+    else:
+        _event(object_id).set()
+
+
+def consume_invalidation(object_id: str) -> bool:
+    """True, если таймлайн объекта помечен устаревшим; сбрасывает отметку."""
+    event = _event(object_id)
+    changed = event.is_set()
+    event.clear()
+    return changed
+
+
+async def wait_for_schedule_check(object_id: str, due: Optional[datetime], max_wait: float) -> bool:
+    """
+    Спит до момента due (UTC), но не дольше max_wait секунд.
+    Возвращает True, если раньше пришло изменение расписаний объекта.
+    """
+    timeout = max_wait
+    if due is not None:
+        until_due = (due - datetime.now(timezone.utc)).total_seconds()
+        timeout = min(max(until_due, 0.0), max_wait)
+    try:
+        await asyncio.wait_for(_event(object_id).wait(), timeout)
+    except asyncio.TimeoutError:
+        return False
+    return True
+
+
+async def listen_schedule_changes():
+    """Подписка на изменения расписаний из API; переподключается при ошибках Redis."""
+    from cor_pass.database.redis_db import redis_client
+
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(SCHEDULE_CHANGES_CHANNEL)
+            logger.info(f"Subscribed to Redis channel: {SCHEDULE_CHANGES_CHANNEL}")
+            # Пока подписки не было, изменения могли пройти мимо
+            invalidate_schedules()
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    invalidate_schedules(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️ Подписка на {SCHEDULE_CHANGES_CHANNEL} прервана: {e}")
+        finally:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+        await asyncio.sleep(LISTENER_RETRY_SECONDS)
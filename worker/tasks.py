@@ -1,14 +1,16 @@
 import asyncio
-from datetime import datetime, time as dt_time
+from datetime import datetime, time as dt_time, timezone
+from functools import partial
 from typing import Optional
 from uuid import uuid4
-from zoneinfo import ZoneInfo
 
 from loguru import logger
 from cor_pass.database.db import async_session_maker
 from cor_pass.schemas import FullDeviceMeasurementCreate
+from worker.collection_planner import MISSING, get_collection_planner
 from worker.modbus_client import (
     get_or_create_modbus_client,
+    get_modbus_read_lanes,
     register_modbus_success,
     get_modbus_error_stats
 )
@@ -16,11 +18,13 @@ from worker.data_collector import (
     collect_battery_data,
     collect_inverter_power_data,
     collect_ess_ac_data,
-    get_solarchargers_current_sum,
     get_battery_status,
     send_grid_feed_w_command,
+    solarcharger_reads,
+    summarize_solarchargers,
 )
-from worker.db_operations import create_full_device_measurement, get_all_schedules, update_schedule_is_active_status
+from worker.db_operations import get_all_schedules, update_schedule_is_active_status
+from worker.measurement_writer import get_measurement_writer
 from worker.schedule_task import send_dvcc_max_charge_current_command, send_vebus_soc_command
 from cor_pass.config.config import settings
 from worker.telegram_bot import (
@@ -31,6 +35,8 @@ from worker.telegram_bot import (
     update_object_data  
 )
 from cor_pass.repository.energy.cerbo_service import get_energetic_object
+from cor_pass.services.energy.schedule_timeline import ScheduleTimeline, ScheduleWindow
+from worker.schedule_engine import consume_invalidation, wait_for_schedule_check
 
 
 
@@ -93,43 +99,52 @@ async def cerbo_collection_task_worker(object_id: str, object_name: str):
         port = obj.port
         protocol = obj.protocol
     
+    planner = get_collection_planner(object_id, max_concurrency=settings.cerbo_read_concurrency)
+
     while True:
         transaction_id = uuid4()
-        modbus_client_instance = await get_or_create_modbus_client(
-            protocol=protocol,
-            ip_address=ip_address,
-            port=port,
-            object_id=object_id
-        )
+        if protocol == "modbus_tcp":
+            clients = await get_modbus_read_lanes(
+                ip_address=ip_address,
+                port=port,
+                object_id=object_id,
+                count=settings.cerbo_read_concurrency,
+            )
+        else:
+            client = await get_or_create_modbus_client(
+                protocol=protocol,
+                ip_address=ip_address,
+                port=port,
+                object_id=object_id
+            )
+            clients = [client] if client and client.connected else []
 
         try:
-            if not modbus_client_instance or not modbus_client_instance.connected:
+            if not clients:
                 logger.critical(f"[{object_id}] [{transaction_id}] Modbus client not connected. Skipping cycle.")
                 await asyncio.sleep(COLLECTION_INTERVAL_SECONDS)
                 continue
 
-            collected_data = {}
+            # Батарея, инвертор, ESS и каждый MPPT — независимые юниты,
+            # читаются параллельно; не ответивший юнит помечается MISSING
+            reads = {
+                "battery": partial(collect_battery_data, transaction_id=transaction_id),
+                "inverter": partial(collect_inverter_power_data, transaction_id=transaction_id),
+                "ess": partial(collect_ess_ac_data, transaction_id=transaction_id),
+                "battery_status": partial(get_battery_status, transaction_id=transaction_id),
+                **solarcharger_reads(),
+            }
+            report = await planner.gather(reads, clients)
+            logger.debug(f"[{object_id}] [{transaction_id}] Collection: {report.summary()}")
 
-            try:
-                collected_data.update(await collect_battery_data(modbus_client_instance, transaction_id))
-            except Exception:
-                pass
-            try:
-                collected_data.update(await collect_inverter_power_data(modbus_client_instance, transaction_id))
-            except Exception:
-                pass
-            try:
-                collected_data.update(await collect_ess_ac_data(modbus_client_instance, transaction_id))
-            except Exception:
-                pass
-            try:
-                collected_data.update(await get_solarchargers_current_sum(modbus_client_instance, transaction_id))
-            except Exception:
-                pass
-            try:
-                collected_data.update(await get_battery_status(modbus_client_instance, transaction_id))
-            except Exception:
-                pass
+            collected_data = {}
+            for unit in ("battery", "inverter", "ess", "battery_status"):
+                value = report.get(unit)
+                if value is not MISSING:
+                    collected_data.update(value)
+            solar = summarize_solarchargers(report, transaction_id)
+            if solar["solar_total_pv_power"] is not None:
+                collected_data.update(solar)
 
             if not collected_data:
                 logger.warning(f"[{object_id}] [{transaction_id}] No data collected. Skipping save.")
@@ -223,9 +238,9 @@ async def cerbo_collection_task_worker(object_id: str, object_name: str):
                             chat_ids=chat_ids
                         )
             
+            # Запись пачками общим писателем (вместе с измерениями остальных объектов)
             full_measurement = FullDeviceMeasurementCreate(**collected_data)
-            async with async_session_maker() as db:
-                await create_full_device_measurement(db=db, data=full_measurement)
+            await get_measurement_writer().submit(full_measurement.model_dump())
             
             # Обновляем данные для команд Telegram бота (только в development)
             if settings.app_env == "development":
@@ -352,67 +367,58 @@ async def cerbo_collection_task_worker(object_id: str, object_name: str):
         await asyncio.sleep(COLLECTION_INTERVAL_SECONDS)
 
 
+async def _load_schedule_timeline(db, object_id: str) -> Optional[ScheduleTimeline]:
+    """Таймлайн операционных расписаний объекта или None, если объекта нет."""
+    energetic_object = await get_energetic_object(db, object_id)
+    if not energetic_object:
+        return None
+    schedules = await get_all_schedules(db, object_id)
+    return ScheduleTimeline(schedules, energetic_object.timezone)
+
+
 async def energetic_schedule_task_worker(object_id: str, object_name: str):
-    current_active_schedule_id: str | None = None
+    """
+    Переключает параметры инвертора по расписаниям объекта.
+
+    Расписания читаются из БД только при старте, по сигналу об их изменении
+    и раз в schedule_resync_interval; между переключениями задача спит до
+    ближайшего перехода таймлайна.
+    """
+    current_active_schedule: Optional[ScheduleWindow] = None
+    timeline: Optional[ScheduleTimeline] = None
+    loop = asyncio.get_running_loop()
+    next_resync = loop.time()
     logger.debug(f"[{object_id}] Starting energetic schedule task worker.")
-    logger.debug(f"current_active_schedule_id initialized to: {current_active_schedule_id}")
 
     while True:
+        now = datetime.now(timezone.utc)
         try:
             async with async_session_maker() as db:
-                # Получаем объект для доступа к его timezone
-                energetic_object = await get_energetic_object(db, object_id)
-                if not energetic_object:
-                    logger.error(f"[{object_id}] Energetic object not found!")
-                    break
-                
-                # Получаем текущее время в timezone объекта
-                object_timezone = ZoneInfo(energetic_object.timezone)
-                now_time = datetime.now(object_timezone).time()
-                
-                all_schedules = await get_all_schedules(db)
-                # фильтруем только для этого объекта
-                object_schedules = [s for s in all_schedules if s.energetic_object_id == object_id]
+                if consume_invalidation(object_id) or timeline is None or loop.time() >= next_resync:
+                    timeline = await _load_schedule_timeline(db, object_id)
+                    if timeline is None:
+                        logger.error(f"[{object_id}] Energetic object not found!")
+                        break
+                    next_resync = loop.time() + settings.schedule_resync_interval
 
-                operational_schedules = [s for s in object_schedules if not s.is_manual_mode]
-                
-                # logger.debug(f"[{object_id}] 🔍 Проверка расписаний: найдено {len(object_schedules)} расписаний для объекта, {len(operational_schedules)} операционных, текущее время {now_time} ({energetic_object.timezone}), активное расписание ID: {current_active_schedule_id}")
-
-                active_schedule = None
-                for schedule in operational_schedules:
-                    if schedule.start_time <= schedule.end_time:
-                        if schedule.start_time <= now_time < schedule.end_time:
-                            active_schedule = schedule
-                            break
-                    else:
-                        if now_time >= schedule.start_time or now_time < schedule.end_time:
-                            active_schedule = schedule
-                            break
+                active_schedule = timeline.active_at(now)
 
                 if active_schedule:
-                    # logger.debug(f"[{object_id}] ✅ Найдено активное расписание ID={active_schedule.id}, период {active_schedule.start_time}-{active_schedule.end_time}")
-                    
-                    if active_schedule.id != current_active_schedule_id:
-                        # logger.info(f"[{object_id}] 🔄 Переключение расписания: {current_active_schedule_id} → {active_schedule.id}")
-                        
-                        # Получаем параметры предыдущего расписания для уведомления
+                    if current_active_schedule is None or active_schedule.id != current_active_schedule.id:
+                        # Параметры предыдущего расписания для уведомления
                         old_grid_feed_kw = None
                         old_battery_level_percent = None
                         old_charge_battery_value = None
-                        
-                        if current_active_schedule_id:
-                            old_schedule = next((s for s in all_schedules if s.id == current_active_schedule_id), None)
-                            if old_schedule:
-                                old_grid_feed_kw = old_schedule.grid_feed_w / 1000  # W -> kW
-                                old_battery_level_percent = old_schedule.battery_level_percent
-                                old_charge_battery_value = old_schedule.charge_battery_value
-                        
-                        # деактивация предыдущей
-                        if current_active_schedule_id:
-                            await update_schedule_is_active_status(db, current_active_schedule_id, False)
-                        
-                        current_active_schedule_id = active_schedule.id
-                        
+
+                        if current_active_schedule:
+                            old_grid_feed_kw = current_active_schedule.grid_feed_w / 1000  # W -> kW
+                            old_battery_level_percent = current_active_schedule.battery_level_percent
+                            old_charge_battery_value = current_active_schedule.charge_battery_value
+                            # деактивация предыдущей
+                            await update_schedule_is_active_status(db, current_active_schedule.id, False)
+
+                        current_active_schedule = active_schedule
+
                         # установка параметров инвертора для объекта
                         await set_inverter_parameters(
                             object_id,
@@ -421,14 +427,14 @@ async def energetic_schedule_task_worker(object_id: str, object_name: str):
                             active_schedule.charge_battery_value,
                         )
                         await update_schedule_is_active_status(db, active_schedule.id, True)
-                        
+
                         # Отправляем уведомление в Telegram (только в development)
                         if settings.app_env == "development":
                             try:
                                 await send_schedule_change_notification(
                                     object_id=object_id,
                                     object_name=object_name,
-                                    object_timezone=energetic_object.timezone,
+                                    object_timezone=timeline.timezone_name,
                                     old_grid_feed_kw=old_grid_feed_kw,
                                     old_battery_level_percent=old_battery_level_percent,
                                     old_charge_battery_value=old_charge_battery_value,
@@ -446,19 +452,18 @@ async def energetic_schedule_task_worker(object_id: str, object_name: str):
                 else:
                     logger.debug(f"[{object_id}] ⚠️ Активное расписание не найдено, сбрасываем на дефолт")
                     # сброс к дефолтным параметрам
-                    if current_active_schedule_id:
-                        # logger.info(f"[{object_id}] 🔄 Сброс расписания {current_active_schedule_id} на дефолтные параметры")
-                        await update_schedule_is_active_status(db, current_active_schedule_id, False)
-                        current_active_schedule_id = None
+                    if current_active_schedule:
+                        await update_schedule_is_active_status(db, current_active_schedule.id, False)
+                        current_active_schedule = None
                         await set_inverter_parameters(object_id, DEFAULT_grid_feed_kw, DEFAULT_battery_level_percent, DEFAULT_charge_battery_value)
-                        
+
                         # Отправляем уведомление о сбросе на дефолт (только в development)
                         if settings.app_env == "development":
                             try:
                                 await send_schedule_change_notification(
                                     object_id=object_id,
                                     object_name=object_name,
-                                    object_timezone=energetic_object.timezone,
+                                    object_timezone=timeline.timezone_name,
                                     old_grid_feed_kw=None,
                                     old_battery_level_percent=None,
                                     old_charge_battery_value=None,
@@ -469,9 +474,17 @@ async def energetic_schedule_task_worker(object_id: str, object_name: str):
                                 )
                             except Exception as e:
                                 logger.error(f"[{object_id}] Error sending schedule reset notification: {e}", exc_info=True)
-                    # Если current_active_schedule_id уже None, не вызываем set_inverter_parameters повторно
+                    # Если активного расписания уже нет, не вызываем set_inverter_parameters повторно
 
         except Exception as e:
             logger.error(f"[{object_id}] Error in schedule task: {e}", exc_info=True)
+            # Перечитываем расписания после паузы, а не спим до перехода по старому таймлайну
+            timeline = None
+            await asyncio.sleep(SCHEDULE_CHECK_INTERVAL_SECONDS)
+            continue
 
-        await asyncio.sleep(SCHEDULE_CHECK_INTERVAL_SECONDS)
\ No newline at end of file
+        await wait_for_schedule_check(
+            object_id,
+            timeline.next_transition(now),
+            max(next_resync - loop.time(), 0.0),
+        )